@@ -0,0 +1,121 @@
+# benchmarks/bench_context_budget.py
+# -*- coding: utf-8 -*-
+"""
+เทียบการจัดบริบทแบบเดิม (≤12 ข้อความ, ≤6000 ตัวอักษร + ข้อความปัจจุบันซ้ำ) กับ utils.token_budget.pack_messages
+- บทสนทนาสังเคราะห์: ไทยล้วน / อังกฤษล้วน / ปนกัน ความยาวแบบ log-normal (ข้อความสั้นมาก ~ ยาวหลายพันตัวอักษร)
+- วัด token ต่อคำขอ (ด้วย TokenCounter ของโมเดล — tiktoken ถ้ามี ไม่งั้นค่าประมาณ): p50/p95/max, % ที่เกินงบ
+  และจำนวนข้อความบริบทที่ได้ใช้
+- วัดเวลา pack ต่อคำขอ: รอบแรก (cache ว่าง) vs รอบต่อไป (จำนวน token ต่อแถวอยู่ใน cache แล้ว)
+
+ใช้งาน:
+  python benchmarks/bench_context_budget.py [--turns 2000] [--model gpt-4o-mini] [--budget 4000]
+"""
+
+from __future__ import annotations
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.token_budget import MESSAGE_OVERHEAD, get_counter, pack_messages  # noqa: E402
+
+SYSTEM = "คุณคือ 'ชิบะน้อย' ผู้ช่วยภาษาไทยที่สุภาพ กระชับ ไม่ทวนคำถาม และซื่อสัตย์ " * 2
+TH_WORDS = ["ราคา", "ทอง", "วันนี้", "ช่วย", "สรุป", "รายงาน", "ประชุม", "ลูกค้า", "โครงการ", "งบประมาณ",
+            "เอกสาร", "พนักงาน", "ระบบ", "ข้อมูล", "ตรวจสอบ", "ส่งมอบ", "กำหนดการ", "ความเสี่ยง", "แผนงาน", "ผลลัพธ์"]
+EN_WORDS = ["price", "report", "meeting", "customer", "project", "budget", "deadline", "risk", "plan",
+            "delivery", "invoice", "server", "deploy", "error", "latency", "database", "query", "result"]
+
+
+def _sentence(rnd: random.Random, lang: str, n_chars: int) -> str:
+    out, size = [], 0
+    while size < n_chars:
+        if lang == "th" or (lang == "mix" and rnd.random() < 0.7):
+            w = rnd.choice(TH_WORDS)
+        else:
+            w = rnd.choice(EN_WORDS) + " "
+        out.append(w)
+        size += len(w)
+    return "".join(out)
+
+
+def _conversation(rnd: random.Random, rows: int):
+    lang = rnd.choice(["th", "th", "mix", "en"])
+    hist = []
+    for i in range(rows):
+        n = int(min(4000, max(8, math.exp(rnd.gauss(5.0, 1.1)))))   # median ~150 ตัวอักษร
+        hist.append({"role": "user" if i % 2 == 0 else "assistant", "content": _sentence(rnd, lang, n), "message_id": None})
+    return hist
+
+
+def _old_way(hist, current, counter):
+    """แบบเดิม: 12 ข้อความล่าสุด ≤6000 ตัวอักษร (รวมข้อความปัจจุบันที่ถูกบันทึกไปแล้ว) + ต่อท้ายข้อความปัจจุบันซ้ำ"""
+    rows = list(reversed(hist + [{"role": "user", "content": current}]))[:12]
+    out, total = [], 0
+    for r in rows:
+        if total + len(r["content"]) > 6000 and out:
+            break
+        out.append(r)
+        total += len(r["content"])
+    msgs = [{"role": "system", "content": SYSTEM}] + list(reversed(out)) + [{"role": "user", "content": current}]
+    return sum(counter.count(m["content"]) + MESSAGE_OVERHEAD for m in msgs) + 3, len(out)
+
+
+def _pct(vals, p):
+    vals = sorted(vals)
+    return vals[min(len(vals) - 1, int(math.ceil(p * len(vals))) - 1)]
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--turns", type=int, default=2000)
+    p.add_argument("--model", default="gpt-4o-mini")
+    p.add_argument("--budget", type=int, default=4000)
+    args = p.parse_args()
+
+    rnd = random.Random(5)
+    counter = get_counter(args.model)
+    next_id = 1
+    convs = []
+    for _ in range(args.turns):
+        hist = _conversation(rnd, 30)
+        for m in hist:
+            m["message_id"] = next_id
+            next_id += 1
+        current = _sentence(rnd, "mix", rnd.randint(10, 300))
+        convs.append((hist, current))
+
+    old_tok, old_turns = [], []
+    for hist, current in convs:
+        t, k = _old_way(hist, current, counter)
+        old_tok.append(t)
+        old_turns.append(k)
+
+    new_tok, new_turns = [], []
+    t0 = time.perf_counter()
+    for hist, current in convs:
+        _msgs, info = pack_messages(SYSTEM, hist, current, model=args.model, budget=args.budget)
+        new_tok.append(info["tokens"])
+        new_turns.append(info["turns"])
+    cold = (time.perf_counter() - t0) / len(convs) * 1e6
+    t0 = time.perf_counter()
+    for hist, current in convs:
+        pack_messages(SYSTEM, hist, current, model=args.model, budget=args.budget)
+    warm = (time.perf_counter() - t0) / len(convs) * 1e6
+
+    def row(name, tok, turns):
+        over = sum(1 for t in tok if t > args.budget) / len(tok)
+        print(f"{name:<12} tokens p50={_pct(tok, .5):>5} p95={_pct(tok, .95):>5} max={max(tok):>5} "
+              f"over_budget={over:6.1%}  context_msgs avg={sum(turns) / len(turns):.1f}")
+
+    print(f"model={args.model} counter={counter.kind} budget={args.budget} requests={len(convs)}")
+    row("char-cap", old_tok, old_turns)
+    row("token-pack", new_tok, new_turns)
+    print(f"pack time: cold {cold:.0f}us/request, warm (row counts cached) {warm:.0f}us/request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# benchmarks/bench_decode.py
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark: ถอด body ของ webhook — ทางเดิม vs utils.fast_json
+- ใช้ payload ตัวอย่างใน benchmarks/payloads/*.json (ทั้งแบบ plain และ gzip)
+- ทางเดิม = GzipFile → list ของ chunk → join → decode เป็น str → json.loads(str)
+- ทางใหม่ = utils.fast_json.parse_body (zlib stream ลง bytearray เดียว → parse จาก bytes)
+- วัด CPU ต่อ request (µs) และ peak allocation ต่อ request (tracemalloc)
+
+ใช้งาน:
+  python benchmarks/bench_decode.py [--repeat 2000]
+"""
+
+from __future__ import annotations
+import argparse
+import glob
+import gzip
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.fast_json import parse_body, BACKEND  # noqa: E402
+
+CAP = 20 * 1024 * 1024
+
+
+def legacy_decode(raw: bytes, enc: str):
+    """สำเนาของ _read_update_json เดิม (ก่อนเปลี่ยนเป็น fast path)"""
+    if enc == "gzip":
+        gz = gzip.GzipFile(fileobj=io.BytesIO(raw), mode="rb")
+        chunks, total = [], 0
+        while True:
+            piece = gz.read(64 * 1024)
+            if not piece:
+                break
+            total += len(piece)
+            if total > CAP:
+                raise ValueError("too large")
+            chunks.append(piece)
+        text = b"".join(chunks).decode("utf-8", errors="replace")
+    else:
+        text = raw.decode("utf-8", errors="replace")
+    return json.loads(text)
+
+
+def fast_decode(raw: bytes, enc: str):
+    return parse_body(raw, enc, CAP)[0]
+
+
+def _cpu_us(fn, raw, enc, repeat):
+    t0 = time.process_time()
+    for _ in range(repeat):
+        fn(raw, enc)
+    return (time.process_time() - t0) / repeat * 1e6
+
+
+def _peak_kb(fn, raw, enc):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    fn(raw, enc)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--repeat", type=int, default=2000)
+    a = p.parse_args()
+
+    files = sorted(glob.glob(os.path.join(os.path.dirname(__file__), "payloads", "*.json")))
+    print(f"backend={BACKEND} repeat={a.repeat}")
+    print(f"{'payload':<22} {'enc':<5} {'bytes':>7} {'legacy µs':>10} {'fast µs':>8} "
+          f"{'legacy KB':>10} {'fast KB':>8}")
+    for path in files:
+        with open(path, "rb") as f:
+            plain = json.dumps(json.load(f), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        for enc, raw in (("", plain), ("gzip", gzip.compress(plain))):
+            assert legacy_decode(raw, enc) == fast_decode(raw, enc)
+            name = os.path.splitext(os.path.basename(path))[0]
+            print(f"{name:<22} {enc or '-':<5} {len(raw):>7} "
+                  f"{_cpu_us(legacy_decode, raw, enc, a.repeat):>10.1f} "
+                  f"{_cpu_us(fast_decode, raw, enc, a.repeat):>8.1f} "
+                  f"{_peak_kb(legacy_decode, raw, enc):>10.1f} "
+                  f"{_peak_kb(fast_decode, raw, enc):>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# benchmarks/bench_ingest.py
+# -*- coding: utf-8 -*-
+"""
+เทียบ throughput ของเส้นทาง ingest: webhook (ทีละ update) vs long-polling (batch ≤100)
+- ใช้ DB ชั่วคราว (memory/journal/dedupe) และ handler จำลองที่ทำงานเหมือนต้นทางของ handle_message
+  คือ get_or_create_user(from) — ไม่เรียก LLM/Telegram จริง
+- ไม่รวม overhead ของ HTTP/Flask ฝั่ง webhook (จึงเป็นค่าที่ "เข้าข้าง" webhook อยู่แล้ว)
+
+ใช้งาน:
+  python benchmarks/bench_ingest.py [--updates 2000] [--users 50] [--batch 100]
+"""
+
+from __future__ import annotations
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+_TMP = tempfile.mkdtemp(prefix="bench_ingest_")
+os.environ.setdefault("BOT_MEMORY_DB_FILE", os.path.join(_TMP, "memory.db"))
+os.environ.setdefault("JOURNAL_DB_FILE", os.path.join(_TMP, "journal.db"))
+os.environ.setdefault("DEDUPE_DB_FILE", os.path.join(_TMP, "dedupe.db"))
+os.environ.setdefault("DISPATCH_COALESCE_MS", "0")
+os.environ.setdefault("ADMISSION_ENABLED", "0")   # วัดเฉพาะ ingest ไม่ให้ shed
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import utils.dispatcher as dispatcher_mod              # noqa: E402
+from utils.dispatcher import UpdateDispatcher           # noqa: E402
+from utils.ingest import ingest_updates                 # noqa: E402
+from utils.memory_store import init_db, get_or_create_user  # noqa: E402
+
+
+def _make_updates(start_id: int, n: int, users: int):
+    out = []
+    for i in range(n):
+        uid = 1000 + (i % users)
+        out.append({
+            "update_id": start_id + i,
+            "message": {
+                "message_id": i + 1,
+                "from": {"id": uid, "first_name": f"u{uid}", "is_bot": False},
+                "chat": {"id": uid, "type": "private"},
+                "text": f"hello {i}",
+            },
+        })
+    return out
+
+
+def _handler(update):
+    get_or_create_user(update["message"]["from"])
+
+
+def _fresh_dispatcher():
+    d = UpdateDispatcher(_handler, workers=8, queue_max=100000, coalesce_ms=0)
+    dispatcher_mod._DEFAULT = d
+    return d
+
+
+def bench_webhook(updates):
+    d = _fresh_dispatcher()
+    t0 = time.perf_counter()
+    for u in updates:
+        ingest_updates([u])
+    t_ack = time.perf_counter() - t0
+    d.stop(timeout=120)
+    return t_ack, time.perf_counter() - t0
+
+
+def bench_polling(updates, batch):
+    d = _fresh_dispatcher()
+    t0 = time.perf_counter()
+    for i in range(0, len(updates), batch):
+        ingest_updates(updates[i:i + batch])
+    t_ack = time.perf_counter() - t0
+    d.stop(timeout=120)
+    return t_ack, time.perf_counter() - t0
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--updates", type=int, default=2000)
+    p.add_argument("--users", type=int, default=50)
+    p.add_argument("--batch", type=int, default=100)
+    a = p.parse_args()
+
+    init_db()
+    n = a.updates
+    rows = []
+    for name, fn in (
+        ("webhook", lambda: bench_webhook(_make_updates(1, n, a.users))),
+        ("polling", lambda: bench_polling(_make_updates(10_000_000, n, a.users), a.batch)),
+    ):
+        t_ack, t_total = fn()
+        rows.append((name, t_ack, t_total))
+
+    print(f"updates={n} users={a.users} batch={a.batch} tmp={_TMP}")
+    print(f"{'mode':<8} {'ingest ms/upd':>14} {'ingest upd/s':>13} {'end-to-end upd/s':>17}")
+    for name, t_ack, t_total in rows:
+        print(f"{name:<8} {t_ack * 1000 / n:>14.3f} {n / t_ack:>13.0f} {n / t_total:>17.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# benchmarks/bench_memory_store.py
+# -*- coding: utf-8 -*-
+"""
+เทียบงาน DB ต่อหนึ่งเทิร์นแชต: เปิด connection ใหม่ทุกครั้ง (SQLITE_POOL=0 แบบเดิม) vs pool ต่อเธรด
+vs pool + write-behind ของ append_message (group commit, MEMORY_WRITE_BEHIND)
+- เทิร์นจำลองตามเส้นทาง handle_message: get_or_create_user → append_message(user) → get_recent_context
+  → get_summary → append_message(assistant) → count_messages (เช็กว่าต้องสรุปไหม)
+- --threads เธรดทำงานพร้อมกัน (เหมือน worker ของ dispatcher) ผู้ใช้ --users คน DB ชั่วคราว
+- วัด: connection ที่เปิดต่อเทิร์น, commit ของ append ต่อเทิร์น, เวลา DB ต่อเทิร์น p50/p95, throughput รวม
+  (--sync FULL ให้ทุก commit fsync จริง ใกล้ดิสก์ของ production ที่ commit แพง)
+
+ใช้งาน:
+  python benchmarks/bench_memory_store.py [--turns 3000] [--threads 8] [--users 200] [--sync NORMAL|FULL]
+"""
+
+from __future__ import annotations
+import argparse
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+
+_TMP = tempfile.mkdtemp(prefix="bench_memory_")
+os.environ.setdefault("BOT_MEMORY_DB_FILE", os.path.join(_TMP, "memory.db"))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import utils.memory_store as ms  # noqa: E402
+
+
+def _turn(uid: int, i: int) -> None:
+    ms.get_or_create_user({"id": uid, "first_name": f"u{uid}", "username": f"user{uid}"})
+    ms.append_message(uid, "user", f"คำถามที่ {i} ของผู้ใช้ {uid} เรื่องราคาทองวันนี้")
+    ms.get_recent_context(uid)
+    ms.get_summary(uid)
+    ms.append_message(uid, "assistant", f"คำตอบที่ {i}: ราคาทองวันนี้ขึ้น 100 บาท " * 3)
+    ms.count_messages(uid)
+
+
+def _pct(vals, p):
+    vals = sorted(vals)
+    return vals[min(len(vals) - 1, int(math.ceil(p * len(vals))) - 1)]
+
+
+def run(mode: str, args) -> None:
+    ms.SQLITE_POOL = mode != "per-call"
+    ms.MEMORY_WRITE_BEHIND = mode == "write-behind"
+    ms._wb_closed = False
+    ms.close_db_connections()
+    opened0 = ms.db_pool_stats()["opened"]
+    lat = []
+    lock = threading.Lock()
+    per_thread = args.turns // args.threads
+
+    def worker(w: int):
+        mine = []
+        for i in range(per_thread):
+            uid = 1000 + (w * per_thread + i) % args.users
+            t0 = time.perf_counter()
+            _turn(uid, i)
+            mine.append((time.perf_counter() - t0) * 1000)
+        with lock:
+            lat.extend(mine)
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(w,)) for w in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wb = ms.write_behind_stats()
+    ms.flush_pending_messages()
+    wall = time.perf_counter() - t0
+    opened = ms.db_pool_stats()["opened"] - opened0
+    commits = wb.get("flushes", 0) + wb.get("sync_flushes", 0) if wb.get("active") else 2 * len(lat)
+    print(f"{mode:<12} turns={len(lat):>5} connections/turn={opened / len(lat):6.3f} "
+          f"append_commits/turn={commits / len(lat):5.3f} "
+          f"db_ms/turn p50={_pct(lat, .5):6.2f} p95={_pct(lat, .95):6.2f}  throughput={len(lat) / wall:7.0f} turns/s")
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--turns", type=int, default=3000)
+    p.add_argument("--threads", type=int, default=8)
+    p.add_argument("--users", type=int, default=200)
+    p.add_argument("--sync", default="NORMAL", choices=["NORMAL", "FULL"])
+    args = p.parse_args()
+    if args.sync == "FULL":
+        _open = ms._open_connection
+
+        def _open_full():
+            conn = _open()
+            conn.execute("PRAGMA synchronous=FULL;")
+            return conn
+        ms._open_connection = _open_full
+    ms.init_db()
+    print(f"db={ms.DB_PATH} threads={args.threads} users={args.users} synchronous={args.sync}")
+    for mode in ("per-call", "pool/thread", "write-behind"):
+        run(mode, args)
+
+
+if __name__ == "__main__":
+    main()
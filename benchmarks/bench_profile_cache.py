@@ -0,0 +1,107 @@
+# benchmarks/bench_profile_cache.py
+# -*- coding: utf-8 -*-
+"""
+เวลาต่อครั้งของ get_or_create_user (ต้นทางทุก update) + get_user_by_id: ไม่มี cache vs cache โปรไฟล์
+- --threads เธรดพร้อมกัน ผู้ใช้ --users คน (Zipf: คนคุยบ่อยไม่กี่คน + หางยาว) DB ชั่วคราว
+- วัด p50/p95 ต่อการเรียก (µs), การเรียกต่อวินาที, hit rate
+- ความสอดคล้องข้ามโปรเซส: fork โปรเซสลูก (แทน worker อีกตัวของ gunicorn) ให้เปลี่ยน status
+  แล้ววัดว่าโปรเซสแม่ที่ cache ไว้เห็นค่าใหม่หลังกี่ ms (ควร ≤ MEMORY_PROFILE_GEN_CHECK_MS)
+
+ใช้งาน:
+  python benchmarks/bench_profile_cache.py [--calls 40000] [--threads 8] [--users 2000]
+"""
+
+from __future__ import annotations
+import argparse
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+_TMP = tempfile.mkdtemp(prefix="bench_profile_")
+os.environ.setdefault("BOT_MEMORY_DB_FILE", os.path.join(_TMP, "memory.db"))
+os.environ.setdefault("MEMORY_WRITE_BEHIND", "0")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import utils.memory_store as ms  # noqa: E402
+
+
+def _user(uid: int):
+    return {"id": uid, "first_name": f"u{uid}", "username": f"user{uid}"}
+
+
+def _pct(vals, p):
+    vals = sorted(vals)
+    return vals[min(len(vals) - 1, int(math.ceil(p * len(vals))) - 1)]
+
+
+def run(name: str, cache: bool, seq, args) -> None:
+    ms.MEMORY_PROFILE_CACHE = cache
+    ms._profiles = None
+    lat = []
+    lock = threading.Lock()
+    chunk = len(seq) // args.threads
+
+    def worker(w: int):
+        mine = []
+        for i, uid in enumerate(seq[w * chunk:(w + 1) * chunk]):
+            t0 = time.perf_counter()
+            ms.get_or_create_user(_user(uid))
+            if i % 10 == 0:
+                ms.get_user_by_id(uid)          # หน้าที่แอดมิน/อนุมัติ
+            mine.append((time.perf_counter() - t0) * 1e6)
+        with lock:
+            lat.extend(mine)
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(w,)) for w in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    st = ms.profile_cache_stats()
+    hit = st["hits"] / max(1, st["hits"] + st["misses"]) if st.get("active") else 0.0
+    print(f"{name:<9} p50={_pct(lat, .5):6.1f}us p95={_pct(lat, .95):7.1f}us "
+          f"calls/s={len(lat) / wall:8.0f} hit_rate={hit:5.1%}")
+
+
+def cross_process(uid: int) -> None:
+    ms.MEMORY_PROFILE_CACHE = True
+    ms._profiles = None
+    ms.get_or_create_user(_user(uid))                       # อยู่ใน cache ของโปรเซสนี้
+    pid = os.fork()
+    if pid == 0:
+        ms.update_user_status(uid, "removed")               # "worker อื่น" แก้
+        os._exit(0)
+    os.waitpid(pid, 0)
+    t0 = time.perf_counter()
+    while ms.get_or_create_user(_user(uid))["profile"]["status"] != "removed":
+        time.sleep(0.001)
+    print(f"cross-process: status change visible after {(time.perf_counter() - t0) * 1000:.0f}ms "
+          f"(gen_check={ms.MEMORY_PROFILE_GEN_CHECK_MS}ms)")
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--calls", type=int, default=40000)
+    p.add_argument("--threads", type=int, default=8)
+    p.add_argument("--users", type=int, default=2000)
+    args = p.parse_args()
+
+    rnd = random.Random(7)
+    seq = rnd.choices(range(1000, 1000 + args.users), weights=[1.0 / (i + 1) for i in range(args.users)], k=args.calls)
+    for uid in set(seq):
+        ms.get_or_create_user(_user(uid))
+    print(f"threads={args.threads} users={args.users} calls={args.calls} db={ms.DB_PATH}")
+    run("no-cache", False, seq, args)
+    run("cache", True, seq, args)
+    if hasattr(os, "fork"):
+        cross_process(seq[0])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# benchmarks/bench_providers.py
+# -*- coding: utf-8 -*-
+"""
+วัด overhead ต่อการเรียก LLM: สร้าง OpenAI client ใหม่ทุกครั้ง (แบบเดิม) vs client จาก providers.registry
+- ใช้ stub server ในเครื่อง (ตอบ /v1/chat/completions แบบสำเร็จรูปทันที) → เวลาที่วัดได้คือ overhead ล้วน
+  (สร้าง client + เปิด connection + serialize) ไม่รวมเวลาคิดของโมเดล
+- นับจำนวน TCP connection ที่ stub ได้รับ → เห็นชัดว่า pool ใช้ connection ซ้ำ
+- --tls CERT KEY: เปิด stub เป็น HTTPS (ใช้ self-signed ได้ — จะตั้ง SSL_CERT_FILE ให้)
+  เพื่อรวมค่า TLS handshake แบบเดียวกับ api.openai.com จริง
+
+ใช้งาน:
+  python benchmarks/bench_providers.py [--calls 200] [--threads 8] [--tls cert.pem key.pem]
+  (ต้องติดตั้ง openai/httpx ตาม requirements.txt)
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import os
+import ssl
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+_REPLY = json.dumps({
+    "id": "chatcmpl-bench",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "bench",
+    "choices": [{"index": 0, "finish_reason": "stop",
+                 "message": {"role": "assistant", "content": "สวัสดีครับ"}}],
+    "usage": {"prompt_tokens": 10, "completion_tokens": 3, "total_tokens": 13},
+}).encode("utf-8")
+
+_CONNECTIONS = 0
+_CONN_LOCK = threading.Lock()
+
+
+class _Stub(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive
+
+    def setup(self):
+        global _CONNECTIONS
+        with _CONN_LOCK:
+            _CONNECTIONS += 1
+        super().setup()
+
+    def _reply(self, body: bytes):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self._reply(_REPLY)
+
+    def do_GET(self):   # /v1/models (warm-up)
+        self._reply(b'{"object":"list","data":[]}')
+
+    def log_message(self, *_a):
+        pass
+
+
+def _start_stub(tls):
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _Stub)
+    scheme = "http"
+    if tls:
+        ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ctx.load_cert_chain(tls[0], tls[1])
+        srv.socket = ctx.wrap_socket(srv.socket, server_side=True)
+        scheme = "https"
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv, f"{scheme}://127.0.0.1:{srv.server_address[1]}/v1"
+
+
+_MSGS = [{"role": "system", "content": "bench"}, {"role": "user", "content": "สวัสดี"}]
+
+
+def _call_fresh(base_url):
+    from openai import OpenAI
+    client = OpenAI(api_key="sk-bench", base_url=base_url)   # พฤติกรรมเดิมของ call_gpt
+    client.chat.completions.create(model="bench", messages=_MSGS, max_tokens=16)
+
+
+def _call_pooled(_base_url):
+    from providers.registry import get_openai_client
+    get_openai_client().chat.completions.create(model="bench", messages=_MSGS, max_tokens=16)
+
+
+def _run(label, fn, base_url, calls, threads):
+    global _CONNECTIONS
+    with _CONN_LOCK:
+        _CONNECTIONS = 0
+    lat = []
+
+    def one(_i):
+        t0 = time.perf_counter()
+        fn(base_url)
+        lat.append((time.perf_counter() - t0) * 1000.0)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as ex:
+        list(ex.map(one, range(calls)))
+    wall = time.perf_counter() - t0
+    lat.sort()
+    print(f"{label:<8} calls={calls} threads={threads} "
+          f"mean={statistics.mean(lat):.2f}ms p50={lat[len(lat) // 2]:.2f}ms "
+          f"p95={lat[int(len(lat) * 0.95) - 1]:.2f}ms wall={wall:.2f}s connections={_CONNECTIONS}")
+    return statistics.mean(lat)
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--calls", type=int, default=200)
+    p.add_argument("--threads", type=int, default=8)
+    p.add_argument("--tls", nargs=2, metavar=("CERT", "KEY"))
+    args = p.parse_args()
+
+    srv, base_url = _start_stub(args.tls)
+    if args.tls:
+        os.environ["SSL_CERT_FILE"] = args.tls[0]
+    os.environ["OPENAI_API_KEY"] = "sk-bench"
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("PROVIDER_POOL_SIZE", str(args.threads))
+
+    from providers.registry import warm_up
+    warm_up(background=False)
+
+    fresh = _run("fresh", _call_fresh, base_url, args.calls, args.threads)
+    pooled = _run("pooled", _call_pooled, base_url, args.calls, args.threads)
+    print(f"overhead removed: {fresh - pooled:.2f} ms/call ({fresh / max(pooled, 1e-9):.1f}x)")
+    srv.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# benchmarks/bench_rate_limit.py
+# -*- coding: utf-8 -*-
+"""
+จำลองช่วงคนใช้เยอะเกินโควตา OpenAI: เทียบ retry แบบเดิม (429 → sleep 0.8s → ยิงซ้ำ → ล้มค่อยไป Gemini)
+กับ providers.rate_limit (รอในคิวได้ไม่เกิน max_wait → BudgetExceeded → ไป Gemini ทันที)
+- provider จำลอง: token bucket ฝั่งเซิร์ฟเวอร์ตาม --rpm (เกิน = 429 หลังเสีย RTT) + เวลาตอบ log-normal
+- โหลด: --threads เธรดยิงต่อเนื่อง --seconds วินาที (เกินโควตาประมาณ --threads/latency เท่า)
+- วัด: เวลาต่อข้อความ p50/p95/max, จำนวน 429 ที่โดนจริง, สัดส่วนที่ตอบจาก fallback
+
+ใช้งาน:
+  python benchmarks/bench_rate_limit.py [--rpm 600] [--threads 24] [--seconds 6] [--max-wait-ms 150]
+"""
+
+from __future__ import annotations
+import argparse
+import math
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from providers.rate_limit import BudgetExceeded, RateLimiter  # noqa: E402
+
+RTT_429 = 0.03          # 429 กลับมาเร็ว แต่ก็เสีย round-trip
+
+
+class FakeProvider:
+    def __init__(self, rpm: float, median_s: float, seed: int):
+        self._rate = rpm / 60.0
+        self._cap = max(1.0, rpm / 60.0)        # เซิร์ฟเวอร์ให้ burst ~1 วินาที
+        self._level = self._cap
+        self._last = time.time()
+        self._lock = threading.Lock()
+        self._median = median_s
+        self._rnd = random.Random(seed)
+        self.calls = 0
+        self.e429 = 0
+
+    def call(self) -> str:
+        with self._lock:
+            now = time.time()
+            self._level = min(self._cap, self._level + (now - self._last) * self._rate)
+            self._last = now
+            self.calls += 1
+            ok = self._level >= 1
+            if ok:
+                self._level -= 1
+            else:
+                self.e429 += 1
+            dur = self._median * math.exp(self._rnd.gauss(0, 0.3))
+        if not ok:
+            time.sleep(RTT_429)
+            raise RuntimeError("Error code: 429 - rate limit exceeded")
+        time.sleep(dur)
+        return "ok"
+
+
+def _old_way(primary: FakeProvider, fallback: FakeProvider) -> str:
+    for attempt in range(2):
+        try:
+            return "primary:" + primary.call()
+        except RuntimeError:
+            if attempt == 0:
+                time.sleep(0.8)
+    return "fallback:" + fallback.call()
+
+
+def _new_way(primary: FakeProvider, fallback: FakeProvider, lim: RateLimiter, max_wait_ms: float) -> str:
+    try:
+        with lim.acquire(0, max_wait_ms):
+            return "primary:" + primary.call()
+    except BudgetExceeded:
+        pass
+    except RuntimeError:
+        lim.penalize(1.0)
+    return "fallback:" + fallback.call()
+
+
+def _pct(vals, p):
+    vals = sorted(vals)
+    return vals[min(len(vals) - 1, int(math.ceil(p * len(vals))) - 1)]
+
+
+def run(mode: str, args) -> None:
+    primary = FakeProvider(args.rpm, args.median_ms / 1000.0, seed=1)
+    fallback = FakeProvider(args.rpm * 100, args.median_ms * 1.3 / 1000.0, seed=2)
+    lim = RateLimiter("openai", "sim", rpm=args.rpm, max_concurrency=args.threads, max_waiters=args.threads, burst_sec=1.0)
+    lat, used = [], []
+    lock = threading.Lock()
+    stop = time.time() + args.seconds
+
+    def worker():
+        while time.time() < stop:
+            t0 = time.time()
+            out = _old_way(primary, fallback) if mode == "retry-sleep" else _new_way(primary, fallback, lim, args.max_wait_ms)
+            with lock:
+                lat.append((time.time() - t0) * 1000)
+                used.append(out.split(":", 1)[0])
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    fb = used.count("fallback") / len(used)
+    print(f"{mode:<12} msgs={len(lat):>5} p50={_pct(lat, .5):7.0f}ms p95={_pct(lat, .95):7.0f}ms max={max(lat):7.0f}ms "
+          f"openai_calls={primary.calls:>5} 429s={primary.e429:>5} fallback={fb:6.1%}")
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--rpm", type=float, default=600)
+    p.add_argument("--threads", type=int, default=24)
+    p.add_argument("--seconds", type=float, default=6)
+    p.add_argument("--median-ms", type=float, default=150)
+    p.add_argument("--max-wait-ms", type=float, default=150)
+    args = p.parse_args()
+    for mode in ("retry-sleep", "limiter"):
+        run(mode, args)
+
+
+if __name__ == "__main__":
+    main()
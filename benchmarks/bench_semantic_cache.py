@@ -0,0 +1,187 @@
+# benchmarks/bench_semantic_cache.py
+# -*- coding: utf-8 -*-
+"""
+วัดคุณภาพ + ความเร็วของ orchestrator.semantic_cache
+1) recall/precision บนชุดคำถามถอดความ (paraphrase) สังเคราะห์ภาษาไทย
+   - ใส่คำถาม "ต้นฉบับ" ของแต่ละ entity (ทอง/น้ำมัน/อากาศ/หุ้น/ค่าเงิน/หวย × วัน/เมือง/สัญลักษณ์ ...)
+   - entity ราว 1/4 ไม่ถูกใส่ (held-out) → คำถามของกลุ่มนี้ที่ hit ถือเป็น false positive
+   - ถอดความด้วยคำขึ้นต้น/ลงท้าย/คำพ้อง/เว้นวรรค/พิมพ์วรรณยุกต์ผิด
+   - TP = hit และได้คำตอบของ entity เดียวกัน, FP = hit ผิด entity, FN = ไม่ hit ทั้งที่มีใน cache
+2) คู่คำถามภาษาไทยจริงที่ "คล้ายแต่คนละเรื่อง" (จังหวัด/ธนาคาร/สกุลเงิน) — ต้องไม่ hit
+   (ชุดสังเคราะห์ข้อ 1 จับไม่ได้ เพราะ entity ต่างกันหลายตัวอักษร Jaccard จึงต่ำอยู่แล้ว)
+3) latency ของ lookup เมื่อมีรายการ 100k (เติมด้วยคำถามสุ่ม) — p50/p99 (µs)
+
+ใช้งาน:
+  python benchmarks/bench_semantic_cache.py [--entries 100000] [--threshold 0.6] [--paraphrases 6]
+"""
+
+from __future__ import annotations
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from orchestrator.semantic_cache import SemanticCache, shingles, thai_normalize  # noqa: E402
+
+DAYS = ["วันนี้", "เมื่อวาน", "พรุ่งนี้", "สัปดาห์นี้"]
+CITIES = ["กรุงเทพ", "เชียงใหม่", "ภูเก็ต", "ขอนแก่น", "หาดใหญ่", "พัทยา", "โคราช", "อุดรธานี",
+          "เชียงราย", "ระยอง", "สุราษฎร์ธานี", "นครสวรรค์", "บางนา", "หัวหิน", "ลำปาง", "ตราด"]
+FUELS = ["ดีเซล", "แก๊สโซฮอล์ 95", "แก๊สโซฮอล์ 91", "E20", "เบนซิน"]
+STOCKS = ["PTT", "AOT", "CPALL", "KBANK", "SCB", "ADVANC", "GULF", "BDMS", "DELTA", "TRUE",
+          "AAPL", "TSLA", "NVDA", "MSFT", "GOOGL"]
+CURRENCIES = ["ดอลลาร์", "เยน", "ยูโร", "หยวน", "วอน", "ปอนด์"]
+MONTHS = ["มกราคม", "กุมภาพันธ์", "มีนาคม", "เมษายน", "พฤษภาคม", "มิถุนายน",
+          "กรกฎาคม", "สิงหาคม", "กันยายน", "ตุลาคม", "พฤศจิกายน", "ธันวาคม"]
+
+PREFIXES = ["", "", "ขอ", "ช่วยบอก", "อยากรู้", "ขอทราบ"]
+SUFFIXES = ["", "", "เท่าไหร่", "เท่าไร", "กี่บาท", "ครับ", "ค่ะ", "หน่อย", "ไหม", "เท่าไหร่ครับ", "หน่อยค่ะ"]
+
+
+def _entities():
+    """คืน [(entity_id, canonical, [รูปแบบย่อย/คำพ้อง ...])]"""
+    out = []
+    for d in DAYS:
+        out.append((f"gold|{d}", f"ราคาทอง{d}", [f"ทอง{d}", f"ราคาทองคำ{d}", f"ทองคำ {d}"]))
+        for f in FUELS:
+            out.append((f"oil|{f}|{d}", f"ราคาน้ำมัน{f}{d}", [f"น้ำมัน{f} {d}", f"ราคา{f}{d}", f"น้ำมันเชื้อเพลิง {f} {d}"]))
+        for c in CITIES:
+            out.append((f"wx|{c}|{d}", f"อากาศ{c}{d}", [f"พยากรณ์อากาศ{c}{d}", f"สภาพอากาศ {c} {d}", f"อากาศที่{c}{d}"]))
+        for s in STOCKS:
+            out.append((f"stk|{s}|{d}", f"หุ้น {s} {d}", [f"ราคาหุ้น {s} {d}", f"หุ้น{s}{d}", f"{s} {d}"]))
+        for cur in CURRENCIES:
+            out.append((f"fx|{cur}|{d}", f"ค่าเงิน{cur}{d}", [f"อัตราแลกเปลี่ยน{cur}{d}", f"เรทเงิน{cur} {d}", f"ค่าเงิน {cur} {d}"]))
+    for n in (1, 16):
+        for m in MONTHS:
+            out.append((f"lotto|{n}|{m}", f"หวยงวด {n} {m}", [f"ลอตเตอรี่งวด {n} {m}", f"สลากกินแบ่งงวด {n} {m}", f"หวย {n} {m}"]))
+    return out
+
+
+# (คำถามที่อยู่ใน cache, คำถามใหม่) — ความหมายต่างกัน ต้องไม่ได้คำตอบของอีกฝั่ง
+CONFUSABLE = [
+    ("สภาพอากาศที่จังหวัดเชียงใหม่วันนี้เป็นอย่างไรบ้าง", "สภาพอากาศที่จังหวัดเชียงรายวันนี้เป็นอย่างไรบ้าง"),
+    ("อากาศสุรินทร์พรุ่งนี้", "อากาศสุโขทัยพรุ่งนี้"),
+    ("ดอกเบี้ยเงินฝากธนาคารกสิกรไทยเท่าไหร่", "ดอกเบี้ยเงินฝากธนาคารกรุงไทยเท่าไหร่"),
+    ("เบอร์คอลเซ็นเตอร์กสิกรไทย", "เบอร์คอลเซ็นเตอร์กรุงไทย"),
+    ("เรทเงินดอลลาร์วันนี้ครับ", "เรทเงินยูโรวันนี้ครับ"),
+    ("ค่าเงินดอลลาร์วันนี้", "ค่าเงินดอลลาร์สิงคโปร์วันนี้"),
+    ("ราคาหุ้น PTT วันนี้", "ราคาหุ้น PTTEP วันนี้"),
+]
+
+
+def bench_confusable(threshold: float):
+    false_hits = 0
+    print(f"confusable pairs threshold={threshold}")
+    for cached, query in CONFUSABLE:
+        cache = SemanticCache(threshold=threshold)
+        cache.put(cached, "A", ttl_sec=3600)
+        a, b = shingles(thai_normalize(cached)), shingles(thai_normalize(query))
+        jac = len(a & b) / len(a | b)
+        hit = cache.lookup(query) is not None
+        false_hits += hit
+        print(f"  jaccard={jac:.3f} {'FALSE HIT' if hit else 'miss     '} {cached} | {query}")
+    print(f"  false_hits={false_hits}/{len(CONFUSABLE)}")
+
+
+def _typo(s: str, rnd: random.Random) -> str:
+    # พิมพ์วรรณยุกต์ผิด/ตก (พบบ่อยในแชต)
+    tones = "่้๊๋"
+    if rnd.random() < 0.3:
+        s = "".join(ch for ch in s if ch not in tones)
+    elif rnd.random() < 0.3:
+        s = s.replace("เท่าไหร่", "เท่าไร่")
+    return s
+
+
+def _paraphrase(base: str, rnd: random.Random) -> str:
+    s = rnd.choice(PREFIXES) + base + rnd.choice(SUFFIXES)
+    if rnd.random() < 0.3:
+        s = s.replace("วันนี้", "ตอนนี้วันนี้")
+    if rnd.random() < 0.3:
+        s = s + rnd.choice(["?", "??", " ?", "ๆ"])
+    if rnd.random() < 0.3:
+        s = s.replace(" ", "") if rnd.random() < 0.5 else s.replace(" ", "  ")
+    return _typo(s, rnd)
+
+
+_SYLL = ["กา", "ขน", "คม", "งู", "จด", "ฉิ่ง", "ชม", "ซอง", "ดาว", "ตึก", "ถัง", "ทาง", "นก", "บ้าน",
+         "ปลา", "ผัก", "ฝน", "พระ", "ฟ้า", "ภู", "มด", "ยา", "รถ", "ลม", "วัด", "ศาล", "สวน", "หมอ", "อ่าง", "ฮา"]
+
+
+def _random_question(rnd: random.Random) -> str:
+    return "".join(rnd.choice(_SYLL) for _ in range(rnd.randint(3, 8))) + rnd.choice(["", "ยังไง", "คืออะไร", "ที่ไหนดี"])
+
+
+def bench_quality(threshold: float, per_entity: int, seed: int = 7):
+    rnd = random.Random(seed)
+    ents = _entities()
+    rnd.shuffle(ents)
+    held_out = set(e[0] for e in ents[: len(ents) // 4])
+    cache = SemanticCache(threshold=threshold, max_entries=len(ents) + 10)
+    for eid, canonical, _variants in ents:
+        if eid not in held_out:
+            cache.put(canonical, eid, ttl_sec=3600)
+
+    tp = fp = fn = tn = 0
+    for eid, canonical, variants in ents:
+        for _ in range(per_entity):
+            q = _paraphrase(rnd.choice(variants + [canonical]), rnd)
+            hit = cache.lookup(q)
+            if eid in held_out:
+                if hit is None:
+                    tn += 1
+                else:
+                    fp += 1
+            elif hit is None:
+                fn += 1
+            elif hit[0] == eid:
+                tp += 1
+            else:
+                fp += 1
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    print(f"quality threshold={threshold} entities={len(ents)} held_out={len(held_out)} queries={tp + fp + fn + tn}")
+    print(f"  TP={tp} FP={fp} FN={fn} TN={tn}  precision={precision:.3f} recall={recall:.3f}")
+
+
+def bench_latency(entries: int, threshold: float, seed: int = 11):
+    rnd = random.Random(seed)
+    ents = _entities()
+    cache = SemanticCache(threshold=threshold, max_entries=entries + len(ents))
+    t0 = time.perf_counter()
+    for eid, canonical, _v in ents:
+        cache.put(canonical, eid, ttl_sec=3600)
+    for i in range(entries - len(ents)):
+        cache.put(_random_question(rnd) + str(i % 97), f"r{i}", ttl_sec=3600)
+    build = time.perf_counter() - t0
+
+    queries = [_paraphrase(rnd.choice(v + [c]), rnd) for _e, c, v in ents] * 3
+    queries += [_random_question(rnd) for _ in range(len(queries))]
+    lat = []
+    for q in queries:
+        t = time.perf_counter()
+        cache.lookup(q)
+        lat.append((time.perf_counter() - t) * 1e6)
+    lat.sort()
+    st = cache.stats()
+    print(f"latency entries={len(cache)} build={build:.1f}s ({build / len(cache) * 1e6:.0f} us/put) "
+          f"lookups={len(lat)} p50={lat[len(lat) // 2]:.0f}us p99={lat[int(len(lat) * 0.99)]:.0f}us "
+          f"max={lat[-1]:.0f}us avg_candidates={st['avg_candidates']}")
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--entries", type=int, default=100_000)
+    p.add_argument("--threshold", type=float, default=0.6)
+    p.add_argument("--paraphrases", type=int, default=6)
+    args = p.parse_args()
+    for th in sorted({0.5, args.threshold, 0.7, 0.8}):
+        bench_quality(th, args.paraphrases)
+    bench_confusable(args.threshold)
+    bench_latency(args.entries, args.threshold)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# benchmarks/bench_session_store.py
+# -*- coding: utf-8 -*-
+"""
+เทียบที่เก็บ ChatSession แบบเดิม (dict + _LAST_USED, ไล่ออกด้วย min() = O(n), จำกัดแค่จำนวน)
+กับ utils.session_store.SessionStore (OrderedDict O(1) + เพดานเทิร์น/bytes ต่อ session + bytes รวม)
+- โหลด: ผู้ใช้ --users คน เลือกแบบ Zipf (คนคุยบ่อยไม่กี่คน + หางยาว) --ops ครั้ง
+  แต่ละเทิร์นเพิ่ม history ~--turn-bytes bytes (session object จำลอง = list ของ bytes)
+- วัด: เวลาเฉลี่ยต่อเทิร์น (ensure + note_turn), bytes ของ history ที่ค้างในหน่วยความจำตอนจบ/สูงสุด,
+  session ที่ใหญ่ที่สุด
+
+ใช้งาน:
+  python benchmarks/bench_session_store.py [--users 5000] [--cap 2000] [--ops 200000] [--turn-bytes 1200]
+"""
+
+from __future__ import annotations
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.session_store import SessionStore  # noqa: E402
+
+
+def _zipf_users(rnd: random.Random, users: int, ops: int):
+    weights = [1.0 / (i + 1) for i in range(users)]
+    return rnd.choices(range(users), weights=weights, k=ops)
+
+
+def run_old(seq, cap, turn_bytes):
+    sessions, last_used = {}, {}
+    peak = total = 0
+    t0 = time.perf_counter()
+    for uid in seq:
+        chat = sessions.get(uid)
+        if chat is None:
+            chat = [0]
+            sessions[uid] = chat
+            last_used[uid] = time.time()
+            if len(sessions) > cap:
+                oldest = min(last_used, key=last_used.get)
+                if oldest != uid:
+                    total -= sessions.pop(oldest)[0]
+                    last_used.pop(oldest, None)
+        else:
+            last_used[uid] = time.time()
+        chat[0] += turn_bytes
+        total += turn_bytes
+        peak = max(peak, total)
+    us = (time.perf_counter() - t0) / len(seq) * 1e6
+    return us, total, peak, max(c[0] for c in sessions.values()), None
+
+
+def run_new(seq, cap, turn_bytes, max_turns, max_bytes, total_bytes):
+    store = SessionStore(max_sessions=cap, idle_ttl_sec=0, max_turns=max_turns,
+                         max_session_bytes=max_bytes, max_total_bytes=total_bytes)
+    peak = 0
+    t0 = time.perf_counter()
+    for uid in seq:
+        chat = store.get(uid)
+        if chat is None:
+            chat = [0]
+            store.put(uid, chat, 0)
+        chat[0] += turn_bytes
+        store.note_turn(uid, turn_bytes, chat)
+        peak = max(peak, store._total_bytes)
+    us = (time.perf_counter() - t0) / len(seq) * 1e6
+    st = store.stats()
+    return us, st["bytes"], peak, max((e.value[0] for e in store._data.values()), default=0), st["evicted"]
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--users", type=int, default=5000)
+    p.add_argument("--cap", type=int, default=2000)
+    p.add_argument("--ops", type=int, default=200000)
+    p.add_argument("--turn-bytes", type=int, default=1200)
+    p.add_argument("--max-turns", type=int, default=40)
+    p.add_argument("--max-bytes", type=int, default=64 * 1024)
+    p.add_argument("--total-bytes", type=int, default=32 * 1024 * 1024)
+    args = p.parse_args()
+
+    seq = _zipf_users(random.Random(7), args.users, args.ops)
+    rows = [
+        ("dict+min", run_old(seq, args.cap, args.turn_bytes)),
+        ("SessionStore", run_new(seq, args.cap, args.turn_bytes, args.max_turns, args.max_bytes, args.total_bytes)),
+    ]
+    print(f"users={args.users} cap={args.cap} ops={args.ops} turn_bytes={args.turn_bytes}")
+    for name, (us, end, peak, biggest, evicted) in rows:
+        print(f"{name:<13} {us:6.2f}us/turn  history end={end / 2**20:7.1f}MiB peak={peak / 2**20:7.1f}MiB "
+              f"largest_session={biggest / 1024:8.1f}KiB" + (f"  evicted={evicted}" if evicted else ""))
+
+
+if __name__ == "__main__":
+    main()
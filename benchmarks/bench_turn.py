@@ -0,0 +1,101 @@
+# benchmarks/bench_turn.py
+# -*- coding: utf-8 -*-
+"""
+เวลา DB ต่อเทิร์นแชตตามขนาดตาราง messages (--sizes เช่น 1k/10k/100k แถว กระจาย --users คน)
+- แบบเดิม: append_message(user) → get_recent_context → get_summary → append_message(assistant)
+- แบบใหม่: begin_turn (บันทึก + บริบท + สรุป + จำนวน บน connection/ทรานแซกชันเดียว) → commit_turn_reply
+- ทั้งสองแบบใช้ pool ต่อเธรด; --write-behind 0 ให้ append เขียนตรง (ทรานแซกชันต่อครั้ง)
+- เธรดเดียว วัด p50/p95 ต่อเทิร์น (µs) หลัง warm-up; แต่ละแบบเริ่มจากสำเนา DB เดียวกัน (ขนาดบริบทเท่ากัน)
+
+ใช้งาน:
+  python benchmarks/bench_turn.py [--sizes 1000,10000,100000] [--users 100] [--turns 2000] [--write-behind 1]
+"""
+
+from __future__ import annotations
+import argparse
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+_TMP = tempfile.mkdtemp(prefix="bench_turn_")
+os.environ.setdefault("BOT_MEMORY_DB_FILE", os.path.join(_TMP, "memory.db"))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import utils.memory_store as ms  # noqa: E402
+
+CTX_ITEMS = 30     # เท่า CONTEXT_MAX_TURNS ดีฟอลต์ (จัดตามงบ token ทีหลัง)
+
+
+def _populate(size: int, users: int) -> None:
+    ms.init_db()
+    now = int(time.time()) - size
+    with ms._get_db_connection() as conn:
+        conn.executemany(
+            "INSERT INTO users (user_id, first_name, first_seen, last_seen, status, role) VALUES (?, 'u', '', '', 'approved', 'employee')",
+            [(1000 + u,) for u in range(users)],
+        )
+        conn.executemany(
+            "INSERT INTO messages (user_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
+            [(1000 + i % users, "user" if i % 2 == 0 else "assistant", f"ข้อความเก่าที่ {i} " * 8, now + i) for i in range(size)],
+        )
+        conn.commit()
+
+
+def _old_turn(uid: int, i: int) -> None:
+    ms.append_message(uid, "user", f"คำถามที่ {i}")
+    ms.get_recent_context(uid, max_items=CTX_ITEMS, max_chars=0)
+    ms.get_summary(uid)
+    ms.append_message(uid, "assistant", f"คำตอบที่ {i} " * 10)
+
+
+def _new_turn(uid: int, i: int) -> None:
+    turn = ms.begin_turn(uid, f"คำถามที่ {i}", max_items=CTX_ITEMS, max_chars=0)
+    ms.commit_turn_reply(turn, f"คำตอบที่ {i} " * 10)
+
+
+def _pct(vals, p):
+    vals = sorted(vals)
+    return vals[min(len(vals) - 1, int(math.ceil(p * len(vals))) - 1)]
+
+
+def _measure(fn, args, rnd):
+    lat = []
+    for i in range(args.turns):
+        uid = 1000 + rnd.randrange(args.users)
+        t0 = time.perf_counter()
+        fn(uid, i)
+        lat.append((time.perf_counter() - t0) * 1e6)
+    return lat[args.turns // 10:]          # ตัดช่วง warm-up
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--sizes", default="1000,10000,100000")
+    p.add_argument("--users", type=int, default=100)
+    p.add_argument("--turns", type=int, default=2000)
+    p.add_argument("--write-behind", type=int, default=1)
+    args = p.parse_args()
+
+    print(f"users={args.users} turns={args.turns} write_behind={bool(args.write_behind)} ctx_items={CTX_ITEMS}")
+    for size in [int(x) for x in args.sizes.split(",")]:
+        template = os.path.join(_TMP, f"turn_{size}.db")
+        ms.DB_PATH = template
+        ms.MEMORY_WRITE_BEHIND = bool(args.write_behind)
+        _populate(size, args.users)
+        ms.close_db_connections()
+        for name, fn in (("old 4-call", _old_turn), ("begin/commit", _new_turn)):
+            ms.DB_PATH = os.path.join(_TMP, f"turn_{size}_{fn.__name__}.db")
+            shutil.copyfile(template, ms.DB_PATH)
+            ms._wb_closed = False
+            lat = _measure(fn, args, random.Random(size))
+            ms.flush_pending_messages()
+            print(f"messages={size:>7} {name:<13} p50={_pct(lat, .5):7.0f}us p95={_pct(lat, .95):7.0f}us "
+                  f"mean={sum(lat) / len(lat):7.0f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+# benchmarks/simulate_router.py
+# -*- coding: utf-8 -*-
+"""
+Replay log "[ORCH META] {...}" (ที่ handlers/main_handler.py พิมพ์ทุกข้อความ) เพื่อเทียบนโยบาย routing แบบ offline
+- แต่ละ record ให้ผลที่สังเกตได้จริง: engine ที่ถูกเรียก + เวลา (durations_ms) + สำเร็จไหม (model_used)
+  record ที่ตอบจาก cache / engine ถูกข้ามด้วย circuit breaker ไม่นับเป็นผลของ engine
+- นโยบาย: rules (ตาราง hybrid เดิม), gpt, gemini, adaptive (orchestrator.adaptive_router เรียนรู้ไปพร้อม replay)
+- นโยบายเลือก engine ที่ record นั้นไม่ได้เรียกจริง → สุ่มผลของ engine×intent เดียวกันจาก record ใกล้เคียง
+  (±--window record; ไม่มีเลยค่อยใช้ทั้ง log) เพื่อให้ช่วงที่ค่ายล่ม/ช้ายังสะท้อนในผลสมมุติ
+- เวลาต่อข้อความ = engine ที่เลือก (+ อีกค่ายถ้าตัวแรกล้ม — เหมือน fallback จริง)
+- สรุป: success, mean/p50/p95 (ms), สัดส่วน engine และเหตุผลการตัดสินของ adaptive
+
+ใช้งาน:
+  python benchmarks/simulate_router.py app.log [more.log ...]
+  python benchmarks/simulate_router.py --synthetic 20000 [--dump synthetic.log]
+"""
+
+from __future__ import annotations
+import argparse
+import ast
+import bisect
+import math
+import os
+import random
+import sys
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from orchestrator.adaptive_router import AdaptiveRouter  # noqa: E402
+
+MARK = "[ORCH META]"
+Outcome = Tuple[bool, float]    # (ok, ms)
+
+
+def _other(engine: str) -> str:
+    return "gemini" if engine == "gpt" else "gpt"
+
+
+def _rule(intent: str) -> str:
+    return "gemini" if intent == "lookup" else "gpt"
+
+
+# ---------- parse ----------
+def parse_lines(lines: Iterable[str]) -> List[Dict[str, Any]]:
+    out = []
+    for line in lines:
+        i = line.find(MARK)
+        if i < 0:
+            continue
+        try:
+            meta = ast.literal_eval(line[i + len(MARK):].strip())
+        except (ValueError, SyntaxError):
+            continue
+        if isinstance(meta, dict):
+            out.append(meta)
+    return out
+
+
+def observations(meta: Dict[str, Any]) -> Tuple[str, Dict[str, Outcome]]:
+    """คืน (intent key, {engine: (ok, ms)}) ของ engine ที่ถูกเรียกจริงใน record นี้"""
+    intent = meta.get("intent") or "reasoning"
+    key = f"{intent}/stream" if meta.get("stream") else intent
+    if meta.get("cache") in ("hit", "semantic"):
+        return key, {}
+    primary = meta.get("route") or _rule(intent)
+    used = meta.get("model_used")
+    durs = meta.get("durations_ms") or {}
+    skipped = set(meta.get("circuit_skipped") or ())
+    obs: Dict[str, Outcome] = {}
+    for role, engine in (("primary", primary), ("fallback", _other(primary))):
+        if engine in skipped or role not in durs:
+            continue
+        obs[engine] = (used == engine, float(durs[role]))
+    return key, obs
+
+
+# ---------- replay ----------
+class _Pools:
+    def __init__(self, records: List[Tuple[str, Dict[str, Outcome]]], rnd: random.Random, window: int):
+        self._idx: Dict[Tuple[str, str], List[int]] = defaultdict(list)
+        self._out: Dict[Tuple[str, str], List[Outcome]] = defaultdict(list)
+        self._by_engine: Dict[str, List[Outcome]] = defaultdict(list)
+        for i, (key, obs) in enumerate(records):
+            for engine, o in obs.items():
+                self._idx[(engine, key)].append(i)
+                self._out[(engine, key)].append(o)
+                self._by_engine[engine].append(o)
+        self._rnd = rnd
+        self._window = max(1, int(window))
+
+    def sample(self, engine: str, key: str, at: int) -> Outcome:
+        idx = self._idx.get((engine, key))
+        if idx:
+            lo = bisect.bisect_left(idx, at - self._window)
+            hi = bisect.bisect_right(idx, at + self._window)
+            if hi > lo:
+                return self._out[(engine, key)][self._rnd.randrange(lo, hi)]
+        pool = self._by_engine.get(engine)
+        if not pool:
+            return False, 0.0
+        return self._rnd.choice(pool)
+
+
+def _pct(vals: List[float], p: float) -> float:
+    if not vals:
+        return 0.0
+    vals = sorted(vals)
+    return vals[min(len(vals) - 1, int(math.ceil(p * len(vals))) - 1)]
+
+
+def replay(records: List[Tuple[str, Dict[str, Outcome]]], policy: str, *, seed: int = 1, window: int = 500,
+           router_kw: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    pools = _Pools(records, random.Random(seed + 1), window)
+    router = AdaptiveRouter(seed=seed, **(router_kw or {})) if policy == "adaptive" else None
+    lat: List[float] = []
+    ok_n = 0
+    share: Counter = Counter()
+    reasons: Counter = Counter()
+    for at, (key, obs) in enumerate(records):
+        intent = key.split("/", 1)[0]
+        if policy in ("gpt", "gemini"):
+            first = policy
+        elif router is not None:
+            first, why = router.choose(key, _rule(intent))
+            reasons[why.split("(", 1)[0]] += 1
+        else:
+            first = _rule(intent)
+        total = 0.0
+        ok = False
+        for engine in (first, _other(first)):
+            o = obs.get(engine) or pools.sample(engine, key, at)
+            if router is not None:
+                router.observe(engine, key, o[1], o[0])
+            total += o[1]
+            if o[0]:
+                ok = True
+                share[engine] += 1
+                break
+        ok_n += ok
+        lat.append(total)
+    n = len(lat)
+    return {
+        "policy": policy,
+        "n": n,
+        "success": round(ok_n / n, 4) if n else 0.0,
+        "mean_ms": round(sum(lat) / n, 1) if n else 0.0,
+        "p50_ms": round(_pct(lat, 0.50), 1),
+        "p95_ms": round(_pct(lat, 0.95), 1),
+        "share": {k: round(v / n, 3) for k, v in sorted(share.items())},
+        **({"decisions": dict(reasons)} if reasons else {}),
+    }
+
+
+# ---------- synthetic log ----------
+_LAT = {  # (engine, intent) → median ms ของ log-normal
+    ("gpt", "reasoning"): 1900, ("gemini", "reasoning"): 2300,
+    ("gpt", "lookup"): 2300, ("gemini", "lookup"): 1500,
+    ("gpt", "writing"): 3400, ("gemini", "writing"): 2500,
+}
+
+
+def synthetic(n: int, seed: int = 3) -> List[str]:
+    """log แบบ production ที่ใช้ตาราง hybrid; ช่วงกลาง gpt error 35%, ช่วงท้าย gemini ช้าลง 2.5 เท่า"""
+    rnd = random.Random(seed)
+    lines = []
+    for i in range(n):
+        phase = i / max(1, n)
+        intent = rnd.choices(["reasoning", "lookup", "writing"], weights=[5, 3, 2])[0]
+        primary = _rule(intent)
+
+        def outcome(engine: str) -> Outcome:
+            ms = _LAT[(engine, intent)] * math.exp(rnd.gauss(0, 0.35))
+            fail = 0.02
+            if engine == "gpt" and 0.4 <= phase < 0.6:
+                fail = 0.35
+            if engine == "gemini" and phase >= 0.8:
+                ms *= 2.5
+            return rnd.random() >= fail, ms
+
+        meta: Dict[str, Any] = {"intent": intent, "route": primary, "fallback": None, "durations_ms": {}}
+        ok, ms = outcome(primary)
+        meta["durations_ms"]["primary"] = int(ms)
+        if ok:
+            meta["model_used"] = primary
+        else:
+            meta["primary_error"] = "429"
+            ok2, ms2 = outcome(_other(primary))
+            meta["durations_ms"]["fallback"] = int(ms2)
+            meta["fallback"] = ok2
+            if ok2:
+                meta["model_used"] = _other(primary)
+        lines.append(f"{MARK} {meta!r}")
+    return lines
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("logs", nargs="*")
+    p.add_argument("--synthetic", type=int, default=0, help="สร้าง log สังเคราะห์ N ข้อความแทนการอ่านไฟล์")
+    p.add_argument("--dump", default="", help="บันทึก log สังเคราะห์ลงไฟล์")
+    p.add_argument("--min-samples", type=int, default=10)
+    p.add_argument("--margin", type=float, default=0.2)
+    p.add_argument("--explore", type=float, default=0.05)
+    p.add_argument("--window", type=int, default=500, help="ระยะ record ที่ใช้สุ่มผลสมมุติ")
+    p.add_argument("--seed", type=int, default=1)
+    args = p.parse_args()
+
+    if args.synthetic:
+        lines = synthetic(args.synthetic)
+        if args.dump:
+            with open(args.dump, "w", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+    else:
+        lines = []
+        for path in args.logs:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                lines.extend(f)
+    metas = parse_lines(lines)
+    records = [r for r in (observations(m) for m in metas) if r[1]]
+    print(f"records={len(metas)} usable={len(records)}")
+    if not records:
+        return
+    kw = {"min_samples": args.min_samples, "switch_margin": args.margin, "explore": args.explore}
+    for policy in ("rules", "gpt", "gemini", "adaptive"):
+        print(replay(records, policy, seed=args.seed, window=args.window, router_kw=kw))
+
+
+if __name__ == "__main__":
+    main()
@@ -102,9 +102,43 @@ GEMINI_MODEL_DIALOGUE = _first(
     default="gemini-1.5-pro",
 )
 
-ROUTER_MODE           = env("ROUTER_MODE", "hybrid")   # hybrid | gpt | gemini
+ROUTER_MODE           = env("ROUTER_MODE", "hybrid")   # hybrid | gpt | gemini | adaptive
 ROUTER_MIN_CONFIDENCE = env_float("ROUTER_MIN_CONFIDENCE", 0.55, min_v=0.0, max_v=1.0)
 
+# ROUTER_MODE=adaptive: EWMA เวลาตอบ/อัตราสำเร็จต่อ (engine, intent) → เลือกค่ายที่ expected latency ดีสุด
+ADAPTIVE_ALPHA          = env_float("ADAPTIVE_ALPHA", 0.2, min_v=0.01, max_v=1.0)
+ADAPTIVE_MIN_SAMPLES    = env_int("ADAPTIVE_MIN_SAMPLES", 10, min_v=1)            # น้อยกว่านี้ = cold → ใช้ตารางกฎ
+ADAPTIVE_MIN_SUCCESS    = env_float("ADAPTIVE_MIN_SUCCESS", 0.9, min_v=0.0, max_v=1.0)
+ADAPTIVE_SWITCH_MARGIN  = env_float("ADAPTIVE_SWITCH_MARGIN", 0.2, min_v=0.0, max_v=0.9)   # ต้องเร็วกว่ากี่ % จึงสลับจากกฎ
+ADAPTIVE_EXPLORE        = env_float("ADAPTIVE_EXPLORE", 0.05, min_v=0.0, max_v=0.5)
+ADAPTIVE_PINNED_INTENTS = env_list("ADAPTIVE_PINNED_INTENTS", ["writing"])        # intent ที่ยึดตารางกฎเสมอ
+ADAPTIVE_STATS_FILE     = env("ADAPTIVE_STATS_FILE", os.path.join(DATA_DIR, "router_stats.json"))
+
+# งบ token ของบริบทต่อคำขอ (system + สรุป + ข้อความล่าสุด + ข้อความปัจจุบัน) — นับต่อโมเดลด้วย utils.token_budget
+CONTEXT_BUDGET_ENABLED = env_bool("CONTEXT_BUDGET_ENABLED", True)
+CONTEXT_TOKEN_BUDGET   = env_int("CONTEXT_TOKEN_BUDGET", 4000, min_v=256)
+CONTEXT_REPLY_RESERVE  = env_int("CONTEXT_REPLY_RESERVE", 1024, min_v=0)      # เว้นให้คำตอบใน context window
+CONTEXT_SUMMARY_SHARE  = env_float("CONTEXT_SUMMARY_SHARE", 0.25, min_v=0.0, max_v=0.9)
+CONTEXT_MAX_TURNS      = env_int("CONTEXT_MAX_TURNS", 30, min_v=1)            # แถวที่ดึงจาก DB ก่อนจัดตามงบ
+TOKEN_COUNT_CACHE_SIZE = env_int("TOKEN_COUNT_CACHE_SIZE", 20000, min_v=0)
+
+# hedged requests: ถ้า primary ช้ากว่า p(HEDGE_PERCENTILE) ของตัวเอง → ยิงอีกค่ายขนาน (ใครตอบได้ก่อนชนะ)
+HEDGE_ENABLED     = env_bool("HEDGE_ENABLED", False)
+HEDGE_PERCENTILE  = env_float("HEDGE_PERCENTILE", 0.90, min_v=0.5, max_v=0.99)
+HEDGE_MIN_MS      = env_int("HEDGE_MIN_MS", 1500, min_v=50)
+HEDGE_MAX_MS      = env_int("HEDGE_MAX_MS", 8000, min_v=100)
+HEDGE_MIN_SAMPLES = env_int("HEDGE_MIN_SAMPLES", 20, min_v=1)
+
+# circuit breaker ต่อ provider: error/ช้าเกินบ่อยใน CIRCUIT_WINDOW_SEC → open (ข้ามทันที) → half-open (ปล่อยลองทีละน้อย)
+CIRCUIT_ENABLED          = env_bool("CIRCUIT_ENABLED", True)
+CIRCUIT_WINDOW_SEC       = env_int("CIRCUIT_WINDOW_SEC", 60, min_v=5)
+CIRCUIT_MIN_CALLS        = env_int("CIRCUIT_MIN_CALLS", 5, min_v=1)          # ตัวอย่างขั้นต่ำก่อนตัดสิน
+CIRCUIT_FAILURE_RATE     = env_float("CIRCUIT_FAILURE_RATE", 0.5, min_v=0.05, max_v=1.0)
+CIRCUIT_SLOW_MS          = env_int("CIRCUIT_SLOW_MS", 30000, min_v=100)      # ช้ากว่านี้นับเป็น failure (สตรีม: วัด TTFT)
+CIRCUIT_OPEN_SEC         = env_int("CIRCUIT_OPEN_SEC", 30, min_v=1)
+CIRCUIT_MAX_OPEN_SEC     = env_int("CIRCUIT_MAX_OPEN_SEC", 300, min_v=1)     # trial ล้มซ้ำ → เวลา open เพิ่มเท่าตัวถึงเพดานนี้
+CIRCUIT_HALF_OPEN_TRIALS = env_int("CIRCUIT_HALF_OPEN_TRIALS", 2, min_v=1)   # trial สำเร็จติดกันกี่ครั้งจึง close
+
 # ---------- web / server ----------
 MAX_PAYLOAD_BYTES       = env_int("MAX_PAYLOAD_BYTES",       10 * 1024 * 1024, min_v=1024)   # 10MB
 MAX_DECOMPRESSED_BYTES  = env_int("MAX_DECOMPRESSED_BYTES",  20 * 1024 * 1024, min_v=2048)   # 20MB
@@ -115,6 +149,116 @@ LOG_JSON                = env_bool("LOG_JSON", False)
 # เส้นทาง webhook (เผื่อใช้งานในส่วนอื่น ๆ)
 TELEGRAM_WEBHOOK_PATH   = env("TELEGRAM_WEBHOOK_PATH", "/webhook")
 
+# ---------- update dispatcher (ack เร็ว + worker pool) ----------
+DISPATCH_MODE       = env("DISPATCH_MODE", "async").strip().lower()   # async | inline
+DISPATCH_WORKERS    = env_int("DISPATCH_WORKERS",   8,   min_v=1, max_v=128)
+DISPATCH_QUEUE_MAX  = env_int("DISPATCH_QUEUE_MAX", 256, min_v=1)
+# รวมข้อความที่พิมพ์ติด ๆ กันในแชตเดียว (ms; 0 = ปิด) และเก็บกวาด lane ที่ว่างนาน
+DISPATCH_COALESCE_MS   = env_int("DISPATCH_COALESCE_MS", 500, min_v=0, max_v=5000)
+DISPATCH_LANE_IDLE_SEC = env_int("DISPATCH_LANE_IDLE_SEC", 300, min_v=5)
+
+# ---------- inbound update journal (กัน update หายตอน redeploy/crash) ----------
+JOURNAL_ENABLED       = env_bool("JOURNAL_ENABLED", True)
+JOURNAL_DB_FILE       = env("JOURNAL_DB_FILE", os.path.join(DATA_DIR, "update_journal.db"))
+JOURNAL_SYNCHRONOUS   = env("JOURNAL_SYNCHRONOUS", "NORMAL").strip().upper()   # OFF | NORMAL | FULL
+JOURNAL_STALE_SEC     = env_int("JOURNAL_STALE_SEC", 20, min_v=2)             # heartbeat เก่ากว่านี้ = เจ้าของตายแล้ว
+JOURNAL_MAX_ATTEMPTS  = env_int("JOURNAL_MAX_ATTEMPTS", 3, min_v=1)
+JOURNAL_RETENTION_SEC = env_int("JOURNAL_RETENTION_SEC", 86400, min_v=60)
+
+# ---------- graceful shutdown (ต้องน้อยกว่า --graceful-timeout ของ gunicorn) ----------
+GRACEFUL_TIMEOUT_SEC = env_int("GRACEFUL_TIMEOUT_SEC", 25, min_v=1, max_v=300)
+
+# ---------- admission control (budget ต่อคลาส: admin / command / chat) ----------
+ADMISSION_ENABLED     = env_bool("ADMISSION_ENABLED", True)
+# *_MAX = งานที่รันพร้อมกันได้ (ส่วนแบ่ง worker); *_QUEUE = งานที่รับไว้รอ worker เพิ่มจากนั้น
+ADMISSION_ADMIN_MAX   = env_int("ADMISSION_ADMIN_MAX", 4, min_v=1)
+ADMISSION_COMMAND_MAX = env_int("ADMISSION_COMMAND_MAX", 16, min_v=1)
+# chat (LLM) ไม่ควรเกินจำนวน worker ลบที่กันไว้ให้ admin/command ไม่งั้นคำสั่งจะรอคิวหลัง LLM
+ADMISSION_CHAT_MAX    = env_int("ADMISSION_CHAT_MAX", max(1, DISPATCH_WORKERS - 2), min_v=1)
+ADMISSION_ADMIN_QUEUE   = env_int("ADMISSION_ADMIN_QUEUE", 16, min_v=0)
+ADMISSION_COMMAND_QUEUE = env_int("ADMISSION_COMMAND_QUEUE", 64, min_v=0)
+ADMISSION_CHAT_QUEUE    = env_int("ADMISSION_CHAT_QUEUE", DISPATCH_WORKERS * 4, min_v=0)
+ADMISSION_NOTICE_COOLDOWN_SEC = env_int("ADMISSION_NOTICE_COOLDOWN_SEC", 15, min_v=0)
+
+# ---------- response cache ของ orchestrator (คำถามซ้ำ → ไม่เรียก LLM ใหม่) ----------
+RESPONSE_CACHE_ENABLED        = env_bool("RESPONSE_CACHE_ENABLED", True)
+RESPONSE_CACHE_MAX_ENTRIES    = env_int("RESPONSE_CACHE_MAX_ENTRIES", 2000, min_v=1)
+RESPONSE_CACHE_MAX_BYTES      = env_int("RESPONSE_CACHE_MAX_BYTES", 8 * 1024 * 1024, min_v=1024)
+RESPONSE_CACHE_TTL_LOOKUP     = env_int("RESPONSE_CACHE_TTL_LOOKUP", 300, min_v=0)     # ราคา/อากาศ/ข่าว เปลี่ยนเร็ว
+RESPONSE_CACHE_TTL_REASONING  = env_int("RESPONSE_CACHE_TTL_REASONING", 3600, min_v=0)
+RESPONSE_CACHE_TTL_WRITING    = env_int("RESPONSE_CACHE_TTL_WRITING", 86400, min_v=0)
+RESPONSE_CACHE_DISK           = env_bool("RESPONSE_CACHE_DISK", False)
+RESPONSE_CACHE_DB_FILE        = env("RESPONSE_CACHE_DB_FILE", os.path.join(DATA_DIR, "response_cache.db"))
+
+# semantic cache (คำถามความหมายเดียวกันแต่พิมพ์ต่าง — MinHash/LSH บน n-gram ภาษาไทย) ใช้ TTL ชุดเดียวกับข้างบน
+SEMANTIC_CACHE_ENABLED     = env_bool("SEMANTIC_CACHE_ENABLED", True)
+SEMANTIC_CACHE_THRESHOLD   = env_float("SEMANTIC_CACHE_THRESHOLD", 0.6, min_v=0.1, max_v=1.0)   # Jaccard ขั้นต่ำ
+SEMANTIC_CACHE_MAX_ENTRIES = env_int("SEMANTIC_CACHE_MAX_ENTRIES", 5000, min_v=1)
+SEMANTIC_CACHE_INTENTS     = env_list("SEMANTIC_CACHE_INTENTS", ["lookup"])
+
+# singleflight: คำขอเดียวกัน (key เดียวกับ response cache) ที่มาพร้อมกัน → เรียก provider ครั้งเดียว ใช้ผลร่วมกัน
+SINGLEFLIGHT_ENABLED       = env_bool("SINGLEFLIGHT_ENABLED", True)
+SINGLEFLIGHT_TIMEOUT_MS    = env_int("SINGLEFLIGHT_TIMEOUT_MS", 20000, min_v=100)    # follower รอเกินนี้ → เรียกเอง
+SINGLEFLIGHT_BG_TIMEOUT_MS = env_int("SINGLEFLIGHT_BG_TIMEOUT_MS", 90000, min_v=100)  # งานสรุป (รอโควตานานกว่า)
+
+# ---------- fact augmentation (lookup → ดึงข้อมูลจริงจาก utils/realtime_providers ขนานกัน ใส่ prompt) ----------
+FACTS_ENABLED      = env_bool("FACTS_ENABLED", True)
+FACTS_DEADLINE_MS  = env_int("FACTS_DEADLINE_MS", 1500, min_v=50)     # เวลาที่เพิ่มสูงสุด; ช้ากว่านี้ใช้เท่าที่ได้
+FACTS_MAX_ENTITIES = env_int("FACTS_MAX_ENTITIES", 4, min_v=1)
+FACTS_WORKERS      = env_int("FACTS_WORKERS", 8, min_v=1)
+
+# ---------- streaming reply (placeholder + editMessageText) ----------
+STREAM_REPLIES                = env_bool("STREAM_REPLIES", False)
+STREAM_EDIT_INTERVAL_MS       = env_int("STREAM_EDIT_INTERVAL_MS", 1000, min_v=250)       # แชตส่วนตัว ~1 edit/วินาที
+STREAM_GROUP_EDIT_INTERVAL_MS = env_int("STREAM_GROUP_EDIT_INTERVAL_MS", 3000, min_v=1000)  # กลุ่ม ~20 ข้อความ/นาที
+STREAM_MIN_DELTA_CHARS        = env_int("STREAM_MIN_DELTA_CHARS", 24, min_v=0)
+
+# ---------- LLM provider clients (สร้างครั้งเดียวต่อโปรเซส + keep-alive pool) ----------
+# pool ต่อโปรเซส: worker ของ dispatcher + เผื่อเธรดของ gunicorn ที่เรียก LLM ตรง
+PROVIDER_POOL_SIZE     = env_int("PROVIDER_POOL_SIZE", DISPATCH_WORKERS + 2, min_v=1, max_v=256)
+PROVIDER_KEEPALIVE_SEC = env_float("PROVIDER_KEEPALIVE_SEC", 90.0, min_v=1.0)
+PROVIDER_TIMEOUT_SEC   = env_float("PROVIDER_TIMEOUT_SEC", 60.0, min_v=1.0)
+PROVIDER_WARMUP        = env_bool("PROVIDER_WARMUP", True)
+
+# client-side rate limit ต่อ (provider, model): token bucket RPM/TPM + คิวรอแบบมีขอบเขต (providers/rate_limit.py)
+# ค่าเป็นต่อโปรเซส — หลาย worker ใช้บัญชีเดียวกันให้หารโควตาบัญชีด้วยจำนวน worker
+RATE_LIMIT_ENABLED        = env_bool("RATE_LIMIT_ENABLED", True)
+OPENAI_RPM                = env_int("OPENAI_RPM", 500, min_v=1)
+OPENAI_TPM                = env_int("OPENAI_TPM", 200_000, min_v=0)           # 0 = ไม่จำกัด token
+GEMINI_RPM                = env_int("GEMINI_RPM", 300, min_v=1)
+GEMINI_TPM                = env_int("GEMINI_TPM", 1_000_000, min_v=0)
+RATE_LIMIT_OVERRIDES      = env_list("RATE_LIMIT_OVERRIDES", [])               # "model=rpm/tpm" เช่น gpt-4o=300/150000
+PROVIDER_MAX_CONCURRENCY  = env_int("PROVIDER_MAX_CONCURRENCY", PROVIDER_POOL_SIZE, min_v=1)
+RATE_LIMIT_MAX_WAIT_MS    = env_int("RATE_LIMIT_MAX_WAIT_MS", 1500, min_v=0)   # ผู้ใช้รออยู่: เกินนี้ไปอีกค่ายแทน
+RATE_LIMIT_BG_MAX_WAIT_MS = env_int("RATE_LIMIT_BG_MAX_WAIT_MS", 20000, min_v=0)  # งานสรุป/เอกสาร รอได้นานกว่า
+RATE_LIMIT_MAX_WAITERS    = env_int("RATE_LIMIT_MAX_WAITERS", 16, min_v=0)
+RATE_LIMIT_BURST_SEC      = env_float("RATE_LIMIT_BURST_SEC", 10.0, min_v=1.0, max_v=60.0)  # ความจุถัง = โควตากี่วินาที
+RATE_LIMIT_429_PAUSE_SEC  = env_float("RATE_LIMIT_429_PAUSE_SEC", 2.0, min_v=0.0)  # 429 ที่ไม่มี Retry-After
+# retry ภายใน SDK (sleep บนเธรดคำขอ) — เปิด rate limit แล้วให้ limiter/การสลับค่ายจัดการแทน
+PROVIDER_MAX_RETRIES      = env_int("PROVIDER_MAX_RETRIES", 0 if RATE_LIMIT_ENABLED else 2, min_v=0)
+
+# ---------- background summarizer (สรุป/ตัดประวัติแชตนอกเส้นทางตอบ — utils/summarizer.py) ----------
+SUMMARY_BACKGROUND     = env_bool("SUMMARY_BACKGROUND", True)                # False = สรุปบนเธรดตอบแบบเดิม
+SUMMARY_TICK_MS        = env_int("SUMMARY_TICK_MS", 2000, min_v=50)
+SUMMARY_BATCH          = env_int("SUMMARY_BATCH", 8, min_v=1)                # ผู้ใช้ต่อรอบ (นับข้อความด้วยคิวรีเดียว)
+SUMMARY_CONCURRENCY    = env_int("SUMMARY_CONCURRENCY", 2, min_v=1)
+SUMMARY_RPM            = env_int("SUMMARY_RPM", 30, min_v=1)                 # งบ LLM ของงานสรุปแยกจากแชต
+SUMMARY_BUDGET_WAIT_MS = env_int("SUMMARY_BUDGET_WAIT_MS", 30000, min_v=0)   # งบไม่พอเกินนี้ → เลื่อนรอบหน้า
+
+# ---------- Gemini ChatSession (function_calling) — LRU + TTL + เพดานขนาด (utils/session_store.py) ----------
+CHAT_SESSION_CAP          = env_int("CHAT_SESSION_CAP", 200, min_v=1)
+CHAT_SESSION_IDLE_TTL_SEC = env_float("CHAT_SESSION_IDLE_TTL_SEC", 1800.0, min_v=0.0)   # 0 = ไม่หมดอายุ
+CHAT_SESSION_MAX_TURNS    = env_int("CHAT_SESSION_MAX_TURNS", 40, min_v=0)             # เกิน → สร้างใหม่จากสรุป
+CHAT_SESSION_MAX_BYTES    = env_int("CHAT_SESSION_MAX_BYTES", 64 * 1024, min_v=0)      # ต่อ session (UTF-8 โดยประมาณ)
+CHAT_SESSION_TOTAL_BYTES  = env_int("CHAT_SESSION_TOTAL_BYTES", 32 * 1024 * 1024, min_v=0)
+CHAT_SESSION_REBUILD_TAIL = env_int("CHAT_SESSION_REBUILD_TAIL", 12, min_v=0)          # ข้อความท้ายที่ใส่ตอนสร้างใหม่
+
+# ---------- update dedupe (แชร์ทุก worker ผ่าน SQLite) ----------
+DEDUPE_SHARED     = env_bool("DEDUPE_SHARED", True)
+DEDUPE_DB_FILE    = env("DEDUPE_DB_FILE", os.path.join(DATA_DIR, "dedupe.db"))
+DEDUPE_TTL_SEC    = env_int("DEDUPE_TTL_SEC", 600, min_v=10)
+DEDUPE_BUCKET_SEC = env_int("DEDUPE_BUCKET_SEC", 60, min_v=1)
+
 # ---------- db / files ----------
 BOT_MEMORY_DB_FILE = env("BOT_MEMORY_DB_FILE", "bot_memory.db")
 
@@ -167,12 +311,53 @@ def diag() -> Dict[str, Any]:
             "gemini_model": GEMINI_MODEL_DIALOGUE,
             "router_mode": ROUTER_MODE,
             "router_min_confidence": ROUTER_MIN_CONFIDENCE,
+            "hedge_enabled": HEDGE_ENABLED,
+            "circuit_enabled": CIRCUIT_ENABLED,
+            "context_token_budget": CONTEXT_TOKEN_BUDGET if CONTEXT_BUDGET_ENABLED else None,
+            "stream_replies": STREAM_REPLIES,
+            "response_cache_enabled": RESPONSE_CACHE_ENABLED,
+            "semantic_cache_enabled": SEMANTIC_CACHE_ENABLED,
+            "singleflight_enabled": SINGLEFLIGHT_ENABLED,
+            "facts_enabled": FACTS_ENABLED,
+            "facts_deadline_ms": FACTS_DEADLINE_MS,
+            "summary_background": SUMMARY_BACKGROUND,
             "webhook_path": TELEGRAM_WEBHOOK_PATH,
+            "dispatch_mode": DISPATCH_MODE,
+            "dispatch_workers": DISPATCH_WORKERS,
+            "dispatch_queue_max": DISPATCH_QUEUE_MAX,
+            "dispatch_coalesce_ms": DISPATCH_COALESCE_MS,
+            "journal_enabled": JOURNAL_ENABLED,
+            "dedupe_shared": DEDUPE_SHARED,
+            "admission_enabled": ADMISSION_ENABLED,
+            "graceful_timeout_sec": GRACEFUL_TIMEOUT_SEC,
+            "provider_pool_size": PROVIDER_POOL_SIZE,
+            "provider_warmup": PROVIDER_WARMUP,
+            "rate_limit_enabled": RATE_LIMIT_ENABLED,
+            "rate_limits": {
+                "openai": {"rpm": OPENAI_RPM, "tpm": OPENAI_TPM},
+                "gemini": {"rpm": GEMINI_RPM, "tpm": GEMINI_TPM},
+                "overrides": RATE_LIMIT_OVERRIDES,
+                "max_concurrency": PROVIDER_MAX_CONCURRENCY,
+                "max_wait_ms": RATE_LIMIT_MAX_WAIT_MS,
+            },
+            "admission_limits": {
+                "admin": ADMISSION_ADMIN_MAX,
+                "command": ADMISSION_COMMAND_MAX,
+                "chat": ADMISSION_CHAT_MAX,
+            },
+            "admission_queue": {
+                "admin": ADMISSION_ADMIN_QUEUE,
+                "command": ADMISSION_COMMAND_QUEUE,
+                "chat": ADMISSION_CHAT_QUEUE,
+            },
         },
         "paths": {
             "root_dir": ROOT_DIR,
             "data_dir": DATA_DIR,
             "db_file": BOT_MEMORY_DB_FILE,
+            "journal_db_file": JOURNAL_DB_FILE,
+            "dedupe_db_file": DEDUPE_DB_FILE,
+            "response_cache_db_file": RESPONSE_CACHE_DB_FILE if RESPONSE_CACHE_DISK else None,
             "usage_file": USAGE_FILE,
             "image_usage_file": IMAGE_USAGE_FILE,
             "context_file": CONTEXT_FILE,
@@ -198,10 +383,41 @@ __all__ = [
     # models/router
     "OPENAI_MODEL_DIALOGUE", "GEMINI_MODEL_DIALOGUE",
     "ROUTER_MODE", "ROUTER_MIN_CONFIDENCE",
+    "ADAPTIVE_ALPHA", "ADAPTIVE_MIN_SAMPLES", "ADAPTIVE_MIN_SUCCESS", "ADAPTIVE_SWITCH_MARGIN",
+    "ADAPTIVE_EXPLORE", "ADAPTIVE_PINNED_INTENTS", "ADAPTIVE_STATS_FILE",
+    "CONTEXT_BUDGET_ENABLED", "CONTEXT_TOKEN_BUDGET", "CONTEXT_REPLY_RESERVE", "CONTEXT_SUMMARY_SHARE",
+    "CONTEXT_MAX_TURNS", "TOKEN_COUNT_CACHE_SIZE",
+    "HEDGE_ENABLED", "HEDGE_PERCENTILE", "HEDGE_MIN_MS", "HEDGE_MAX_MS", "HEDGE_MIN_SAMPLES",
+    "CIRCUIT_ENABLED", "CIRCUIT_WINDOW_SEC", "CIRCUIT_MIN_CALLS", "CIRCUIT_FAILURE_RATE", "CIRCUIT_SLOW_MS",
+    "CIRCUIT_OPEN_SEC", "CIRCUIT_MAX_OPEN_SEC", "CIRCUIT_HALF_OPEN_TRIALS",
     # server
     "MAX_PAYLOAD_BYTES", "MAX_DECOMPRESSED_BYTES",
     "ENABLE_BACKUP_SCHEDULER", "TRUST_PROXY_HEADERS", "LOG_JSON",
     "TELEGRAM_WEBHOOK_PATH",
+    "DISPATCH_MODE", "DISPATCH_WORKERS", "DISPATCH_QUEUE_MAX",
+    "DISPATCH_COALESCE_MS", "DISPATCH_LANE_IDLE_SEC",
+    "JOURNAL_ENABLED", "JOURNAL_DB_FILE", "JOURNAL_SYNCHRONOUS",
+    "JOURNAL_STALE_SEC", "JOURNAL_MAX_ATTEMPTS", "JOURNAL_RETENTION_SEC",
+    "DEDUPE_SHARED", "DEDUPE_DB_FILE", "DEDUPE_TTL_SEC", "DEDUPE_BUCKET_SEC",
+    "GRACEFUL_TIMEOUT_SEC",
+    "RESPONSE_CACHE_ENABLED", "RESPONSE_CACHE_MAX_ENTRIES", "RESPONSE_CACHE_MAX_BYTES",
+    "RESPONSE_CACHE_TTL_LOOKUP", "RESPONSE_CACHE_TTL_REASONING",
+    "RESPONSE_CACHE_TTL_WRITING", "RESPONSE_CACHE_DISK", "RESPONSE_CACHE_DB_FILE",
+    "SEMANTIC_CACHE_ENABLED", "SEMANTIC_CACHE_THRESHOLD", "SEMANTIC_CACHE_MAX_ENTRIES", "SEMANTIC_CACHE_INTENTS",
+    "SINGLEFLIGHT_ENABLED", "SINGLEFLIGHT_TIMEOUT_MS", "SINGLEFLIGHT_BG_TIMEOUT_MS",
+    "FACTS_ENABLED", "FACTS_DEADLINE_MS", "FACTS_MAX_ENTITIES", "FACTS_WORKERS",
+    "STREAM_REPLIES", "STREAM_EDIT_INTERVAL_MS", "STREAM_GROUP_EDIT_INTERVAL_MS", "STREAM_MIN_DELTA_CHARS",
+    "PROVIDER_POOL_SIZE", "PROVIDER_KEEPALIVE_SEC", "PROVIDER_TIMEOUT_SEC", "PROVIDER_WARMUP",
+    "RATE_LIMIT_ENABLED", "OPENAI_RPM", "OPENAI_TPM", "GEMINI_RPM", "GEMINI_TPM", "RATE_LIMIT_OVERRIDES",
+    "PROVIDER_MAX_CONCURRENCY", "RATE_LIMIT_MAX_WAIT_MS", "RATE_LIMIT_BG_MAX_WAIT_MS", "RATE_LIMIT_MAX_WAITERS",
+    "RATE_LIMIT_BURST_SEC", "RATE_LIMIT_429_PAUSE_SEC", "PROVIDER_MAX_RETRIES",
+    "SUMMARY_BACKGROUND", "SUMMARY_TICK_MS", "SUMMARY_BATCH", "SUMMARY_CONCURRENCY",
+    "SUMMARY_RPM", "SUMMARY_BUDGET_WAIT_MS",
+    "CHAT_SESSION_CAP", "CHAT_SESSION_IDLE_TTL_SEC", "CHAT_SESSION_MAX_TURNS", "CHAT_SESSION_MAX_BYTES",
+    "CHAT_SESSION_TOTAL_BYTES", "CHAT_SESSION_REBUILD_TAIL",
+    "ADMISSION_ENABLED", "ADMISSION_ADMIN_MAX", "ADMISSION_COMMAND_MAX",
+    "ADMISSION_CHAT_MAX", "ADMISSION_ADMIN_QUEUE", "ADMISSION_COMMAND_QUEUE", "ADMISSION_CHAT_QUEUE",
+    "ADMISSION_NOTICE_COOLDOWN_SEC",
     # files/db
     "ROOT_DIR", "DATA_DIR", "BOT_MEMORY_DB_FILE",
     "USAGE_FILE", "IMAGE_USAGE_FILE", "CONTEXT_FILE", "CONTEXT_MSG_FILE", "LOCATION_FILE",
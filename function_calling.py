@@ -10,12 +10,22 @@ Function Calling Engine (Gemini, ChatSession)
 """
 from __future__ import annotations
 from typing import List, Dict, Any, Optional, Tuple
+import hashlib
 import os
-import time
-from threading import RLock
 
 import google.generativeai as genai
 
+from config import (
+    CHAT_SESSION_CAP,
+    CHAT_SESSION_IDLE_TTL_SEC,
+    CHAT_SESSION_MAX_TURNS,
+    CHAT_SESSION_MAX_BYTES,
+    CHAT_SESSION_TOTAL_BYTES,
+    CHAT_SESSION_REBUILD_TAIL,
+)
+from utils.session_store import SessionStore, text_bytes
+from utils.singleflight import FlightTimeout, get_group
+
 # --- import generate_text: รองรับทั้ง providers/ และ utils/ ---
 try:
     from providers.gemini_client import generate_text as _gen_text  # แนะนำให้มีไฟล์นี้
@@ -45,7 +55,6 @@ _GEMINI_API_KEY = (
 
 _TEXT_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT_SEC", "60"))
 _MAX_TOOL_RESULT_CHARS = int(os.getenv("MAX_TOOL_RESULT_CHARS", "4000"))
-_SESSION_CAP = int(os.getenv("CHAT_SESSION_CAP", "200"))
 
 # ตั้งค่า genai.configure ถ้ามีคีย์
 try:
@@ -103,10 +112,15 @@ if _GEMINI_API_KEY:
 else:
     print("[function_calling] INFO: GOOGLE_API_KEY/GEMINI_API_KEY not set — tools chat disabled.")
 
-# ---------- In-memory sessions (LRU + lock) ----------
-CHAT_SESSIONS: Dict[int, Any] = {}
-_LAST_USED: Dict[int, float] = {}
-_SESS_LOCK = RLock()
+# ---------- In-memory sessions (O(1) LRU + idle TTL + เพดานขนาด; thread-safe) ----------
+# session ที่ยาวเกิน CHAT_SESSION_MAX_TURNS/MAX_BYTES ถูกทิ้ง แล้วสร้างใหม่จากสรุป + ข้อความท้าย ๆ ในเทิร์นถัดไป
+CHAT_SESSIONS = SessionStore(
+    max_sessions=CHAT_SESSION_CAP,
+    idle_ttl_sec=CHAT_SESSION_IDLE_TTL_SEC,
+    max_turns=CHAT_SESSION_MAX_TURNS,
+    max_session_bytes=CHAT_SESSION_MAX_BYTES,
+    max_total_bytes=CHAT_SESSION_TOTAL_BYTES,
+)
 
 # ---------- Helpers ----------
 def _clip(s: str, n: int = _MAX_TOOL_RESULT_CHARS) -> str:
@@ -148,37 +162,31 @@ def _dispatch_tool(user_info: Dict[str, Any], fname: str, args: Dict[str, Any])
         print(f"[function_dispatch] {fname} error: {e}")
         return f"อุ๊ย! เครื่องมือ {fname} ของชิบะน้อยมีปัญหาซะแล้วครับ: {e}"
 
+
 def _ensure_session(user_id: int, ctx: List[Dict[str, str]], conv_summary: str) -> Any:
-    with _SESS_LOCK:
-        chat = CHAT_SESSIONS.get(user_id)
-        if chat is not None:
-            _LAST_USED[user_id] = time.time()
-            return chat
-
-        print(f"[ChatSession] create new session for user {user_id}")
-        history = []
-        if conv_summary:
-            history.append({"role": "user", "parts": [{"text": f"[สรุปก่อนหน้า]\n{conv_summary}"}]})
-        for m in (ctx or [])[-12:]:
-            role = "user" if (m.get("role") == "user") else "model"
-            history.append({"role": role, "parts": [{"text": m.get("content", "")}]})
-        chat = gemini_model_with_tools.start_chat(history=history)  # type: ignore[union-attr]
-        CHAT_SESSIONS[user_id] = chat
-        _LAST_USED[user_id] = time.time()
-
-        # LRU eviction
-        if len(CHAT_SESSIONS) > max(_SESSION_CAP, 1):
-            oldest_uid = min(_LAST_USED, key=_LAST_USED.get)
-            if oldest_uid != user_id:
-                CHAT_SESSIONS.pop(oldest_uid, None)
-                _LAST_USED.pop(oldest_uid, None)
-                print(f"[ChatSession] evict user {oldest_uid}")
+    chat = CHAT_SESSIONS.get(user_id)
+    if chat is not None:
         return chat
 
+    print(f"[ChatSession] create new session for user {user_id}")
+    history = []
+    size = 0
+    if conv_summary:
+        text = f"[สรุปก่อนหน้า]\n{conv_summary}"
+        history.append({"role": "user", "parts": [{"text": text}]})
+        size += text_bytes(text)
+    tail = (ctx or [])[-CHAT_SESSION_REBUILD_TAIL:] if CHAT_SESSION_REBUILD_TAIL else []
+    for m in tail:
+        role = "user" if (m.get("role") == "user") else "model"
+        text = m.get("content", "")
+        history.append({"role": role, "parts": [{"text": text}]})
+        size += text_bytes(text)
+    chat = gemini_model_with_tools.start_chat(history=history)  # type: ignore[union-attr]
+    CHAT_SESSIONS.put(user_id, chat, size)
+    return chat
+
 def _clear_session(user_id: int) -> None:
-    with _SESS_LOCK:
-        CHAT_SESSIONS.pop(user_id, None)
-        _LAST_USED.pop(user_id, None)
+    CHAT_SESSIONS.pop(user_id, None)
 
 def _send_function_response(chat: Any, name: str, tool_result: str):
     """
@@ -286,12 +294,16 @@ def process_with_function_calling(
 
         # 2) ถ้าไม่มี parts ให้ fallback ส่งข้อความธรรมดา
         if not getattr(resp, "parts", None) and not getattr(resp, "candidates", None):
-            return (getattr(resp, "text", "") or "").strip() or "ขอโทษครับ ผมยังตอบไม่ได้ในตอนนี้ ลองใหม่อีกครั้งนะครับ"
+            out = (getattr(resp, "text", "") or "").strip()
+            CHAT_SESSIONS.note_turn(user_id, text_bytes(user_text, out), chat)
+            return out or "ขอโทษครับ ผมยังตอบไม่ได้ในตอนนี้ ลองใหม่อีกครั้งนะครับ"
 
         # 3) หา function_call ถ้ามี
         fname, fargs = _extract_function_call(resp)
         if not fname:
-            return (getattr(resp, "text", "") or "").strip() or "ขอโทษครับ ผมยังตอบไม่ได้ในตอนนี้ ลองใหม่อีกครั้งนะครับ"
+            out = (getattr(resp, "text", "") or "").strip()
+            CHAT_SESSIONS.note_turn(user_id, text_bytes(user_text, out), chat)
+            return out or "ขอโทษครับ ผมยังตอบไม่ได้ในตอนนี้ ลองใหม่อีกครั้งนะครับ"
 
         # 4) เรียก tool
         tool_result = _clip(_dispatch_tool(user_info, fname, fargs))
@@ -299,8 +311,10 @@ def process_with_function_calling(
         # 5) ส่ง FunctionResponse กลับเข้า session
         resp2 = _send_function_response(chat, fname, tool_result)
 
-        # 6) คืนผลลัพธ์สุดท้าย
-        return (getattr(resp2, "text", "") or "").strip() or tool_result
+        # 6) คืนผลลัพธ์สุดท้าย (นับขนาด history ที่โตขึ้น — เกินเพดานจะถูกสร้างใหม่เทิร์นหน้า)
+        out = (getattr(resp2, "text", "") or "").strip()
+        CHAT_SESSIONS.note_turn(user_id, text_bytes(user_text, tool_result, out), chat)
+        return out or tool_result
 
     except Exception as e:
         print(f"[process_with_function_calling] Error: {e}")
@@ -308,13 +322,27 @@ def process_with_function_calling(
         return "อุ๊ย! สมองชิบะน้อยรวนไปแป๊บนึงครับ ลองอีกทีนะ"
 
 def summarize_text_with_gpt(text: str) -> str:
+    """สรุปข้อความ (บริบท/เอกสาร) — งานเบื้องหลัง จึงรอโควตา rate limit ได้นานกว่าข้อความแชต"""
+    from config import RATE_LIMIT_BG_MAX_WAIT_MS, SINGLEFLIGHT_BG_TIMEOUT_MS, SINGLEFLIGHT_ENABLED
     prompt = (
         "สรุปใจความสำคัญต่อไปนี้แบบสั้น กระชับ เป็นข้อ ๆ ไม่เกิน 6 บรรทัด "
         "ใช้ภาษาไทยล้วน เน้นสาระที่ควรเก็บไว้เป็นบริบทคุยต่อไป:\n\n"
         f"{text}"
     )
+    prefer_strong = len(text) > 800
+
+    def _call() -> str:
+        return generate_text(prompt, prefer_strong=prefer_strong, max_wait_ms=RATE_LIMIT_BG_MAX_WAIT_MS) or ""
+
     try:
-        prefer_strong = len(text) > 800
-        return generate_text(prompt, prefer_strong=prefer_strong) or ""
+        if not SINGLEFLIGHT_ENABLED:
+            return _call()
+        # ข้อความเดียวกันที่สรุปพร้อมกัน (เช่น เอกสารเดียวกันส่งมาหลายคน) → เรียกโมเดลครั้งเดียว
+        key = hashlib.sha256(f"{int(prefer_strong)}\x00{prompt}".encode("utf-8", "ignore")).hexdigest()
+        try:
+            out, _dups, _shared = get_group("summarize").do(key, _call, SINGLEFLIGHT_BG_TIMEOUT_MS / 1000.0)
+        except FlightTimeout:
+            out = _call()
+        return out
     except Exception:
         return ""
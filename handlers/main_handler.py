@@ -36,6 +36,7 @@ from handlers.admin import handle_admin_command
 
 # ✅ Backup/Restore commands (เสถียร)
 from handlers.backup import handle_backup_command
+from handlers.router import ROUTER
 
 # ===== Messaging (wrapper ที่มี chunk/parse_mode/no-echo/retry) =====
 from utils.message_utils import send_message, send_typing_action
@@ -50,19 +51,20 @@ except Exception:
 from utils.bot_profile import bot_intro
 from utils.memory_store import (
     get_or_create_user,
-    append_message,
-    get_recent_context,
-    get_summary,
-    prune_and_maybe_summarize,
+    begin_turn,
+    commit_turn_reply,
     update_user_location,
 )
+from utils.summarizer import schedule_summary
 from utils.admin_utils import notify_super_admin_for_approval
 
 # ===== Usage limit =====
 from utils.context_utils import check_and_increase_usage, get_usage_for
 
 # ===== Orchestrator =====
-from orchestrator.orchestrate import orchestrate
+from orchestrator.orchestrate import orchestrate, orchestrate_stream
+from utils.stream_reply import StreamingReply
+from config import STREAM_REPLIES, CONTEXT_BUDGET_ENABLED, CONTEXT_MAX_TURNS
 
 # ===== Optional external dedupe support =====
 try:
@@ -70,9 +72,10 @@ try:
 except Exception:  # pragma: no cover
     _ext_seen_update = None
 
-# --- In-file dedupe (fallback) ---
+# --- In-file dedupe (fallback เมื่อ import utils.dedupe ไม่ได้) ---
 _RECENT_UPDATES: dict[int, float] = {}
 _DEDUPE_TTL_SEC = 600  # 10 นาที
+_last_sweep = 0.0
 
 
 def _seen_update(update_id: int) -> bool:
@@ -83,13 +86,17 @@ def _seen_update(update_id: int) -> bool:
         except Exception:
             pass
 
+    global _last_sweep
     now = time.time()
-    # ล้างของหมดอายุ (ไม่ให้โตเกิน)
-    for k, ts in list(_RECENT_UPDATES.items()):
-        if now - ts > _DEDUPE_TTL_SEC:
-            _RECENT_UPDATES.pop(k, None)
-
-    if update_id in _RECENT_UPDATES:
+    # ล้างของหมดอายุเป็นระยะ (ไม่กวาดทุก request)
+    if now - _last_sweep > _DEDUPE_TTL_SEC / 10:
+        _last_sweep = now
+        for k, ts in list(_RECENT_UPDATES.items()):
+            if now - ts > _DEDUPE_TTL_SEC:
+                _RECENT_UPDATES.pop(k, None)
+
+    ts = _RECENT_UPDATES.get(update_id)
+    if ts is not None and now - ts <= _DEDUPE_TTL_SEC:
         return True
     _RECENT_UPDATES[update_id] = now
     return False
@@ -156,6 +163,8 @@ def _handle_location_message(user_info: Dict[str, Any], msg: Dict[str, Any]) ->
 
 
 # ===== Command Router =====
+# ตารางเดิม (คงไว้เพื่อความเข้ากันได้) → คอมไพล์เข้า handlers.router.ROUTER ตอน import
+# handler ใหม่ลงทะเบียนผ่าน @handlers.router.register(...) ได้โดยไม่ต้องแก้ dict นี้
 COMMAND_HANDLERS: Dict[str, Callable[[Dict[str, Any], str], Any]] = {
     # Slash commands
     "/start": _handle_start,
@@ -184,12 +193,14 @@ COMMAND_HANDLERS: Dict[str, Callable[[Dict[str, Any], str], Any]] = {
     "ชื่ออะไร": _handle_whoami,
     "คุณคือใคร": _handle_whoami,
 }
+ROUTER.add_many(COMMAND_HANDLERS)
 
 # ===== Main Entry =====
-def handle_message(data: Dict[str, Any]) -> None:
+def handle_message(data: Dict[str, Any], *, deduped: bool = False) -> None:
     """
     จุดเข้าใช้งานจาก Flask webhook (main.py)
     - ปลอดภัยต่อการ retry: มี dedupe ด้วย update_id
+      (deduped=True เมื่อผู้เรียกกรองซ้ำมาแล้ว เช่น webhook → dispatcher / journal replay)
     - เสถียร: แยกเส้นทาง admin/location/document/command ก่อนลงโมเดล
     - โหมดสนทนาทั่วไป: ใช้ Orchestrator (GPT+Gemini) และ fallback ไป engine เดิมได้
     """
@@ -197,7 +208,7 @@ def handle_message(data: Dict[str, Any]) -> None:
     try:
         # --- ตรวจโครงสร้างและกันซ้ำ ---
         upd = data.get("update_id")
-        if isinstance(upd, int) and _seen_update(upd):
+        if not deduped and isinstance(upd, int) and _seen_update(upd):
             return  # ข้าม update เดิมที่ Telegram retry
 
         msg = data.get("message") or data.get("edited_message") or {}
@@ -266,10 +277,10 @@ def handle_message(data: Dict[str, Any]) -> None:
             traceback.print_exc()
             # ไม่ให้ผู้ใช้เห็นรายละเอียด error ตรงนี้
 
-        # --- Router คำสั่งทั่วไป ---
-        for command, handler in COMMAND_HANDLERS.items():
-            if user_text_low.startswith(command):
-                return handler(user_info, user_text)
+        # --- Router คำสั่งทั่วไป (slash = dict lookup, phrase = longest-prefix trie) ---
+        route = ROUTER.match(user_text)
+        if route is not None:
+            return route[1](user_info, user_text)
 
         # --- ตรวจ daily usage limit (ข้อความ) ---
         if not check_and_increase_usage(str(user_id), is_image=False):
@@ -284,21 +295,40 @@ def handle_message(data: Dict[str, Any]) -> None:
         # =========================
         # โหมดสนทนาทั่วไป (ใช้ Orchestrator)
         # =========================
-        append_message(user_id, "user", user_text)
-        ctx = get_recent_context(user_id)  # [{"role":"user"/"assistant","content":"..."}]
-
+        # บันทึกข้อความ + อ่านบริบท/สรุป/จำนวนข้อความในรอบเดียว (memory_store.begin_turn)
+        if CONTEXT_BUDGET_ENABLED:
+            # ดึงแถวเผื่อไว้ แล้วให้ orchestrator จัดตามงบ token ของแต่ละโมเดล (รวมสรุปบทสนทนา)
+            turn = begin_turn(user_id, user_text, max_items=CONTEXT_MAX_TURNS, max_chars=0)
+            conv_summary = turn["summary"]
+        else:
+            turn = begin_turn(user_id, user_text)
+            conv_summary = ""
+        ctx = turn["context"]  # [{"role":"user"/"assistant","content":"...","message_id"}]
+
+        streamer = None
         try:
-            # แสดงกำลังพิมพ์ระหว่างคิด
-            send_typing_action(chat_id, "typing")
-
             # Orchestrator:
             # - ตรวจ intent (lookup vs reasoning)
-            # - ดึง facts จาก utils (aggregator) ตามที่จำเป็น
+            # - lookup: ดึง facts จริงจาก utils/realtime_providers ขนานกันภายใน deadline (orchestrator/facts.py)
             # - เลือก GPT/Gemini อัตโนมัติ + Fallback
-            result = orchestrate(user_text, context=ctx)
+            if STREAM_REPLIES:
+                # ส่ง placeholder แล้ว edit ทยอยแสดงคำตอบระหว่างสตรีม
+                streamer = StreamingReply(chat_id)
+                if not streamer.start():
+                    send_typing_action(chat_id, "typing")
+                result = orchestrate_stream(
+                    user_text, context=ctx, on_delta=streamer.feed, on_reset=streamer.reset, summary=conv_summary,
+                    user_id=user_id,
+                )
+            else:
+                # แสดงกำลังพิมพ์ระหว่างคิด
+                send_typing_action(chat_id, "typing")
+                result = orchestrate(user_text, context=ctx, summary=conv_summary, user_id=user_id)
             reply = result.get("text", "") or "ขออภัยครับ ผมยังตอบไม่ได้ในตอนนี้"
             try:
                 meta = result.get("meta", {})
+                if streamer is not None:
+                    meta["stream_reply"] = streamer.stats()
                 print("[ORCH META]", meta)
             except Exception:
                 pass
@@ -311,19 +341,24 @@ def handle_message(data: Dict[str, Any]) -> None:
                     user_info,
                     user_text,
                     ctx=ctx,
-                    conv_summary=get_summary(user_id),
+                    conv_summary=conv_summary or turn["summary"],
                 )
             except Exception:
                 traceback.print_exc()
                 reply = "ขออภัยครับ ผมเจอปัญหาบางอย่างในการประมวลผล"
 
         # ส่งข้อความ (wrapper จะจัดการแบ่งก้อน ≤4096 และกัน no-echo ให้)
-        send_message(chat_id, reply)
-        append_message(user_id, "assistant", reply)
-
-        # จัดการบริบทและสรุปย่อเพื่อไม่ให้โตเกิน
+        # โหมดสตรีม: edit ข้อความ placeholder เป็นคำตอบสุดท้ายแทนการส่งใหม่
+        if streamer is not None:
+            streamer.finish(reply)
+        else:
+            send_message(chat_id, reply)
+        needs_summary = commit_turn_reply(turn, reply)
+
+        # จัดการบริบทและสรุปย่อเพื่อไม่ให้โตเกิน (เข้าคิว summarizer เบื้องหลัง ไม่รอ LLM บนเธรดนี้)
         try:
-            prune_and_maybe_summarize(user_id, summarize_func=summarize_text_with_gpt)
+            if needs_summary:
+                schedule_summary(user_id, summarize_text_with_gpt)
         except Exception:
             traceback.print_exc()
 
@@ -0,0 +1,146 @@
+# handlers/router.py
+# -*- coding: utf-8 -*-
+"""
+Compiled Command Router (แทนการวน startswith ทีละ key ใน COMMAND_HANDLERS)
+- Slash command: ดูแค่ token แรก → dict lookup O(1)
+  * ตัด @botname ท้ายคำสั่ง (/gold@TKCBot) — ถ้าตั้ง TELEGRAM_BOT_USERNAME และชื่อไม่ตรง จะไม่รับ (เป็นคำสั่งของบอทอื่นในกลุ่ม)
+  * จับคู่แบบตรงตัว → /favorite กับ /favorite_add ไม่ชนกันอีกต่อไป ไม่ขึ้นกับลำดับใน dict
+- Phrase trigger (ภาษาไทย ฯลฯ): trie ตัวอักษร จับคู่ "ยาวที่สุด" ที่ต้นข้อความ
+  (คง semantics เดิมแบบ startswith — ไม่จับกลางประโยค กันคุยเรื่องอื่นแล้วหลุดเข้าคำสั่ง)
+- นับ hit ต่อ route สำหรับ /diag
+- ลงทะเบียนแบบ declarative:
+      from handlers.router import register
+      @register("/news", phrases=["ข่าววันนี้"])
+      def handle_news(user_info, text): ...
+  หรือ ROUTER.add_many({...}) จาก dict เดิม (key ขึ้นต้น "/" = command, นอกนั้น = phrase)
+"""
+
+from __future__ import annotations
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+import os
+import threading
+
+Handler = Callable[[Dict[str, Any], str], Any]
+
+_END = ""  # key พิเศษใน trie node: เก็บ (route_name, handler) ของคำที่จบตรงนี้
+
+
+def _log(tag: str, **kw: Any) -> None:
+    extra = f" | {kw}" if kw else ""
+    print(f"[router] {tag}{extra}", flush=True)
+
+
+class CommandRouter:
+    def __init__(self, bot_username: Optional[str] = None):
+        self._bot = (bot_username or "").lstrip("@").lower() or None
+        self._commands: Dict[str, Tuple[str, Handler]] = {}
+        self._trie: Dict[str, Any] = {}
+        self._phrases = 0
+        self._hits: Dict[str, int] = {}
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    # ---------- registration ----------
+    def add_command(self, command: str, handler: Handler) -> None:
+        key = command.strip().lower()
+        if not key.startswith("/") or " " in key:
+            raise ValueError(f"invalid command: {command!r}")
+        if key in self._commands and self._commands[key][1] is not handler:
+            _log("OVERRIDE", command=key)
+        self._commands[key] = (key, handler)
+
+    def add_phrase(self, phrase: str, handler: Handler) -> None:
+        key = phrase.strip().lower()
+        if not key:
+            raise ValueError("empty phrase")
+        node = self._trie
+        for ch in key:
+            node = node.setdefault(ch, {})
+        if _END not in node:
+            self._phrases += 1
+        node[_END] = (key, handler)
+
+    def add(self, trigger: str, handler: Handler) -> None:
+        if trigger.lstrip().startswith("/"):
+            self.add_command(trigger, handler)
+        else:
+            self.add_phrase(trigger, handler)
+
+    def add_many(self, mapping: Dict[str, Handler]) -> None:
+        for trigger, handler in mapping.items():
+            self.add(trigger, handler)
+
+    def register(self, *commands: str, phrases: Iterable[str] = ()) -> Callable[[Handler], Handler]:
+        """decorator: @router.register("/cmd", "/alias", phrases=["คำไทย"])"""
+        def deco(fn: Handler) -> Handler:
+            for c in commands:
+                self.add(c, fn)
+            for p in phrases:
+                self.add_phrase(p, fn)
+            return fn
+        return deco
+
+    # ---------- matching ----------
+    def _match_command(self, text: str) -> Optional[Tuple[str, Handler]]:
+        token = text.split(None, 1)[0].lower()
+        if "@" in token:
+            token, _, target = token.partition("@")
+            if self._bot and target and target != self._bot:
+                return None
+        return self._commands.get(token)
+
+    def _match_phrase(self, text: str) -> Optional[Tuple[str, Handler]]:
+        node = self._trie
+        best = None
+        for ch in text.lower():
+            node = node.get(ch)
+            if node is None:
+                break
+            if _END in node:
+                best = node[_END]
+        return best
+
+    def match(self, text: str, *, count: bool = True) -> Optional[Tuple[str, Handler]]:
+        """คืน (route_name, handler) หรือ None (count=False = แค่ดู ไม่นับ hit เช่น ตอนจัดคลาส admission)"""
+        t = (text or "").lstrip()
+        if not t:
+            return None
+        hit = self._match_command(t) if t.startswith("/") else None
+        if hit is None:
+            hit = self._match_phrase(t)
+        if not count:
+            return hit
+        with self._lock:
+            if hit is None:
+                self._misses += 1
+            else:
+                self._hits[hit[0]] = self._hits.get(hit[0], 0) + 1
+        return hit
+
+    def dispatch(self, user_info: Dict[str, Any], text: str) -> Tuple[bool, Any]:
+        """(True, ผลจาก handler) ถ้ามี route รับ; (False, None) ถ้าไม่มี"""
+        hit = self.match(text)
+        if hit is None:
+            return False, None
+        return True, hit[1](user_info, text)
+
+    # ---------- stats ----------
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "commands": len(self._commands),
+                "phrases": self._phrases,
+                "misses": self._misses,
+                "hits": dict(sorted(self._hits.items(), key=lambda kv: -kv[1])),
+            }
+
+
+ROUTER = CommandRouter(os.getenv("TELEGRAM_BOT_USERNAME"))
+
+
+def register(*commands: str, phrases: Iterable[str] = ()) -> Callable[[Handler], Handler]:
+    """ลงทะเบียน handler เข้ากับ router หลัก (ดูตัวอย่างใน docstring ของโมดูล)"""
+    return ROUTER.register(*commands, phrases=phrases)
+
+
+__all__ = ["CommandRouter", "ROUTER", "register"]
@@ -2,9 +2,7 @@
 # -*- coding: utf-8 -*-
 import os
 import sys
-import io
 import json
-import gzip
 import hmac
 import uuid
 import threading
@@ -39,7 +37,14 @@ from config import (
 
 # --- DB / Handlers / Settings ---
 from utils.memory_store import init_db, _get_db_connection  # _get_db_connection ใช้ใน /healthz เชิงลึก
-from handlers.main_handler import handle_message
+from utils.dispatcher import get_dispatcher, replay_journal
+from utils.update_journal import get_journal
+from utils.dedupe import get_deduper, forget_update
+from utils.ingest import ingest_updates
+from utils.admission import get_admission
+from utils import lifecycle
+from utils.fast_json import parse_body, PayloadTooLarge, BadPayload
+from handlers.router import ROUTER
 from utils.backup_utils import restore_all, setup_backup_scheduler
 try:
     from settings import SUPPORTED_FORMATS
@@ -110,39 +115,20 @@ def _read_update_json() -> Tuple[Dict[str, Any], int]:
         log_warn("Payload too large (compressed)", req_id=req_id, size=len(raw))
         abort(413)
 
-    # 3) Decompress if needed (stream) + cap decompressed bytes
-    enc = (request.headers.get("Content-Encoding") or "").lower()
-    if enc == "gzip":
-        try:
-            buf = io.BytesIO(raw)
-            gz = gzip.GzipFile(fileobj=buf, mode="rb")
-            chunks = []
-            total = 0
-            CHUNK = 64 * 1024
-            while True:
-                piece = gz.read(CHUNK)
-                if not piece:
-                    break
-                total += len(piece)
-                if total > MAX_DECOMPRESSED_BYTES:
-                    log_warn("Payload too large (decompressed)", req_id=req_id, size=total)
-                    abort(413)
-                chunks.append(piece)
-            text = b"".join(chunks).decode("utf-8", errors="replace")
-        except Exception as e:
+    # 3) Decompress (stream, cap ระหว่างแตก) + parse จาก bytes ครั้งเดียว (utils.fast_json)
+    enc = request.headers.get("Content-Encoding") or ""
+    try:
+        data, _decoded = parse_body(raw, enc, MAX_DECOMPRESSED_BYTES)
+    except PayloadTooLarge as e:
+        log_warn("Payload too large (decompressed)", req_id=req_id, size=str(e))
+        abort(413)
+    except BadPayload as e:
+        if enc.strip().lower() == "gzip":
             log_warn("Gzip decompress failed", req_id=req_id, err=str(e))
             abort(400)
-    else:
-        text = raw.decode("utf-8", errors="replace")
-
-    # 4) Parse JSON
-    if not text:
+        log_warn("Invalid JSON body", req_id=req_id, err=str(e)[:200])
         return {}, len(raw)
-    try:
-        return json.loads(text), len(raw)
-    except Exception:
-        data = request.get_json(silent=True) or {}
-        return data, len(raw)
+    return (data if isinstance(data, dict) else {}), len(raw)
 
 # ======================
 # Init: DB, Restore & Schedule Backup
@@ -152,6 +138,14 @@ def _safe_init():
         log_info("INIT: Initializing database…")
         init_db()
 
+        # replay update ที่ค้างใน journal (โปรเซสก่อนหน้าตายก่อนทำเสร็จ)
+        try:
+            n = replay_journal()
+            if n:
+                log_info("INIT: Replayed unfinished updates from journal", count=n)
+        except Exception as e:
+            log_err("INIT JOURNAL REPLAY ERROR", err=str(e), tb=traceback.format_exc())
+
         # กรณีรันหลายอินสแตนซ์ ให้เปิด/ปิด scheduler ด้วย ENV
         if ENABLE_BACKUP_SCHEDULER:
             def _bg():
@@ -170,6 +164,17 @@ def _safe_init():
 
 _safe_init()
 
+# สร้าง LLM client + เปิด connection ล่วงหน้า (เธรดพื้นหลัง) → ข้อความแรกไม่ต้องจ่ายค่า TLS handshake
+try:
+    from providers.registry import warm_up as _providers_warm_up
+    _providers_warm_up()
+except Exception as e:
+    log_err("INIT PROVIDERS WARMUP ERROR", err=str(e))
+
+# SIGTERM (deploy) → หยุดรับงาน, เคลียร์/journal งานค้าง, flush buffer ภายใน GRACEFUL_TIMEOUT_SEC
+lifecycle.register_default_hooks()
+lifecycle.install()
+
 # ======================
 # Error Handlers (ให้ตอบ JSON เสมอ)
 # ======================
@@ -241,8 +246,17 @@ def readyz():
     except Exception as e:
         checks["db"] = f"error: {e}"
 
-    # พร้อมจริงต้อง DB ok และไม่มี missing_required
-    ready = (checks["db"] == "ok") and not checks["missing_required"]
+    checks["draining"] = lifecycle.is_draining()
+    # สถานะวงจรของแต่ละค่าย: แจ้งให้เห็นเฉย ๆ ไม่ทำให้ไม่พร้อม
+    # (provider ใช้ร่วมกันทุก instance — ถอด instance ออกจาก LB ไม่ช่วย และ orchestrator fallback ให้อยู่แล้ว)
+    try:
+        from orchestrator.circuit_breaker import circuit_stats
+        checks["circuits"] = {k: v.get("state", "disabled") for k, v in circuit_stats().items()}
+    except Exception as e:
+        checks["circuits"] = {"error": str(e)}
+
+    # พร้อมจริงต้อง DB ok, ไม่มี missing_required และไม่ได้กำลังปิดตัว
+    ready = (checks["db"] == "ok") and not checks["missing_required"] and not checks["draining"]
     return jsonify(checks), (200 if ready else 503)
 
 @app.get("/diag")
@@ -269,6 +283,85 @@ def diag():
         imports["providers_error"] = str(e)
 
     payload["imports"] = imports
+    payload["dispatcher"] = get_dispatcher().stats()
+    payload["dedupe"] = get_deduper().stats()
+    payload["router"] = ROUTER.stats()
+    admission = get_admission()
+    payload["admission"] = admission.stats() if admission is not None else {"enabled": False}
+    payload["lifecycle"] = lifecycle.report()
+    try:
+        from providers.registry import stats as _provider_stats
+        payload["providers"] = _provider_stats()
+    except Exception as e:
+        payload["providers"] = {"error": str(e)}
+    try:
+        from providers.rate_limit import limiter_stats
+        payload["rate_limits"] = limiter_stats()
+    except Exception as e:
+        payload["rate_limits"] = {"error": str(e)}
+    try:
+        from utils.summarizer import get_summarizer
+        sm = get_summarizer()
+        payload["summarizer"] = sm.stats() if sm is not None else {"enabled": False}
+    except Exception as e:
+        payload["summarizer"] = {"error": str(e)}
+    try:
+        from function_calling import CHAT_SESSIONS
+        payload["chat_sessions"] = CHAT_SESSIONS.stats()
+    except Exception as e:
+        payload["chat_sessions"] = {"error": str(e)}
+    try:
+        from utils.singleflight import group_stats
+        payload["singleflight"] = group_stats()
+    except Exception as e:
+        payload["singleflight"] = {"error": str(e)}
+    try:
+        from utils.memory_store import db_pool_stats
+        payload["db_pool"] = db_pool_stats()
+    except Exception as e:
+        payload["db_pool"] = {"error": str(e)}
+    try:
+        from utils.memory_store import write_behind_stats
+        payload["message_write_behind"] = write_behind_stats()
+    except Exception as e:
+        payload["message_write_behind"] = {"error": str(e)}
+    try:
+        from utils.memory_store import profile_cache_stats
+        payload["profile_cache"] = profile_cache_stats()
+    except Exception as e:
+        payload["profile_cache"] = {"error": str(e)}
+    try:
+        from utils.token_budget import cache_stats as _token_cache_stats
+        payload["token_budget"] = _token_cache_stats()
+    except Exception as e:
+        payload["token_budget"] = {"error": str(e)}
+    try:
+        from orchestrator.adaptive_router import get_adaptive_router
+        ar = get_adaptive_router()
+        payload["adaptive_router"] = ar.snapshot() if ar is not None else {"enabled": False}
+    except Exception as e:
+        payload["adaptive_router"] = {"error": str(e)}
+    try:
+        from orchestrator.circuit_breaker import circuit_stats
+        payload["circuits"] = circuit_stats()
+    except Exception as e:
+        payload["circuits"] = {"error": str(e)}
+    try:
+        from orchestrator.hedge import hedge_stats
+        payload["hedge"] = hedge_stats()
+    except Exception as e:
+        payload["hedge"] = {"error": str(e)}
+    try:
+        from orchestrator.response_cache import get_response_cache
+        rc = get_response_cache()
+        payload["response_cache"] = rc.stats() if rc is not None else {"enabled": False}
+        from orchestrator.semantic_cache import get_semantic_cache
+        sc = get_semantic_cache()
+        payload["semantic_cache"] = sc.stats() if sc is not None else {"enabled": False}
+    except Exception as e:
+        payload["response_cache"] = {"error": str(e)}
+    journal = get_journal()
+    payload["journal"] = journal.stats() if journal is not None else {"enabled": False}
     payload["missing_required"] = missing_required()
     payload["missing_recommended"] = missing_recommended()
     return jsonify(payload), 200
@@ -310,13 +403,37 @@ def webhook():
     except Exception:
         pass
 
-    # ส่งต่อให้ handler หลัก (ภายในมี dedupe อีกชั้น)
+    # dedupe ข้าม worker → journal (group commit) → dispatcher  (ดู utils/ingest.py)
     try:
-        handle_message(data)
+        res = ingest_updates([data])
     except Exception as e:
-        log_err("Handler error", req_id=req_id, err=str(e), tb=traceback.format_exc())
+        log_err("Ingest error", req_id=req_id, err=str(e), tb=traceback.format_exc())
+        # ล้มหลัง dedupe ได้ → ถอน update_id ออก ไม่งั้น retry ของ Telegram จะถูกมองว่าซ้ำแล้วทิ้ง
+        if isinstance(data.get("update_id"), int):
+            try:
+                forget_update(data["update_id"])
+            except Exception:
+                pass
+        res = {"accepted": 0, "duplicates": 0, "shed": 0, "deferred": 0, "rejected": [data]}
+
+    if res["duplicates"]:
+        log_info("Duplicate update skipped", req_id=req_id, update_id=data.get("update_id"))
+        return jsonify({"status": "ok"}), 200
+
+    if res["shed"]:
+        # ผู้ใช้ได้รับข้อความ "ระบบยุ่ง" แล้ว → ack ปกติ ไม่ให้ Telegram retry
+        return jsonify({"status": "shed"}), 200
+
+    if res["deferred"]:
+        # กำลัง drain → journal แล้ว โปรเซสใหม่จะ replay ให้
+        return jsonify({"status": "deferred"}), 200
+
+    if res["rejected"]:
+        # คิวเต็ม → ให้ Telegram retry ภายหลัง แทนที่จะทิ้ง update เงียบ ๆ
+        log_warn("Dispatcher saturated — asking Telegram to retry", req_id=req_id)
+        return jsonify({"status": "busy"}), 503
 
-    # ตอบ Telegram ทันทีเพื่อกัน retry
+    # ตอบ Telegram ทันทีเพื่อกัน retry (งานจริงทำต่อใน worker)
     return jsonify({"status": "ok"}), 200
 
 
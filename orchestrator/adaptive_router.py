@@ -0,0 +1,253 @@
+# orchestrator/adaptive_router.py
+# -*- coding: utf-8 -*-
+"""
+Adaptive routing (ROUTER_MODE=adaptive): เลือก engine จากสถิติจริงแทนตารางกฎอย่างเดียว
+- เก็บ EWMA ต่อ (engine, intent): เวลาตอบของคำตอบที่ใช้ได้ (ms) + อัตราสำเร็จ (0..1)
+  * อัตราสำเร็จใช้ alpha/4 (ค่า 0/1 แกว่งแรง — ล้มครั้งเดียวไม่ควรทำให้ค่ายนั้นตกเกณฑ์)
+  * สตรีมเก็บแยกเป็น intent "<intent>/stream" และวัด time-to-first-token (คนละความหมายกับเวลารวม)
+- expected latency = ewma_ms / success (ล้มแล้วต้องไปเสียเวลากับอีกค่ายเพิ่ม)
+- choose(intent, rule_engine):
+  * intent ใน ADAPTIVE_PINNED_INTENTS (ดีฟอลต์ writing) → ใช้ตารางกฎเสมอ (ข้อจำกัดด้านคุณภาพ)
+  * สถิติยังน้อยกว่า ADAPTIVE_MIN_SAMPLES ฝั่งใดฝั่งหนึ่ง (cold) → ตารางกฎ
+  * engine ที่อัตราสำเร็จต่ำกว่า ADAPTIVE_MIN_SUCCESS หรือครบ ADAPTIVE_MIN_SAMPLES แล้วแต่ไม่เคยตอบสำเร็จเลย
+    = unhealthy (ไม่ใช่ cold) → ไม่ถูกเลือก ถ้าอีกตัวไม่ได้ unhealthy ด้วย (แม้อีกตัวยัง cold)
+  * สลับจากตารางกฎเฉพาะเมื่ออีกค่ายเร็วกว่าเกิน ADAPTIVE_SWITCH_MARGIN (กันสลับไปมา)
+  * สุ่มสำรวจ (ADAPTIVE_EXPLORE) ให้ค่ายที่ไม่ถูกเลือกยังมีสถิติสด/ออกจาก cold ได้
+- เก็บสถิติลง ADAPTIVE_STATS_FILE (JSON, เขียนแบบ atomic) ไม่ถี่กว่า save_interval + ตอน drain
+  (หลาย worker เขียนไฟล์เดียวกัน: ใครเขียนหลังสุดชนะ — สถิติเป็นค่าประมาณอยู่แล้ว)
+- snapshot() สำหรับ /diag; benchmarks/simulate_router.py ใช้คลาสนี้ replay log "[ORCH META]" เทียบนโยบาย
+"""
+
+from __future__ import annotations
+from typing import Any, Dict, Iterable, Optional, Tuple
+import json
+import os
+import random
+import threading
+import time
+
+ENGINES = ("gpt", "gemini")
+
+
+def _log(tag: str, **kw: Any) -> None:
+    extra = f" | {kw}" if kw else ""
+    print(f"[adaptive_router] {tag}{extra}", flush=True)
+
+
+class _Stat:
+    __slots__ = ("ms", "success", "n", "updated")
+
+    def __init__(self, ms: Optional[float] = None, success: float = 1.0, n: int = 0, updated: float = 0.0):
+        self.ms, self.success, self.n, self.updated = ms, success, n, updated
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "ms": round(self.ms, 1) if self.ms is not None else None,
+            "success": round(self.success, 4),
+            "n": self.n,
+            "updated": round(self.updated, 1),
+        }
+
+
+class AdaptiveRouter:
+    def __init__(
+        self,
+        *,
+        alpha: float = 0.2,
+        min_samples: int = 10,
+        min_success: float = 0.9,
+        switch_margin: float = 0.2,
+        explore: float = 0.05,
+        pinned_intents: Iterable[str] = ("writing",),
+        path: Optional[str] = None,
+        save_interval_sec: float = 60.0,
+        seed: Optional[int] = None,
+    ):
+        self._alpha = min(1.0, max(0.01, float(alpha)))
+        self._min_samples = max(1, int(min_samples))
+        self._min_success = float(min_success)
+        self._margin = max(0.0, float(switch_margin))
+        self._explore = max(0.0, float(explore))
+        self._pinned = frozenset(pinned_intents or ())
+        self._path = path or None
+        self._save_interval = float(save_interval_sec)
+        self._rnd = random.Random(seed)
+        self._stats: Dict[str, _Stat] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_save = time.time()
+        self._decisions: Dict[str, int] = {}
+        if self._path:
+            self.load()
+
+    @staticmethod
+    def _key(engine: str, intent: str) -> str:
+        return f"{engine}|{intent}"
+
+    # ---------- stats ----------
+    def observe(self, engine: str, intent: str, ms: Optional[float], ok: bool) -> None:
+        now = time.time()
+        with self._lock:
+            st = self._stats.get(self._key(engine, intent))
+            if st is None:
+                st = self._stats[self._key(engine, intent)] = _Stat()
+            first = st.n == 0
+            a = self._alpha
+            st.n += 1
+            st.updated = now
+            hit = 1.0 if ok else 0.0
+            st.success = hit if first else st.success + (a / 4.0) * (hit - st.success)
+            if ok and ms is not None:
+                st.ms = float(ms) if st.ms is None else st.ms + a * (float(ms) - st.ms)
+            self._dirty = True
+            due = self._path and now - self._last_save >= self._save_interval
+        if due:
+            self.save()
+
+    def expected_ms(self, engine: str, intent: str) -> Optional[float]:
+        """None = cold (ตัวอย่างไม่พอ หรือยังไม่เคยตอบสำเร็จ)"""
+        st = self._stats.get(self._key(engine, intent))
+        if st is None or st.n < self._min_samples or st.ms is None:
+            return None
+        return st.ms / max(st.success, 0.05)
+
+    def _health(self, engine: str, intent: str) -> Optional[bool]:
+        """None = cold (ตัวอย่างไม่พอ), False = ตัวอย่างพอแต่สำเร็จต่ำกว่าเกณฑ์/ไม่เคยสำเร็จ, True = ใช้ได้"""
+        st = self._stats.get(self._key(engine, intent))
+        if st is None or st.n < self._min_samples:
+            return None
+        return st.ms is not None and st.success >= self._min_success
+
+    # ---------- decision ----------
+    def choose(self, intent: str, rule_engine: str) -> Tuple[str, str]:
+        """คืน (engine, reason) — reason ขึ้นต้นด้วย adaptive:"""
+        other = "gemini" if rule_engine == "gpt" else "gpt"
+        base = intent.split("/", 1)[0]
+        if base in self._pinned:
+            return self._count(rule_engine, "pinned")
+        hr, ho = self._health(rule_engine, intent), self._health(other, intent)
+        if hr is not False and (hr is None or ho is None):
+            if ho is None and self._rnd.random() < self._explore:
+                return self._count(other, "explore_cold")
+            return self._count(rule_engine, "cold")
+
+        if hr is False:
+            pick, why = (other, "rule_unhealthy") if ho is not False else (rule_engine, "rule")
+        elif ho:
+            er, eo = self.expected_ms(rule_engine, intent), self.expected_ms(other, intent)
+            if eo < er * (1.0 - self._margin):
+                pick, why = other, f"faster({eo:.0f}<{er:.0f})"
+            else:
+                pick, why = rule_engine, "rule"
+        else:
+            pick, why = rule_engine, "rule"
+        if self._rnd.random() < self._explore:
+            return self._count("gemini" if pick == "gpt" else "gpt", "explore")
+        return self._count(pick, why)
+
+    def _count(self, engine: str, why: str) -> Tuple[str, str]:
+        label = why.split("(", 1)[0]
+        with self._lock:
+            self._decisions[label] = self._decisions.get(label, 0) + 1
+        return engine, f"adaptive:{why}"
+
+    # ---------- persistence ----------
+    def load(self) -> int:
+        try:
+            with open(self._path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except Exception as e:
+            _log("LOAD_ERROR", err=str(e))
+            return 0
+        loaded = 0
+        with self._lock:
+            for key, d in (data.get("stats") or {}).items():
+                try:
+                    self._stats[key] = _Stat(
+                        ms=None if d.get("ms") is None else float(d["ms"]),
+                        success=float(d.get("success", 1.0)),
+                        n=int(d.get("n", 0)),
+                        updated=float(d.get("updated", 0.0)),
+                    )
+                    loaded += 1
+                except Exception:
+                    continue
+        _log("LOADED", path=self._path, keys=loaded)
+        return loaded
+
+    def save(self) -> bool:
+        if not self._path:
+            return False
+        with self._lock:
+            if not self._dirty:
+                return True
+            data = {"version": 1, "saved_at": time.time(), "stats": {k: v.to_dict() for k, v in self._stats.items()}}
+            self._dirty = False
+            self._last_save = time.time()
+        try:
+            tmp = f"{self._path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self._path)
+            return True
+        except Exception as e:
+            _log("SAVE_ERROR", err=str(e))
+            with self._lock:
+                self._dirty = True
+            return False
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {k: v.to_dict() for k, v in sorted(self._stats.items())}
+            decisions = dict(self._decisions)
+        return {
+            "stats": stats,
+            "decisions": decisions,
+            "min_samples": self._min_samples,
+            "min_success": self._min_success,
+            "switch_margin": self._margin,
+            "explore": self._explore,
+            "pinned": sorted(self._pinned),
+            "path": self._path,
+        }
+
+
+# ---------- default instance ----------
+_DEFAULT: Optional[AdaptiveRouter] = None
+_DEFAULT_LOCK = threading.Lock()
+
+
+def get_adaptive_router() -> Optional[AdaptiveRouter]:
+    """คืน router หลัก (None ถ้า ROUTER_MODE ไม่ใช่ adaptive)"""
+    global _DEFAULT
+    from config import (
+        ROUTER_MODE,
+        ADAPTIVE_ALPHA,
+        ADAPTIVE_MIN_SAMPLES,
+        ADAPTIVE_MIN_SUCCESS,
+        ADAPTIVE_SWITCH_MARGIN,
+        ADAPTIVE_EXPLORE,
+        ADAPTIVE_PINNED_INTENTS,
+        ADAPTIVE_STATS_FILE,
+    )
+    if (ROUTER_MODE or "").strip().lower() != "adaptive":
+        return None
+    if _DEFAULT is not None:
+        return _DEFAULT
+    with _DEFAULT_LOCK:
+        if _DEFAULT is None:
+            _DEFAULT = AdaptiveRouter(
+                alpha=ADAPTIVE_ALPHA,
+                min_samples=ADAPTIVE_MIN_SAMPLES,
+                min_success=ADAPTIVE_MIN_SUCCESS,
+                switch_margin=ADAPTIVE_SWITCH_MARGIN,
+                explore=ADAPTIVE_EXPLORE,
+                pinned_intents=ADAPTIVE_PINNED_INTENTS,
+                path=ADAPTIVE_STATS_FILE,
+            )
+    return _DEFAULT
+
+
+__all__ = ["AdaptiveRouter", "get_adaptive_router", "ENGINES"]
@@ -0,0 +1,237 @@
+# orchestrator/circuit_breaker.py
+# -*- coding: utf-8 -*-
+"""
+Circuit breaker ต่อ provider (gpt / gemini) — ค่ายที่กำลังล่ม (429/timeout ถี่) ถูกข้ามทันทีแทนที่จะรอให้ล้มทุกข้อความ
+- closed: เรียกได้ปกติ; เก็บผลใน sliding window (CIRCUIT_WINDOW_SEC)
+  failure = exception, คำตอบใช้ไม่ได้ หรือช้ากว่า CIRCUIT_SLOW_MS
+  มีตัวอย่าง ≥ CIRCUIT_MIN_CALLS และ failure rate ≥ CIRCUIT_FAILURE_RATE → open
+- open: allow() = False จนครบ open_sec → half-open
+- half-open: ปล่อย trial ทีละ 1 คำขอ; สำเร็จติดกัน CIRCUIT_HALF_OPEN_TRIALS ครั้ง → closed (ล้าง window)
+  trial ล้ม → open ใหม่โดย open_sec เพิ่มเท่าตัว (สูงสุด CIRCUIT_MAX_OPEN_SEC)
+  trial ที่ไม่มีใครรายงานผลภายใน open_sec ถือว่าหลุด → ปล่อย trial ใหม่ได้
+  คำขอที่ไม่ได้เรียก provider จริง (เช่น BudgetExceeded) → cancel_trial() คืน trial ทันทีโดยไม่นับผล
+- health: 0..1 (1 - failure rate ใน window; half-open ลดครึ่ง; open = 0) สำหรับ /diag และ /readyz
+"""
+
+from __future__ import annotations
+from typing import Any, Dict, Optional
+from collections import deque
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def _log(tag: str, **kw: Any) -> None:
+    extra = f" | {kw}" if kw else ""
+    print(f"[circuit] {tag}{extra}", flush=True)
+
+
+class CircuitOpenError(RuntimeError):
+    """provider ถูกข้ามเพราะวงจรเปิดอยู่ (ไม่ได้เรียกจริง)"""
+
+    def __init__(self, name: str):
+        super().__init__(f"circuit_open:{name}")
+        self.name = name
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        *,
+        window_sec: float = 60.0,
+        min_calls: int = 5,
+        failure_rate: float = 0.5,
+        slow_ms: float = 30000.0,
+        open_sec: float = 30.0,
+        max_open_sec: float = 300.0,
+        half_open_trials: int = 2,
+    ):
+        self.name = name
+        self._window_sec = float(window_sec)
+        self._min_calls = max(1, int(min_calls))
+        self._failure_rate = float(failure_rate)
+        self._slow_ms = float(slow_ms)
+        self._base_open = float(open_sec)
+        self._max_open = max(float(open_sec), float(max_open_sec))
+        self._trials_needed = max(1, int(half_open_trials))
+
+        self._lock = threading.Lock()
+        self._events: "deque[tuple]" = deque(maxlen=2000)   # (ts, failed, slow, ms)
+        self._state = CLOSED
+        self._open_sec = self._base_open
+        self._opened_at = 0.0
+        self._trial_started = 0.0       # >0 = มี trial กำลังวิ่งอยู่ (half-open)
+        self._trial_ok = 0
+        self.trips = 0
+        self.rejected = 0
+
+    # ---------- internal (ถือ lock อยู่แล้ว) ----------
+    def _trim(self, now: float) -> None:
+        cutoff = now - self._window_sec
+        ev = self._events
+        while ev and ev[0][0] < cutoff:
+            ev.popleft()
+
+    def _rates(self) -> tuple:
+        n = len(self._events)
+        if not n:
+            return 0, 0.0, 0.0
+        failed = sum(1 for e in self._events if e[1])
+        slow = sum(1 for e in self._events if e[2])
+        return n, failed / n, slow / n
+
+    def _open(self, now: float, reason: str) -> None:
+        self._state = OPEN
+        self._opened_at = now
+        self._trial_started = 0.0
+        self._trial_ok = 0
+        self.trips += 1
+        _log("OPEN", name=self.name, reason=reason, open_sec=self._open_sec)
+
+    def _advance(self, now: float) -> None:
+        if self._state == OPEN and now - self._opened_at >= self._open_sec:
+            self._state = HALF_OPEN
+            self._trial_started = 0.0
+            self._trial_ok = 0
+            _log("HALF_OPEN", name=self.name)
+
+    # ---------- public API ----------
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._advance(time.time())
+            return self._state
+
+    def allow(self) -> bool:
+        """True = เรียก provider ได้ (half-open: จอง trial; ต้องตามด้วย record())"""
+        now = time.time()
+        with self._lock:
+            self._advance(now)
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and (
+                not self._trial_started or now - self._trial_started > self._open_sec
+            ):
+                self._trial_started = now
+                return True
+            self.rejected += 1
+            return False
+
+    def cancel_trial(self) -> None:
+        """คืน trial ที่ allow() จองไว้โดยไม่นับผล (คำขอไม่ได้ไปถึง provider เช่นโดน rate limiter ปฏิเสธ)"""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._trial_started = 0.0
+
+    def record(self, ok: bool, ms: Optional[float] = None) -> None:
+        now = time.time()
+        slow = ms is not None and ms >= self._slow_ms
+        failed = (not ok) or slow
+        with self._lock:
+            self._advance(now)
+            if self._state == HALF_OPEN:
+                self._trial_started = 0.0
+                if failed:
+                    self._open_sec = min(self._max_open, self._open_sec * 2)
+                    self._open(now, "trial_failed")
+                    return
+                self._trial_ok += 1
+                if self._trial_ok >= self._trials_needed:
+                    self._state = CLOSED
+                    self._open_sec = self._base_open
+                    self._events.clear()
+                    _log("CLOSED", name=self.name)
+                return
+            if self._state == OPEN:         # ผลของคำขอที่เริ่มก่อนวงจรเปิด — ไม่ต้องนับ
+                return
+            self._events.append((now, failed, slow, ms))
+            self._trim(now)
+            n, fail_rate, _slow_rate = self._rates()
+            if n >= self._min_calls and fail_rate >= self._failure_rate:
+                self._open(now, f"failure_rate={fail_rate:.2f}/{n}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            self._advance(now)
+            self._trim(now)
+            n, fail_rate, slow_rate = self._rates()
+            lat = [e[3] for e in self._events if e[3] is not None]
+            state = self._state
+            if state == OPEN:
+                health = 0.0
+            else:
+                health = (1.0 - fail_rate) * (0.5 if state == HALF_OPEN else 1.0)
+            return {
+                "state": state,
+                "health": round(health, 3),
+                "calls": n,
+                "failure_rate": round(fail_rate, 3),
+                "slow_rate": round(slow_rate, 3),
+                "avg_ms": round(sum(lat) / len(lat), 1) if lat else None,
+                "open_remaining_sec": round(max(0.0, self._opened_at + self._open_sec - now), 1) if state == OPEN else 0.0,
+                "open_sec": self._open_sec,
+                "trips": self.trips,
+                "rejected": self.rejected,
+            }
+
+
+# ---------- registry ----------
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+_LOCK = threading.Lock()
+
+
+def get_breaker(name: str) -> Optional[CircuitBreaker]:
+    """breaker ของ provider (None ถ้าปิดด้วย CIRCUIT_ENABLED=0)"""
+    from config import (
+        CIRCUIT_ENABLED,
+        CIRCUIT_WINDOW_SEC,
+        CIRCUIT_MIN_CALLS,
+        CIRCUIT_FAILURE_RATE,
+        CIRCUIT_SLOW_MS,
+        CIRCUIT_OPEN_SEC,
+        CIRCUIT_MAX_OPEN_SEC,
+        CIRCUIT_HALF_OPEN_TRIALS,
+    )
+    if not CIRCUIT_ENABLED:
+        return None
+    br = _BREAKERS.get(name)
+    if br is not None:
+        return br
+    with _LOCK:
+        br = _BREAKERS.get(name)
+        if br is None:
+            br = _BREAKERS[name] = CircuitBreaker(
+                name,
+                window_sec=CIRCUIT_WINDOW_SEC,
+                min_calls=CIRCUIT_MIN_CALLS,
+                failure_rate=CIRCUIT_FAILURE_RATE,
+                slow_ms=CIRCUIT_SLOW_MS,
+                open_sec=CIRCUIT_OPEN_SEC,
+                max_open_sec=CIRCUIT_MAX_OPEN_SEC,
+                half_open_trials=CIRCUIT_HALF_OPEN_TRIALS,
+            )
+    return br
+
+
+def circuit_stats() -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    for name in ("gpt", "gemini"):
+        br = get_breaker(name)
+        out[name] = br.snapshot() if br is not None else {"enabled": False}
+    return out
+
+
+__all__ = [
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "get_breaker",
+    "circuit_stats",
+    "CLOSED",
+    "OPEN",
+    "HALF_OPEN",
+]
@@ -0,0 +1,246 @@
+# orchestrator/facts.py
+# -*- coding: utf-8 -*-
+"""
+Fact augmentation สำหรับ intent แบบ lookup — ดึงข้อมูลจริงจาก utils/realtime_providers ใส่ prompt
+- detect_entities(): หา entity จากข้อความ (ทองคำ, น้ำมัน, คู่เงิน FX, คริปโต, หุ้น, อากาศ) ไม่เกิน FACTS_MAX_ENTITIES
+- fetch_facts(): ยิงทุก entity พร้อมกันบน thread pool ของโมดูล แล้วรอไม่เกิน FACTS_DEADLINE_MS
+  * เวลาที่เพิ่ม = min(provider ที่ช้าที่สุด, deadline) — ครบก่อนก็ไปต่อทันที
+  * เกิน deadline → ใช้เท่าที่ได้ (partial) ส่วนที่ค้างปล่อยให้วิ่งต่อจนจบ
+    (ผลเข้า TTL cache ของ realtime_providers → ข้อความถัดไปเร็วขึ้น)
+- facts_message(): ข้อมูลแบบมีโครงสร้าง (system message) + บอกชัดว่ารายการไหนไม่มีข้อมูล ให้โมเดลไม่เดาตัวเลข
+- import realtime_providers ตอนเรียกจริงเท่านั้น (ต้องใช้ requests)
+"""
+
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import re
+import threading
+import time
+
+Entity = Tuple[str, str, str]     # (kind, arg, label)
+
+
+def _log(tag: str, **kw: Any) -> None:
+    extra = f" | {kw}" if kw else ""
+    print(f"[facts] {tag}{extra}", flush=True)
+
+
+# ---------- entity detection ----------
+_GOLD = re.compile(r"ทอง|gold|xau", re.I)
+_OIL = re.compile(r"น้ำมัน|ดีเซล|เบนซิน|แก๊สโซฮอล์|โซฮอล์|\boil\b|diesel|gasohol", re.I)
+_WEATHER = re.compile(r"อากาศ|ฝนตก|อุณหภูมิ|weather|temperature", re.I)
+_FX_PAIR = re.compile(r"\b(USD|EUR|JPY|GBP|CNY|SGD|HKD|AUD|KRW|THB)\s*/?\s*(USD|EUR|JPY|GBP|CNY|SGD|HKD|AUD|KRW|THB)\b", re.I)
+_FX_HINT = re.compile(r"ค่าเงิน|เรท|อัตราแลกเปลี่ยน|แลกเงิน|แลกเปลี่ยน|exchange|\bfx\b", re.I)
+_FX_NAMES = {
+    "ดอลลาร์": "USD", "ดอลล่าร์": "USD", "ยูโร": "EUR", "เยน": "JPY", "ปอนด์": "GBP",
+    "หยวน": "CNY", "ดอลลาร์สิงคโปร์": "SGD", "วอน": "KRW",
+}
+# ยาวก่อนสั้น + finditer กินช่วงที่จับแล้ว → "ดอลลาร์สิงคโปร์" ได้ SGD อย่างเดียว (ไม่ได้ USD ด้วย)
+_FX_NAMES_RE = re.compile("|".join(re.escape(n) for n in sorted(_FX_NAMES, key=len, reverse=True)))
+_CRYPTO_NAMES = {"บิทคอยน์": "BTC", "บิตคอยน์": "BTC", "bitcoin": "BTC", "อีเธอเรียม": "ETH", "ethereum": "ETH",
+                 "โดชคอยน์": "DOGE", "dogecoin": "DOGE", "โซลานา": "SOL", "solana": "SOL"}
+_CRYPTO_SYMBOLS = ("BTC", "ETH", "BNB", "SOL", "XRP", "ADA", "DOGE", "TON", "TRX", "DOT", "LTC", "USDT", "USDC", "MATIC")
+_CRYPTO_SYM = re.compile(r"\b(" + "|".join(_CRYPTO_SYMBOLS) + r")\b")     # ตัวพิมพ์ใหญ่เท่านั้น (กันคำอังกฤษทั่วไป)
+_CRYPTO_LOWER = re.compile(r"\b(btc|eth)\b")
+# ticker = ตัวพิมพ์ใหญ่ (หรือ .BK) เท่านั้น — "stock market"/"stock price" ไม่ใช่หุ้นชื่อ MARKET/PRICE
+_STOCK = re.compile(r"(?:หุ้น|(?i:stocks?))\s*([A-Z][A-Z0-9]{0,5}(?:\.BK)?)(?![A-Za-z0-9])")
+_STOCK_STOPWORDS = {"MARKET", "PRICE", "PRICES", "INDEX", "TODAY", "NEWS", "SET", "THE", "OF", "IN", "FOR", "AND", "IS"}
+_STOCK_CASHTAG = re.compile(r"\$([A-Z]{1,5})\b")
+_CITIES = {
+    "กรุงเทพ": "Bangkok", "กทม": "Bangkok", "bangkok": "Bangkok", "เชียงใหม่": "Chiang Mai", "chiang mai": "Chiang Mai",
+    "ภูเก็ต": "Phuket", "phuket": "Phuket", "ขอนแก่น": "Khon Kaen", "หาดใหญ่": "Hat Yai", "พัทยา": "Pattaya",
+    "ชลบุรี": "Chon Buri", "นครราชสีมา": "Nakhon Ratchasima", "โคราช": "Nakhon Ratchasima", "อุดรธานี": "Udon Thani",
+    "เชียงราย": "Chiang Rai", "หัวหิน": "Hua Hin", "สุราษฎร์ธานี": "Surat Thani",
+}
+
+
+def detect_entities(text: str, max_entities: int = 4) -> List[Entity]:
+    """entity ที่ดึงข้อมูลจริงได้ เรียงตามที่พบ (ไม่ซ้ำ) ไม่เกิน max_entities"""
+    t = text or ""
+    low = t.lower()
+    out: List[Entity] = []
+
+    def add(kind: str, arg: str, label: str) -> None:
+        if (kind, arg) not in {(k, a) for k, a, _ in out}:
+            out.append((kind, arg, label))
+
+    if _GOLD.search(t):
+        add("gold", "", "ราคาทองคำ (spot)")
+    if _OIL.search(t):
+        add("oil", "", "ราคาน้ำมันในประเทศ")
+    for m in _FX_PAIR.finditer(t):
+        base, quote = m.group(1).upper(), m.group(2).upper()
+        if base != quote:
+            add("fx", f"{base}/{quote}", f"อัตราแลกเปลี่ยน {base}/{quote}")
+    for m in _FX_NAMES_RE.finditer(t):
+        code = _FX_NAMES[m.group(0)]
+        add("fx", f"{code}/THB", f"อัตราแลกเปลี่ยน {code}/THB")
+    if _FX_HINT.search(t) and not any(k == "fx" for k, _, _ in out):
+        add("fx", "USD/THB", "อัตราแลกเปลี่ยน USD/THB")
+    for name, sym in _CRYPTO_NAMES.items():
+        if name in low:
+            add("crypto", sym, f"ราคา {sym}")
+    for m in list(_CRYPTO_SYM.finditer(t)) + list(_CRYPTO_LOWER.finditer(t)):
+        sym = m.group(1).upper()
+        add("crypto", sym, f"ราคา {sym}")
+    crypto_syms = {a for k, a, _ in out if k == "crypto"}
+    for m in list(_STOCK.finditer(t)) + list(_STOCK_CASHTAG.finditer(t)):
+        sym = m.group(1).upper()
+        if sym not in crypto_syms and sym not in _STOCK_STOPWORDS:
+            add("stock", sym, f"ราคาหุ้น {sym}")
+    if _WEATHER.search(t):
+        for name, city in _CITIES.items():
+            if name in low:
+                add("weather", city, f"สภาพอากาศ {city}")
+                break
+    return out[: max(0, int(max_entities))]
+
+
+# ---------- fetch ----------
+def _fetcher(kind: str) -> Callable[[str], Dict[str, Any]]:
+    from utils import realtime_providers as rp
+    if kind == "gold":
+        return lambda _arg: rp.get_gold_price_spot()
+    if kind == "oil":
+        return lambda _arg: rp.get_oil_price_th()
+    if kind == "fx":
+        return lambda arg: rp.get_fx_rate(*arg.split("/", 1))
+    if kind == "crypto":
+        return lambda arg: rp.get_crypto_price(arg, vs="USD")
+    if kind == "stock":
+        return rp.get_stock_quote
+    if kind == "weather":
+        return lambda arg: rp.get_weather(q=arg)
+    raise ValueError(f"unknown fact kind: {kind}")
+
+
+_POOL: Optional[ThreadPoolExecutor] = None
+_POOL_LOCK = threading.Lock()
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                from config import FACTS_WORKERS
+                _POOL = ThreadPoolExecutor(max_workers=FACTS_WORKERS, thread_name_prefix="orch-facts")
+    return _POOL
+
+
+def _run(kind: str, arg: str) -> Tuple[Dict[str, Any], float]:
+    t0 = time.time()
+    try:
+        res = _fetcher(kind)(arg)
+    except Exception as e:
+        res = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+    return res, (time.time() - t0) * 1000
+
+
+def fetch_facts(entities: List[Entity], deadline_ms: float) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    ดึงทุก entity พร้อมกัน รอไม่เกิน deadline_ms
+    คืน (facts [{kind, arg, label, ok, data|error, ms}], info {ok, failed, timeout, ms})
+    """
+    t0 = time.time()
+    if not entities:
+        return [], {"ok": 0, "failed": 0, "timeout": 0, "ms": 0}
+    pool = _pool()
+    futs = {pool.submit(_run, kind, arg): (kind, arg, label) for kind, arg, label in entities}
+    done, _pending = wait(futs, timeout=max(0.0, deadline_ms) / 1000.0)
+    facts: List[Dict[str, Any]] = []
+    n_ok = n_failed = n_timeout = 0
+    for fut, (kind, arg, label) in futs.items():      # คงลำดับตามที่พบในข้อความ
+        row: Dict[str, Any] = {"kind": kind, "arg": arg, "label": label}
+        if fut not in done:
+            row.update(ok=False, error="timeout")
+            n_timeout += 1
+        else:
+            res, ms = fut.result()
+            row["ms"] = int(ms)
+            if res.get("ok") and _has_value(kind, res):
+                row.update(ok=True, data=res)
+                n_ok += 1
+            else:
+                row.update(ok=False, error=res.get("error") or "no_data")
+                n_failed += 1
+        facts.append(row)
+    return facts, {"ok": n_ok, "failed": n_failed, "timeout": n_timeout, "ms": int((time.time() - t0) * 1000)}
+
+
+def _has_value(kind: str, res: Dict[str, Any]) -> bool:
+    if kind == "oil":
+        return bool(res.get("items"))
+    if kind == "fx":
+        return res.get("rate") is not None
+    if kind == "weather":
+        return res.get("temp") is not None
+    return res.get("price") is not None
+
+
+# ---------- format ----------
+def _num(v: Any, digits: int = 2) -> str:
+    try:
+        return f"{float(v):,.{digits}f}"
+    except (TypeError, ValueError):
+        return "-"
+
+
+def _line(f: Dict[str, Any]) -> str:
+    d, kind = f["data"], f["kind"]
+    src = d.get("source") or "-"
+    if kind == "gold":
+        return f"- {f['label']}: {_num(d.get('price'))} {d.get('currency') or 'USD'}/ออนซ์ [{src}]"
+    if kind == "oil":
+        items = "; ".join(f"{it.get('name')} {_num(it.get('price'))} {it.get('unit') or 'THB/L'}" for it in d.get("items") or [])
+        return f"- {f['label']}: {items} [{src}]"
+    if kind == "fx":
+        return f"- {f['label']}: 1 {d.get('base')} = {_num(d.get('rate'), 4)} {d.get('quote')} [{src}]"
+    if kind == "crypto":
+        chg = d.get("change_24h")
+        tail = f" (24 ชม. {chg:+.2f}%)" if isinstance(chg, (int, float)) else ""
+        return f"- {f['label']}: {_num(d.get('price'))} {d.get('vs') or 'USD'}{tail} [{src}]"
+    if kind == "stock":
+        return (f"- {f['label']}: {_num(d.get('price'))} (เปิด {_num(d.get('open'))}, สูง {_num(d.get('high'))}, "
+                f"ต่ำ {_num(d.get('low'))}) [{src}]")
+    if kind == "weather":
+        return (f"- {f['label']}: {_num(d.get('temp'), 1)}°C รู้สึกเหมือน {_num(d.get('feels_like'), 1)}°C, "
+                f"{d.get('desc') or '-'}, ความชื้น {_num(d.get('humidity'), 0)}%, ลม {_num(d.get('wind_kmh'), 1)} กม./ชม. [{src}]")
+    return f"- {f['label']}: {d}"
+
+
+def facts_message(facts: List[Dict[str, Any]]) -> str:
+    """system message ข้อมูลจริง ('' ถ้าไม่มี entity)"""
+    if not facts:
+        return ""
+    stamp = time.strftime("%Y-%m-%d %H:%M", time.localtime())
+    lines = [f"ข้อมูลจริงล่าสุด (ดึงเมื่อ {stamp}) — ใช้ตัวเลขจากรายการนี้เท่านั้น:"]
+    lines.extend(_line(f) for f in facts if f.get("ok"))
+    missing = [f["label"] for f in facts if not f.get("ok")]
+    if missing:
+        lines.append("ไม่มีข้อมูลตอนนี้ (ห้ามเดาตัวเลข ให้บอกผู้ใช้ตรง ๆ): " + ", ".join(missing))
+    return "\n".join(lines)
+
+
+def gather_facts(text: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    ใช้ใน orchestrator: คืน (system message, meta) — ('', None) เมื่อปิด FACTS_ENABLED หรือไม่พบ entity
+    meta: entities, ok, failed, timeout, ms
+    """
+    from config import FACTS_ENABLED, FACTS_DEADLINE_MS, FACTS_MAX_ENTITIES
+    if not FACTS_ENABLED:
+        return "", None
+    entities = detect_entities(text, FACTS_MAX_ENTITIES)
+    if not entities:
+        return "", None
+    try:
+        facts, info = fetch_facts(entities, FACTS_DEADLINE_MS)
+    except Exception as e:
+        _log("FETCH_ERROR", err=str(e))
+        return "", {"entities": [f"{k}:{a}" if a else k for k, a, _ in entities], "error": str(e)}
+    info["entities"] = [f"{k}:{a}" if a else k for k, a, _ in entities]
+    return facts_message(facts), info
+
+
+__all__ = ["detect_entities", "fetch_facts", "facts_message", "gather_facts"]
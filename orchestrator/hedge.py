@@ -0,0 +1,201 @@
+# orchestrator/hedge.py
+# -*- coding: utf-8 -*-
+"""
+Hedged requests ระหว่าง GPT/Gemini (เปิดด้วย HEDGE_ENABLED=1)
+- LatencyTracker: เก็บเวลาตอบ "ที่ใช้ได้" ล่าสุดต่อ engine (rolling window) → threshold = percentile (ดีฟอลต์ p90)
+  จำกัดอยู่ในช่วง [HEDGE_MIN_MS, HEDGE_MAX_MS]; ถ้าตัวอย่างยังน้อยกว่า HEDGE_MIN_SAMPLES ใช้ HEDGE_MAX_MS
+- hedged_call(): ยิง primary ก่อน ถ้าเกิน threshold ยังไม่ตอบ → ยิง fallback ขนานกัน
+  คำตอบแรกที่ผ่าน accept() ชนะ; ตัวที่แพ้ถูก cancel (ถ้ายังไม่เริ่ม) หรือปล่อยให้จบแล้วทิ้งผล
+  ถ้า primary จบก่อน threshold แต่ใช้ไม่ได้ → ยิง fallback ทันที (เหมือน fallback แบบเดิม)
+- สถิติรวม (hedge rate / win rate / ต้นทุนส่วนเกิน) ผ่าน hedge_stats() สำหรับ /diag
+"""
+
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+import threading
+import time
+
+
+def _log(tag: str, **kw: Any) -> None:
+    extra = f" | {kw}" if kw else ""
+    print(f"[hedge] {tag}{extra}", flush=True)
+
+
+class LatencyTracker:
+    """rolling window ของเวลาตอบ (ms) ต่อ engine"""
+
+    def __init__(self, window: int = 200):
+        self._window = max(10, int(window))
+        self._samples: Dict[str, "deque[float]"] = {}
+        self._lock = threading.Lock()
+
+    def record(self, engine: str, ms: float) -> None:
+        with self._lock:
+            dq = self._samples.get(engine)
+            if dq is None:
+                dq = self._samples[engine] = deque(maxlen=self._window)
+            dq.append(float(ms))
+
+    def percentile(self, engine: str, pct: float) -> Tuple[Optional[float], int]:
+        with self._lock:
+            vals = sorted(self._samples.get(engine) or ())
+        if not vals:
+            return None, 0
+        idx = min(len(vals) - 1, max(0, int(round(pct * (len(vals) - 1)))))
+        return vals[idx], len(vals)
+
+    def threshold_ms(self, engine: str, *, pct: float, min_ms: float, max_ms: float, min_samples: int) -> float:
+        value, n = self.percentile(engine, pct)
+        if value is None or n < min_samples:
+            return float(max_ms)
+        return float(min(max_ms, max(min_ms, value)))
+
+
+class _Stats:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0          # fallback ที่ยิงแบบ hedge ชนะ primary
+        self.extra_calls = 0         # การเรียกที่ผลถูกทิ้ง (ต้นทุนส่วนเกิน)
+        self.extra_ms = 0.0
+        self.cancelled = 0
+
+    def add(self, **kw: float) -> None:
+        with self._lock:
+            for k, v in kw.items():
+                setattr(self, k, getattr(self, k) + v)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "hedged": self.hedged,
+                "hedge_rate": round(self.hedged / self.calls, 4) if self.calls else 0.0,
+                "hedge_wins": self.hedge_wins,
+                "win_rate": round(self.hedge_wins / self.hedged, 4) if self.hedged else 0.0,
+                "extra_calls": self.extra_calls,
+                "extra_ms": round(self.extra_ms, 1),
+                "cancelled": self.cancelled,
+            }
+
+
+TRACKER = LatencyTracker()
+_STATS = _Stats()
+_POOL: Optional[ThreadPoolExecutor] = None
+_POOL_LOCK = threading.Lock()
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                from config import PROVIDER_POOL_SIZE
+                # แต่ละคำขอใช้ได้สูงสุด 2 เธรด (primary + hedge)
+                _POOL = ThreadPoolExecutor(max_workers=PROVIDER_POOL_SIZE * 2, thread_name_prefix="orch-hedge")
+    return _POOL
+
+
+def _timed(fn: Callable[[], str]) -> Tuple[str, float]:
+    t0 = time.time()
+    out = fn()
+    return out, (time.time() - t0) * 1000.0
+
+
+def hedged_call(
+    calls: Dict[str, Callable[[], str]],
+    primary: str,
+    fallback: str,
+    accept: Callable[[str], bool],
+    threshold_ms: float,
+    meta: Dict[str, Any],
+) -> Optional[Tuple[str, str]]:
+    """
+    คืน (engine ที่ชนะ, ข้อความ) หรือ None ถ้าทั้งสองใช้ไม่ได้
+    เติม meta: durations_ms[primary/fallback], primary_error/fallback_error,
+              hedge{threshold_ms, launched, launched_after_ms, winner, extra_calls}
+    (รวม meta หลายรายการ → hedge rate = launched, win rate = winner=="fallback" ในกลุ่มที่ launched)
+    """
+    pool = _pool()
+    role = {primary: "primary", fallback: "fallback"}
+    hedge: Dict[str, Any] = {"threshold_ms": int(threshold_ms), "launched": False, "winner": None}
+    meta["hedge"] = hedge
+    _STATS.add(calls=1)
+
+    futs: Dict[Future, str] = {pool.submit(_timed, calls[primary]): primary}
+    pending = set(futs)
+    started = time.time()
+
+    def _launch_fallback(hedged: bool) -> None:
+        f = pool.submit(_timed, calls[fallback])
+        futs[f] = fallback
+        pending.add(f)
+        if hedged:
+            hedge["launched"] = True
+            hedge["launched_after_ms"] = int((time.time() - started) * 1000)
+            _STATS.add(hedged=1)
+
+    done, _ = wait(pending, timeout=threshold_ms / 1000.0)
+    if not done:
+        _launch_fallback(hedged=True)
+
+    winner: Optional[Tuple[str, str]] = None
+    while pending and winner is None:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for f in done:
+            pending.discard(f)
+            engine = futs[f]
+            try:
+                out, ms = f.result()
+            except Exception as e:
+                meta[f"{role[engine]}_error"] = str(e)
+                out, ms = "", None
+            if ms is not None:
+                meta["durations_ms"][role[engine]] = int(ms)
+            if out and accept(out):
+                TRACKER.record(engine, ms)
+                if winner is None:
+                    winner = (engine, out)
+                else:                       # จบพร้อมกันทั้งคู่ → ตัวที่ไม่ได้ใช้คือต้นทุนส่วนเกิน
+                    hedge["extra_calls"] = hedge.get("extra_calls", 0) + 1
+                    _STATS.add(extra_calls=1, extra_ms=ms)
+                continue
+            if ms is not None:
+                meta[f"{role[engine]}_empty_or_config"] = True
+            if engine == primary and fallback not in futs.values():
+                _launch_fallback(hedged=False)
+
+    if winner is not None:
+        hedge["winner"] = role[winner[0]]
+        if hedge["launched"] and winner[0] == fallback:
+            _STATS.add(hedge_wins=1)
+        for f in pending:                   # ตัวที่แพ้: ยกเลิกถ้ายังไม่เริ่ม ไม่งั้นรอจบแล้วนับเป็นต้นทุนส่วนเกิน
+            if f.cancel():
+                _STATS.add(cancelled=1)
+                continue
+            hedge["loser_ignored"] = role[futs[f]]
+            hedge["extra_calls"] = hedge.get("extra_calls", 0) + 1
+
+            def _count(fut: Future) -> None:
+                try:
+                    _out, ms = fut.result()
+                    _STATS.add(extra_calls=1, extra_ms=ms)
+                except Exception:
+                    _STATS.add(extra_calls=1)
+            f.add_done_callback(_count)
+    return winner
+
+
+def hedge_stats() -> Dict[str, Any]:
+    out = _STATS.snapshot()
+    for engine in ("gpt", "gemini"):
+        p90, n = TRACKER.percentile(engine, 0.90)
+        out[f"{engine}_p90_ms"] = round(p90, 1) if p90 is not None else None
+        out[f"{engine}_samples"] = n
+    return out
+
+
+__all__ = ["LatencyTracker", "TRACKER", "hedged_call", "hedge_stats"]
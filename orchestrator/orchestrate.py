@@ -3,14 +3,27 @@
 """
 Shiba Orchestrator
 - เลือกใช้ GPT หรือ Gemini ตาม "intent" ของคำถาม (reasoning vs lookup)
-- เคารพโหมดบังคับจาก ENV: ROUTER_MODE = hybrid|gpt|gemini
+- เคารพโหมดบังคับจาก ENV: ROUTER_MODE = hybrid|gpt|gemini|adaptive
+  (adaptive: เลือกจาก EWMA เวลาตอบ/อัตราสำเร็จจริงต่อ engine×intent; สถิติยังน้อย → ตารางกฎแบบ hybrid)
 - มี fallback อัตโนมัติข้ามค่ายเมื่อเกิดข้อผิดพลาด/ผลลัพธ์ว่าง
+- response cache: คำถามเดิม (normalize แล้ว) + บริบทเดิม + route/model เดิม → ตอบจาก cache (TTL ตาม intent)
+  + semantic cache (MinHash/LSH) สำหรับคำถามแนว lookup ที่พิมพ์ต่างแต่ความหมายเดียวกัน
+- singleflight: คำขอที่ key เดียวกับ response cache มาพร้อมกัน (เช่น ทุกคนถามเรื่องประกาศเดียวกัน)
+  → เรียก provider ครั้งเดียว คนที่ตามมารอผลเดียวกัน (เกิน SINGLEFLIGHT_TIMEOUT_MS → เรียกเอง)
+- lookup: ดึง facts จริง (ทอง/น้ำมัน/FX/คริปโต/หุ้น/อากาศ) จาก utils/realtime_providers ขนานกัน
+  ภายใน FACTS_DEADLINE_MS แล้วใส่เป็น system message (orchestrator/facts.py; ได้บางส่วนก็ใช้)
+- บริบทจัดตามงบ token ต่อโมเดล (utils.token_budget): system + สรุปบทสนทนา + ข้อความล่าสุดเท่าที่พอดีงบ
+- orchestrate_stream(): สตรีมคำตอบทีละส่วน (ใช้กับ utils.stream_reply เมื่อเปิด STREAM_REPLIES)
+- circuit breaker ต่อ provider: ค่ายที่ error/ช้าถี่ถูกข้ามทันที (ไปอีกค่ายเลย) จนกว่าจะกลับมาดี
+- rate limit ฝั่ง client (providers/rate_limit.py): ค่ายที่โควตา RPM/TPM จะเกินภายใน RATE_LIMIT_MAX_WAIT_MS
+  → BudgetExceeded ทันที แล้วไปอีกค่าย (ไม่นับเป็น failure ของ breaker/adaptive router)
+- (ออปชัน HEDGE_ENABLED=1) hedged request: primary ช้ากว่า p90 ของตัวเอง → ยิง fallback ขนาน ใครตอบได้ก่อนชนะ
 - ไม่ทำให้แอปล่มถ้ายังไม่มีคีย์ฝั่งใดฝั่งหนึ่ง (orchestrate จะ fallback ให้เอง)
 - ปลอดภัย: ตัด prefix แนว "รับทราบ:/คุณถามว่า:" ออก และจำกัดความยาวผลลัพธ์
 """
 
 from __future__ import annotations
-from typing import List, Dict, Any, Tuple
+from typing import Callable, Iterator, List, Dict, Any, Tuple
 import re
 import time
 
@@ -19,11 +32,31 @@ from config import (
     ROUTER_MIN_CONFIDENCE,
     OPENAI_MODEL_DIALOGUE,
     GEMINI_MODEL_DIALOGUE,
+    HEDGE_ENABLED,
+    HEDGE_PERCENTILE,
+    HEDGE_MIN_MS,
+    HEDGE_MAX_MS,
+    HEDGE_MIN_SAMPLES,
+    RESPONSE_CACHE_TTL_LOOKUP,
+    SEMANTIC_CACHE_INTENTS,
+    SINGLEFLIGHT_ENABLED,
+    SINGLEFLIGHT_TIMEOUT_MS,
+    CONTEXT_BUDGET_ENABLED,
+    CONTEXT_SUMMARY_SHARE,
 )
 
 # providers (ต้องมีตามที่เราวางไว้)
-from providers.openai_client import call_gpt
-from providers.gemini_client import call_gemini
+from providers.openai_client import call_gpt, stream_gpt
+from providers.gemini_client import call_gemini, stream_gemini
+from orchestrator.adaptive_router import get_adaptive_router
+from orchestrator.circuit_breaker import CircuitOpenError, get_breaker
+from orchestrator.facts import detect_entities, gather_facts
+from orchestrator.hedge import TRACKER, hedged_call
+from orchestrator.response_cache import get_response_cache, context_fingerprint, make_key
+from orchestrator.semantic_cache import get_semantic_cache
+from providers.rate_limit import BudgetExceeded
+from utils.singleflight import FlightTimeout, get_group
+from utils.token_budget import pack_messages
 
 # --- optional postprocess (ถ้าไม่มีไฟล์นี้ ก็ใช้ noop) ---
 try:
@@ -78,7 +111,7 @@ def _classify_intent(text: str) -> Tuple[str, float, str]:
     # คำถามเชิงเหตุผลทั่วไป
     return ("reasoning", 0.62, "default_reasoning")
 
-def _route_engine(text: str) -> Dict[str, Any]:
+def _route_engine(text: str, stream: bool = False) -> Dict[str, Any]:
     """
     ตัดสินใจเลือก engine ตาม intent/โหมด
     """
@@ -91,14 +124,18 @@ def _route_engine(text: str) -> Dict[str, Any]:
     if mode == "gemini":
         return {"engine": "gemini", "intent": intent, "confidence": max(conf, 0.99), "reason": f"forced:gemini/{why}"}
 
-    # hybrid:
-    if intent == "lookup":
-        return {"engine": "gemini", "intent": intent, "confidence": conf, "reason": why}
-    # งานเขียน/ภาษา → GPT เด่น
-    if intent == "writing":
-        return {"engine": "gpt", "intent": intent, "confidence": conf, "reason": why}
-    # เหตุผลทั่วไปให้ GPT นำ
-    return {"engine": "gpt", "intent": intent, "confidence": conf, "reason": why}
+    # hybrid (ตารางกฎ): lookup → Gemini, งานเขียน/ภาษา → GPT เด่น, เหตุผลทั่วไปให้ GPT นำ
+    rule = "gemini" if intent == "lookup" else "gpt"
+
+    if mode == "adaptive":
+        router = get_adaptive_router()
+        if router is not None:
+            engine, how = router.choose(f"{intent}/stream" if stream else intent, rule)
+            return {
+                "engine": engine, "intent": intent, "confidence": conf, "reason": f"{why}|{how}",
+                "adaptive": how not in ("adaptive:cold", "adaptive:pinned"),
+            }
+    return {"engine": rule, "intent": intent, "confidence": conf, "reason": why}
 
 # ---------- utility ----------
 _VALID_ROLES = {"user", "assistant", "system"}
@@ -114,6 +151,47 @@ def _normalize_context(ctx: List[Dict[str, str]] | None) -> List[Dict[str, str]]
             out.append({"role": r, "content": c})
     return out
 
+def _build_messages(
+    text: str, context: List[Dict[str, str]] | None, summary: str, primary: str, meta: Dict[str, Any]
+) -> Dict[str, List[Dict[str, str]]]:
+    """
+    messages ต่อ engine: จัดตามงบ token ของโมเดลนั้น (CONTEXT_BUDGET_ENABLED)
+    หรือแบบเดิม (system + บริบททั้งหมด + ข้อความปัจจุบัน) ถ้าปิด
+    """
+    if not CONTEXT_BUDGET_ENABLED:
+        msgs = _normalize_context(context)
+        msgs.append({"role": "user", "content": text})
+        return {"gpt": msgs, "gemini": msgs}
+    history = []
+    for m in context or []:
+        r = (m.get("role") or "").strip().lower()
+        c = (m.get("content") or "").strip()
+        if r in _VALID_ROLES and c:
+            history.append({"role": r, "content": c, "message_id": m.get("message_id")})
+    out: Dict[str, List[Dict[str, str]]] = {}
+    tokens: Dict[str, int] = {}
+    for engine, model in meta["model_candidates"].items():
+        out[engine], info = pack_messages(
+            _SYSTEM_PROMPT, history, text, model=model, summary=summary, summary_share=CONTEXT_SUMMARY_SHARE,
+        )
+        tokens[engine] = info["tokens"]
+        if engine == primary:
+            meta["context"] = {k: info[k] for k in ("budget", "turns", "dropped", "summary_tokens", "counter")}
+    meta["context"]["tokens"] = tokens
+    return out
+
+def _add_facts(text: str, msgs: Dict[str, List[Dict[str, str]]], meta: Dict[str, Any]) -> Dict[str, List[Dict[str, str]]]:
+    """lookup: แทรก facts จริงต่อจาก system prompt ของทุก engine (เรียกหลัง cache miss เท่านั้น)"""
+    if meta["intent"] != "lookup":
+        return msgs
+    block, info = gather_facts(text)
+    if info is not None:
+        meta["facts"] = info
+    if not block:
+        return msgs
+    fact_msg = {"role": "system", "content": block}
+    return {engine: m[:1] + [fact_msg] + m[1:] for engine, m in msgs.items()}
+
 def _looks_like_config_error(s: str) -> bool:
     if not s:
         return True
@@ -135,19 +213,159 @@ def _ok(text: str) -> bool:
         return False
     return True
 
+_APOLOGY = (
+    "ขออภัยครับ ผมเจอปัญหาระหว่างประมวลผลคำขอนี้ "
+    "รบกวนลองใหม่อีกครั้ง หรือระบุรายละเอียดเพิ่มเติมได้ไหมครับ"
+)
+
+# ---------- circuit breaker ----------
+def _guarded(engine: str, fn: Callable[[], str], meta: Dict[str, Any]) -> Callable[[], str]:
+    """
+    ห่อการเรียก provider: วงจรเปิด → CircuitOpenError ทันที (ไม่เรียกจริง)
+    ไม่งั้นรายงานผล/เวลาให้ breaker และ adaptive router (ถ้าเปิด)
+    เกินโควตา (BudgetExceeded) → บันทึก meta["rate_limited"] แล้วส่งต่อ; ไม่รายงานผล (provider ไม่ได้ป่วย)
+    และคืน trial ของ half-open (cancel_trial)
+    """
+    def run() -> str:
+        br = get_breaker(engine)
+        if br is not None and not br.allow():
+            meta.setdefault("circuit_skipped", []).append(engine)
+            raise CircuitOpenError(engine)
+        t0 = time.time()
+        ok = False
+        limited = False
+        try:
+            out = fn()
+            ok = _ok(out)
+            return out
+        except BudgetExceeded as e:
+            limited = True
+            meta.setdefault("rate_limited", []).append(f"{engine}:{e.reason}")
+            if br is not None:
+                br.cancel_trial()       # ไม่ได้เรียก provider → ไม่ค้าง trial ของ half-open ไว้ทั้ง open_sec
+            raise
+        finally:
+            if not limited:
+                _report(engine, meta["intent"], br, ok, (time.time() - t0) * 1000)
+    return run
+
+
+def _report(engine: str, intent: str, br: Any, ok: bool, ms: float) -> None:
+    if br is not None:
+        br.record(ok, ms)
+    router = get_adaptive_router()
+    if router is not None:
+        router.observe(engine, intent, ms, ok)
+
+
+def _guarded_stream(engine: str, msgs: List[Dict[str, str]], meta: Dict[str, Any]) -> Iterator[str]:
+    """เหมือน _guarded สำหรับสตรีม; เวลาที่รายงานคือ time-to-first-token (คำตอบยาวไม่ได้แปลว่า provider ป่วย)"""
+    br = get_breaker(engine)
+    if br is not None and not br.allow():
+        meta.setdefault("circuit_skipped", []).append(engine)
+        raise CircuitOpenError(engine)
+    t0 = time.time()
+    ttft = None
+    limited = False
+    parts: List[str] = []
+    try:
+        for delta in (stream_gemini if engine == "gemini" else stream_gpt)(msgs):
+            if ttft is None:
+                ttft = (time.time() - t0) * 1000
+            parts.append(delta)
+            yield delta
+    except BudgetExceeded as e:
+        limited = True
+        meta.setdefault("rate_limited", []).append(f"{engine}:{e.reason}")
+        if br is not None:
+            br.cancel_trial()
+        raise
+    finally:
+        if not limited:
+            ms = ttft if ttft is not None else (time.time() - t0) * 1000
+            _report(engine, f"{meta['intent']}/stream", br, _ok("".join(parts).strip()), ms)
+
+
+# ---------- response cache (exact + semantic) ----------
+def _cache_context(
+    text: str, msgs: Dict[str, List[Dict[str, str]]], primary: str, meta: Dict[str, Any], user_id: int | None
+) -> str:
+    """
+    ส่วนของ key ที่แทน "บริบทที่เกี่ยวข้อง"
+    - lookup ที่ระบุ entity ชัด (facts.detect_entities เช่น ทอง, USD/THB, หุ้น PTT) → entity ที่ normalize แล้ว
+      (คำตอบไม่ขึ้นกับบทสนทนา ใช้ร่วมข้ามผู้ใช้ได้)
+    - อื่น ๆ → user id + hash ของ prompt ทั้งชุดที่ส่งให้ primary (system + สรุปบทสนทนา + ประวัติ + ข้อความ)
+      เช่น "สรุปที่เราคุยกัน"/"ฉันชื่ออะไร" ของสองคนที่ประวัติต่างกันต้องไม่ได้คำตอบของกันและกัน
+    """
+    if meta["intent"] == "lookup":
+        ents = detect_entities(text)
+        if ents:
+            return "e:" + ",".join(sorted({f"{kind}={arg}" for kind, arg, _ in ents}))
+    return f"u:{user_id if user_id is not None else '-'}:{context_fingerprint(msgs.get(primary))}"
+
+
+def _cache_lookup(
+    text: str, msgs: Dict[str, List[Dict[str, str]]], primary: str, meta: Dict[str, Any], user_id: int | None
+) -> Tuple[Dict[str, Any], Dict[str, Any] | None]:
+    """
+    คืน (state สำหรับ _cache_store, ผลลัพธ์ถ้า hit)
+    - exact: key = ข้อความ + _cache_context (entity ของ lookup หรือผู้ใช้ + prompt ทั้งชุด) + route/model
+    - semantic: เฉพาะ intent ใน SEMANTIC_CACHE_INTENTS (ถาม-ตอบแบบข้อเท็จจริง) เมื่อ exact miss
+      scope รวม _cache_context ด้วย → คำถามใกล้เคียงชนกันได้เฉพาะเมื่อ entity เดียวกัน หรือผู้ใช้+บริบทเดียวกัน
+    """
+    model = meta["model_candidates"].get(primary) or ""
+    ctx = _cache_context(text, msgs, primary, meta, user_id)
+    state: Dict[str, Any] = {
+        "cache": get_response_cache(), "key": "", "semantic": None, "scope": f"{primary}:{model}:{ctx}", "query": text,
+    }
+    cache = state["cache"]
+    if cache is not None:
+        state["key"] = make_key(text, ctx, primary, model)
+        hit = cache.get(state["key"])
+        if hit is not None:
+            meta["cache"] = "hit"
+            meta["model_used"] = hit[1].get("model_used", primary)
+            return state, {"text": hit[0], "meta": meta}
+        meta["cache"] = "miss"
+
+    if meta["intent"] in SEMANTIC_CACHE_INTENTS:
+        sem = get_semantic_cache()
+        state["semantic"] = sem
+        if sem is not None:
+            near = sem.lookup(text, scope=state["scope"])
+            if near is not None:
+                meta["cache"] = "semantic"
+                meta["similarity"] = near[2]
+                meta["model_used"] = near[1].get("model_used", primary)
+                return state, {"text": near[0], "meta": meta}
+    return state, None
+
+
+def _cache_store(state: Dict[str, Any], text: str, meta: Dict[str, Any]) -> None:
+    try:
+        small = {"model_used": meta.get("model_used")}
+        cache, sem = state["cache"], state["semantic"]
+        if cache is not None and state["key"]:
+            cache.put(state["key"], text, meta["intent"], small)
+        if sem is not None:
+            ttl = cache.ttl_for(meta["intent"]) if cache is not None else RESPONSE_CACHE_TTL_LOOKUP
+            sem.put(state["query"], text, ttl, scope=state["scope"], meta=small)
+    except Exception as e:
+        meta["cache_error"] = str(e)
+
+
 # ---------- main ----------
-def orchestrate(text: str, context: List[Dict[str, str]] | None = None) -> Dict[str, Any]:
+def _prepare(
+    text: str, context: List[Dict[str, str]] | None, stream: bool = False, summary: str = ""
+) -> Tuple[str, str, Dict[str, List[Dict[str, str]]], Dict[str, Any]]:
     """
-    รับข้อความผู้ใช้ + บริบท แล้วคืน {"text": <คำตอบ>, "meta": {...}}
-    meta: route, intent, confidence, model_used, fallback, durations (ms)
+    เลือก engine + เตรียมข้อความ/meta (ใช้ร่วมกันระหว่าง orchestrate และ orchestrate_stream)
+    คืน msgs เป็น dict ต่อ engine (แต่ละค่ายจัดบริบทตามงบ token ของโมเดลตัวเอง)
     """
-    route = _route_engine(text)
+    route = _route_engine(text, stream=stream)
     primary = route["engine"]            # "gpt" | "gemini"
     fallback = "gemini" if primary == "gpt" else "gpt"
 
-    msgs = _normalize_context(context)
-    msgs.append({"role": "user", "content": text})
-
     meta: Dict[str, Any] = {
         "intent": route["intent"],
         "route": primary,
@@ -161,23 +379,108 @@ def orchestrate(text: str, context: List[Dict[str, str]] | None = None) -> Dict[
         "durations_ms": {},
     }
 
-    # ความเชื่อมั่นต่ำมาก → ลองสลับใช้ GPT เป็นค่าเริ่ม (ภาษากว้าง)
-    if route["confidence"] < float(ROUTER_MIN_CONFIDENCE or 0.55):
+    # ความเชื่อมั่นต่ำมาก → ลองสลับใช้ GPT เป็นค่าเริ่ม (ภาษากว้าง) — เว้นแต่ adaptive ตัดสินจากสถิติแล้ว
+    if route["confidence"] < float(ROUTER_MIN_CONFIDENCE or 0.55) and not route.get("adaptive"):
         primary, fallback = "gpt", "gemini"
         meta["route"] = primary
         meta["reason"] += "|low_conf->prefer_gpt"
+    msgs = _build_messages(text, context, summary, primary, meta)
+    return primary, fallback, msgs, meta
+
+def orchestrate(
+    text: str, context: List[Dict[str, str]] | None = None, summary: str = "", user_id: int | None = None
+) -> Dict[str, Any]:
+    """
+    รับข้อความผู้ใช้ + บริบท (+ สรุปบทสนทนาเดิม) แล้วคืน {"text": <คำตอบ>, "meta": {...}}
+    user_id: แยก response cache/singleflight ต่อผู้ใช้ (ยกเว้น lookup ที่ระบุ entity ซึ่งใช้ร่วมกันได้)
+    meta: route, intent, confidence, model_used, fallback, durations (ms)
+          + hedge {threshold_ms, launched, launched_after_ms, winner, extra_calls} เมื่อเปิด HEDGE_ENABLED
+          + cache "hit"|"semantic"|"miss" (+ similarity เมื่อ semantic) เมื่อเปิด cache
+          + circuit_skipped [engine ...] เมื่อวงจรของค่ายนั้นเปิดอยู่ (ไม่ได้เรียกจริง)
+          + rate_limited ["engine:reason" ...] เมื่อโควตาฝั่ง client ของค่ายนั้นเต็ม (ไม่ได้เรียกจริง)
+          + context {budget, turns, dropped, summary_tokens, counter, tokens{gpt, gemini}} เมื่อจัดตามงบ token
+          + facts {entities, ok, failed, timeout, ms} เมื่อ lookup ที่พบ entity ดึงข้อมูลจริงได้
+          + singleflight {role "leader"|"follower", coalesced} เมื่อมีคำขอเดียวกันมาพร้อมกัน
+            (follower ใช้คำตอบของ leader; follower ที่รอเกิน SINGLEFLIGHT_TIMEOUT_MS → timeout=True แล้วเรียกเอง)
+    """
+    primary, fallback, msgs, meta = _prepare(text, context, summary=summary)
+    cache_state, cached = _cache_lookup(text, msgs, primary, meta, user_id)
+    if cached is not None:
+        return cached
+    if not SINGLEFLIGHT_ENABLED:
+        return _call_providers(text, primary, fallback, msgs, meta, cache_state)
+
+    key = cache_state["key"] or _flight_key(text, msgs, primary, meta, user_id)
+    try:
+        res, dups, shared = get_group("orchestrate").do(
+            key,
+            lambda: _call_providers(text, primary, fallback, msgs, meta, cache_state),
+            SINGLEFLIGHT_TIMEOUT_MS / 1000.0,
+        )
+    except FlightTimeout:
+        meta["singleflight"] = {"role": "follower", "timeout": True}
+        return _call_providers(text, primary, fallback, msgs, meta, cache_state)
+    if shared:
+        lead = res["meta"]
+        for k in ("model_used", "fallback", "facts"):
+            if k in lead:
+                meta[k] = lead[k]
+        meta["singleflight"] = {"role": "follower", "coalesced": dups}
+        return {"text": res["text"], "meta": meta}
+    if dups:
+        meta["singleflight"] = {"role": "leader", "coalesced": dups}
+    return res
+
+
+def _flight_key(
+    text: str, msgs: Dict[str, List[Dict[str, str]]], primary: str, meta: Dict[str, Any], user_id: int | None
+) -> str:
+    """key เดียวกับ response cache (ใช้ตอนปิด cache) — ผูก entity ของ lookup หรือผู้ใช้ + prompt ทั้งชุด (_cache_context)"""
+    return make_key(text, _cache_context(text, msgs, primary, meta, user_id), primary, meta["model_candidates"].get(primary) or "")
+
+
+def _call_providers(
+    text: str,
+    primary: str,
+    fallback: str,
+    msgs: Dict[str, List[Dict[str, str]]],
+    meta: Dict[str, Any],
+    cache_state: Dict[str, Any],
+) -> Dict[str, Any]:
+    """ส่วนที่เรียก provider จริง (facts → hedged หรือ primary แล้ว fallback) — singleflight ครอบส่วนนี้"""
+    msgs = _add_facts(text, msgs, meta)
+
+    calls = {
+        "gpt": _guarded("gpt", lambda: call_gpt(msgs["gpt"]), meta),
+        "gemini": _guarded("gemini", lambda: call_gemini(msgs["gemini"]), meta),
+    }
+
+    # ---- hedged: primary + (fallback ขนานเมื่อ primary ช้าเกิน threshold) ----
+    if HEDGE_ENABLED:
+        threshold = TRACKER.threshold_ms(
+            primary, pct=HEDGE_PERCENTILE, min_ms=HEDGE_MIN_MS, max_ms=HEDGE_MAX_MS, min_samples=HEDGE_MIN_SAMPLES,
+        )
+        won = hedged_call(calls, primary, fallback, _ok, threshold, meta)
+        if won is not None:
+            engine, out = won
+            meta["model_used"] = engine
+            meta["fallback"] = engine == fallback or None
+            final = _safe_truncate(_strip_no_echo_prefix(out), 3900)
+            _cache_store(cache_state, final, meta)
+            return {"text": final, "meta": meta}
+        meta["fallback"] = False
+        return {"text": _APOLOGY, "meta": meta}
 
     # ---- call primary ----
     t0 = time.time()
     try:
-        if primary == "gemini":
-            out = call_gemini(msgs)
-        else:
-            out = call_gpt(msgs)
+        out = calls[primary]()
         meta["durations_ms"]["primary"] = int((time.time() - t0) * 1000)
         if _ok(out):
+            TRACKER.record(primary, meta["durations_ms"]["primary"])
             final = _safe_truncate(_strip_no_echo_prefix(out), 3900)
             meta["model_used"] = primary
+            _cache_store(cache_state, final, meta)
             return {"text": final, "meta": meta}
         else:
             meta["primary_empty_or_config"] = True
@@ -187,15 +490,14 @@ def orchestrate(text: str, context: List[Dict[str, str]] | None = None) -> Dict[
     # ---- fallback ----
     t1 = time.time()
     try:
-        if fallback == "gemini":
-            out2 = call_gemini(msgs)
-        else:
-            out2 = call_gpt(msgs)
+        out2 = calls[fallback]()
         meta["durations_ms"]["fallback"] = int((time.time() - t1) * 1000)
         if _ok(out2):
+            TRACKER.record(fallback, meta["durations_ms"]["fallback"])
             final = _safe_truncate(_strip_no_echo_prefix(out2), 3900)
             meta["model_used"] = fallback
             meta["fallback"] = True
+            _cache_store(cache_state, final, meta)
             return {"text": final, "meta": meta}
         else:
             meta["fallback_empty_or_config"] = True
@@ -204,8 +506,62 @@ def orchestrate(text: str, context: List[Dict[str, str]] | None = None) -> Dict[
         meta["fallback"] = False
 
     # ---- both failed ----
-    apology = (
-        "ขออภัยครับ ผมเจอปัญหาระหว่างประมวลผลคำขอนี้ "
-        "รบกวนลองใหม่อีกครั้ง หรือระบุรายละเอียดเพิ่มเติมได้ไหมครับ"
-    )
-    return {"text": apology, "meta": meta}
+    return {"text": _APOLOGY, "meta": meta}
+
+
+def orchestrate_stream(
+    text: str,
+    context: List[Dict[str, str]] | None = None,
+    on_delta: Callable[[str], None] | None = None,
+    on_reset: Callable[[], None] | None = None,
+    summary: str = "",
+    user_id: int | None = None,
+) -> Dict[str, Any]:
+    """
+    เหมือน orchestrate แต่สตรีมคำตอบทีละส่วนผ่าน on_delta (เช่น StreamingReply.feed)
+    - engine แรกล้ม/ใช้ไม่ได้ (แม้สตรีมไปบางส่วนแล้ว) → on_reset() แล้วสตรีม fallback แทน
+    - คืน {"text", "meta"} เหมือนเดิม โดย text ผ่าน post-process แล้ว (ใช้ทำ edit สุดท้าย)
+    - meta เพิ่ม: stream=True, ttft_ms (เวลาตั้งแต่เริ่มจนได้ token แรกจาก provider)
+    - ไม่ใช้ hedging (สตรีมแสดงผลได้เร็วอยู่แล้ว และสองสตรีมแย่งข้อความเดียวกันไม่ได้)
+    """
+    started = time.time()
+    primary, fallback, msgs, meta = _prepare(text, context, stream=True, summary=summary)
+    meta["stream"] = True
+    cache_state, cached = _cache_lookup(text, msgs, primary, meta, user_id)
+    if cached is not None:
+        if on_delta is not None:
+            on_delta(cached["text"])
+        return cached
+    msgs = _add_facts(text, msgs, meta)
+
+    for role, engine in (("primary", primary), ("fallback", fallback)):
+        parts: List[str] = []
+        t0 = time.time()
+        try:
+            for delta in _guarded_stream(engine, msgs[engine], meta):
+                if "ttft_ms" not in meta:
+                    meta["ttft_ms"] = int((time.time() - started) * 1000)
+                parts.append(delta)
+                if on_delta is not None:
+                    on_delta(delta)
+            out = "".join(parts).strip()
+            meta["durations_ms"][role] = int((time.time() - t0) * 1000)
+            if _ok(out):
+                TRACKER.record(engine, meta["durations_ms"][role])
+                meta["model_used"] = engine
+                if role == "fallback":
+                    meta["fallback"] = True
+                final = _safe_truncate(_strip_no_echo_prefix(out), 3900)
+                _cache_store(cache_state, final, meta)
+                return {"text": final, "meta": meta}
+            meta[f"{role}_empty_or_config"] = True
+        except Exception as e:
+            meta[f"{role}_error"] = str(e)
+            if parts:
+                meta[f"{role}_partial_chars"] = sum(len(p) for p in parts)
+        if parts and on_reset is not None:
+            on_reset()
+        meta.pop("ttft_ms", None)
+
+    meta["fallback"] = False
+    return {"text": _APOLOGY, "meta": meta}
@@ -0,0 +1,257 @@
+# orchestrator/response_cache.py
+# -*- coding: utf-8 -*-
+"""
+Response cache ของ orchestrator (คำถามซ้ำทั้งวัน เช่น "ราคาทองวันนี้" ไม่ต้องเรียก LLM ใหม่ทุกครั้ง)
+- key = sha1(ข้อความที่ normalize แล้ว | fingerprint ของบริบทที่เกี่ยวข้อง | route | model)
+  * normalize: Unicode NFKC, ตัด zero-width, lower, ยุบช่องว่าง, ตัดเครื่องหมายท้ายประโยค (?!.ๆ …)
+  * บริบทที่เกี่ยวข้อง (orchestrate._cache_context): lookup ที่ระบุ entity ชัด = entity ที่ normalize แล้ว
+    (ข้อเท็จจริงไม่ขึ้นกับบทสนทนา), อื่น ๆ = RESPONSE_CACHE_CONTEXT_TURNS ข้อความล่าสุด
+- TTL ตาม intent (_classify_intent): lookup สั้น (ข้อมูลเปลี่ยนเร็ว), writing ยาว, reasoning กลาง
+- ชั้นหน่วยความจำ: LRU จำกัดทั้งจำนวนรายการและจำนวนไบต์
+- ชั้นดิสก์ (ออปชัน RESPONSE_CACHE_DISK=1): SQLite แชร์ระหว่าง worker/รอด restart; hit จากดิสก์จะถูกดึงขึ้นหน่วยความจำ
+- stats(): hits (memory/disk), misses, puts, evictions, expired, entries, bytes
+"""
+
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Tuple
+from collections import OrderedDict
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+_ZERO_WIDTH = re.compile("[\u200b\u200c\u200d\u2060\ufeff]")
+_SPACES = re.compile(r"\s+")
+_TRAILING_PUNCT = re.compile(r"[\s?!.。,;:~…ๆฯ\"'`]+$")
+
+
+def _log(tag: str, **kw: Any) -> None:
+    extra = f" | {kw}" if kw else ""
+    print(f"[response_cache] {tag}{extra}", flush=True)
+
+
+def normalize_text(text: str) -> str:
+    t = unicodedata.normalize("NFKC", text or "")
+    t = _ZERO_WIDTH.sub("", t).lower()
+    t = _SPACES.sub(" ", t).strip()
+    return _TRAILING_PUNCT.sub("", t)
+
+
+def context_fingerprint(messages: Optional[List[Dict[str, str]]]) -> str:
+    """hash ของทุกข้อความ (role+content ที่ normalize แล้ว) — ใช้กับ prompt ทั้งชุดที่ส่งให้โมเดล"""
+    if not messages:
+        return ""
+    h = hashlib.sha1()
+    for m in messages:
+        h.update((m.get("role") or "").encode("utf-8"))
+        h.update(b"\x1e")
+        h.update(normalize_text(m.get("content") or "").encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()[:16]
+
+
+def make_key(text: str, context_fp: str, route: str, model: str) -> str:
+    raw = "\x1f".join((normalize_text(text), context_fp, route or "", model or ""))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        *,
+        ttl_by_intent: Dict[str, int],
+        default_ttl: int = 600,
+        max_entries: int = 2000,
+        max_bytes: int = 8 * 1024 * 1024,
+        disk_path: Optional[str] = None,
+    ):
+        self._ttl = dict(ttl_by_intent)
+        self._default_ttl = int(default_ttl)
+        self._max_entries = max(1, int(max_entries))
+        self._max_bytes = max(1024, int(max_bytes))
+        self._mem: "OrderedDict[str, Tuple[float, str, Dict[str, Any], int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._disk_path = disk_path or None
+        self._tls = threading.local()
+        self._last_prune = 0.0
+        self._counters = {"hits_memory": 0, "hits_disk": 0, "misses": 0, "puts": 0, "evictions": 0, "expired": 0}
+        if self._disk_path:
+            self._init_disk()
+
+    # ---------- disk tier ----------
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._tls, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._disk_path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._tls.conn = conn
+        return conn
+
+    def _init_disk(self) -> None:
+        try:
+            self._conn().execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                " key TEXT PRIMARY KEY, text TEXT NOT NULL, meta TEXT, expires_at REAL NOT NULL)"
+            )
+            self._conn().execute("CREATE INDEX IF NOT EXISTS idx_response_cache_exp ON response_cache(expires_at)")
+        except Exception as e:
+            _log("DISK_DISABLED", err=str(e))
+            self._disk_path = None
+
+    def _disk_get(self, key: str, now: float) -> Optional[Tuple[float, str, Dict[str, Any]]]:
+        try:
+            row = self._conn().execute(
+                "SELECT expires_at, text, meta FROM response_cache WHERE key=? AND expires_at>?", (key, now)
+            ).fetchone()
+        except Exception as e:
+            _log("DISK_GET_ERROR", err=str(e))
+            return None
+        if row is None:
+            return None
+        return row[0], row[1], json.loads(row[2] or "{}")
+
+    def _disk_put(self, key: str, expires_at: float, text: str, meta: Dict[str, Any], now: float) -> None:
+        try:
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO response_cache(key, text, meta, expires_at) VALUES (?,?,?,?)",
+                (key, text, json.dumps(meta, ensure_ascii=False), expires_at),
+            )
+            if now - self._last_prune > 300:
+                self._last_prune = now
+                conn.execute("DELETE FROM response_cache WHERE expires_at<=?", (now,))
+        except Exception as e:
+            _log("DISK_PUT_ERROR", err=str(e))
+
+    # ---------- memory tier ----------
+    def _mem_put(self, key: str, expires_at: float, text: str, meta: Dict[str, Any]) -> None:
+        size = len(text.encode("utf-8")) + 64
+        with self._lock:
+            old = self._mem.pop(key, None)
+            if old is not None:
+                self._bytes -= old[3]
+            self._mem[key] = (expires_at, text, meta, size)
+            self._bytes += size
+            while self._mem and (len(self._mem) > self._max_entries or self._bytes > self._max_bytes):
+                _k, ev = self._mem.popitem(last=False)
+                self._bytes -= ev[3]
+                self._counters["evictions"] += 1
+
+    # ---------- public API ----------
+    def ttl_for(self, intent: str) -> int:
+        return int(self._ttl.get(intent, self._default_ttl))
+
+    def get(self, key: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        now = time.time()
+        with self._lock:
+            ent = self._mem.get(key)
+            if ent is not None:
+                if ent[0] > now:
+                    self._mem.move_to_end(key)
+                    self._counters["hits_memory"] += 1
+                    return ent[1], ent[2]
+                self._mem.pop(key, None)
+                self._bytes -= ent[3]
+                self._counters["expired"] += 1
+        if self._disk_path:
+            hit = self._disk_get(key, now)
+            if hit is not None:
+                self._mem_put(key, hit[0], hit[1], hit[2])
+                with self._lock:
+                    self._counters["hits_disk"] += 1
+                return hit[1], hit[2]
+        with self._lock:
+            self._counters["misses"] += 1
+        return None
+
+    def put(self, key: str, text: str, intent: str, meta: Optional[Dict[str, Any]] = None) -> None:
+        ttl = self.ttl_for(intent)
+        if ttl <= 0 or not text:
+            return
+        now = time.time()
+        expires_at = now + ttl
+        meta = dict(meta or {})
+        self._mem_put(key, expires_at, text, meta)
+        if self._disk_path:
+            self._disk_put(key, expires_at, text, meta, now)
+        with self._lock:
+            self._counters["puts"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._mem.clear()
+            self._bytes = 0
+        if self._disk_path:
+            try:
+                self._conn().execute("DELETE FROM response_cache")
+            except Exception as e:
+                _log("DISK_CLEAR_ERROR", err=str(e))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            c = dict(self._counters)
+            entries, nbytes = len(self._mem), self._bytes
+        hits = c["hits_memory"] + c["hits_disk"]
+        total = hits + c["misses"]
+        return {
+            **c,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "entries": entries,
+            "bytes": nbytes,
+            "max_entries": self._max_entries,
+            "max_bytes": self._max_bytes,
+            "disk": bool(self._disk_path),
+            "ttl_sec": dict(self._ttl),
+        }
+
+
+# ---------- default instance ----------
+_DEFAULT: Optional[ResponseCache] = None
+_DEFAULT_LOCK = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """คืน cache หลัก (None ถ้าปิดด้วย RESPONSE_CACHE_ENABLED=0)"""
+    global _DEFAULT
+    from config import (
+        RESPONSE_CACHE_ENABLED,
+        RESPONSE_CACHE_MAX_ENTRIES,
+        RESPONSE_CACHE_MAX_BYTES,
+        RESPONSE_CACHE_TTL_LOOKUP,
+        RESPONSE_CACHE_TTL_REASONING,
+        RESPONSE_CACHE_TTL_WRITING,
+        RESPONSE_CACHE_DISK,
+        RESPONSE_CACHE_DB_FILE,
+    )
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    if _DEFAULT is not None:
+        return _DEFAULT
+    with _DEFAULT_LOCK:
+        if _DEFAULT is None:
+            _DEFAULT = ResponseCache(
+                ttl_by_intent={
+                    "lookup": RESPONSE_CACHE_TTL_LOOKUP,
+                    "reasoning": RESPONSE_CACHE_TTL_REASONING,
+                    "writing": RESPONSE_CACHE_TTL_WRITING,
+                },
+                default_ttl=RESPONSE_CACHE_TTL_REASONING,
+                max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+                max_bytes=RESPONSE_CACHE_MAX_BYTES,
+                disk_path=RESPONSE_CACHE_DB_FILE if RESPONSE_CACHE_DISK else None,
+            )
+    return _DEFAULT
+
+
+__all__ = [
+    "ResponseCache",
+    "get_response_cache",
+    "normalize_text",
+    "context_fingerprint",
+    "make_key",
+]
@@ -0,0 +1,309 @@
+# orchestrator/semantic_cache.py
+# -*- coding: utf-8 -*-
+"""
+Semantic (near-duplicate) cache — จับคำถามที่ "ความหมายเดียวกันแต่พิมพ์ต่างกัน"
+  เช่น "ทองวันนี้" ≈ "ราคาทองคำวันนี้เท่าไหร่" ≈ "ขอราคาทองวันนี้หน่อยครับ"
+- ไม่พึ่งไลบรารีภายนอก: normalize ภาษาไทย → character n-gram shingles → MinHash → LSH buckets
+- normalize (ต่อจาก response_cache.normalize_text):
+  * ตัดวรรณยุกต์/การันต์ (พิมพ์ผิดบ่อย: เท่าไหร่/เท่าไร), ตัดช่องว่างทั้งหมด (ภาษาไทยไม่เว้นวรรค)
+  * แทนคำพ้อง (ทองคำ→ทอง, ลอตเตอรี่→หวย) และตัดคำฟุ่มเฟือย (ราคา, เท่าไร, ช่วยบอก ...)
+  * คำสั้นตัดเฉพาะต้น/ท้ายประโยค (ขอ/ช่วย ..., ... ครับ/ค่ะ/หน่อย/ไหม)
+- ค้นหา: signature 64 ค่า แบ่ง 16 band × 4 row → รายการที่ชน band ใดก็ได้เป็น candidate
+  แล้วยืนยันด้วย Jaccard จริงของ shingle set ≥ SEMANTIC_CACHE_THRESHOLD
+  + ตัวเลขในคำถามต้องตรงกันทุกตัว (กัน "หวยงวด 1" ชน "หวยงวด 16")
+  + ชุดชื่อเฉพาะต้องตรงกัน (entity_keys): ตารางชื่อ FX/คริปโต/เมืองของ facts + จังหวัด/ธนาคาร (ยาวก่อนสั้น,
+    พับวรรณยุกต์เหมือน shingle) + ตัวพิมพ์ใหญ่ละติน (ticker/รหัสเงิน)
+    (กัน "อากาศเชียงใหม่" ชน "อากาศเชียงราย" ที่ Jaccard 0.67, กสิกรไทย/กรุงไทย, ดอลลาร์/ยูโร)
+- LRU จำกัดจำนวนรายการ + TTL ต่อรายการ, แบ่ง scope (เช่น route/model) ไม่ให้คำตอบปนกัน
+- signature: ค่า hash ทั้ง 64 ต่อ shingle ถูก memoize (LRU) → คำถามที่ใช้ shingle ที่เคยเห็นแล้วเหลือแค่ min ต่อคอลัมน์
+- stats(): hits/misses/candidates เฉลี่ย/เวลาค้นหาเฉลี่ย (µs)/อัตรา hit ของ shingle cache
+"""
+
+from __future__ import annotations
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+from collections import OrderedDict
+import functools
+import random
+import re
+import threading
+import time
+import unicodedata
+import zlib
+
+from orchestrator.facts import _CITIES, _CRYPTO_NAMES, _FX_NAMES
+from orchestrator.response_cache import normalize_text
+
+_THAI_MARKS = re.compile("[\u0e47-\u0e4e]")    # ไม้ไต่คู้, วรรณยุกต์, การันต์ ฯลฯ
+_DIGITS = re.compile(r"\d+")
+
+
+def _fold(text: str) -> str:
+    """NFKC + lower + ตัดวรรณยุกต์ (NFKC แยก ำ เป็น ํ+า ด้วย จึงต้องพับตารางคำด้วยฟังก์ชันเดียวกัน)"""
+    return _THAI_MARKS.sub("", unicodedata.normalize("NFKC", text).lower())
+
+
+# แทนคำพ้องก่อนตัดคำฟุ่มเฟือย (ยาวก่อนสั้น)
+_SYNONYMS: Tuple[Tuple[str, str], ...] = tuple((_fold(a), _fold(b)) for a, b in (
+    ("น้ำมันเชื้อเพลิง", "น้ำมัน"),
+    ("พยากรณ์อากาศ", "อากาศ"),
+    ("สภาพอากาศ", "อากาศ"),
+    ("ทองคำ", "ทอง"),
+    ("ลอตเตอรี่", "หวย"),
+    ("สลากกินแบ่ง", "หวย"),
+    ("อัตราแลกเปลี่ยน", "ค่าเงิน"),
+    ("เรทเงิน", "ค่าเงิน"),
+))
+# คำฟุ่มเฟือยที่ตัดได้ทุกตำแหน่ง (เป็นคำยาว/เฉพาะ ไม่ไปชนกลางคำอื่น)
+_FILLERS = sorted({_fold(w) for w in (
+    "ช่วยบอก", "บอกหน่อย", "ขอทราบ", "อยากทราบ", "อยากรู้", "เท่าไหร่", "เท่าไร", "กี่บาท",
+    "อย่างไร", "ยังไง", "หรือเปล่า", "ตอนนี้", "ล่าสุด", "ราคา",
+)}, key=len, reverse=True)
+_FILLER_RE = re.compile("|".join(re.escape(f) for f in _FILLERS))
+# คำสั้นตัดเฉพาะต้น/ท้ายประโยค (กลางคำอาจเป็นส่วนของคำอื่น เช่น "คะแนน", "บางนา")
+_LEADING = re.compile("^(?:%s)+" % "|".join(_fold(w) for w in ("ขอ", "ช่วย", "บอก")))
+_TRAILING = re.compile("(?:%s)+$" % "|".join(_fold(w) for w in (
+    "ครับ", "คับ", "ค่ะ", "คะ", "จ้า", "นะ", "ด้วย", "หน่อย", "ไหม", "มั้ย", "บ้าง", "เป็น", "คือ",
+)))
+
+def _letters(text: str) -> str:
+    """พับแบบ _fold แล้วเก็บเฉพาะตัวอักษร/ตัวเลข (ไม่ขึ้นกับวรรณยุกต์ที่พิมพ์ตก/เว้นวรรค)"""
+    return "".join(ch for ch in _fold(normalize_text(text)) if unicodedata.category(ch)[0] in "LMN")
+
+
+# ชื่อเฉพาะที่ต่างกันไม่กี่ตัวอักษรแต่คนละเรื่อง (ชื่อ → key หลัก): ตาราง FX/คริปโต/เมือง ของ facts + จังหวัด + ธนาคาร
+# เว้นชื่อที่เป็นคำทั่วไป/อยู่กลางคำอื่นบ่อย: เลย, ตาก, แพร่, น่าน (→ นาน), ตราด (อัตรา|ดอก)
+_NAMES: Dict[str, str] = {
+    **{p: p for p in (
+        "กรุงเทพ", "กระบี่", "กาญจนบุรี", "กาฬสินธุ์", "กำแพงเพชร", "ขอนแก่น", "จันทบุรี", "ฉะเชิงเทรา", "ชลบุรี",
+        "ชัยนาท", "ชัยภูมิ", "ชุมพร", "เชียงราย", "เชียงใหม่", "ตรัง", "นครนายก", "นครปฐม", "นครพนม",
+        "นครราชสีมา", "นครศรีธรรมราช", "นครสวรรค์", "นนทบุรี", "นราธิวาส", "บึงกาฬ", "บุรีรัมย์", "ปทุมธานี",
+        "ประจวบคีรีขันธ์", "ปราจีนบุรี", "ปัตตานี", "พระนครศรีอยุธยา", "พะเยา", "พังงา", "พัทลุง", "พิจิตร", "พิษณุโลก",
+        "เพชรบุรี", "เพชรบูรณ์", "ภูเก็ต", "มหาสารคาม", "มุกดาหาร", "แม่ฮ่องสอน", "ยโสธร", "ยะลา", "ร้อยเอ็ด",
+        "ระนอง", "ระยอง", "ราชบุรี", "ลพบุรี", "ลำปาง", "ลำพูน", "ศรีสะเกษ", "สกลนคร", "สงขลา", "สตูล", "สมุทรปราการ",
+        "สมุทรสงคราม", "สมุทรสาคร", "สระแก้ว", "สระบุรี", "สิงห์บุรี", "สุโขทัย", "สุพรรณบุรี", "สุราษฎร์ธานี",
+        "สุรินทร์", "หนองคาย", "หนองบัวลำภู", "อ่างทอง", "อำนาจเจริญ", "อุดรธานี", "อุตรดิตถ์", "อุทัยธานี",
+        "อุบลราชธานี", "บางนา",
+        "กสิกรไทย", "กรุงไทย", "ไทยพาณิชย์", "กรุงศรี", "ออมสิน", "ยูโอบี", "ซีไอเอ็มบี", "เกียรตินาคิน", "ทหารไทยธนชาต",
+    )},
+    "อยุธยา": "พระนครศรีอยุธยา", "กสิกร": "กสิกรไทย", "ทีทีบี": "ทหารไทยธนชาต", "ธกส": "ธกส", "ธอส": "ธอส",
+    **_FX_NAMES, **_CRYPTO_NAMES, **_CITIES,      # facts: ชื่อ → USD/BTC/"Chiang Mai" (กทม = กรุงเทพ = Bangkok)
+}
+_NAME_KEYS: Dict[str, str] = {_letters(k): v for k, v in _NAMES.items()}
+_NAME_RE = re.compile("|".join(re.escape(k) for k in sorted(_NAME_KEYS, key=len, reverse=True)))   # ยาวก่อน + กินช่วงที่จับแล้ว
+_LATIN_UPPER = re.compile(r"(?<![A-Za-z0-9])[A-Z][A-Z0-9]{1,5}(?:\.[A-Z]{1,2})?(?![A-Za-z0-9])")   # ticker/รหัสเงิน (ติดอักษรไทยได้)
+
+
+def entity_keys(text: str) -> FrozenSet[str]:
+    """ชุดชื่อเฉพาะของคำถาม — ต้องเท่ากันถึงนับเป็นคำถามเดียวกัน (เชียงใหม่ ≠ เชียงราย, กสิกรไทย ≠ กรุงไทย)"""
+    keys = {_NAME_KEYS[m.group(0)] for m in _NAME_RE.finditer(_letters(text))}
+    keys.update(_LATIN_UPPER.findall(unicodedata.normalize("NFKC", text or "")))
+    return frozenset(keys)
+
+
+_PRIME = (1 << 61) - 1
+_MASK32 = (1 << 32) - 1
+
+
+def _log(tag: str, **kw: Any) -> None:
+    extra = f" | {kw}" if kw else ""
+    print(f"[semantic_cache] {tag}{extra}", flush=True)
+
+
+def thai_normalize(text: str) -> str:
+    t = _THAI_MARKS.sub("", normalize_text(text))
+    # เก็บเฉพาะตัวอักษร/สระ-วรรณยุกต์/ตัวเลข (\W ของ re นับสระบน-ล่างภาษาไทย (Mn) เป็น non-word จึงใช้ไม่ได้)
+    t = "".join(ch for ch in t if unicodedata.category(ch)[0] in "LMN")
+    for a, b in _SYNONYMS:
+        if a in t:
+            t = t.replace(a, b)
+    stripped = _TRAILING.sub("", _LEADING.sub("", _FILLER_RE.sub("", t)))
+    return stripped or t             # ถ้าตัดแล้วว่าง (เช่น "ราคา") ใช้ข้อความก่อนตัด
+
+
+def shingles(norm: str, n: int = 3) -> FrozenSet[int]:
+    if not norm:
+        return frozenset()
+    if len(norm) <= n:
+        return frozenset((zlib.crc32(norm.encode("utf-8")),))
+    return frozenset(zlib.crc32(norm[i:i + n].encode("utf-8")) for i in range(len(norm) - n + 1))
+
+
+def _jaccard(a: FrozenSet[int], b: FrozenSet[int]) -> float:
+    if not a or not b:
+        return 0.0
+    inter = len(a & b)
+    return inter / (len(a) + len(b) - inter)
+
+
+class _Entry:
+    __slots__ = ("scope", "sh", "digits", "keys", "bands", "text", "meta", "expires_at")
+
+    def __init__(self, scope, sh, digits, keys, bands, text, meta, expires_at):
+        self.scope, self.sh, self.digits, self.keys, self.bands = scope, sh, digits, keys, bands
+        self.text, self.meta, self.expires_at = text, meta, expires_at
+
+
+class SemanticCache:
+    def __init__(
+        self,
+        *,
+        threshold: float = 0.6,
+        num_perm: int = 64,
+        bands: int = 16,
+        ngram: int = 3,
+        max_entries: int = 5000,
+        max_candidates: int = 64,
+        shingle_cache: int = 50_000,
+        seed: int = 1,
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold = float(threshold)
+        self._rows = num_perm // bands
+        self._bands = bands
+        self._n = int(ngram)
+        self._max_entries = max(1, int(max_entries))
+        self._max_candidates = max(1, int(max_candidates))
+        rnd = random.Random(seed)
+        self._perms = [(rnd.randrange(1, _PRIME), rnd.randrange(0, _PRIME)) for _ in range(num_perm)]
+        # คำนวณค่า hash ทั้ง num_perm ต่อ shingle ครั้งเดียวแล้วจำไว้ (3-gram ภาษาไทยในแชตซ้ำกันสูง)
+        self._vector = functools.lru_cache(maxsize=max(0, int(shingle_cache)))(self._perm_vector)
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._buckets: List[Dict[int, set]] = [dict() for _ in range(bands)]
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "puts": 0, "evictions": 0, "candidates": 0, "lookups": 0}
+        self._lookup_us = 0.0
+
+    # ---------- hashing ----------
+    def _perm_vector(self, x: int) -> Tuple[int, ...]:
+        return tuple(((a * x + b) % _PRIME) & _MASK32 for a, b in self._perms)
+
+    def _band_keys(self, sh: FrozenSet[int]) -> Tuple[int, ...]:
+        vec = self._vector
+        sig = list(map(min, zip(*[vec(x) for x in sh])))
+        r = self._rows
+        return tuple(hash(tuple(sig[i * r:(i + 1) * r])) for i in range(self._bands))
+
+    def _features(self, text: str) -> Tuple[FrozenSet[int], Tuple[str, ...], FrozenSet[str]]:
+        norm = thai_normalize(text)
+        digits = tuple(str(int(d)) for d in _DIGITS.findall(norm))   # ๑๖ == 16
+        return shingles(norm, self._n), digits, entity_keys(text)
+
+    # ---------- internal ----------
+    def _remove(self, eid: int) -> None:
+        ent = self._entries.pop(eid, None)
+        if ent is None:
+            return
+        for i, key in enumerate(ent.bands):
+            ids = self._buckets[i].get(key)
+            if ids is not None:
+                ids.discard(eid)
+                if not ids:
+                    del self._buckets[i][key]
+
+    # ---------- public API ----------
+    def lookup(self, text: str, scope: str = "") -> Optional[Tuple[str, Dict[str, Any], float]]:
+        """คืน (คำตอบ, meta, similarity) ของรายการที่คล้ายที่สุดที่ผ่าน threshold หรือ None"""
+        t0 = time.perf_counter()
+        sh, digits, keys = self._features(text)
+        if not sh:
+            return None
+        bands = self._band_keys(sh)
+        now = time.time()
+        best: Optional[Tuple[float, int]] = None
+        with self._lock:
+            cands: set = set()
+            for i, key in enumerate(bands):
+                ids = self._buckets[i].get(key)
+                if ids:
+                    cands.update(ids)
+                    if len(cands) >= self._max_candidates:
+                        break
+            expired = []
+            for eid in cands:
+                ent = self._entries.get(eid)
+                if ent is None or ent.scope != scope or ent.digits != digits or ent.keys != keys:
+                    continue
+                if ent.expires_at <= now:
+                    expired.append(eid)
+                    continue
+                sim = _jaccard(sh, ent.sh)
+                if sim >= self.threshold and (best is None or sim > best[0]):
+                    best = (sim, eid)
+            for eid in expired:
+                self._remove(eid)
+            self._counters["lookups"] += 1
+            self._counters["candidates"] += len(cands)
+            self._lookup_us += (time.perf_counter() - t0) * 1e6
+            if best is None:
+                self._counters["misses"] += 1
+                return None
+            ent = self._entries[best[1]]
+            self._entries.move_to_end(best[1])
+            self._counters["hits"] += 1
+            return ent.text, dict(ent.meta), round(best[0], 3)
+
+    def put(self, text: str, answer: str, ttl_sec: float, scope: str = "", meta: Optional[Dict[str, Any]] = None) -> None:
+        if ttl_sec <= 0 or not answer:
+            return
+        sh, digits, keys = self._features(text)
+        if not sh:
+            return
+        bands = self._band_keys(sh)
+        ent = _Entry(scope, sh, digits, keys, bands, answer, dict(meta or {}), time.time() + ttl_sec)
+        with self._lock:
+            eid = self._next_id
+            self._next_id += 1
+            self._entries[eid] = ent
+            for i, key in enumerate(bands):
+                self._buckets[i].setdefault(key, set()).add(eid)
+            while len(self._entries) > self._max_entries:
+                old = next(iter(self._entries))
+                self._remove(old)
+                self._counters["evictions"] += 1
+            self._counters["puts"] += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            c = dict(self._counters)
+            n = len(self._entries)
+            us = self._lookup_us
+        lookups = c.pop("lookups")
+        cand = c.pop("candidates")
+        vi = self._vector.cache_info()
+        return {
+            **c,
+            "entries": n,
+            "max_entries": self._max_entries,
+            "threshold": self.threshold,
+            "hit_rate": round(c["hits"] / lookups, 4) if lookups else 0.0,
+            "avg_candidates": round(cand / lookups, 2) if lookups else 0.0,
+            "avg_lookup_us": round(us / lookups, 1) if lookups else 0.0,
+            "shingle_cache": {"size": vi.currsize, "hit_rate": round(vi.hits / (vi.hits + vi.misses), 4) if vi.hits + vi.misses else 0.0},
+        }
+
+
+# ---------- default instance ----------
+_DEFAULT: Optional[SemanticCache] = None
+_DEFAULT_LOCK = threading.Lock()
+
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """คืน semantic cache หลัก (None ถ้าปิดด้วย SEMANTIC_CACHE_ENABLED=0)"""
+    global _DEFAULT
+    from config import SEMANTIC_CACHE_ENABLED, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    if _DEFAULT is not None:
+        return _DEFAULT
+    with _DEFAULT_LOCK:
+        if _DEFAULT is None:
+            _DEFAULT = SemanticCache(threshold=SEMANTIC_CACHE_THRESHOLD, max_entries=SEMANTIC_CACHE_MAX_ENTRIES)
+    return _DEFAULT
+
+
+__all__ = ["SemanticCache", "get_semantic_cache", "thai_normalize", "shingles", "entity_keys"]
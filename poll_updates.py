@@ -0,0 +1,171 @@
+# poll_updates.py
+# -*- coding: utf-8 -*-
+"""
+Long-polling entry point (ทางเลือกแทน webhook — สำหรับ staging / เครื่องที่ไม่มี HTTPS สาธารณะ)
+- วน getUpdates (long-poll) พร้อมติดตาม offset ดึงได้สูงสุด 100 update ต่อครั้ง
+- ส่งทั้ง batch เข้า pipeline เดียวกับ webhook (utils.ingest → dedupe/journal/dispatcher)
+  โดยงานระดับ batch ทำครั้งเดียวต่อชุด: dedupe 1 รอบ, upsert ผู้ใช้ 1 ทรานแซกชัน, journal 1 commit
+- ถ้า dispatcher เต็ม จะไม่เลื่อน offset ผ่าน update ที่ยังไม่ถูกรับ → Telegram ส่งชุดนั้นมาใหม่
+- ต้องไม่มี webhook ค้างอยู่ (Telegram ตอบ 409) → ค่าเริ่มต้นจะเรียก deleteWebhook ให้ก่อน (ไม่ทิ้ง pending)
+
+ENV ที่ใช้:
+  TELEGRAM_BOT_TOKEN         (จำเป็น)
+  POLL_TIMEOUT_SEC           (ดีฟอลต์: 25)  long-poll timeout ต่อครั้ง
+  POLL_LIMIT                 (ดีฟอลต์: 100) จำนวน update สูงสุดต่อครั้ง (1..100)
+  POLL_BUSY_SLEEP_SEC        (ดีฟอลต์: 1.0) พักเมื่อ dispatcher เต็ม
+  TELEGRAM_ALLOWED_UPDATES   (ออปชัน CSV) เหมือน set_webhook.py
+  + DISPATCH_* / JOURNAL_* / DEDUPE_* / ADMISSION_* เหมือนโหมด webhook
+
+ใช้งาน:
+  python poll_updates.py                 # วนไปเรื่อย ๆ (Ctrl+C / SIGTERM เพื่อหยุดแบบ drain)
+  python poll_updates.py --once          # ดึงชุดเดียวแล้วจบ (debug)
+  python poll_updates.py --keep-webhook  # ไม่เรียก deleteWebhook
+"""
+
+from __future__ import annotations
+from typing import Any, Dict, List, Optional
+import argparse
+import signal
+import sys
+import threading
+import time
+
+from config import env_int, env_float, env_list, TELEGRAM_BOT_TOKEN
+from utils.memory_store import init_db
+from utils.telegram_api import get_updates, delete_webhook
+from utils.dispatcher import replay_journal
+from utils.ingest import ingest_updates
+from utils import lifecycle
+
+POLL_TIMEOUT_SEC    = env_int("POLL_TIMEOUT_SEC", 25, min_v=0, max_v=50)
+POLL_LIMIT          = env_int("POLL_LIMIT", 100, min_v=1, max_v=100)
+POLL_BUSY_SLEEP_SEC = env_float("POLL_BUSY_SLEEP_SEC", 1.0, min_v=0.05)
+ALLOWED_UPDATES     = env_list("TELEGRAM_ALLOWED_UPDATES", ["message", "edited_message", "callback_query"])
+
+_stop = threading.Event()
+
+
+def _log(tag: str, **kw: Any) -> None:
+    extra = f" | {kw}" if kw else ""
+    print(f"[poll] {tag}{extra}", flush=True)
+
+
+class PollStats:
+    def __init__(self) -> None:
+        self.started = time.monotonic()
+        self.batches = 0
+        self.updates = 0
+        self.accepted = 0
+        self.duplicates = 0
+        self.shed = 0
+        self.rejected = 0
+        self.errors = 0
+        self.ingest_ms = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        up = max(1e-9, time.monotonic() - self.started)
+        return {
+            "batches": self.batches,
+            "updates": self.updates,
+            "accepted": self.accepted,
+            "duplicates": self.duplicates,
+            "shed": self.shed,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "avg_batch": round(self.updates / self.batches, 2) if self.batches else 0.0,
+            "ingest_ms_per_update": round(self.ingest_ms / self.updates, 3) if self.updates else 0.0,
+            "updates_per_sec": round(self.updates / up, 2),
+        }
+
+
+def process_batch(updates: List[Dict[str, Any]], offset: Optional[int], stats: PollStats) -> Optional[int]:
+    """ส่ง batch เข้า ingest แล้วคืน offset ถัดไป (ไม่เลื่อนผ่าน update ที่ยังไม่ถูกรับ)"""
+    if not updates:
+        return offset
+    updates = sorted(updates, key=lambda u: u.get("update_id", 0))
+    t0 = time.perf_counter()
+    res = ingest_updates(updates)
+    stats.ingest_ms += (time.perf_counter() - t0) * 1000.0
+    stats.batches += 1
+    stats.updates += len(updates)
+    stats.accepted += res["accepted"]
+    stats.duplicates += res["duplicates"]
+    stats.shed += res["shed"]
+    rejected = res["rejected"]
+    if rejected:
+        stats.rejected += len(rejected)
+        return int(rejected[0]["update_id"])
+    return int(updates[-1]["update_id"]) + 1
+
+
+def run(once: bool = False) -> PollStats:
+    stats = PollStats()
+    offset: Optional[int] = None
+    backoff = 1.0
+    last_report = time.monotonic()
+    while not _stop.is_set():
+        res = get_updates(offset, limit=POLL_LIMIT, timeout=0 if once else POLL_TIMEOUT_SEC,
+                          allowed_updates=ALLOWED_UPDATES)
+        if not res or not res.get("ok"):
+            stats.errors += 1
+            _log("GET_UPDATES_FAILED", resp=(res or {}).get("description"), retry_in=backoff)
+            _stop.wait(backoff)
+            backoff = min(30.0, backoff * 2)
+            continue
+        backoff = 1.0
+
+        updates = res.get("result") or []
+        new_offset = process_batch(updates, offset, stats)
+        if updates and new_offset is not None and new_offset <= int(updates[-1]["update_id"]):
+            _log("DISPATCHER_BUSY", hold_offset=new_offset, sleep=POLL_BUSY_SLEEP_SEC)
+            _stop.wait(POLL_BUSY_SLEEP_SEC)
+        offset = new_offset
+
+        if once:
+            break
+        if time.monotonic() - last_report > 60:
+            last_report = time.monotonic()
+            _log("STATS", **stats.as_dict())
+    return stats
+
+
+def _install_signals() -> None:
+    def _handler(signum, _frame):
+        _log("SIGNAL", signum=signum)
+        _stop.set()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            signal.signal(sig, _handler)
+        except Exception:
+            pass
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Telegram long-polling runner")
+    p.add_argument("--once", action="store_true", help="ดึงชุดเดียวแล้วจบ")
+    p.add_argument("--keep-webhook", action="store_true", help="ไม่เรียก deleteWebhook ก่อนเริ่ม")
+    args = p.parse_args()
+
+    if not TELEGRAM_BOT_TOKEN:
+        print("❌ ต้องตั้ง ENV TELEGRAM_BOT_TOKEN ก่อน", file=sys.stderr)
+        sys.exit(1)
+
+    init_db()
+    if not args.keep_webhook:
+        _log("DELETE_WEBHOOK", resp=delete_webhook(drop_pending=False))
+    n = replay_journal()
+    if n:
+        _log("JOURNAL_REPLAYED", count=n)
+
+    _install_signals()
+    lifecycle.register_default_hooks()
+    lifecycle.install()                 # chain ต่อจาก handler ของเรา: สัญญาณ → begin drain + หยุดลูป
+    stats = run(once=args.once)
+
+    # drain: รอ worker ทำงานที่รับไปแล้วให้จบ, ส่งข้อความค้าง, flush journal (ภายใน GRACEFUL_TIMEOUT_SEC)
+    report = lifecycle.drain("poll-exit")
+    _log("EXIT", drain=report.get("hooks"), **stats.as_dict())
+
+
+if __name__ == "__main__":
+    main()
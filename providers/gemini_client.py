@@ -1,9 +1,14 @@
 # providers/gemini_client.py
 # -*- coding: utf-8 -*-
 from __future__ import annotations
-from typing import List, Dict
+from typing import Iterator, List, Dict, Optional
 import os
 
+from providers.rate_limit import acquire, estimate_request_tokens, note_rate_limited, usage_tokens
+from providers.registry import get_gemini_model
+
+_EST_OUTPUT_TOKENS = 1024   # ค่าประมาณคำตอบตอนจองโควตา (settle ด้วย usage จริงภายหลัง)
+
 def _to_gemini_history(messages: List[Dict[str, str]]):
     # แปลงเล็กน้อย: Gemini ใช้ [{"role":"user","parts":[...]}]
     out = []
@@ -16,9 +21,10 @@ def _to_gemini_history(messages: List[Dict[str, str]]):
         out.append({"role": role, "parts": [m["content"]]})
     return out
 
-def call_gemini(messages: List[Dict[str, str]]) -> str:
+def call_gemini(messages: List[Dict[str, str]], *, max_wait_ms: Optional[float] = None) -> str:
     """
     เรียก Google Generative AI (google-generativeai>=0.8.x)
+    - ผ่าน rate limiter ของ (gemini, model): เกินโควตาภายใน max_wait_ms → BudgetExceeded ทันที
     ENV:
       GOOGLE_API_KEY
       GEMINI_MODEL_DIALOGUE (default: gemini-1.5-pro)
@@ -27,17 +33,40 @@ def call_gemini(messages: List[Dict[str, str]]) -> str:
     if not api_key:
         return "ยังไม่ได้ตั้งค่า GOOGLE_API_KEY ครับ"
 
-    import google.generativeai as genai  # type: ignore
-    genai.configure(api_key=api_key)
+    # configure ครั้งเดียว + cache model ต่อชื่อ (providers/registry.py)
     model_name = os.getenv("GEMINI_MODEL_DIALOGUE", "gemini-1.5-pro")
-    model = genai.GenerativeModel(model_name)
+    model = get_gemini_model(model_name, api_key=api_key)
 
     history = _to_gemini_history(messages[:-1])
     prompt = messages[-1]["content"]
 
-    try:
-        chat = model.start_chat(history=history)
-        rsp = chat.send_message(prompt)
+    est = estimate_request_tokens(model_name, messages, _EST_OUTPUT_TOKENS)
+    with acquire("gemini", model_name, est, max_wait_ms) as permit:
+        try:
+            chat = model.start_chat(history=history)
+            rsp = chat.send_message(prompt)
+        except Exception as e:
+            note_rate_limited("gemini", model_name, e)
+            raise
+        permit.settle(usage_tokens(rsp))
         return (getattr(rsp, "text", "") or "").strip()
-    except Exception as e:
-        raise
+
+def stream_gemini(messages: List[Dict[str, str]], *, max_wait_ms: Optional[float] = None) -> Iterator[str]:
+    """เหมือน call_gemini แต่ yield ข้อความทีละส่วน (send_message(stream=True)); ถือ permit ตลอดสตรีม"""
+    api_key = os.getenv("GOOGLE_API_KEY", "")
+    if not api_key:
+        raise RuntimeError("GOOGLE_API_KEY is not set")
+    model_name = os.getenv("GEMINI_MODEL_DIALOGUE", "gemini-1.5-pro")
+    model = get_gemini_model(model_name, api_key=api_key)
+    est = estimate_request_tokens(model_name, messages, _EST_OUTPUT_TOKENS)
+    with acquire("gemini", model_name, est, max_wait_ms):
+        chat = model.start_chat(history=_to_gemini_history(messages[:-1]))
+        try:
+            stream = chat.send_message(messages[-1]["content"], stream=True)
+        except Exception as e:
+            note_rate_limited("gemini", model_name, e)
+            raise
+        for chunk in stream:
+            text = getattr(chunk, "text", "") or ""
+            if text:
+                yield text
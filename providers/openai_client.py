@@ -1,11 +1,11 @@
 # providers/openai_client.py
 # -*- coding: utf-8 -*-
 from __future__ import annotations
-from typing import List, Dict
-import time
-import os
+from typing import Iterator, List, Dict, Optional
 
 from config import OPENAI_API_KEY, OPENAI_MODEL_DIALOGUE
+from providers.rate_limit import acquire, estimate_request_tokens, note_rate_limited, usage_tokens
+from providers.registry import get_openai_client
 
 _VALID_ROLES = {"user", "assistant", "system"}
 
@@ -23,43 +23,82 @@ def call_gpt(
     messages: List[Dict[str, str]],
     temperature: float = 0.3,
     max_output_tokens: int = 1024,
+    *,
+    max_wait_ms: Optional[float] = None,
 ) -> str:
     """
     เรียก OpenAI Chat Completions (SDK >= 1.x)
     - ใช้คีย์/โมเดลจาก config.py
+    - ใช้ client ที่สร้างไว้แล้วจาก providers.registry (ไม่สร้างใหม่ทุกครั้ง)
+    - ผ่าน rate limiter ของ (openai, model): เกินโควตาภายใน max_wait_ms → BudgetExceeded ทันที
     - ถ้าคีย์หาย/ผิดพลาด → raise เพื่อให้ออเคสเตรเตอร์สลับไป Gemini ได้
     """
     if not OPENAI_API_KEY:
         raise RuntimeError("OPENAI_API_KEY is not set")
 
-    # รองรับ BASE URL เผื่อใช้พร็อกซี/เซิร์ฟเวอร์ภายใน
-    base_url = os.getenv("OPENAI_BASE_URL") or os.getenv("OPENAI_API_BASE") or None
-
-    from openai import OpenAI  # import ภายในฟังก์ชัน กันล่มตอนติดตั้งไม่ครบ
-    client = OpenAI(api_key=OPENAI_API_KEY, base_url=base_url) if base_url else OpenAI(api_key=OPENAI_API_KEY)
+    # client ตัวเดียวของโปรเซส (keep-alive pool; รองรับ OPENAI_BASE_URL) — ดู providers/registry.py
+    client = get_openai_client()
 
     model = OPENAI_MODEL_DIALOGUE or "gpt-4o-mini"
     msgs = _normalize_messages(messages)
+    est = estimate_request_tokens(model, msgs, max_output_tokens)
 
-    # retry เบา ๆ กรณี rate limit/เน็ตสะดุด
+    # ลองซ้ำ 1 ครั้งเมื่อ 429/timeout — ไม่ sleep เอง: 429 ทำให้ limiter pause ตาม Retry-After
+    # แล้วรอบสองต้องผ่าน limiter (รอได้ไม่เกิน max_wait_ms ไม่งั้น BudgetExceeded → orchestrator ไปอีกค่าย)
     last_err: Exception | None = None
     for attempt in range(2):  # รวม 2 ครั้ง
+        with acquire("openai", model, est, max_wait_ms) as permit:
+            try:
+                rsp = client.chat.completions.create(
+                    model=model,
+                    messages=msgs,
+                    temperature=float(temperature),
+                    max_tokens=int(max_output_tokens),
+                )
+                permit.settle(usage_tokens(rsp))
+                text = (rsp.choices[0].message.content or "").strip()
+                return text
+            except Exception as e:
+                last_err = e
+        limited = note_rate_limited("openai", model, last_err)
+        msg = str(last_err).lower()
+        if attempt == 0 and (limited or any(k in msg for k in ("timeout", "overloaded"))):
+            continue
+        break
+
+    raise RuntimeError(f"openai_call_failed: {last_err}")
+
+def stream_gpt(
+    messages: List[Dict[str, str]],
+    temperature: float = 0.3,
+    max_output_tokens: int = 1024,
+    *,
+    max_wait_ms: Optional[float] = None,
+) -> Iterator[str]:
+    """
+    เหมือน call_gpt แต่ yield ข้อความทีละส่วน (stream=True) สำหรับ streaming reply
+    - ถือ permit ของ rate limiter ตลอดสตรีม (นับ concurrency จนกว่าจะจบ)
+    - error ก่อน/ระหว่างสตรีม → raise (ผู้เรียกตัดสินใจ fallback เอง; ไม่ yield ข้อความ error ปนคำตอบ)
+    """
+    if not OPENAI_API_KEY:
+        raise RuntimeError("OPENAI_API_KEY is not set")
+    model = OPENAI_MODEL_DIALOGUE or "gpt-4o-mini"
+    msgs = _normalize_messages(messages)
+    with acquire("openai", model, estimate_request_tokens(model, msgs, max_output_tokens), max_wait_ms):
         try:
-            rsp = client.chat.completions.create(
+            stream = get_openai_client().chat.completions.create(
                 model=model,
                 messages=msgs,
                 temperature=float(temperature),
                 max_tokens=int(max_output_tokens),
+                stream=True,
             )
-            text = (rsp.choices[0].message.content or "").strip()
-            return text
         except Exception as e:
-            last_err = e
-            msg = str(e).lower()
-            # ลองอีกครั้งถ้าเป็นแนว 429/timeout
-            if attempt == 0 and any(k in msg for k in ("429", "rate", "timeout", "overloaded")):
-                time.sleep(0.8)
+            note_rate_limited("openai", model, e)
+            raise
+        for chunk in stream:
+            if not chunk.choices:
                 continue
-            break
-
-    raise RuntimeError(f"openai_call_failed: {last_err}")
+            delta = getattr(chunk.choices[0].delta, "content", None)
+            if delta:
+                yield delta
@@ -0,0 +1,374 @@
+# providers/rate_limit.py
+# -*- coding: utf-8 -*-
+"""
+Client-side rate limit ต่อ (provider, model) — ใช้ร่วมกันทุกผู้เรียกในโปรเซส
+(orchestrate, summarize_text_with_gpt/สรุปเอกสาร, vision ใน utils/openai_client + utils/gemini_client)
+- token bucket 2 ถัง: requests/min + tokens/min (TPM=0 → ไม่จำกัด token)
+  * ความจุถัง = โควตา RATE_LIMIT_BURST_SEC วินาที (ไม่ปล่อยโควตาทั้งนาทีออกไปในครั้งเดียว — provider วัดถี่กว่านาที)
+  * จองโควตาล่วงหน้าตามค่าประมาณ (prompt + max output) แล้วคืนส่วนต่างเมื่อรู้ usage จริง (Permit.settle)
+  * จองแล้วถังติดลบได้ → คนถัดไปรอนานขึ้นตามลำดับ (FIFO โดยปริยาย)
+- คิวรอมีขอบเขต: รอได้ไม่เกิน max_wait_ms (ดีฟอลต์ RATE_LIMIT_MAX_WAIT_MS) และไม่เกิน RATE_LIMIT_MAX_WAITERS คน
+  ถ้ารู้ตั้งแต่ต้นว่าจะเกิน → raise BudgetExceeded ทันที (ไม่บล็อกเธรด) ให้ orchestrator ไปอีกค่ายแทน
+- concurrency cap ต่อ (provider, model): PROVIDER_MAX_CONCURRENCY คำขอพร้อมกัน
+- เจอ 429 จริง → หยุดปล่อยคำขอตาม Retry-After (ไม่มี header → RATE_LIMIT_429_PAUSE_SEC) แทนการ sleep แล้วยิงซ้ำ
+- โควตาเป็นต่อโปรเซส: หลาย worker ใช้บัญชีเดียวกัน → ตั้ง RPM/TPM = โควตาบัญชี / จำนวน worker
+- RATE_LIMIT_OVERRIDES: "model=rpm/tpm" ต่อโมเดล (เช่น gpt-4o=300/150000)
+- limiter_stats() สำหรับ /diag
+"""
+
+from __future__ import annotations
+from typing import Any, Dict, Iterable, Optional, Tuple
+import threading
+import time
+
+IMAGE_TOKENS = 800          # ค่าประมาณต่อภาพ (vision) — เผื่อไว้ก่อน แล้ว settle ด้วย usage จริง
+
+
+def _log(tag: str, **kw: Any) -> None:
+    extra = f" | {kw}" if kw else ""
+    print(f"[rate_limit] {tag}{extra}", flush=True)
+
+
+class BudgetExceeded(RuntimeError):
+    """คำขอจะเกินโควตา (หรือคิวรอเต็ม) ภายในเวลาที่ยอมรอ — ไม่ได้เรียก provider จริง"""
+
+    def __init__(self, provider: str, model: str, reason: str, wait_ms: float = 0.0):
+        super().__init__(f"rate_limited:{provider}:{model}:{reason}")
+        self.provider = provider
+        self.model = model
+        self.reason = reason        # rpm | tpm | paused | queue_full | concurrency
+        self.wait_ms = wait_ms
+
+
+class _Bucket:
+    __slots__ = ("capacity", "rate", "level", "last")
+
+    def __init__(self, per_min: float, now: float, burst_sec: float = 60.0):
+        self.rate = float(per_min) / 60.0
+        self.capacity = max(1.0, self.rate * float(burst_sec))
+        self.level = self.capacity
+        self.last = now
+
+    def refill(self, now: float) -> None:
+        if now > self.last:
+            self.level = min(self.capacity, self.level + (now - self.last) * self.rate)
+            self.last = now
+
+    def wait_for(self, n: float) -> float:
+        """วินาทีที่ต้องรอจนถังมีพอสำหรับ n"""
+        return 0.0 if self.level >= n else (n - self.level) / self.rate
+
+    def give_back(self, n: float) -> None:
+        self.level = min(self.capacity, self.level + n)
+
+
+class Permit:
+    """สิทธิ์เรียก provider 1 ครั้ง — ใช้แบบ with หรือเรียก release() เอง"""
+
+    __slots__ = ("_limiter", "_est", "_used", "_released")
+
+    def __init__(self, limiter: Optional["RateLimiter"], est_tokens: float):
+        self._limiter = limiter
+        self._est = est_tokens
+        self._used: Optional[float] = None
+        self._released = False
+
+    def settle(self, used_tokens: Optional[float]) -> None:
+        """บอก usage จริง (ถ้ามี) → คืน/หักส่วนต่างกับที่จองไว้ตอน release"""
+        if used_tokens:
+            self._used = float(used_tokens)
+
+    def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        if self._limiter is not None:
+            self._limiter._release(self._est, self._used)
+
+    def __enter__(self) -> "Permit":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.release()
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        provider: str,
+        model: str,
+        *,
+        rpm: float,
+        tpm: float = 0,
+        max_concurrency: int = 8,
+        max_waiters: int = 16,
+        burst_sec: float = 60.0,
+    ):
+        now = time.time()
+        self.provider = provider
+        self.model = model
+        self._req = _Bucket(max(1.0, float(rpm)), now, burst_sec)
+        self._tok = _Bucket(float(tpm), now, burst_sec) if tpm and tpm > 0 else None
+        self._max_conc = max(1, int(max_concurrency))
+        self._max_waiters = max(0, int(max_waiters))
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._waiters = 0
+        self._paused_until = 0.0
+        self.granted = 0
+        self.waited = 0
+        self.rejected: Dict[str, int] = {}
+        self.throttled_429 = 0
+
+    def _reject(self, reason: str, wait_s: float) -> BudgetExceeded:
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        return BudgetExceeded(self.provider, self.model, reason, round(wait_s * 1000, 1))
+
+    def acquire(self, est_tokens: float = 0, max_wait_ms: float = 0) -> Permit:
+        """
+        จองโควตา 1 request + est_tokens แล้วคืน Permit
+        รอได้ไม่เกิน max_wait_ms (ในคิวที่มีขอบเขต) ไม่งั้น raise BudgetExceeded ทันทีโดยไม่จองอะไร
+        """
+        max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        now = time.time()
+        deadline = now + max_wait
+        with self._cond:
+            self._req.refill(now)
+            est = 0.0
+            waits: Dict[str, float] = {"paused": max(0.0, self._paused_until - now), "rpm": self._req.wait_for(1)}
+            if self._tok is not None:
+                self._tok.refill(now)
+                est = min(float(est_tokens or 0), self._tok.capacity)    # คำขอใหญ่กว่าถังทั้งใบ ต้องผ่านได้สักครั้ง
+                waits["tpm"] = self._tok.wait_for(est)
+            reason, wait = max(waits.items(), key=lambda kv: kv[1])
+            if wait > max_wait:
+                raise self._reject(reason, wait)
+            queued = wait > 0 or self._in_flight >= self._max_conc
+            if queued and self._waiters >= self._max_waiters:
+                raise self._reject("queue_full", wait)
+            self._req.level -= 1
+            if self._tok is not None:
+                self._tok.level -= est
+            if queued:
+                self._waiters += 1
+                self.waited += 1
+        try:
+            if wait > 0:
+                time.sleep(wait)
+            with self._cond:
+                # ระหว่างรออาจเจอ 429 (pause) หรือ slot ยังเต็ม — รอต่อได้ถึง deadline เท่านั้น
+                while self._in_flight >= self._max_conc or self._paused_until > time.time():
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        self._req.give_back(1)
+                        if self._tok is not None:
+                            self._tok.give_back(est)
+                        raise self._reject("concurrency" if self._in_flight >= self._max_conc else "paused", 0.0)
+                    pause_left = self._paused_until - time.time()
+                    self._cond.wait(min(remaining, pause_left) if pause_left > 0 else remaining)
+                self._in_flight += 1
+                self.granted += 1
+        finally:
+            if queued:
+                with self._cond:
+                    self._waiters -= 1
+        return Permit(self, est)
+
+    def _release(self, est: float, used: Optional[float]) -> None:
+        with self._cond:
+            self._in_flight = max(0, self._in_flight - 1)
+            if self._tok is not None and used is not None:
+                self._tok.refill(time.time())
+                self._tok.level = min(self._tok.capacity, self._tok.level + est - used)
+            self._cond.notify()
+
+    def penalize(self, retry_after_sec: float) -> None:
+        """provider ตอบ 429 — หยุดปล่อยคำขอใหม่จนพ้น retry_after และล้างโควตาที่เหลือในถัง"""
+        now = time.time()
+        with self._cond:
+            self._paused_until = max(self._paused_until, now + max(0.0, float(retry_after_sec)))
+            self._req.refill(now)
+            self._req.level = min(self._req.level, 0.0)
+            self.throttled_429 += 1
+        _log("PAUSE_429", provider=self.provider, model=self.model, sec=round(retry_after_sec, 2))
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._cond:
+            self._req.refill(now)
+            if self._tok is not None:
+                self._tok.refill(now)
+            return {
+                "rpm": round(self._req.rate * 60),
+                "tpm": round(self._tok.rate * 60) if self._tok is not None else None,
+                "requests_available": round(self._req.level, 2),
+                "tokens_available": round(self._tok.level) if self._tok is not None else None,
+                "in_flight": self._in_flight,
+                "max_concurrency": self._max_conc,
+                "waiters": self._waiters,
+                "paused_sec": round(max(0.0, self._paused_until - now), 2),
+                "granted": self.granted,
+                "waited": self.waited,
+                "rejected": dict(self.rejected),
+                "throttled_429": self.throttled_429,
+            }
+
+
+# ---------- registry ----------
+_LIMITERS: Dict[Tuple[str, str], RateLimiter] = {}
+_LOCK = threading.Lock()
+
+
+def _overrides(items: Iterable[str]) -> Dict[str, Tuple[float, float]]:
+    out: Dict[str, Tuple[float, float]] = {}
+    for item in items or ():
+        try:
+            name, limits = item.split("=", 1)
+            rpm, _, tpm = limits.partition("/")
+            out[name.strip()] = (float(rpm), float(tpm or 0))
+        except ValueError:
+            _log("BAD_OVERRIDE", item=item)
+    return out
+
+
+def get_limiter(provider: str, model: str) -> Optional[RateLimiter]:
+    """limiter ของ (provider, model) (None ถ้าปิดด้วย RATE_LIMIT_ENABLED=0)"""
+    from config import (
+        RATE_LIMIT_ENABLED,
+        OPENAI_RPM,
+        OPENAI_TPM,
+        GEMINI_RPM,
+        GEMINI_TPM,
+        RATE_LIMIT_OVERRIDES,
+        PROVIDER_MAX_CONCURRENCY,
+        RATE_LIMIT_MAX_WAITERS,
+        RATE_LIMIT_BURST_SEC,
+    )
+    if not RATE_LIMIT_ENABLED:
+        return None
+    key = (provider, model or "")
+    lim = _LIMITERS.get(key)
+    if lim is not None:
+        return lim
+    with _LOCK:
+        lim = _LIMITERS.get(key)
+        if lim is None:
+            rpm, tpm = (OPENAI_RPM, OPENAI_TPM) if provider == "openai" else (GEMINI_RPM, GEMINI_TPM)
+            rpm, tpm = _overrides(RATE_LIMIT_OVERRIDES).get(key[1], (rpm, tpm))
+            lim = _LIMITERS[key] = RateLimiter(
+                provider,
+                key[1],
+                rpm=rpm,
+                tpm=tpm,
+                max_concurrency=PROVIDER_MAX_CONCURRENCY,
+                max_waiters=RATE_LIMIT_MAX_WAITERS,
+                burst_sec=RATE_LIMIT_BURST_SEC,
+            )
+    return lim
+
+
+def acquire(provider: str, model: str, est_tokens: float = 0, max_wait_ms: Optional[float] = None) -> Permit:
+    """Permit สำหรับเรียก provider 1 ครั้ง (ปิด rate limit → Permit เปล่า); เกินงบ → BudgetExceeded"""
+    lim = get_limiter(provider, model)
+    if lim is None:
+        return Permit(None, 0)
+    if max_wait_ms is None:
+        from config import RATE_LIMIT_MAX_WAIT_MS
+        max_wait_ms = RATE_LIMIT_MAX_WAIT_MS
+    return lim.acquire(est_tokens, max_wait_ms)
+
+
+def is_rate_limit_error(e: BaseException) -> bool:
+    if isinstance(e, BudgetExceeded):
+        return False
+    if getattr(e, "status_code", None) == 429 or type(e).__name__ in ("RateLimitError", "ResourceExhausted", "TooManyRequests"):
+        return True
+    msg = str(e).lower()
+    return "429" in msg or "rate limit" in msg or "resource_exhausted" in msg or "quota" in msg
+
+
+def _retry_after(e: BaseException) -> Optional[float]:
+    headers = getattr(getattr(e, "response", None), "headers", None)
+    if not headers:
+        return None
+    for name in ("retry-after-ms", "retry-after"):
+        v = headers.get(name)
+        if not v:
+            continue
+        try:
+            return float(v) / (1000.0 if name.endswith("-ms") else 1.0)
+        except ValueError:
+            continue
+    return None
+
+
+def note_rate_limited(provider: str, model: str, e: BaseException) -> bool:
+    """ถ้า e คือ 429 จาก provider → pause limiter ตาม Retry-After; คืน True เมื่อเป็น 429"""
+    if not is_rate_limit_error(e):
+        return False
+    lim = get_limiter(provider, model)
+    if lim is not None:
+        from config import RATE_LIMIT_429_PAUSE_SEC
+        after = _retry_after(e)
+        lim.penalize(min(60.0, after) if after is not None else RATE_LIMIT_429_PAUSE_SEC)
+    return True
+
+
+def estimate_request_tokens(model: str, messages: Any, max_output: int = 0) -> int:
+    """ค่าประมาณ token ของคำขอ (prompt + max output) — messages เป็น list ของ dict, list ของ part หรือ str"""
+    from utils.token_budget import MESSAGE_OVERHEAD, get_counter
+    counter = get_counter(model)
+    total = int(max_output or 0)
+    items = messages if isinstance(messages, (list, tuple)) else [messages]
+    for m in items:
+        content = m.get("content") if isinstance(m, dict) else m
+        if isinstance(m, dict):
+            total += MESSAGE_OVERHEAD
+        if isinstance(content, str):
+            total += counter.count(content)
+        elif isinstance(content, list):
+            for part in content:
+                if isinstance(part, dict) and part.get("type") == "text":
+                    total += counter.count(part.get("text") or "")
+                elif isinstance(part, str):
+                    total += counter.count(part)
+                else:
+                    total += IMAGE_TOKENS
+        elif content is not None:
+            total += IMAGE_TOKENS
+    return total
+
+
+def usage_tokens(rsp: Any) -> Optional[int]:
+    """token ที่ใช้จริงจาก response (OpenAI: usage.total_tokens, Gemini: usage_metadata.total_token_count)"""
+    usage = getattr(rsp, "usage", None)
+    if usage is not None and getattr(usage, "total_tokens", None):
+        return int(usage.total_tokens)
+    meta = getattr(rsp, "usage_metadata", None)
+    if meta is not None and getattr(meta, "total_token_count", None):
+        return int(meta.total_token_count)
+    return None
+
+
+def limiter_stats() -> Dict[str, Any]:
+    from config import RATE_LIMIT_ENABLED
+    if not RATE_LIMIT_ENABLED:
+        return {"enabled": False}
+    with _LOCK:
+        items = list(_LIMITERS.items())
+    return {f"{p}:{m}": lim.snapshot() for (p, m), lim in sorted(items)}
+
+
+__all__ = [
+    "BudgetExceeded",
+    "RateLimiter",
+    "Permit",
+    "get_limiter",
+    "acquire",
+    "is_rate_limit_error",
+    "note_rate_limited",
+    "estimate_request_tokens",
+    "usage_tokens",
+    "limiter_stats",
+    "IMAGE_TOKENS",
+]
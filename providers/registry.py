@@ -0,0 +1,191 @@
+# providers/registry.py
+# -*- coding: utf-8 -*-
+"""
+Provider client registry — สร้าง client ของ LLM "ครั้งเดียวต่อโปรเซส" แล้วใช้ซ้ำ
+- OpenAI: OpenAI(...) ตัวเดียว บน httpx.Client ที่มี keep-alive pool ขนาด PROVIDER_POOL_SIZE
+  (ดีฟอลต์ = DISPATCH_WORKERS + 2) → ไม่ต้อง TLS handshake / สร้าง object ใหม่ทุกครั้ง
+- Gemini: genai.configure ครั้งเดียว (configure ใหม่เฉพาะเมื่อคีย์เปลี่ยน) + cache GenerativeModel ต่อชื่อโมเดล
+- fork-safe: ผูกกับ pid — ถ้าโปรเซสถูก fork (gunicorn --preload) จะสร้างใหม่ในโปรเซสลูก ไม่แชร์ socket
+- warm_up(): เปิด connection ล่วงหน้าตอนสตาร์ต (เธรดพื้นหลัง ไม่บล็อกการรับ request)
+- close(): ปิด pool ตอน drain (utils.lifecycle)
+- stats(): สำหรับ /diag
+
+ENV: PROVIDER_POOL_SIZE, PROVIDER_KEEPALIVE_SEC, PROVIDER_TIMEOUT_SEC, PROVIDER_MAX_RETRIES, PROVIDER_WARMUP
+     + OPENAI_API_KEY / OPENAI_BASE_URL (หรือ OPENAI_API_BASE), GOOGLE_API_KEY
+"""
+
+from __future__ import annotations
+from typing import Any, Dict, Optional
+import os
+import threading
+import time
+
+_lock = threading.Lock()
+_pid: Optional[int] = None
+_openai: Any = None
+_http: Any = None
+_gemini_key: Optional[str] = None
+_gemini_models: Dict[str, Any] = {}
+_stats: Dict[str, Any] = {"openai_clients_built": 0, "gemini_configured": 0, "gemini_models_built": 0, "warmup": {}}
+
+
+def _log(tag: str, **kw: Any) -> None:
+    extra = f" | {kw}" if kw else ""
+    print(f"[providers] {tag}{extra}", flush=True)
+
+
+def _reset_if_forked() -> None:
+    """เรียกภายใต้ _lock: ทิ้งของที่สร้างในโปรเซสแม่ (socket ใช้ข้าม fork ไม่ได้)"""
+    global _pid, _openai, _http, _gemini_key
+    pid = os.getpid()
+    if _pid == pid:
+        return
+    _pid = pid
+    _openai = None
+    _http = None
+    _gemini_key = None
+    _gemini_models.clear()
+
+
+def _openai_base_url() -> Optional[str]:
+    return os.getenv("OPENAI_BASE_URL") or os.getenv("OPENAI_API_BASE") or None
+
+
+# ---------- OpenAI ----------
+def get_openai_client() -> Any:
+    """คืน OpenAI client ตัวเดียวของโปรเซส (raise ถ้าไม่มีคีย์/ไม่มี SDK)"""
+    global _openai, _http
+    client = _openai
+    if client is not None and _pid == os.getpid():
+        return client
+    from config import (
+        OPENAI_API_KEY, PROVIDER_POOL_SIZE, PROVIDER_KEEPALIVE_SEC, PROVIDER_TIMEOUT_SEC, PROVIDER_MAX_RETRIES,
+    )
+    if not OPENAI_API_KEY:
+        raise RuntimeError("OPENAI_API_KEY is not set")
+    with _lock:
+        _reset_if_forked()
+        if _openai is not None:
+            return _openai
+        import httpx                # มากับ openai SDK อยู่แล้ว
+        from openai import OpenAI   # import ภายในฟังก์ชัน กันล่มตอนติดตั้งไม่ครบ
+        _http = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=PROVIDER_POOL_SIZE,
+                max_keepalive_connections=PROVIDER_POOL_SIZE,
+                keepalive_expiry=PROVIDER_KEEPALIVE_SEC,
+            ),
+            timeout=httpx.Timeout(PROVIDER_TIMEOUT_SEC, connect=10.0),
+        )
+        kwargs: Dict[str, Any] = {
+            "api_key": OPENAI_API_KEY,
+            "http_client": _http,
+            "timeout": PROVIDER_TIMEOUT_SEC,
+            "max_retries": PROVIDER_MAX_RETRIES,    # 429 ให้ providers/rate_limit จัดการ ไม่ sleep ใน SDK
+        }
+        base_url = _openai_base_url()
+        if base_url:
+            kwargs["base_url"] = base_url
+        _openai = OpenAI(**kwargs)
+        _stats["openai_clients_built"] += 1
+        _log("OPENAI_CLIENT", pool=PROVIDER_POOL_SIZE, base_url=base_url or "default")
+        return _openai
+
+
+# ---------- Gemini ----------
+def get_gemini_model(model_name: str, api_key: Optional[str] = None) -> Any:
+    """คืน GenerativeModel ที่ cache ไว้ต่อชื่อโมเดล (configure SDK ครั้งเดียวต่อคีย์)"""
+    global _gemini_key
+    if api_key is None:
+        from config import GOOGLE_API_KEY
+        api_key = GOOGLE_API_KEY
+    if not api_key:
+        raise RuntimeError("GOOGLE_API_KEY is not set")
+    if _pid == os.getpid() and _gemini_key == api_key:
+        model = _gemini_models.get(model_name)
+        if model is not None:
+            return model
+    with _lock:
+        _reset_if_forked()
+        import google.generativeai as genai  # type: ignore
+        if _gemini_key != api_key:
+            genai.configure(api_key=api_key)
+            _gemini_key = api_key
+            _gemini_models.clear()
+            _stats["gemini_configured"] += 1
+        model = _gemini_models.get(model_name)
+        if model is None:
+            model = genai.GenerativeModel(model_name)
+            _gemini_models[model_name] = model
+            _stats["gemini_models_built"] += 1
+        return model
+
+
+# ---------- warm-up / shutdown ----------
+def _warm_openai() -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    client = get_openai_client()
+    # GET /models: เบา ไม่กินโทเคน — แค่ให้ TCP+TLS เปิดค้างไว้ใน pool
+    client.with_options(max_retries=0, timeout=10.0).models.list()
+    return {"ok": True, "ms": round((time.perf_counter() - t0) * 1000.0, 1)}
+
+
+def _warm_gemini() -> Dict[str, Any]:
+    from config import GEMINI_MODEL_DIALOGUE
+    t0 = time.perf_counter()
+    get_gemini_model(GEMINI_MODEL_DIALOGUE or "gemini-1.5-pro")
+    import google.generativeai as genai  # type: ignore
+    genai.get_model(f"models/{GEMINI_MODEL_DIALOGUE or 'gemini-1.5-pro'}")   # metadata call: เปิด channel
+    return {"ok": True, "ms": round((time.perf_counter() - t0) * 1000.0, 1)}
+
+
+def warm_up(background: bool = True) -> None:
+    """สร้าง client + เปิด connection ล่วงหน้า (ข้ามฝั่งที่ไม่มีคีย์; error ไม่ทำให้แอปล่ม)"""
+    from config import PROVIDER_WARMUP, OPENAI_KEY_SET, GOOGLE_KEY_SET
+    if not PROVIDER_WARMUP:
+        return
+
+    def _run() -> None:
+        for name, enabled, fn in (("openai", OPENAI_KEY_SET, _warm_openai), ("gemini", GOOGLE_KEY_SET, _warm_gemini)):
+            if not enabled:
+                _stats["warmup"][name] = {"ok": False, "skipped": "no_key"}
+                continue
+            try:
+                _stats["warmup"][name] = fn()
+            except Exception as e:
+                _stats["warmup"][name] = {"ok": False, "error": str(e)[:200]}
+        _log("WARMUP", **_stats["warmup"])
+
+    if background:
+        threading.Thread(target=_run, name="providers-warmup", daemon=True).start()
+    else:
+        _run()
+
+
+def close() -> bool:
+    """ปิด keep-alive pool (เรียกตอน drain หลัง dispatcher หยุดแล้ว)"""
+    global _openai, _http
+    with _lock:
+        http, _http, _openai = _http, None, None
+    if http is None:
+        return False
+    try:
+        http.close()
+    except Exception as e:
+        _log("CLOSE_ERROR", err=str(e))
+    return True
+
+
+def stats() -> Dict[str, Any]:
+    from config import PROVIDER_POOL_SIZE
+    with _lock:
+        return {
+            "pid": _pid,
+            "pool_size": PROVIDER_POOL_SIZE,
+            "openai_ready": _openai is not None,
+            "gemini_models": sorted(_gemini_models),
+            **{k: (dict(v) if isinstance(v, dict) else v) for k, v in _stats.items()},
+        }
+
+
+__all__ = ["get_openai_client", "get_gemini_model", "warm_up", "close", "stats"]
@@ -0,0 +1,321 @@
+# utils/admission.py
+# -*- coding: utf-8 -*-
+"""
+Admission control + load shedding (หน้าประตู dispatcher)
+- จัด update เป็น 3 คลาส:
+    admin   : /admin..., คำสั่งสำรอง/กู้คืน (ต้องผ่านได้เสมอแม้ระบบแน่น)
+    command : slash command / phrase trigger อื่น ๆ, location, callback (งานถูก ไม่ต้องรอ LLM)
+    chat    : ข้อความคุยทั่วไป/เอกสาร (เรียก LLM — ช้าและกิน worker)
+- แต่ละคลาสมี budget สองส่วนแยกกัน
+  * running (limit): ส่วนแบ่ง worker ที่รันพร้อมกันได้ — dispatcher เรียก permit.start() ก่อนรัน
+    ถ้าเต็ม lane จะรอจนงานอื่นจบ (chat ดีฟอลต์ = DISPATCH_WORKERS - 2 → เหลือ worker ให้ admin/command เสมอ)
+  * queued (queue_max): งานที่รับแล้วรอ worker — รับเพิ่มได้เมื่อ queued < queue_max + ช่อง running ที่ว่าง
+- ข้อความต่อเนื่อง (coalescible) ของแชตที่ถือ permit อยู่แล้ว → ใช้ permit เดิม (dispatcher รวมเป็นคำขอเดียว)
+  ไม่เปลือง budget ใหม่ (สูงสุด join_max ข้อความต่อ permit)
+- ถ้าคลาสเต็ม: ไม่ส่งเข้าคิว แต่ตอบผู้ใช้ทันทีว่า "ระบบยุ่ง ลองใหม่" (ส่งผ่าน notifier thread เดียว
+  ไม่บล็อก webhook และจำกัดไม่ให้ตอบซ้ำแชตเดิมถี่เกิน ADMISSION_NOTICE_COOLDOWN_SEC)
+- permit คืนเมื่อ handler ของข้อความสุดท้ายที่ถือ permit จบ (dispatcher on_done) → วัด latency ต่อข้อความจากตอนรับจนจบ
+- stats() ต่อคลาส: running/queued/limit/queue_max/admitted/joined/shed/deferred/latency สำหรับ /diag
+"""
+
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, Optional
+from collections import deque
+import queue
+import threading
+import time
+
+from utils.dispatcher import _is_coalescible
+
+ADMIN, COMMAND, CHAT = "admin", "command", "chat"
+CLASSES = (ADMIN, COMMAND, CHAT)
+
+_ADMIN_PREFIXES = ("/admin", "/backup_now", "/backup_status", "/restore", "/list_snapshots")
+
+BUSY_TEXT = "ขออภัยครับ ตอนนี้ระบบมีผู้ใช้งานหนาแน่น กรุณาลองส่งใหม่อีกครั้งในอีกสักครู่นะครับ 🙏"
+
+
+def _log(tag: str, **kw: Any) -> None:
+    extra = f" | {kw}" if kw else ""
+    print(f"[admission] {tag}{extra}", flush=True)
+
+
+def _percentile(sorted_vals: List[float], pct: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    idx = min(len(sorted_vals) - 1, max(0, int(round(pct * (len(sorted_vals) - 1)))))
+    return sorted_vals[idx]
+
+
+def classify(update: Dict[str, Any]) -> str:
+    """คืนคลาสของ update (admin / command / chat)"""
+    if update.get("callback_query"):
+        return COMMAND
+    msg = update.get("message") or update.get("edited_message") or {}
+    if not isinstance(msg, dict):
+        return COMMAND
+    if msg.get("document") or msg.get("photo"):
+        return CHAT
+    if msg.get("location"):
+        return COMMAND
+    text = (msg.get("text") or msg.get("caption") or "").lstrip()
+    if not text:
+        return COMMAND
+    low = text.lower()
+    if low.startswith(_ADMIN_PREFIXES):
+        return ADMIN
+    if low.startswith("/"):
+        return COMMAND
+    try:
+        from handlers.router import ROUTER
+        if ROUTER.match(text, count=False) is not None:
+            return COMMAND
+    except Exception:
+        pass
+    return CHAT
+
+
+def _chat_id(update: Dict[str, Any]) -> Any:
+    msg = update.get("message") or update.get("edited_message") or {}
+    return (msg.get("chat") or {}).get("id") if isinstance(msg, dict) else None
+
+
+class _ClassState:
+    __slots__ = ("limit", "queue_max", "running", "queued", "admitted", "joined", "shed", "deferred", "lat_ms")
+
+    def __init__(self, limit: int, queue_max: int):
+        self.limit = max(1, int(limit))
+        self.queue_max = max(0, int(queue_max))
+        self.running = 0
+        self.queued = 0
+        self.admitted = 0
+        self.joined = 0
+        self.shed = 0
+        self.deferred = 0
+        self.lat_ms: "deque[float]" = deque(maxlen=512)
+
+
+class _Permit:
+    """สิทธิ์ของแชตหนึ่งในคลาสหนึ่ง (หลายข้อความใช้ร่วมกันได้) — นับเป็น queued จนกว่า start() สำเร็จ"""
+    __slots__ = ("st", "key", "refs", "running")
+
+    def __init__(self, st: _ClassState, key: Any):
+        self.st = st
+        self.key = key
+        self.refs = 1
+        self.running = False
+
+
+class _Ticket:
+    """
+    handle ต่อข้อความ: เรียกเป็นฟังก์ชัน = คืนสิทธิ์ (dispatcher on_done)
+    start(force=False) -> bool : dispatcher เรียกก่อนรัน; False = ส่วน running ของคลาสเต็ม ให้รอ
+    """
+    __slots__ = ("_ctl", "_permit", "_t0", "_released")
+
+    def __init__(self, ctl: "AdmissionController", permit: _Permit):
+        self._ctl = ctl
+        self._permit = permit
+        self._t0 = time.monotonic()
+        self._released = False
+
+    def start(self, force: bool = False) -> bool:
+        return self._ctl._start(self._permit, force)
+
+    def __call__(self) -> None:
+        self._ctl._release(self)
+
+
+class AdmissionController:
+    """
+    - try_admit(update) -> (klass, ticket | None) : None = ถูก shed (แจ้งผู้ใช้แล้ว)
+      ticket() คืนสิทธิ์, ticket.start() ขอช่อง running (ใช้เป็น on_done/on_start ของ dispatcher)
+    - flush(timeout) / stats()
+    """
+
+    def __init__(
+        self,
+        limits: Dict[str, int],
+        queue_limits: Optional[Dict[str, int]] = None,
+        *,
+        notify: Optional[Callable[[Any, str], Any]] = None,
+        notice_cooldown_sec: float = 15.0,
+        notice_queue_max: int = 256,
+        join_max: int = 8,
+    ):
+        queue_limits = queue_limits or {}
+        self._classes = {k: _ClassState(limits.get(k, 1), queue_limits.get(k, 0)) for k in CLASSES}
+        self._lock = threading.Lock()
+        self._notify = notify
+        self._cooldown = max(0.0, float(notice_cooldown_sec))
+        self._last_notice: Dict[Any, float] = {}
+        self._notices: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, int(notice_queue_max)))
+        self._notifier: Optional[threading.Thread] = None
+        self._notices_dropped = 0
+        self._join_max = max(1, int(join_max))
+        self._live: Dict[Any, _Permit] = {}      # (klass, chat_id) → permit ที่ยังถืออยู่
+
+    # ---------- admission ----------
+    def try_admit(self, update: Dict[str, Any]):
+        klass = classify(update)
+        st = self._classes[klass]
+        chat_id = _chat_id(update)
+        key = (klass, chat_id) if chat_id is not None else None
+        with self._lock:
+            permit = self._live.get(key) if key is not None else None
+            if permit is not None and permit.refs < self._join_max and _is_coalescible(update):
+                permit.refs += 1
+                st.admitted += 1
+                st.joined += 1
+                return klass, _Ticket(self, permit)
+            shed = st.queued >= st.queue_max + max(0, st.limit - st.running)
+            if shed:
+                st.shed += 1
+            else:
+                permit = _Permit(st, key)
+                st.queued += 1
+                st.admitted += 1
+                if key is not None:
+                    self._live[key] = permit
+        if shed:
+            _log("SHED", klass=klass, limit=st.limit, queue_max=st.queue_max)
+            self._queue_notice(chat_id)
+            return klass, None
+        return klass, _Ticket(self, permit)
+
+    def _start(self, permit: _Permit, force: bool) -> bool:
+        st = permit.st
+        with self._lock:
+            if permit.running:
+                return True
+            if not force and st.running >= st.limit:
+                st.deferred += 1
+                return False
+            permit.running = True
+            st.queued -= 1
+            st.running += 1
+            return True
+
+    def _release(self, ticket: _Ticket) -> None:
+        permit = ticket._permit
+        st = permit.st
+        with self._lock:
+            if ticket._released:
+                return
+            ticket._released = True
+            st.lat_ms.append((time.monotonic() - ticket._t0) * 1000.0)
+            permit.refs -= 1
+            if permit.refs > 0:
+                return
+            if permit.running:
+                st.running -= 1
+            else:
+                st.queued -= 1
+            if permit.key is not None and self._live.get(permit.key) is permit:
+                del self._live[permit.key]
+
+    # ---------- busy notices ----------
+    def _queue_notice(self, chat_id: Any) -> None:
+        if chat_id is None or self._notify is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_notice.get(chat_id, 0.0)
+            if now - last < self._cooldown:
+                return
+            self._last_notice[chat_id] = now
+            if len(self._last_notice) > 4096:      # กัน dict โต: ตัดรายการที่พ้น cooldown แล้ว
+                for k in [k for k, t in self._last_notice.items() if now - t >= self._cooldown]:
+                    self._last_notice.pop(k, None)
+            if self._notifier is None or not self._notifier.is_alive():
+                self._notifier = threading.Thread(target=self._notify_loop, name="admission-notify", daemon=True)
+                self._notifier.start()
+        try:
+            self._notices.put_nowait(chat_id)
+        except queue.Full:
+            with self._lock:
+                self._notices_dropped += 1
+
+    def _notify_loop(self) -> None:
+        while True:
+            chat_id = self._notices.get()
+            try:
+                self._notify(chat_id, BUSY_TEXT)
+            except Exception as e:
+                _log("NOTIFY_ERROR", err=str(e))
+            finally:
+                self._notices.task_done()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """รอให้ข้อความ "ระบบยุ่ง" ที่ค้างคิวถูกส่งหมด (ใช้ตอน drain)"""
+        deadline = time.monotonic() + max(0.0, timeout)
+        while self._notices.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return not self._notices.unfinished_tasks
+
+    # ---------- stats ----------
+    def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        with self._lock:
+            for k, st in self._classes.items():
+                lat = sorted(st.lat_ms)
+                out[k] = {
+                    "limit": st.limit,
+                    "queue_max": st.queue_max,
+                    "running": st.running,
+                    "queued": st.queued,
+                    "in_flight": st.running + st.queued,
+                    "admitted": st.admitted,
+                    "joined": st.joined,
+                    "shed": st.shed,
+                    "deferred": st.deferred,
+                    "latency_ms": {
+                        "p50": round(_percentile(lat, 0.50), 2),
+                        "p95": round(_percentile(lat, 0.95), 2),
+                        "max": round(lat[-1], 2) if lat else 0.0,
+                    },
+                }
+            out["notices_pending"] = self._notices.qsize()
+            out["notices_dropped"] = self._notices_dropped
+        return out
+
+
+# ---------- default instance ----------
+_DEFAULT: Optional[AdmissionController] = None
+_DEFAULT_LOCK = threading.Lock()
+
+
+def _send_busy(chat_id: Any, text: str) -> None:
+    from utils.telegram_api import send_message  # import ภายใน (requests) เฉพาะตอนต้องส่งจริง
+    send_message(chat_id, text)
+
+
+def get_admission() -> Optional[AdmissionController]:
+    """คืน controller หลัก (None ถ้าปิดด้วย ADMISSION_ENABLED=0)"""
+    global _DEFAULT
+    from config import (
+        ADMISSION_ENABLED,
+        ADMISSION_ADMIN_MAX,
+        ADMISSION_COMMAND_MAX,
+        ADMISSION_CHAT_MAX,
+        ADMISSION_ADMIN_QUEUE,
+        ADMISSION_COMMAND_QUEUE,
+        ADMISSION_CHAT_QUEUE,
+        ADMISSION_NOTICE_COOLDOWN_SEC,
+    )
+    if not ADMISSION_ENABLED:
+        return None
+    if _DEFAULT is not None:
+        return _DEFAULT
+    with _DEFAULT_LOCK:
+        if _DEFAULT is None:
+            _DEFAULT = AdmissionController(
+                {ADMIN: ADMISSION_ADMIN_MAX, COMMAND: ADMISSION_COMMAND_MAX, CHAT: ADMISSION_CHAT_MAX},
+                {ADMIN: ADMISSION_ADMIN_QUEUE, COMMAND: ADMISSION_COMMAND_QUEUE, CHAT: ADMISSION_CHAT_QUEUE},
+                notify=_send_busy,
+                notice_cooldown_sec=ADMISSION_NOTICE_COOLDOWN_SEC,
+            )
+    return _DEFAULT
+
+
+__all__ = ["AdmissionController", "get_admission", "classify", "ADMIN", "COMMAND", "CHAT"]
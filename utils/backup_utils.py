@@ -433,12 +433,30 @@ def setup_backup_scheduler():
         _print("SCHEDULED_BACKUP_START")
         backup_all()
 
+    global _SCHEDULER
     scheduler = BackgroundScheduler(timezone=pytz.timezone("Asia/Bangkok"))
     scheduler.add_job(backup_job, "cron", hour=0, minute=9)
     scheduler.start()
+    _SCHEDULER = scheduler
     _print("SCHEDULED_BACKUP_STARTED")
 
 
+_SCHEDULER = None
+
+
+def shutdown_backup_scheduler() -> bool:
+    """หยุด scheduler (ไม่รอ job ที่กำลังรัน) — เรียกตอนปิดโปรเซส; คืน True ถ้ามี scheduler ให้หยุด"""
+    global _SCHEDULER
+    sch, _SCHEDULER = _SCHEDULER, None
+    if sch is None:
+        return False
+    try:
+        sch.shutdown(wait=False)
+    except Exception as e:
+        _print("SCHEDULER_SHUTDOWN_ERROR", err=str(e))
+    return True
+
+
 # --- CLI/Test mode ---
 if __name__ == "__main__":
     import argparse
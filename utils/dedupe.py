@@ -0,0 +1,225 @@
+# utils/dedupe.py
+# -*- coding: utf-8 -*-
+"""
+Update dedupe (ข้ามทุก gunicorn worker)
+- seen_update(update_id) -> bool : True = เคยเห็นแล้วภายใน DEDUPE_TTL_SEC (ให้ข้าม)
+- filter_new(update_ids) -> list : คืนเฉพาะ id ที่ยังไม่เคยเห็น (ตรวจทั้งชุดในทรานแซกชันเดียว)
+
+โครงสร้าง
+- ชั้นหน้า (ในโปรเซส): แบ่งเวลาเป็น bucket ละ DEDUPE_BUCKET_SEC เก็บเป็น set ต่อ bucket
+  → insert/check O(1) (จำนวน bucket คงที่) และหมดอายุทีละ bucket ไม่ต้องกวาดทุก key
+- ชั้นกลาง (แชร์ทุก worker): ตาราง SQLite `seen_updates(update_id PK, bucket)`
+  ใช้ INSERT OR IGNORE → rowcount บอกได้ทันทีว่าเป็นของใหม่หรือ worker อื่นรับไปแล้ว
+  ลบของเก่าด้วย `DELETE WHERE bucket < ?` ตอนเปลี่ยน bucket (มี index)
+- ถ้า SQLite ใช้ไม่ได้ จะตกไปใช้ชั้นในโปรเซสอย่างเดียว (ไม่ล้ม)
+"""
+
+from __future__ import annotations
+from typing import Any, Dict, Iterable, List, Optional
+import os
+import sqlite3
+import threading
+import time
+
+
+def _log(tag: str, **kw: Any) -> None:
+    extra = f" | {kw}" if kw else ""
+    print(f"[dedupe] {tag}{extra}", flush=True)
+
+
+class _BucketSet:
+    """set ที่หมดอายุเป็นช่วงเวลา (bucket) — ไม่ thread-safe ต้องถือ lock เอง"""
+
+    def __init__(self, ttl_sec: int, bucket_sec: int):
+        self.bucket_sec = max(1, int(bucket_sec))
+        self.n_buckets = max(1, -(-int(ttl_sec) // self.bucket_sec))  # ceil
+        self.buckets: Dict[int, set] = {}
+
+    def bucket_of(self, now: float) -> int:
+        return int(now // self.bucket_sec)
+
+    def _expire(self, cur: int) -> None:
+        if len(self.buckets) > self.n_buckets:
+            for b in [b for b in self.buckets if b <= cur - self.n_buckets]:
+                del self.buckets[b]
+
+    def contains(self, key: int, now: float) -> bool:
+        cur = self.bucket_of(now)
+        lo = cur - self.n_buckets
+        return any(key in s for b, s in self.buckets.items() if b > lo)
+
+    def add(self, key: int, now: float) -> None:
+        cur = self.bucket_of(now)
+        s = self.buckets.get(cur)
+        if s is None:
+            s = self.buckets[cur] = set()
+            self._expire(cur)
+        s.add(key)
+
+    def __len__(self) -> int:
+        return sum(len(s) for s in self.buckets.values())
+
+
+class UpdateDeduper:
+    def __init__(self, path: Optional[str], *, ttl_sec: int = 600, bucket_sec: int = 60):
+        self._path = path
+        self._local = _BucketSet(ttl_sec, bucket_sec)
+        self._lock = threading.Lock()
+        self._tls = threading.local()
+        self._shared_ok = bool(path)
+        self._last_purge_bucket = -1
+        self._hits = 0
+        self._misses = 0
+        self._shared_hits = 0
+        self._errors = 0
+
+    # ---------- shared store ----------
+    def _conn(self) -> Optional[sqlite3.Connection]:
+        if not self._shared_ok:
+            return None
+        c = getattr(self._tls, "conn", None)
+        if c is not None and getattr(self._tls, "pid", None) == os.getpid():
+            return c
+        try:
+            os.makedirs(os.path.dirname(self._path) or ".", exist_ok=True)
+            c = sqlite3.connect(self._path, timeout=5, isolation_level=None, check_same_thread=False)
+            c.execute("PRAGMA journal_mode=WAL;")
+            c.execute("PRAGMA synchronous=NORMAL;")
+            c.execute("PRAGMA busy_timeout=3000;")
+            c.execute(
+                "CREATE TABLE IF NOT EXISTS seen_updates ("
+                " update_id INTEGER PRIMARY KEY, bucket INTEGER NOT NULL)"
+            )
+            c.execute("CREATE INDEX IF NOT EXISTS idx_seen_bucket ON seen_updates (bucket)")
+        except Exception as e:
+            _log("SHARED_DISABLED", err=str(e), path=self._path)
+            self._shared_ok = False
+            return None
+        self._tls.conn, self._tls.pid = c, os.getpid()
+        return c
+
+    def _shared_insert(self, ids: List[int], bucket: int) -> Optional[List[int]]:
+        """INSERT OR IGNORE ทั้งชุดในทรานแซกชันเดียว → คืน id ที่เป็นของใหม่ (None = ใช้ shared ไม่ได้)"""
+        c = self._conn()
+        if c is None:
+            return None
+        try:
+            fresh: List[int] = []
+            c.execute("BEGIN IMMEDIATE")
+            for uid in ids:
+                cur = c.execute(
+                    "INSERT OR IGNORE INTO seen_updates (update_id, bucket) VALUES (?, ?)", (uid, bucket)
+                )
+                if cur.rowcount == 1:
+                    fresh.append(uid)
+            if bucket != self._last_purge_bucket:
+                # เปลี่ยน bucket → ลบของที่หมดอายุทั้งก้อน (ทำครั้งเดียวต่อ bucket ต่อโปรเซส)
+                c.execute("DELETE FROM seen_updates WHERE bucket <= ?", (bucket - self._local.n_buckets,))
+                self._last_purge_bucket = bucket
+            c.execute("COMMIT")
+            return fresh
+        except Exception as e:
+            try:
+                c.execute("ROLLBACK")
+            except Exception:
+                pass
+            with self._lock:
+                self._errors += 1
+            _log("SHARED_ERROR", err=str(e))
+            return None
+
+    # ---------- public ----------
+    def filter_new(self, update_ids: Iterable[int]) -> List[int]:
+        now = time.time()
+        ids: List[int] = []
+        local_seen = set()
+        with self._lock:
+            for uid in update_ids:
+                if not isinstance(uid, int) or uid in local_seen:
+                    continue
+                local_seen.add(uid)
+                if self._local.contains(uid, now):
+                    self._hits += 1
+                else:
+                    ids.append(uid)
+        if not ids:
+            return []
+
+        fresh = self._shared_insert(ids, self._local.bucket_of(now))
+        with self._lock:
+            if fresh is None:
+                # ไม่มี shared store → ตัดสินด้วยชั้นในโปรเซส (เช็กซ้ำใต้ lock กันสองเธรดชนกัน)
+                fresh = [uid for uid in ids if not self._local.contains(uid, now)]
+            else:
+                self._shared_hits += len(ids) - len(fresh)
+            for uid in ids:
+                self._local.add(uid, now)
+            self._misses += len(fresh)
+            self._hits += len(ids) - len(fresh)
+        return fresh
+
+    def seen_update(self, update_id: int) -> bool:
+        return not self.filter_new([update_id])
+
+    def forget(self, update_id: int) -> None:
+        """ถอน id ออก (เช่น ตอบ 503 ให้ Telegram ส่งใหม่ → ต้องไม่ถูกมองว่าซ้ำ)"""
+        with self._lock:
+            for s in self._local.buckets.values():
+                s.discard(update_id)
+        c = self._conn()
+        if c is None:
+            return
+        try:
+            c.execute("DELETE FROM seen_updates WHERE update_id = ?", (update_id,))
+        except Exception as e:
+            _log("SHARED_ERROR", err=str(e))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "shared": self._shared_ok,
+                "path": self._path,
+                "local_size": len(self._local),
+                "buckets": len(self._local.buckets),
+                "hits": self._hits,
+                "shared_hits": self._shared_hits,
+                "misses": self._misses,
+                "errors": self._errors,
+            }
+
+
+# ---------- default instance ----------
+_DEFAULT: Optional[UpdateDeduper] = None
+_DEFAULT_LOCK = threading.Lock()
+
+
+def get_deduper() -> UpdateDeduper:
+    global _DEFAULT
+    if _DEFAULT is not None:
+        return _DEFAULT
+    with _DEFAULT_LOCK:
+        if _DEFAULT is None:
+            from config import DEDUPE_SHARED, DEDUPE_DB_FILE, DEDUPE_TTL_SEC, DEDUPE_BUCKET_SEC
+            _DEFAULT = UpdateDeduper(
+                DEDUPE_DB_FILE if DEDUPE_SHARED else None,
+                ttl_sec=DEDUPE_TTL_SEC,
+                bucket_sec=DEDUPE_BUCKET_SEC,
+            )
+    return _DEFAULT
+
+
+def seen_update(update_id: int) -> bool:
+    """True ถ้า update_id นี้เคยถูกรับไปแล้ว (โดย worker ใดก็ได้) ภายใน TTL"""
+    return get_deduper().seen_update(update_id)
+
+
+def filter_new(update_ids: Iterable[int]) -> List[int]:
+    """คืนเฉพาะ update_id ที่ยังไม่เคยเห็น และบันทึกว่าเห็นแล้วทั้งชุด"""
+    return get_deduper().filter_new(update_ids)
+
+
+def forget_update(update_id: int) -> None:
+    get_deduper().forget(update_id)
+
+
+__all__ = ["UpdateDeduper", "get_deduper", "seen_update", "filter_new", "forget_update"]
@@ -0,0 +1,487 @@
+# utils/dispatcher.py
+# -*- coding: utf-8 -*-
+"""
+In-process Update Dispatcher (ack เร็ว + worker pool แบบมีขอบเขต)
+- webhook แค่ parse/validate แล้ว submit() → ตอบ Telegram 200 ได้ทันที ไม่ต้องรอ LLM
+- คิวมีขอบเขต (DISPATCH_QUEUE_MAX) ถ้าเต็มจะนับ dropped และคืน False ให้ผู้เรียกตัดสินใจ
+- worker thread จำนวน DISPATCH_WORKERS ดึงงานไปเรียก handler (เช่น handle_message)
+- สถิติสำหรับ sizing: queue depth, wait time (avg/p50/p95/max), processed/errors/dropped
+- เริ่ม worker แบบ lazy ตอน submit ครั้งแรก (ปลอดภัยกับ gunicorn ที่ fork หลัง import)
+- DISPATCH_MODE=inline → เรียก handler ตรง ๆ บนเธรด request (พฤติกรรมเดิม ไว้ debug)
+
+Per-chat lanes (ลำดับต่อแชต)
+- งานของ chat_id เดียวกันเข้า "lane" เดียวกัน และรันทีละงานตามลำดับที่เข้ามา
+  (append_message/get_recent_context/orchestrate ของผู้ใช้คนเดียวจะไม่แซงกัน)
+- ต่างแชตรันขนานกันได้เต็ม worker pool
+- lane ที่ว่างนานเกิน DISPATCH_LANE_IDLE_SEC จะถูกเก็บกวาด (reaping) ไม่ให้ dict โตไม่จำกัด
+- Coalescing: ข้อความตัวอักษรล้วน (ไม่ใช่คำสั่ง /...) ที่มาติด ๆ กันภายใน DISPATCH_COALESCE_MS
+  จะถูกรวมเป็น update เดียว (ต่อบรรทัดด้วย \\n) → เรียก orchestrator ครั้งเดียวแทนหลายครั้ง
+
+Tickets (journal)
+- submit(update, ticket=...) แนบ ticket (เช่น key ของ utils.update_journal) ไปกับงาน
+- เมื่อ handler จบ (รวมถึงงานที่ถูก coalesce) จะเรียก on_complete([tickets...]) ครั้งเดียว
+- submit(update, on_done=fn) → fn() ถูกเรียกเมื่องานนั้นจบ (เช่น คืน permit ของ admission control)
+- submit(update, on_start=fn) → worker เรียก fn() ก่อนรัน; False = ส่วนแบ่ง worker ของคลาสนั้นเต็ม
+  → lane ถูกพักไว้ (parked) แล้วลองใหม่เมื่อมีงานอื่นจบ (งานอื่นในชุด coalesce เรียก fn(force=True))
+"""
+
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from collections import deque
+import functools
+import heapq
+import os
+import queue
+import threading
+import time
+import traceback
+
+_STOP = object()  # sentinel ปิด worker
+
+
+def _log(tag: str, **kw: Any) -> None:
+    extra = f" | {kw}" if kw else ""
+    print(f"[dispatcher] {tag}{extra}", flush=True)
+
+
+def _percentile(sorted_vals: List[float], pct: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    idx = min(len(sorted_vals) - 1, max(0, int(round(pct * (len(sorted_vals) - 1)))))
+    return sorted_vals[idx]
+
+
+# ---------- update helpers (lane key / coalescing) ----------
+def _update_chat_id(update: Dict[str, Any]) -> Any:
+    for k in ("message", "edited_message", "channel_post"):
+        m = update.get(k)
+        if isinstance(m, dict):
+            return (m.get("chat") or {}).get("id")
+    cq = update.get("callback_query")
+    if isinstance(cq, dict):
+        return ((cq.get("message") or {}).get("chat") or {}).get("id")
+    return None
+
+
+def lane_key(update: Dict[str, Any]) -> str:
+    """คีย์ของ lane: ใช้ chat_id ถ้ามี ไม่งั้นแยก lane ตาม update_id (ไม่ต้องเรียงลำดับ)"""
+    cid = _update_chat_id(update)
+    if cid is not None:
+        return f"c:{cid}"
+    return f"u:{update.get('update_id', id(update))}"
+
+
+def _is_coalescible(update: Dict[str, Any]) -> bool:
+    """รวมได้เฉพาะข้อความตัวอักษรล้วนแบบใหม่ (ไม่ใช่คำสั่ง/ไฟล์/ตำแหน่ง/แก้ไข)"""
+    msg = update.get("message")
+    if not isinstance(msg, dict) or len(update) > 2:
+        return False
+    text = msg.get("text")
+    if not isinstance(text, str) or not text.strip() or text.lstrip().startswith("/"):
+        return False
+    for k in ("caption", "document", "photo", "location", "contact", "sticker", "voice"):
+        if msg.get(k):
+            return False
+    return True
+
+
+def _merge_updates(updates: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """รวมหลาย update เป็นอันเดียว: ยึด update สุดท้าย แล้วต่อข้อความทุกอันด้วยบรรทัดใหม่"""
+    if len(updates) == 1:
+        return updates[0]
+    last = updates[-1]
+    merged = dict(last)
+    merged["message"] = dict(last["message"])
+    merged["message"]["text"] = "\n".join(u["message"]["text"].strip() for u in updates)
+    return merged
+
+
+class _Job:
+    __slots__ = ("update", "enqueued_at", "coalescible", "ticket", "on_done", "on_start")
+
+    def __init__(self, update: Dict[str, Any], coalescible: bool = False, ticket: Optional[str] = None,
+                 on_done: Optional[Callable[[], Any]] = None, on_start: Optional[Callable[..., bool]] = None):
+        self.update = update
+        self.ticket = ticket
+        self.on_done = on_done
+        self.on_start = on_start
+        self.enqueued_at = time.monotonic()
+        self.coalescible = coalescible
+
+
+class _Lane:
+    __slots__ = ("jobs", "running", "scheduled", "due", "last_active")
+
+    def __init__(self) -> None:
+        self.jobs: "deque[_Job]" = deque()
+        self.running = False
+        self.scheduled = False        # อยู่ใน ready queue หรือรอ timer แล้ว
+        self.due = 0.0                # เวลาที่ timer จะปล่อย lane (coalescing window)
+        self.last_active = time.monotonic()
+
+
+class UpdateDispatcher:
+    """
+    Per-chat lanes + worker pool
+    - submit(update) -> bool : True = รับเข้าคิวแล้ว, False = คิวเต็ม (dropped) หรือปิดอยู่
+    - stats() -> dict        : ตัวเลขสำหรับ /diag
+    - stop(timeout)          : ปิดรับงานและรอ worker เคลียร์คิว
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Dict[str, Any]], Any],
+        *,
+        workers: int = 8,
+        queue_max: int = 256,
+        mode: str = "async",
+        name: str = "dispatch",
+        coalesce_ms: int = 0,
+        coalesce_max: int = 8,
+        lane_idle_sec: float = 300.0,
+        on_complete: Optional[Callable[[List[str]], Any]] = None,
+    ):
+        self._handler = handler
+        self._on_complete = on_complete
+        self._workers_n = max(1, int(workers))
+        self._queue_max = max(1, int(queue_max))
+        self._mode = (mode or "async").strip().lower()
+        self._name = name
+        self._coalesce_sec = max(0, int(coalesce_ms)) / 1000.0
+        self._coalesce_max = max(1, int(coalesce_max))
+        self._lane_idle_sec = max(1.0, float(lane_idle_sec))
+
+        self._ready: "queue.Queue[Any]" = queue.Queue()   # lane key ที่พร้อมรัน
+        self._parked: List[str] = []                       # lane ที่ on_start ปฏิเสธ รอมีงานจบ
+        self._lanes: Dict[str, _Lane] = {}
+        self._timers: List[Tuple[float, int, str]] = []   # heap (due, seq, key)
+        self._timer_seq = 0
+        self._pending = 0
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._started_pid: Optional[int] = None
+        self._accepting = True
+        self._flush_timers = False
+        self._last_reap = time.monotonic()
+
+        # counters
+        self._submitted = 0
+        self._processed = 0
+        self._errors = 0
+        self._dropped = 0
+        self._busy = 0
+        self._coalesced = 0
+        self._reaped = 0
+        self._wait_ms: "deque[float]" = deque(maxlen=512)
+        self._run_ms: "deque[float]" = deque(maxlen=512)
+        self._wait_max_ms = 0.0
+
+    # ---------- lifecycle ----------
+    @property
+    def mode(self) -> str:
+        return self._mode
+
+    def _ensure_started(self) -> None:
+        # หลัง fork (gunicorn) เธรดของ parent ไม่ตามมา → สตาร์ตใหม่ตาม pid
+        pid = os.getpid()
+        if self._started_pid == pid:
+            return
+        with self._lock:
+            if self._started_pid == pid:
+                return
+            self._threads = []
+            for i in range(self._workers_n):
+                t = threading.Thread(target=self._worker, name=f"{self._name}-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+            if self._coalesce_sec > 0:
+                t = threading.Thread(target=self._timer_loop, name=f"{self._name}-timer", daemon=True)
+                t.start()
+                self._threads.append(t)
+            self._started_pid = pid
+            _log("STARTED", workers=self._workers_n, queue_max=self._queue_max,
+                 coalesce_ms=int(self._coalesce_sec * 1000), pid=pid)
+
+    def stop(self, timeout: float = 10.0) -> bool:
+        """หยุดรับงานใหม่ แล้วรอให้ทุก lane ว่าง/worker จบภายใน timeout; คืน True ถ้าเคลียร์หมด"""
+        deadline = time.monotonic() + max(0.0, timeout)
+        with self._cond:
+            self._accepting = False
+            self._flush_timers = True          # ไม่ต้องรอ coalescing window แล้ว
+            self._cond.notify_all()
+            while (self._pending > 0 or self._busy > 0) and time.monotonic() < deadline:
+                self._cond.wait(max(0.01, deadline - time.monotonic()))
+            drained = self._pending == 0 and self._busy == 0
+        for _ in range(self._workers_n):
+            self._ready.put(_STOP)
+        for t in self._threads:
+            t.join(max(0.0, deadline - time.monotonic()))
+        return drained
+
+    # ---------- submit ----------
+    def submit(self, update: Dict[str, Any], *, ticket: Optional[str] = None,
+               on_done: Optional[Callable[[], Any]] = None,
+               on_start: Optional[Callable[..., bool]] = None) -> bool:
+        if not self._accepting:
+            with self._lock:
+                self._dropped += 1
+            return False
+
+        if self._mode == "inline":
+            with self._lock:
+                self._submitted += 1
+            if on_start is not None:
+                on_start(force=True)
+            self._run([_Job(update, ticket=ticket, on_done=on_done)])
+            return True
+
+        self._ensure_started()
+        key = lane_key(update)
+        job = _Job(update, coalescible=self._coalesce_sec > 0 and _is_coalescible(update),
+                   ticket=ticket, on_done=on_done, on_start=on_start)
+        with self._cond:
+            if self._pending >= self._queue_max:
+                self._dropped += 1
+                _log("DROP_QUEUE_FULL", depth=self._pending, queue_max=self._queue_max)
+                return False
+            lane = self._lanes.get(key)
+            if lane is None:
+                lane = self._lanes[key] = _Lane()
+            lane.jobs.append(job)
+            self._pending += 1
+            self._submitted += 1
+            if not lane.running and not lane.scheduled:
+                lane.scheduled = True
+                if job.coalescible and len(lane.jobs) == 1:
+                    # รอ window สั้น ๆ เผื่อผู้ใช้พิมพ์ต่อหลายบรรทัด
+                    lane.due = job.enqueued_at + self._coalesce_sec
+                    self._timer_seq += 1
+                    heapq.heappush(self._timers, (lane.due, self._timer_seq, key))
+                    self._cond.notify_all()
+                else:
+                    self._ready.put(key)
+            self._maybe_reap_locked()
+        return True
+
+    # ---------- timer (coalescing window) ----------
+    def _timer_loop(self) -> None:
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                while self._timers and (self._flush_timers or self._timers[0][0] <= now):
+                    due, _, key = heapq.heappop(self._timers)
+                    lane = self._lanes.get(key)
+                    if lane is not None and lane.scheduled and not lane.running and lane.due == due:
+                        lane.due = 0.0
+                        self._ready.put(key)
+                if not self._timers and not self._accepting:
+                    return
+                timeout = (self._timers[0][0] - now) if self._timers else None
+                self._cond.wait(timeout)
+
+    # ---------- workers ----------
+    def _take_batch_locked(self, lane: _Lane) -> List[_Job]:
+        first = lane.jobs.popleft()
+        batch = [first]
+        if first.coalescible:
+            while lane.jobs and lane.jobs[0].coalescible and len(batch) < self._coalesce_max:
+                batch.append(lane.jobs.popleft())
+        return batch
+
+    def _worker(self) -> None:
+        while True:
+            key = self._ready.get()
+            if key is _STOP:
+                return
+            with self._cond:
+                lane = self._lanes.get(key)
+                if lane is None or lane.running or not lane.jobs:
+                    if lane is not None:
+                        lane.scheduled = False
+                    continue
+                batch = self._take_batch_locked(lane)
+                if not self._start_batch(batch):
+                    lane.jobs.extendleft(reversed(batch))
+                    self._parked.append(key)      # lane.scheduled ค้างไว้ → submit ไม่ put ซ้ำ
+                    continue
+                lane.running = True
+                lane.scheduled = False
+                lane.due = 0.0
+                self._pending -= len(batch)
+                if len(batch) > 1:
+                    self._coalesced += len(batch) - 1
+            try:
+                self._run(batch)
+            finally:
+                with self._cond:
+                    lane.running = False
+                    lane.last_active = time.monotonic()
+                    if lane.jobs and not lane.scheduled:
+                        # งานที่ค้างระหว่างรัน → รันต่อเลย (รวม burst ที่มาระหว่างรอ LLM ได้ทันที)
+                        lane.scheduled = True
+                        self._ready.put(key)
+                    for k in self._parked:        # งานนี้จบแล้ว (คืนช่อง running) → lane ที่พักไว้ลองใหม่
+                        self._ready.put(k)
+                    self._parked = []
+                    self._cond.notify_all()
+
+    @staticmethod
+    def _start_batch(batch: List[_Job]) -> bool:
+        """ขอช่อง running ให้ทั้งชุด (งานแรกตัดสิน; งานที่ถูก coalesce ตามไปด้วย force)"""
+        if batch[0].on_start is not None and not batch[0].on_start():
+            return False
+        for j in batch[1:]:
+            if j.on_start is not None:
+                j.on_start(force=True)
+        return True
+
+    def _run(self, batch: List[_Job]) -> None:
+        started = time.monotonic()
+        wait_ms = (started - batch[0].enqueued_at) * 1000.0
+        with self._lock:
+            self._busy += 1
+            self._wait_ms.append(wait_ms)
+            if wait_ms > self._wait_max_ms:
+                self._wait_max_ms = wait_ms
+        ok = True
+        try:
+            update = _merge_updates([j.update for j in batch])
+            self._handler(update)
+        except Exception as e:
+            ok = False
+            _log("HANDLER_ERROR", err=str(e), tb=traceback.format_exc())
+        finally:
+            run_ms = (time.monotonic() - started) * 1000.0
+            with self._lock:
+                self._busy -= 1
+                self._run_ms.append(run_ms)
+                if ok:
+                    self._processed += len(batch)
+                else:
+                    self._errors += len(batch)
+            tickets = [j.ticket for j in batch if j.ticket]
+            if tickets and self._on_complete is not None:
+                try:
+                    self._on_complete(tickets)
+                except Exception as e:
+                    _log("ON_COMPLETE_ERROR", err=str(e))
+            for j in batch:
+                if j.on_done is not None:
+                    try:
+                        j.on_done()
+                    except Exception as e:
+                        _log("ON_DONE_ERROR", err=str(e))
+
+    # ---------- reaping ----------
+    def _maybe_reap_locked(self) -> None:
+        now = time.monotonic()
+        if now - self._last_reap < min(60.0, self._lane_idle_sec):
+            return
+        self._last_reap = now
+        idle = [
+            k for k, ln in self._lanes.items()
+            if not ln.jobs and not ln.running and not ln.scheduled
+            and now - ln.last_active > self._lane_idle_sec
+        ]
+        for k in idle:
+            self._lanes.pop(k, None)
+        self._reaped += len(idle)
+
+    # ---------- stats ----------
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = sorted(self._wait_ms)
+            runs = sorted(self._run_ms)
+            return {
+                "mode": self._mode,
+                "workers": self._workers_n,
+                "workers_alive": sum(1 for t in self._threads[: self._workers_n] if t.is_alive()),
+                "busy": self._busy,
+                "queue_depth": self._pending,
+                "queue_max": self._queue_max,
+                "accepting": self._accepting,
+                "submitted": self._submitted,
+                "processed": self._processed,
+                "errors": self._errors,
+                "dropped": self._dropped,
+                "lanes": len(self._lanes),
+                "lanes_running": sum(1 for ln in self._lanes.values() if ln.running),
+                "lanes_parked": len(self._parked),
+                "lanes_reaped": self._reaped,
+                "coalesced": self._coalesced,
+                "coalesce_ms": int(self._coalesce_sec * 1000),
+                "wait_ms": {
+                    "avg": round(sum(waits) / len(waits), 2) if waits else 0.0,
+                    "p50": round(_percentile(waits, 0.50), 2),
+                    "p95": round(_percentile(waits, 0.95), 2),
+                    "max": round(self._wait_max_ms, 2),
+                },
+                "run_ms": {
+                    "p50": round(_percentile(runs, 0.50), 2),
+                    "p95": round(_percentile(runs, 0.95), 2),
+                },
+            }
+
+
+# ---------- default instance (ใช้ร่วมกันทั้ง webhook และ entry point อื่น) ----------
+_DEFAULT: Optional[UpdateDispatcher] = None
+_DEFAULT_LOCK = threading.Lock()
+
+
+def get_dispatcher() -> UpdateDispatcher:
+    """
+    สร้าง dispatcher หลักจาก config (ครั้งเดียวต่อโปรเซส) โดยผูกกับ handle_message
+    - ผู้ submit ต้องกรอง update ซ้ำเอง (utils.dedupe) ก่อนส่งเข้ามา
+    """
+    global _DEFAULT
+    if _DEFAULT is not None:
+        return _DEFAULT
+    with _DEFAULT_LOCK:
+        if _DEFAULT is None:
+            from config import (
+                DISPATCH_MODE,
+                DISPATCH_WORKERS,
+                DISPATCH_QUEUE_MAX,
+                DISPATCH_COALESCE_MS,
+                DISPATCH_LANE_IDLE_SEC,
+            )
+            from handlers.main_handler import handle_message  # import ภายใน กันวงจร import
+            from utils.update_journal import get_journal
+            journal = get_journal()
+            # ทุกทางที่ submit เข้ามา (webhook/replay) กรองซ้ำด้วย utils.dedupe แล้ว
+            _DEFAULT = UpdateDispatcher(
+                functools.partial(handle_message, deduped=True),
+                workers=DISPATCH_WORKERS,
+                queue_max=DISPATCH_QUEUE_MAX,
+                mode=DISPATCH_MODE,
+                coalesce_ms=DISPATCH_COALESCE_MS,
+                lane_idle_sec=DISPATCH_LANE_IDLE_SEC,
+                on_complete=journal.mark_done if journal is not None else None,
+            )
+            if journal is not None:
+                d = _DEFAULT
+                journal.set_replay(lambda key, upd: d.submit(upd, ticket=key))
+    return _DEFAULT
+
+
+def dispatch_update(update: Dict[str, Any]) -> bool:
+    """ทางลัด: ส่ง update เข้า dispatcher หลัก"""
+    return get_dispatcher().submit(update)
+
+
+def replay_journal(limit: int = 200) -> int:
+    """
+    ส่งงานที่ค้างใน journal (ของโปรเซสที่ตายไปแล้ว) กลับเข้า dispatcher
+    - เรียกตอนสตาร์ต; หลังจากนั้น journal จะ sweep เองเป็นระยะ
+    - คืนจำนวนที่รับเข้าคิว
+    """
+    get_dispatcher()  # ผูก replay_fn เข้ากับ journal
+    from utils.update_journal import get_journal
+    journal = get_journal()
+    if journal is None:
+        return 0
+    return journal.replay(limit=limit)
+
+
+__all__ = ["UpdateDispatcher", "get_dispatcher", "dispatch_update", "replay_journal", "lane_key"]
@@ -0,0 +1,95 @@
+# utils/fast_json.py
+# -*- coding: utf-8 -*-
+"""
+Fast path สำหรับถอด body ของ webhook
+- parse JSON จาก bytes ตรง ๆ (ไม่ decode เป็น str ก่อน) — ใช้ orjson ถ้าติดตั้งไว้ (ออปชัน) ไม่งั้นใช้ json มาตรฐาน
+- แตก gzip แบบ stream ด้วย zlib.decompressobj เขียนลง bytearray เดียว
+  และบังคับเพดานขนาดระหว่างแตก (max_length) → ไม่ต้องแตกจนหมดก่อนค่อยรู้ว่าเกิน
+- parse ครั้งเดียว: ถ้าไม่ใช่ JSON ที่ถูกต้องจะโยน BadPayload (ไม่ parse ซ้ำด้วยทางอื่น)
+- ถ้า bytes ไม่ใช่ UTF-8 ที่ถูกต้อง จะ decode แบบ replace แล้วลองอีกครั้ง (พฤติกรรมเดิม)
+"""
+
+from __future__ import annotations
+from typing import Any, Tuple
+import json
+import zlib
+
+try:  # optional accelerated backend
+    import orjson as _orjson  # type: ignore
+except Exception:  # pragma: no cover
+    _orjson = None
+
+BACKEND = "orjson" if _orjson is not None else "json"
+_CHUNK = 64 * 1024
+
+
+class PayloadTooLarge(ValueError):
+    """ขนาดหลังแตก gzip เกินเพดาน"""
+
+
+class BadPayload(ValueError):
+    """ถอด gzip/JSON ไม่ได้"""
+
+
+def loads(data: bytes | bytearray | memoryview | str) -> Any:
+    """json.loads ที่รับ bytes ได้ตรง ๆ (orjson ถ้ามี)"""
+    if not data:
+        return None
+    try:
+        if _orjson is not None:
+            return _orjson.loads(data)
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return json.loads(data)
+    except UnicodeDecodeError:
+        pass
+    except ValueError as e:
+        if _orjson is None or "utf-8" not in str(e).lower():
+            raise BadPayload(str(e)) from None
+    # UTF-8 เสีย → แทนที่ตัวที่เสียแล้วลองอีกรอบ
+    try:
+        return json.loads(bytes(data).decode("utf-8", errors="replace"))
+    except ValueError as e:
+        raise BadPayload(str(e)) from None
+
+
+def gunzip_capped(raw: bytes, cap: int) -> bytearray:
+    """แตก gzip (รองรับหลาย member) โดยหยุดทันทีเมื่อเกิน cap ไบต์"""
+    out = bytearray()
+    data: bytes | memoryview = memoryview(raw)
+    try:
+        while data:
+            d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            while True:
+                room = cap - len(out) + 1              # +1 เพื่อจับได้ว่า "เกิน"
+                piece = d.decompress(data, min(_CHUNK, room))
+                out += piece
+                if len(out) > cap:
+                    raise PayloadTooLarge(len(out))
+                if d.eof:
+                    break
+                data = d.unconsumed_tail
+                if not data and not piece:
+                    raise BadPayload("truncated gzip stream")
+            data = d.unused_data                        # gzip หลาย member ต่อกัน
+    except zlib.error as e:
+        raise BadPayload(str(e)) from None
+    return out
+
+
+def parse_body(raw: bytes, content_encoding: str = "", cap: int = 20 * 1024 * 1024) -> Tuple[Any, int]:
+    """
+    คืน (data, decoded_len)
+    - content_encoding: ค่า header Content-Encoding (รองรับ gzip / identity)
+    - โยน PayloadTooLarge / BadPayload ให้ผู้เรียกแปลงเป็น 413 / 400
+    """
+    if (content_encoding or "").strip().lower() == "gzip":
+        body: bytes | bytearray = gunzip_capped(raw, cap)
+    else:
+        body = raw
+    if not body:
+        return None, 0
+    return loads(body), len(body)
+
+
+__all__ = ["BACKEND", "PayloadTooLarge", "BadPayload", "loads", "gunzip_capped", "parse_body"]
@@ -7,6 +7,8 @@ Gemini Client (SDK v1) — hardened & feature-complete
 - Image generation: try Imagen 3 models (imagen-3.0, imagen-3.0-fast, imagen-3.0-generate) with graceful fallback
 - Robust error handling -> user-friendly Thai messages
 - Optional web-aided answering (uses utils.google_search_utils if available)
+- Text/vision calls share the per-model rate limiter with the orchestrator (providers/rate_limit.py);
+  over budget -> try the other model once, else a Thai "rate limit" message (no blocking)
 
 ENV
   GEMINI_API_KEY                 (required)
@@ -23,6 +25,8 @@ import uuid
 import google.generativeai as genai
 from google.api_core import exceptions as gexc
 
+from providers.rate_limit import BudgetExceeded, acquire, estimate_request_tokens, note_rate_limited, usage_tokens
+
 try:
     from PIL import Image
 except Exception:
@@ -73,6 +77,8 @@ for m in _IMAGEN_CANDIDATES:
 
 # ---------- Helpers ----------
 def _err_to_text(e: Exception) -> str:
+    if isinstance(e, BudgetExceeded):
+        return "❌ ใช้งานหนาแน่น (rate limit) กรุณาลองใหม่"
     if isinstance(e, gexc.DeadlineExceeded):
         return "❌ หมดเวลาเชื่อมต่อบริการ Gemini (timeout)"
     if isinstance(e, (gexc.PermissionDenied, gexc.Unauthenticated)):
@@ -85,6 +91,19 @@ def _err_to_text(e: Exception) -> str:
         return f"❌ ไม่พบโมเดลที่เรียกใช้: {e}"
     return f"❌ ขัดข้องที่บริการ Gemini: {e}"
 
+def _generate(model: Any, contents: Any, *, max_wait_ms: Optional[float] = None) -> Any:
+    """model.generate_content ผ่าน rate limiter ของ (gemini, ชื่อโมเดล)"""
+    name = (getattr(model, "model_name", "") or "gemini").split("/")[-1]
+    est = estimate_request_tokens(name, contents, 1024)
+    with acquire("gemini", name, est, max_wait_ms) as permit:
+        try:
+            resp = model.generate_content(contents, request_options={"timeout": TEXT_TIMEOUT})
+        except Exception as e:
+            note_rate_limited("gemini", name, e)
+            raise
+        permit.settle(usage_tokens(resp))
+        return resp
+
 def _safe_text(resp) -> str:
     try:
         t = getattr(resp, "text", None)
@@ -159,12 +178,14 @@ def generate_text(
     *,
     web_queries: Optional[List[str]] = None,
     system_instruction: Optional[str] = None,
+    max_wait_ms: Optional[float] = None,
 ) -> str:
     """
     สร้างข้อความตอบกลับจาก Gemini
     - เลือก Flash/Pro ให้โดยอัตโนมัติ (หรือบังคับด้วย prefer_strong=True)
     - ผสานสรุปจากเว็บ (ถ้าให้ web_queries และมี google_search_utils)
     - รองรับ system_instruction แบบเบา ๆ
+    - max_wait_ms: รอโควตา rate limit ได้นานเท่าไร (งานเบื้องหลังเช่นสรุปเอกสารตั้งให้นานกว่าดีฟอลต์)
     """
     if not (_MODEL_PRO or _MODEL_FLASH):
         return "❌ ไม่สามารถเริ่มต้นโมเดล Gemini ได้ (ตรวจ GEMINI_API_KEY)"
@@ -183,10 +204,7 @@ def generate_text(
     messages.append(prompt)
 
     try:
-        resp = model.generate_content(
-            messages if len(messages) > 1 else prompt,
-            request_options={"timeout": TEXT_TIMEOUT},
-        )
+        resp = _generate(model, messages if len(messages) > 1 else prompt, max_wait_ms=max_wait_ms)
         out = _safe_text(resp)
         if out:
             return out
@@ -196,10 +214,7 @@ def generate_text(
         backup = _MODEL_PRO if model is _MODEL_FLASH else _MODEL_FLASH
         if backup:
             try:
-                resp = backup.generate_content(
-                    messages if len(messages) > 1 else prompt,
-                    request_options={"timeout": TEXT_TIMEOUT},
-                )
+                resp = _generate(backup, messages if len(messages) > 1 else prompt, max_wait_ms=max_wait_ms)
                 out = _safe_text(resp)
                 if out:
                     return out
@@ -237,10 +252,7 @@ def vision_analyze(
         return f"❌ เตรียมไฟล์ภาพไม่สำเร็จ: {e}"
 
     try:
-        resp = model.generate_content(
-            parts,
-            request_options={"timeout": TEXT_TIMEOUT},
-        )
+        resp = _generate(model, parts)
         out = _safe_text(resp)
         return out or "❌ โมเดลไม่ส่งคำบรรยายกลับมา"
     except Exception as e:
@@ -0,0 +1,142 @@
+# utils/ingest.py
+# -*- coding: utf-8 -*-
+"""
+Ingest pipeline (ใช้ร่วมกันระหว่าง webhook และ long-polling)
+ลำดับต่อ batch:
+  1) dedupe ทั้งชุดครั้งเดียว (utils.dedupe.filter_new)
+  2) admission control ต่อคลาส (utils.admission) — คลาสที่เต็มจะถูก shed และแจ้งผู้ใช้ว่า "ระบบยุ่ง"
+     (นับเป็น "shed" ไม่ใช่ "rejected": Telegram ไม่ต้องส่งซ้ำเพราะผู้ใช้รู้แล้ว)
+  3) upsert ผู้ใช้ทั้งชุดในทรานแซกชันเดียว (memory_store.touch_users) — เฉพาะ batch > 1
+  4) journal ทั้งชุดรอ commit ครั้งเดียว (utils.update_journal.append_many)
+  5) submit เข้า dispatcher ทีละตัว (ตามลำดับ update_id) — permit ขอช่อง running ตอนเริ่มรัน และคืนเมื่องานจบ
+- งานที่ dispatcher ไม่รับ (คิวเต็ม/กำลังปิด) จะถูกถอนออกจาก dedupe/journal และคืนใน "rejected"
+  เพื่อให้ผู้เรียกให้ Telegram ส่งซ้ำ (webhook: 503, polling: ไม่เลื่อน offset)
+- ระหว่าง drain (utils.lifecycle): journal อย่างเดียวแล้ว ack ("deferred") → โปรเซสใหม่ replay ให้
+"""
+
+from __future__ import annotations
+from typing import Any, Dict, List
+
+from utils.admission import get_admission
+from utils.dedupe import filter_new, forget_update
+from utils.dispatcher import get_dispatcher
+from utils.update_journal import get_journal
+from utils.lifecycle import is_draining
+
+
+def _log(tag: str, **kw: Any) -> None:
+    extra = f" | {kw}" if kw else ""
+    print(f"[ingest] {tag}{extra}", flush=True)
+
+
+def _sender(update: Dict[str, Any]) -> Dict[str, Any] | None:
+    msg = update.get("message") or update.get("edited_message")
+    if isinstance(msg, dict):
+        u = msg.get("from")
+        if isinstance(u, dict) and u.get("id") and not u.get("is_bot"):
+            return u
+    return None
+
+
+def ingest_updates(updates: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    คืน dict:
+      accepted   : จำนวนที่ส่งเข้า dispatcher แล้ว
+      duplicates : จำนวนที่ข้ามเพราะซ้ำ
+      shed       : จำนวนที่ถูกปฏิเสธโดย admission control (แจ้งผู้ใช้แล้ว)
+      deferred   : จำนวนที่ journal ไว้ระหว่าง drain (ยังไม่ประมวลผล)
+      rejected   : รายการ update ที่ต้องให้ Telegram ส่งใหม่ (เรียงตาม update_id)
+    """
+    result: Dict[str, Any] = {"accepted": 0, "duplicates": 0, "shed": 0, "deferred": 0, "rejected": []}
+    if not updates:
+        return result
+
+    # 1) dedupe (update ที่ไม่มี update_id ปล่อยผ่าน)
+    ids = [u.get("update_id") for u in updates if isinstance(u.get("update_id"), int)]
+    fresh_ids = set(filter_new(ids)) if ids else set()
+    fresh: List[Dict[str, Any]] = []
+    for u in updates:
+        uid = u.get("update_id")
+        if isinstance(uid, int) and uid not in fresh_ids:
+            result["duplicates"] += 1
+            continue
+        fresh_ids.discard(uid)          # update_id ซ้ำภายใน batch เดียวกัน → รับแค่ครั้งแรก
+        fresh.append(u)
+    if not fresh:
+        return result
+
+    # กำลังปิดโปรเซส → journal ไว้ให้โปรเซสใหม่ (ถ้า journal ไม่ได้ ให้ Telegram ส่งซ้ำ)
+    if is_draining():
+        journal = get_journal()
+        tickets = journal.append_many(fresh) if journal is not None else [None] * len(fresh)
+        for u, t in zip(fresh, tickets):
+            if t is not None:
+                result["deferred"] += 1
+                continue
+            if isinstance(u.get("update_id"), int):
+                forget_update(u["update_id"])
+            result["rejected"].append(u)
+        return result
+
+    # 2) admission control
+    dispatcher = get_dispatcher()        # สร้างก่อน (ผูก router ของ handler ที่ใช้จัดคลาส)
+    admission = get_admission()
+    releases: List[Any] = [None] * len(fresh)
+    if admission is not None:
+        admitted: List[Dict[str, Any]] = []
+        kept: List[Any] = []
+        for u in fresh:
+            _klass, release = admission.try_admit(u)
+            if release is None:
+                result["shed"] += 1
+                continue
+            admitted.append(u)
+            kept.append(release)
+        fresh, releases = admitted, kept
+        if not fresh:
+            return result
+
+    # 3) user upsert แบบ batch (ข้อความเดี่ยวปล่อยให้ handler ทำเหมือนเดิม)
+    if len(fresh) > 1:
+        senders = [s for s in (_sender(u) for u in fresh) if s]
+        if senders:
+            try:
+                from utils.memory_store import touch_users
+                touch_users(senders)
+            except Exception as e:
+                _log("TOUCH_USERS_ERROR", err=str(e))
+
+    # 4) journal
+    journal = get_journal()
+    tickets: List[Any] = [None] * len(fresh)
+    if journal is not None:
+        tickets = journal.append_many(fresh)
+        if any(t is None for t in tickets):
+            _log("JOURNAL_PARTIAL", failed=sum(1 for t in tickets if t is None), total=len(tickets))
+
+    # 5) dispatch — ถ้าตัวไหนไม่ถูกรับ ตัวถัดไปในชุดก็ต้องไม่ถูกรับ (รักษาลำดับต่อแชต/offset)
+    for i, u in enumerate(fresh):
+        try:
+            rel = releases[i]
+            ok = dispatcher.submit(u, ticket=tickets[i], on_done=rel,
+                                   on_start=rel.start if rel is not None else None)
+        except Exception as e:
+            _log("SUBMIT_ERROR", err=str(e))
+            ok = False
+        if not ok:
+            rest = fresh[i:]
+            if journal is not None:
+                journal.mark_done([t for t in tickets[i:] if t])
+            for rel in releases[i:]:
+                if rel is not None:
+                    rel()
+            for r in rest:
+                if isinstance(r.get("update_id"), int):
+                    forget_update(r["update_id"])
+            result["rejected"] = rest
+            break
+        result["accepted"] += 1
+    return result
+
+
+__all__ = ["ingest_updates"]
@@ -0,0 +1,271 @@
+# utils/lifecycle.py
+# -*- coding: utf-8 -*-
+"""
+Lifecycle / graceful drain ตอนปิดโปรเซส (Render ส่ง SIGTERM ทุกครั้งที่ deploy)
+- install(): ผูก SIGTERM/SIGINT (ต่อ chain กับ handler เดิม เช่นของ gunicorn worker) + atexit
+- เมื่อได้สัญญาณ: เข้าโหมด draining ทันที (ไม่บล็อก signal handler) แล้วรัน drain hooks
+  ตามลำดับในเธรดแยก ภายใต้ deadline เดียว (GRACEFUL_TIMEOUT_SEC < --graceful-timeout ของ gunicorn)
+- ระหว่าง draining: ingest จะ journal แล้ว ack โดยไม่ส่งเข้า dispatcher (โปรเซสใหม่ replay ให้)
+- hook: register_drain(name, fn, order) โดย fn(deadline_monotonic) -> ผลสรุป (ใส่ใน report)
+  ลำดับมาตรฐาน (register_default_hooks):
+    10 dispatcher  : หยุดรับงาน รอ handler ที่ค้าง/กำลังรันให้จบ (งานที่ไม่ทันยังอยู่ใน journal)
+    20 notices     : ส่งข้อความ "ระบบยุ่ง" ที่ค้างในคิวให้หมด
+    25 summarizer  : ทิ้งคิวสรุปประวัติที่ยังไม่เริ่ม รองานที่กำลังสรุปให้ commit
+    60 messages    : flush ข้อความแชตที่ค้างใน write-behind ของ memory_store (group commit) ลง DB
+    70 db_pool     : ปิด connection SQLite ที่ค้างใน pool ต่อเธรด — เฉพาะเมื่อไม่มี handler/สรุปที่ยังรันค้าง
+    75 router_stats: บันทึกสถิติ adaptive router ลงไฟล์ (ROUTER_MODE=adaptive)
+    80 journal     : flush + ปิด journal
+    85 providers   : ปิด keep-alive pool ของ LLM client
+    90 backup      : ปิด scheduler สำรองข้อมูล (ไม่เริ่มงานใหม่)
+  ส่วนอื่นที่มี buffer ลงทะเบียนเพิ่มได้ที่ลำดับ 30–59
+- report(): สถานะ/ผล drain สำหรับ /diag และ log
+"""
+
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import atexit
+import signal
+import threading
+import time
+import traceback
+
+DrainFn = Callable[[float], Any]
+
+_hooks: List[Tuple[int, str, DrainFn]] = []
+_lock = threading.Lock()
+_draining = threading.Event()
+_drained = threading.Event()
+_installed = False
+_deadline = 0.0
+_report: Dict[str, Any] = {}
+
+
+def _log(tag: str, **kw: Any) -> None:
+    extra = f" | {kw}" if kw else ""
+    print(f"[lifecycle] {tag}{extra}", flush=True)
+
+
+def _grace_sec() -> float:
+    try:
+        from config import GRACEFUL_TIMEOUT_SEC
+        return float(GRACEFUL_TIMEOUT_SEC)
+    except Exception:
+        return 25.0
+
+
+# ---------- registration ----------
+def register_drain(name: str, fn: DrainFn, order: int = 50) -> None:
+    """ลงทะเบียน hook (ชื่อซ้ำ = แทนที่ของเดิม)"""
+    with _lock:
+        _hooks[:] = [h for h in _hooks if h[1] != name]
+        _hooks.append((int(order), name, fn))
+        _hooks.sort(key=lambda h: h[0])
+
+
+def is_draining() -> bool:
+    return _draining.is_set()
+
+
+def remaining(deadline: float, margin: float = 0.0) -> float:
+    """เวลาที่เหลือก่อน deadline (วินาที, ไม่ติดลบ)"""
+    return max(0.0, deadline - time.monotonic() - margin)
+
+
+# ---------- drain ----------
+def _run_hooks(reason: str) -> None:
+    started = time.monotonic()
+    results: List[Dict[str, Any]] = []
+    with _lock:
+        hooks = list(_hooks)
+    for order, name, fn in hooks:
+        left = remaining(_deadline)
+        if left <= 0:
+            results.append({"hook": name, "skipped": "deadline"})
+            continue
+        t0 = time.monotonic()
+        entry: Dict[str, Any] = {"hook": name}
+        try:
+            entry["result"] = fn(_deadline)
+        except Exception as e:
+            entry["error"] = str(e)
+            _log("HOOK_ERROR", hook=name, err=str(e), tb=traceback.format_exc())
+        entry["ms"] = round((time.monotonic() - t0) * 1000.0, 1)
+        results.append(entry)
+    _report.update({
+        "finished": True,
+        "elapsed_ms": round((time.monotonic() - started) * 1000.0, 1),
+        "hooks": results,
+    })
+    _log("DRAINED", reason=reason, **{k: v for k, v in _report.items() if k != "reason"})
+    _drained.set()
+
+
+def begin_drain(reason: str = "manual", timeout: Optional[float] = None) -> None:
+    """เริ่ม drain (ครั้งเดียว) ในเธรดแยก — เรียกจาก signal handler ได้"""
+    global _deadline
+    with _lock:
+        if _draining.is_set():
+            return
+        _deadline = time.monotonic() + (_grace_sec() if timeout is None else max(0.0, timeout))
+        _report.clear()
+        _report.update({"reason": reason, "started_at": time.time(), "finished": False})
+        _draining.set()
+    _log("DRAIN_BEGIN", reason=reason, grace_sec=round(_deadline - time.monotonic(), 1))
+    threading.Thread(target=_run_hooks, args=(reason,), name="lifecycle-drain", daemon=True).start()
+
+
+def wait_drained(timeout: Optional[float] = None) -> bool:
+    if timeout is None:
+        timeout = remaining(_deadline) + 1.0 if _draining.is_set() else 0.0
+    return _drained.wait(max(0.0, timeout))
+
+
+def drain(reason: str = "manual", timeout: Optional[float] = None) -> Dict[str, Any]:
+    """drain แบบรอจนจบ (ใช้ใน CLI/poller หรือ atexit)"""
+    begin_drain(reason, timeout)
+    wait_drained()
+    return report()
+
+
+def report() -> Dict[str, Any]:
+    with _lock:
+        out = dict(_report)
+        out["draining"] = _draining.is_set()
+        out["hooks_registered"] = [h[1] for h in _hooks]
+    return out
+
+
+# ---------- signals / atexit ----------
+def _chain_handler(signum: int, prev: Any) -> Callable[[int, Any], None]:
+    def handler(sig, frame):
+        begin_drain(signal.Signals(sig).name)
+        if callable(prev):
+            prev(sig, frame)                # เช่น gunicorn: หยุดรับ request แล้วรอ request ค้างให้จบ
+        elif prev == signal.SIG_DFL:
+            # ไม่มีใครจัดการต่อ (เช่น python main.py) → รอ drain แล้วค่อยออก
+            wait_drained()
+            raise SystemExit(0)
+    return handler
+
+
+def _atexit() -> None:
+    if not _draining.is_set():
+        begin_drain("atexit")
+    wait_drained()
+
+
+def install() -> bool:
+    """ผูก signal + atexit (ครั้งเดียว; ต้องเรียกจาก main thread ถึงจะผูก signal ได้)"""
+    global _installed
+    if _installed:
+        return True
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            prev = signal.getsignal(sig)
+            signal.signal(sig, _chain_handler(sig, prev))
+        except (ValueError, OSError) as e:   # ไม่ใช่ main thread / แพลตฟอร์มไม่รองรับ
+            _log("SIGNAL_SKIP", sig=str(sig), err=str(e))
+    atexit.register(_atexit)
+    _installed = True
+    return True
+
+
+# ---------- default hooks ----------
+def register_default_hooks() -> None:
+    """ลงทะเบียน hook มาตรฐานของบอท (import ภายในเพื่อไม่ผูกวงจร import)"""
+
+    def _dispatcher(deadline: float) -> Dict[str, Any]:
+        from utils.dispatcher import get_dispatcher
+        d = get_dispatcher()
+        before = d.stats()
+        drained = d.stop(timeout=remaining(deadline, margin=2.0))
+        after = d.stats()
+        return {
+            "drained": drained,
+            "in_flight_at_start": before["queue_depth"] + before["busy"],
+            "left_queued": after["queue_depth"],   # ยังอยู่ใน journal → โปรเซสใหม่ replay
+            "left_running": after["busy"],
+        }
+
+    def _notices(deadline: float) -> Any:
+        from utils.admission import get_admission
+        adm = get_admission()
+        if adm is None:
+            return "disabled"
+        return {"flushed": adm.flush(timeout=remaining(deadline, margin=1.5))}
+
+    def _summarizer(deadline: float) -> Any:
+        from utils.summarizer import get_summarizer
+        s = get_summarizer()
+        if s is None:
+            return "disabled"
+        return {"drained": s.stop(timeout=remaining(deadline, margin=2.0))}
+
+    def _messages(deadline: float) -> Any:
+        from utils.memory_store import flush_pending_messages, write_behind_stats
+        before = write_behind_stats()
+        if not before.get("active"):
+            return "idle" if before.get("enabled") else "disabled"
+        left = flush_pending_messages(timeout=remaining(deadline, margin=1.0))
+        return {"pending_at_start": before["pending"], "left": left}
+
+    def _db_pool(_deadline: float) -> Any:
+        # dispatcher/summarizer หยุดไม่ทัน → handler ที่ยังรันใช้ connection ของเธรดตัวเองกลางทรานแซกชันอยู่
+        # ปิดตอนนี้ = งานเขียนของมันล้ม (ProgrammingError) แล้วหายเงียบ → ข้ามไป ปล่อยให้ปิดตอนโปรเซสจบ
+        from utils.dispatcher import get_dispatcher
+        from utils.summarizer import get_summarizer
+        from utils.memory_store import close_db_connections
+        handlers = get_dispatcher().stats()["busy"]
+        s = get_summarizer()
+        summaries = s.stats()["running"] if s is not None else 0
+        if handlers or summaries:
+            return {"skipped": "busy", "handlers_running": handlers, "summaries_running": summaries}
+        return {"closed": close_db_connections()}
+
+    def _router_stats(_deadline: float) -> Any:
+        from orchestrator.adaptive_router import get_adaptive_router
+        router = get_adaptive_router()
+        if router is None:
+            return "disabled"
+        return {"saved": router.save()}
+
+    def _journal(deadline: float) -> Any:
+        from utils.update_journal import get_journal
+        j = get_journal()
+        if j is None:
+            return "disabled"
+        ok = j.close(timeout=remaining(deadline, margin=0.5))
+        st = j.stats()
+        # รายการที่ยังไม่ done จะถูกโปรเซสถัดไป claim/replay เมื่อ heartbeat ของเราหมดอายุ
+        return {"flushed": ok, "handed_over": max(0, st["appended"] + st["replayed"] - st["done"])}
+
+    def _providers(_deadline: float) -> Any:
+        from providers.registry import close
+        return {"closed": close()}
+
+    def _backup(_deadline: float) -> Any:
+        from utils.backup_utils import shutdown_backup_scheduler
+        return {"stopped": shutdown_backup_scheduler()}
+
+    register_drain("dispatcher", _dispatcher, order=10)
+    register_drain("notices", _notices, order=20)
+    register_drain("summarizer", _summarizer, order=25)
+    register_drain("messages", _messages, order=60)
+    register_drain("db_pool", _db_pool, order=70)
+    register_drain("router_stats", _router_stats, order=75)
+    register_drain("journal", _journal, order=80)
+    register_drain("providers", _providers, order=85)
+    register_drain("backup", _backup, order=90)
+
+
+__all__ = [
+    "register_drain",
+    "register_default_hooks",
+    "install",
+    "is_draining",
+    "begin_drain",
+    "wait_drained",
+    "drain",
+    "report",
+    "remaining",
+]
@@ -5,6 +5,14 @@ Persistent Memory Store using SQLite (Master Version, hardened+)
 - โปรไฟล์ผู้ใช้ (สถานะ, role, location) + ประวัติสนทนา/สรุป
 - รีวิว รายการโปรด FAQ ใบลา
 - เสถียร: WAL, foreign_keys, busy_timeout, retry on locked, UPSERT users
+- connection pool ต่อเธรด: เปิดครั้งเดียว + ตั้ง PRAGMA ครั้งเดียว + cache prepared statement
+  (เช็ก pid หลัง fork, ping เมื่อว่างนาน, rollback ทรานแซกชันที่ค้าง) — SQLITE_POOL=0 กลับไปเปิดใหม่ทุกครั้ง
+- append_message แบบ write-behind (group commit): ข้อความจากทุกเธรดรวมเป็นทรานแซกชันเดียว
+  ทุก MEMORY_WB_FLUSH_MS หรือครบ MEMORY_WB_MAX_ROWS แถว — อ่านของผู้ใช้คนเดียวกันเห็นข้อความที่ยังไม่ flush เสมอ
+  (get_recent_context/count รวมแถวที่ค้าง, งานที่ต้องใช้ message_id flush ก่อน); drain flush ให้ก่อนปิด
+- cache โปรไฟล์ผู้ใช้ (LRU + TTL) สำหรับ get_or_create_user/get_user_by_id: ตัวแก้ไข (status/role/location/ลบ)
+  อัปเดต cache ทันที + เพิ่มตัวนับ cache_generation ใน DB; ทุก worker เช็กตัวนับทุก MEMORY_PROFILE_GEN_CHECK_MS
+  ถ้าเปลี่ยนโดยคนอื่น → ล้าง cache ทั้งก้อน (gunicorn หลายโปรเซสเห็นค่าตรงกัน)
 - Backward-compatible กับโค้ดเดิมและ handler ที่มีอยู่
 - รองรับ schema migration อัตโนมัติไปเป็น ON DELETE CASCADE บนตารางลูก
 """
@@ -14,7 +22,10 @@ from typing import List, Dict, Any, Optional, Callable, Tuple
 import os
 import sqlite3
 import datetime
+import threading
 import time
+import weakref
+from collections import OrderedDict
 
 # --------------------- Config ---------------------
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -42,6 +53,25 @@ _MSG_ROLES = {"user", "assistant", "system"}
 SQLITE_LOCK_RETRY = int(os.getenv("SQLITE_LOCK_RETRY", "1"))
 SQLITE_LOCK_SLEEP = float(os.getenv("SQLITE_LOCK_SLEEP", "0.15"))
 
+# connection pool (ต่อเธรด) + PRAGMA ที่ตั้งครั้งเดียวตอนเปิด
+SQLITE_POOL             = os.getenv("SQLITE_POOL", "1").strip().lower() not in ("0", "false", "no", "off")
+SQLITE_CACHE_KB         = int(os.getenv("SQLITE_CACHE_KB", "8192"))              # page cache ต่อ connection
+SQLITE_MMAP_BYTES       = int(os.getenv("SQLITE_MMAP_BYTES", str(128 * 1024 * 1024)))
+SQLITE_STATEMENT_CACHE  = int(os.getenv("SQLITE_STATEMENT_CACHE", "256"))        # prepared statements ต่อ connection
+SQLITE_HEALTH_CHECK_SEC = float(os.getenv("SQLITE_HEALTH_CHECK_SEC", "30"))      # ว่างนานกว่านี้ → ping ก่อนใช้
+
+# write-behind ของ append_message (group commit) — FLUSH_MS = ช่วงที่อาจเสียข้อความถ้าโปรเซสตายกะทันหัน
+MEMORY_WRITE_BEHIND   = os.getenv("MEMORY_WRITE_BEHIND", "1").strip().lower() not in ("0", "false", "no", "off")
+MEMORY_WB_FLUSH_MS    = int(os.getenv("MEMORY_WB_FLUSH_MS", "50"))
+MEMORY_WB_MAX_ROWS    = int(os.getenv("MEMORY_WB_MAX_ROWS", "256"))       # ครบเท่านี้ flush ทันทีไม่รอรอบ
+MEMORY_WB_MAX_PENDING = int(os.getenv("MEMORY_WB_MAX_PENDING", "5000"))   # ค้างเกินนี้ → ผู้เขียน flush เอง (backpressure)
+
+# cache โปรไฟล์ผู้ใช้ (LRU + TTL) หน้าตาราง users — ตัวแก้ไขเขียนผ่าน cache + เพิ่ม generation ใน DB ให้ worker อื่นล้าง
+MEMORY_PROFILE_CACHE        = os.getenv("MEMORY_PROFILE_CACHE", "1").strip().lower() not in ("0", "false", "no", "off")
+MEMORY_PROFILE_CACHE_SIZE   = int(os.getenv("MEMORY_PROFILE_CACHE_SIZE", "5000"))
+MEMORY_PROFILE_TTL_SEC      = float(os.getenv("MEMORY_PROFILE_TTL_SEC", "120"))   # ตาข่ายสุดท้าย + ความถี่เขียน last_seen
+MEMORY_PROFILE_GEN_CHECK_MS = int(os.getenv("MEMORY_PROFILE_GEN_CHECK_MS", "1000"))  # worker อื่นเห็นการแก้ช้าสุดเท่านี้
+
 def _parse_super_admin_ids() -> set[int]:
     """
     รองรับ:
@@ -114,9 +144,9 @@ def _executemany_retry(conn: sqlite3.Connection, sql: str, seq_params: List[Tupl
                 continue
             raise
 
-def _get_db_connection() -> sqlite3.Connection:
-    """Create a SQLite connection with sane PRAGMAs for server use."""
-    conn = sqlite3.connect(DB_PATH, timeout=10, check_same_thread=False)
+def _open_connection() -> sqlite3.Connection:
+    """เปิด connection ใหม่ + PRAGMA สำหรับงาน server (ทำครั้งเดียวต่อ connection)"""
+    conn = sqlite3.connect(DB_PATH, timeout=10, check_same_thread=False, cached_statements=SQLITE_STATEMENT_CACHE)
     conn.row_factory = sqlite3.Row
     # concurrency / safety
     conn.execute("PRAGMA journal_mode=WAL;")
@@ -126,11 +156,319 @@ def _get_db_connection() -> sqlite3.Connection:
     # เพิ่มเติมเล็กน้อยเพื่อประสิทธิภาพ (ไม่บังคับทุกเวอร์ชัน)
     try:
         conn.execute("PRAGMA temp_store=MEMORY;")
-        conn.execute("PRAGMA mmap_size=134217728;")  # 128MB ถ้ารองรับ
+        conn.execute(f"PRAGMA cache_size=-{max(0, SQLITE_CACHE_KB)};")   # ค่าลบ = KiB
+        conn.execute(f"PRAGMA mmap_size={max(0, SQLITE_MMAP_BYTES)};")
     except Exception:
         pass
+    with _pool_lock:
+        _pool_stats["opened"] += 1
     return conn
 
+
+class _PooledConn:
+    __slots__ = ("conn", "pid", "path", "last_used", "closed", "__weakref__")
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self.closed = False
+        self.pid = os.getpid()
+        self.path = DB_PATH
+        self.last_used = time.monotonic()
+
+
+_pool_local = threading.local()
+_pool_lock = threading.Lock()
+_pool_conns: "weakref.WeakSet[_PooledConn]" = weakref.WeakSet()   # เธรดจบ → หลุดจาก set เอง
+_pool_stats: Dict[str, int] = {"opened": 0, "checkouts": 0, "reset_fork": 0, "reset_health": 0, "rolled_back": 0}
+
+
+def _get_db_connection() -> sqlite3.Connection:
+    """
+    connection ของเธรดนี้ (เปิดครั้งแรกที่ใช้ แล้วใช้ซ้ำ) — ใช้แบบเดิมได้: `with _get_db_connection() as conn:`
+    (context manager ของ sqlite3 แค่ commit/rollback ไม่ปิด connection)
+    - pid เปลี่ยน (fork หลัง preload) → ทิ้งของเดิมโดยไม่ปิด (handle เป็นของโปรเซสแม่) แล้วเปิดใหม่
+    - ว่างเกิน SQLITE_HEALTH_CHECK_SEC → SELECT 1 ก่อน; ล้ม = ปิดแล้วเปิดใหม่
+    - มีทรานแซกชันค้างจากรอบก่อน → rollback ก่อนส่งให้ผู้เรียก
+    """
+    if not SQLITE_POOL:
+        return _open_connection()
+    now = time.monotonic()
+    pc: Optional[_PooledConn] = getattr(_pool_local, "pc", None)
+    if pc is not None and pc.pid != os.getpid():
+        _pool_stats["reset_fork"] += 1
+        pc = None
+    elif pc is not None and (pc.closed or pc.path != DB_PATH):
+        _close_quietly(pc.conn)
+        pc = None
+    elif pc is not None and now - pc.last_used > SQLITE_HEALTH_CHECK_SEC:
+        try:
+            pc.conn.execute("SELECT 1").fetchone()
+        except sqlite3.Error:
+            _pool_stats["reset_health"] += 1
+            _close_quietly(pc.conn)
+            pc = None
+    if pc is not None and pc.conn.in_transaction:
+        try:
+            pc.conn.rollback()
+            _pool_stats["rolled_back"] += 1
+        except sqlite3.Error:
+            _close_quietly(pc.conn)
+            pc = None
+    if pc is None:
+        pc = _PooledConn(_open_connection())
+        _pool_local.pc = pc
+        with _pool_lock:
+            _pool_conns.add(pc)
+    pc.last_used = now
+    _pool_stats["checkouts"] += 1
+    return pc.conn
+
+
+def _close_quietly(conn: sqlite3.Connection) -> None:
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+def close_db_connections() -> int:
+    """
+    ปิดทุก connection ใน pool; คืนจำนวนที่ปิด
+    - ผู้เรียกต้องแน่ใจว่าไม่มีเธรดใดใช้ connection อยู่ (ตอน drain: หลัง dispatcher/summarizer หยุดครบแล้วเท่านั้น)
+      check_same_thread=False → ปิดจากเธรดนี้ได้แม้อีกเธรดอยู่กลางทรานแซกชัน
+    """
+    with _pool_lock:
+        pcs = list(_pool_conns)
+        _pool_conns.clear()
+    for pc in pcs:
+        pc.closed = True            # เธรดที่ยังทำงานอยู่จะเปิดใหม่เองในการใช้ครั้งถัดไป
+        _close_quietly(pc.conn)
+    return len(pcs)
+
+
+def db_pool_stats() -> Dict[str, Any]:
+    """สถิติ pool สำหรับ /diag"""
+    with _pool_lock:
+        out: Dict[str, Any] = dict(_pool_stats)
+        out["open"] = len(_pool_conns)
+    out["enabled"] = SQLITE_POOL
+    out["statement_cache"] = SQLITE_STATEMENT_CACHE
+    return out
+
+# --------------------- Write-behind (group commit) ---------------------
+
+_MsgRow = Tuple[int, str, str, int]   # (user_id, role, content, timestamp)
+
+
+class _WriteBehind:
+    """
+    คิวข้อความที่รอเขียน + เธรด flush เบื้องหลัง
+    - flush(): เขียนทั้งคิวในทรานแซกชันเดียว (เรียงตามลำดับที่ append; มี lock กันสอง flush สลับลำดับ)
+    - แถวที่กำลังเขียน (inflight) ยังนับเป็น "ค้าง" จน commit → ผู้อ่านไม่พลาดช่วงกลาง flush
+    - commit + ล้าง inflight อยู่ใต้ _vis; ผู้อ่านที่รวมแถวค้างถือ _vis ระหว่างอ่าน DB → ไม่ซ้ำ/ไม่หาย
+    - เขียนไม่สำเร็จเพราะ locked/IO → แถวกลับไปหัวคิว รอรอบหน้า (ไม่ทิ้ง); FK ล้ม (ผู้ใช้ถูกลบ) → ทิ้งเฉพาะแถวนั้น
+    """
+
+    def __init__(self, flush_ms: int, max_rows: int, max_pending: int):
+        self._interval = max(1, flush_ms) / 1000.0
+        self._max_rows = max(1, max_rows)
+        self._max_pending = max(self._max_rows, max_pending)
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._vis = threading.Lock()
+        self._rows: List[_MsgRow] = []
+        self._inflight: List[_MsgRow] = []
+        self._per_user: Dict[int, int] = {}
+        self._stop = False
+        self._stats: Dict[str, int] = {
+            "appended": 0, "flushed": 0, "flushes": 0, "max_batch": 0,
+            "sync_flushes": 0, "retries": 0, "dropped": 0,
+        }
+        self._thread = threading.Thread(target=self._loop, name="memory-write-behind", daemon=True)
+        self._thread.start()
+
+    def add(self, row: _MsgRow) -> None:
+        with self._cond:
+            self._rows.append(row)
+            self._per_user[row[0]] = self._per_user.get(row[0], 0) + 1
+            self._stats["appended"] += 1
+            n = len(self._rows)
+            if n >= self._max_rows:
+                self._cond.notify()
+        if n >= self._max_pending:
+            self.flush(sync=True)
+
+    def has_pending(self, user_id: int) -> bool:
+        return self._per_user.get(user_id, 0) > 0
+
+    def pending_for(self, user_id: int) -> List[_MsgRow]:
+        """แถวค้างของผู้ใช้ (เก่า→ใหม่) — เรียกภายใต้ _vis"""
+        with self._cond:
+            return [r for r in self._inflight + self._rows if r[0] == user_id]
+
+    def flush(self, sync: bool = False) -> int:
+        """เขียนทั้งคิวตอนนี้ (คืนจำนวนแถวที่ commit)"""
+        with self._flush_lock:
+            with self._cond:
+                if not self._rows:
+                    return 0
+                batch, self._rows = self._rows, []
+                self._inflight = batch
+                if sync:
+                    self._stats["sync_flushes"] += 1
+            written = self._write(batch)
+            if written < 0:                           # เขียนไม่ได้ทั้งชุด → คืนหัวคิว
+                with self._cond:
+                    self._inflight = []
+                    self._rows = batch + self._rows
+                    self._stats["retries"] += 1
+                return 0
+            return written
+
+    def _settle(self, batch: List[_MsgRow], written: int) -> None:
+        """ล้าง inflight + ลดตัวนับค้าง — เรียกใต้ _vis ทันทีหลัง commit (ผู้อ่านไม่เห็นแถวเดียวกันสองที่)"""
+        with self._cond:
+            self._inflight = []
+            for r in batch:
+                left = self._per_user.get(r[0], 0) - 1
+                if left > 0:
+                    self._per_user[r[0]] = left
+                else:
+                    self._per_user.pop(r[0], None)
+            self._stats["flushed"] += written
+            self._stats["dropped"] += len(batch) - written
+            self._stats["flushes"] += 1
+            self._stats["max_batch"] = max(self._stats["max_batch"], len(batch))
+
+    def _write(self, batch: List[_MsgRow]) -> int:
+        """จำนวนที่เขียน (ที่เหลือทิ้งเพราะ FK); เขียนไม่ได้ทั้งชุด → -1"""
+        sql = "INSERT INTO messages (user_id, role, content, timestamp) VALUES (?, ?, ?, ?)"
+        conn: Optional[sqlite3.Connection] = None
+        try:
+            conn = _get_db_connection()
+            try:
+                _executemany_retry(conn, sql, batch)
+                with self._vis:
+                    conn.commit()
+                    self._settle(batch, len(batch))
+                return len(batch)
+            except sqlite3.IntegrityError:
+                conn.rollback()
+            written = 0
+            for r in batch:                           # ไล่ทีละแถว ทิ้งเฉพาะแถวที่ผิด FK
+                try:
+                    _execute_retry(conn, sql, r)
+                    written += 1
+                except sqlite3.IntegrityError:
+                    pass
+            with self._vis:
+                conn.commit()
+                self._settle(batch, written)
+            return written
+        except sqlite3.Error as e:
+            print(f"[Memory] write-behind flush failed ({len(batch)} rows, will retry): {e}")
+            if conn is not None:
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+            return -1
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                if not self._stop and len(self._rows) < self._max_rows:
+                    self._cond.wait(self._interval)
+                if self._stop:
+                    return
+                has_rows = bool(self._rows)
+            if has_rows:
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"[Memory] write-behind loop error: {e}")
+
+    def close(self, timeout: float = 5.0) -> int:
+        """หยุดเธรด + flush ที่เหลือ (ลองซ้ำจนหมดเวลา); คืนจำนวนแถวที่ยังค้าง"""
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        self._thread.join(timeout=max(0.0, timeout))
+        deadline = time.monotonic() + max(0.0, timeout)
+        while True:
+            self.flush()
+            with self._cond:
+                left = len(self._rows)
+            if not left or time.monotonic() >= deadline:
+                return left
+            time.sleep(SQLITE_LOCK_SLEEP)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            out: Dict[str, Any] = dict(self._stats)
+            out["pending"] = len(self._rows) + len(self._inflight)
+            out["users_pending"] = len(self._per_user)
+        out["flush_ms"] = int(self._interval * 1000)
+        out["max_rows"] = self._max_rows
+        return out
+
+
+_wb: Optional[_WriteBehind] = None
+_wb_lock = threading.Lock()
+_wb_closed = False          # หลัง drain: append เขียนตรงแบบเดิม
+
+
+def _get_write_behind() -> Optional[_WriteBehind]:
+    global _wb
+    if not MEMORY_WRITE_BEHIND or _wb_closed:
+        return None
+    if _wb is None:
+        with _wb_lock:
+            if _wb is None and not _wb_closed:
+                _wb = _WriteBehind(MEMORY_WB_FLUSH_MS, MEMORY_WB_MAX_ROWS, MEMORY_WB_MAX_PENDING)
+    return _wb
+
+
+def _flush_many(user_ids: List[int]) -> None:
+    wb = _wb
+    if wb is not None and any(wb.has_pending(u) for u in user_ids):
+        wb.flush(sync=True)
+
+
+def _flush_user(user_id: int) -> None:
+    """ให้แถวค้างของผู้ใช้นี้ลง DB ก่อน (งานที่ต้องใช้ message_id/ลบ/นับตาม DB จริง)"""
+    wb = _wb
+    if wb is not None and wb.has_pending(user_id):
+        wb.flush(sync=True)
+
+
+def _read_with_pending(user_id: int, read: Callable[[sqlite3.Connection], Any]) -> Tuple[Any, List[_MsgRow]]:
+    """อ่าน DB + แถวค้างของผู้ใช้เป็น snapshot เดียวกัน (ไม่มีแถวค้าง → อ่านตรง ไม่แตะ lock)"""
+    wb = _wb
+    with _get_db_connection() as conn:
+        if wb is None or not wb.has_pending(user_id):
+            return read(conn), []
+        with wb._vis:
+            return read(conn), wb.pending_for(user_id)
+
+
+def flush_pending_messages(timeout: float = 5.0) -> int:
+    """flush + หยุด write-behind (drain hook) — คืนจำนวนแถวที่ยังเขียนไม่ได้; append หลังจากนี้เขียนตรง"""
+    global _wb, _wb_closed
+    with _wb_lock:
+        wb, _wb = _wb, None
+        _wb_closed = True
+    return wb.close(timeout) if wb is not None else 0
+
+
+def write_behind_stats() -> Dict[str, Any]:
+    wb = _wb
+    if wb is None:
+        return {"enabled": MEMORY_WRITE_BEHIND, "active": False}
+    out = wb.stats()
+    out.update(enabled=True, active=True)
+    return out
+
 def _add_column_if_not_exists(cursor: sqlite3.Cursor, table: str, column: str, col_type: str, default_val: str = "NULL") -> None:
     cursor.execute(f"PRAGMA table_info({table})")
     columns = [row["name"] for row in cursor.fetchall()]
@@ -267,8 +605,14 @@ def _ensure_child_tables_cascade(conn: sqlite3.Connection) -> None:
 # ให้ app.py ใช้ใน /healthz
 __all__ = [
     "_get_db_connection",
+    "close_db_connections",
+    "db_pool_stats",
+    "flush_pending_messages",
+    "write_behind_stats",
+    "profile_cache_stats",
     "init_db",
     "get_or_create_user",
+    "touch_users",
     "get_user_by_id",
     "get_all_users",
     "update_user_status",
@@ -281,6 +625,11 @@ __all__ = [
     "get_summary",
     "set_summary",
     "prune_and_maybe_summarize",
+    "begin_turn",
+    "commit_turn_reply",
+    "count_messages_many",
+    "collect_for_summary",
+    "apply_summary",
     "add_review",
     "get_last_review_timestamp",
     "add_favorite",
@@ -328,6 +677,17 @@ def init_db() -> None:
             c.execute("CREATE INDEX IF NOT EXISTS idx_users_status ON users (status)")
             c.execute("CREATE INDEX IF NOT EXISTS idx_users_last_seen ON users (last_seen)")
 
+            # ตัวนับ generation ของ cache โปรไฟล์ (เพิ่มทุกครั้งที่ status/role/location/ลบ เปลี่ยน)
+            c.execute(
+                """
+                CREATE TABLE IF NOT EXISTS cache_generation (
+                    name TEXT PRIMARY KEY,
+                    gen  INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            c.execute("INSERT OR IGNORE INTO cache_generation (name, gen) VALUES ('users', 0)")
+
             # Backfill status/role ให้ถูกเซ็ต
             placeholders = ",".join("?" for _ in _ALLOWED_STATUS)
             c.execute(
@@ -433,12 +793,271 @@ init_db()
 def is_super_admin(user_id: int) -> bool:
     return int(user_id) in SUPER_ADMIN_IDS
 
+def _user_defaults(user_id: int) -> Tuple[str, str, str]:
+    """(default_status, default_role, status_report) สำหรับผู้ใช้ใหม่"""
+    if is_super_admin(user_id):
+        return "approved", "super_admin", "returning_user"
+    return "pending", "employee", "new_user_pending"
+
+_UPSERT_USER_SQL = """
+    INSERT INTO users (user_id, first_name, last_name, username, first_seen, last_seen, status, role)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET
+        first_name=excluded.first_name,
+        last_name =excluded.last_name,
+        username  =excluded.username,
+        last_seen =excluded.last_seen
+"""
+
+# ผลของ touch_users() ที่รอให้ get_or_create_user() หยิบไปใช้ (1 รายการต่อ 1 ข้อความใน batch)
+_PRIMED_USERS: Dict[int, List[Any]] = {}   # user_id -> [remaining, result, expires_at]
+_PRIMED_LOCK = threading.Lock()
+_PRIMED_TTL_SEC = 10.0
+
+def _take_primed_user(user_id: int) -> Optional[Dict[str, Any]]:
+    with _PRIMED_LOCK:
+        ent = _PRIMED_USERS.get(user_id)
+        if ent is None:
+            return None
+        if ent[2] < time.monotonic():
+            _PRIMED_USERS.pop(user_id, None)
+            return None
+        ent[0] -= 1
+        if ent[0] <= 0:
+            _PRIMED_USERS.pop(user_id, None)
+        return ent[1]
+
+def _drop_primed_user(user_id: int) -> None:
+    """เรียกเมื่อสถานะ/สิทธิ์ผู้ใช้เปลี่ยน เพื่อไม่ให้คืนโปรไฟล์เก่าจาก batch ก่อนหน้า"""
+    with _PRIMED_LOCK:
+        _PRIMED_USERS.pop(int(user_id), None)
+
+
+class _ProfileCache:
+    """
+    LRU ของแถว users (user_id -> dict) อายุ ttl วินาที — get คืนสำเนา (ผู้เรียกแก้ dict ได้ไม่กระทบ cache)
+    - _epoch เพิ่มทุกครั้งที่มีการแก้/ล้าง → ผู้อ่านที่อ่าน DB ก่อนการแก้แล้วค่อย put จะถูกทิ้ง (ค่าเก่าไม่กลับเข้า cache)
+    - _gen = generation ล่าสุดที่เห็นใน DB; เจอเลขที่โปรเซสนี้ไม่ได้เพิ่มเอง → ล้างทั้งหมด (worker อื่นแก้)
+    """
+
+    def __init__(self, max_items: int, ttl_sec: float, check_ms: int):
+        self._max = max(1, max_items)
+        self._ttl = max(0.0, ttl_sec)
+        self._check = max(0, check_ms) / 1000.0
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[int, List[Any]]" = OrderedDict()   # user_id -> [expires_at, profile]
+        self._gen: Optional[int] = None
+        self._epoch = 0
+        self._next_check = 0.0
+        self._stats: Dict[str, int] = {
+            "hits": 0, "misses": 0, "expired": 0, "evicted": 0,
+            "gen_checks": 0, "remote_invalidations": 0, "write_through": 0,
+        }
+
+    def gen_due(self, now: float) -> bool:
+        return now >= self._next_check
+
+    def sync_gen(self, gen: int, now: float) -> None:
+        with self._lock:
+            self._stats["gen_checks"] += 1
+            self._next_check = now + self._check
+            if self._gen is not None and gen <= self._gen:
+                return                          # ไม่เปลี่ยน (หรืออ่านได้ค่าก่อน bump ของเราเอง)
+            if self._gen is not None:
+                self._clear()
+                self._stats["remote_invalidations"] += 1
+            self._gen = gen
+
+    def note_local_gen(self, gen: int) -> None:
+        """generation ที่โปรเซสนี้เพิ่มเอง (write-through แล้ว) — ข้ามเลข = มีคนอื่นแก้ในช่วงเดียวกัน → ล้าง"""
+        with self._lock:
+            if self._gen is not None and gen > self._gen + 1:
+                self._clear()
+                self._stats["remote_invalidations"] += 1
+            if self._gen is None or gen > self._gen:
+                self._gen = gen
+
+    def epoch(self) -> int:
+        return self._epoch
+
+    def get(self, user_id: int, now: float) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            ent = self._data.get(user_id)
+            if ent is None:
+                self._stats["misses"] += 1
+                return None
+            if ent[0] <= now:
+                del self._data[user_id]
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._data.move_to_end(user_id)
+            self._stats["hits"] += 1
+            return dict(ent[1])
+
+    def put(self, user_id: int, profile: Dict[str, Any], epoch: int, now: float) -> None:
+        with self._lock:
+            if epoch != self._epoch:
+                return
+            self._data[user_id] = [now + self._ttl, dict(profile)]
+            self._data.move_to_end(user_id)
+            while len(self._data) > self._max:
+                self._data.popitem(last=False)
+                self._stats["evicted"] += 1
+
+    def update(self, user_id: int, fields: Optional[Dict[str, Any]]) -> None:
+        """หลัง commit: แก้ฟิลด์ของรายการที่มีอยู่ (fields=None = ลบรายการ)"""
+        with self._lock:
+            self._epoch += 1
+            self._stats["write_through"] += 1
+            if fields is None:
+                self._data.pop(user_id, None)
+                return
+            ent = self._data.get(user_id)
+            if ent is not None:
+                ent[1].update(fields)
+
+    def _clear(self) -> None:
+        self._data.clear()
+        self._epoch += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            out["size"] = len(self._data)
+            out["generation"] = self._gen
+        out["max_items"] = self._max
+        out["ttl_sec"] = self._ttl
+        out["gen_check_ms"] = int(self._check * 1000)
+        return out
+
+
+_profiles: Optional[_ProfileCache] = None
+_profiles_lock = threading.Lock()
+
+_GEN_READ_SQL = "SELECT gen FROM cache_generation WHERE name = 'users'"
+_GEN_BUMP_SQL = "UPDATE cache_generation SET gen = gen + 1 WHERE name = 'users'"
+
+
+def _get_profile_cache() -> Optional[_ProfileCache]:
+    global _profiles
+    if not MEMORY_PROFILE_CACHE:
+        return None
+    if _profiles is None:
+        with _profiles_lock:
+            if _profiles is None:
+                _profiles = _ProfileCache(MEMORY_PROFILE_CACHE_SIZE, MEMORY_PROFILE_TTL_SEC, MEMORY_PROFILE_GEN_CHECK_MS)
+    return _profiles
+
+
+def _cached_profile(user_id: int) -> Tuple[Optional[Dict[str, Any]], int]:
+    """
+    (โปรไฟล์จาก cache หรือ None, epoch ที่ต้องส่งให้ _remember_profile หลังอ่าน DB)
+    - ถึงรอบ → อ่าน generation จาก DB ก่อน (เช็กไม่ได้ = ไม่เชื่อ cache รอบนี้)
+    """
+    pc = _get_profile_cache()
+    if pc is None:
+        return None, -1
+    now = time.monotonic()
+    if pc.gen_due(now):
+        try:
+            with _get_db_connection() as conn:
+                row = conn.execute(_GEN_READ_SQL).fetchone()
+        except sqlite3.Error:
+            return None, -1
+        pc.sync_gen(int(row[0]) if row else 0, now)
+    return pc.get(user_id, now), pc.epoch()
+
+
+def _remember_profile(user_id: int, profile: Optional[Dict[str, Any]], epoch: int) -> None:
+    pc = _profiles
+    if pc is not None and profile:
+        pc.put(int(user_id), profile, epoch, time.monotonic())
+
+
+def _bump_profile_gen(conn: sqlite3.Connection) -> Optional[int]:
+    """เรียกในทรานแซกชันเดียวกับการแก้ users (ก่อน commit) — คืน generation ใหม่ให้ _profile_written"""
+    _execute_retry(conn, _GEN_BUMP_SQL)
+    row = conn.execute(_GEN_READ_SQL).fetchone()
+    return int(row[0]) if row else None
+
+
+def _profile_written(user_id: int, fields: Optional[Dict[str, Any]], gen: Optional[int] = None) -> None:
+    """write-through หลัง commit (fields=None = ผู้ใช้ถูกลบ); gen=None = ไม่ต้องแจ้ง worker อื่น"""
+    pc = _profiles
+    if pc is None:
+        return
+    pc.update(int(user_id), fields)
+    if gen is not None:
+        pc.note_local_gen(gen)
+
+
+def profile_cache_stats() -> Dict[str, Any]:
+    """สถิติ cache โปรไฟล์สำหรับ /diag"""
+    pc = _profiles
+    if pc is None:
+        return {"enabled": MEMORY_PROFILE_CACHE, "active": False}
+    out = pc.stats()
+    out.update(enabled=True, active=True)
+    return out
+
+def touch_users(users: List[Dict[str, Any]]) -> int:
+    """
+    UPSERT ผู้ใช้ทั้งชุดในทรานแซกชันเดียว (ใช้กับ batch จาก getUpdates)
+    - users: รายการ `from` ของแต่ละข้อความ (ซ้ำได้ = ผู้ใช้ส่งหลายข้อความใน batch)
+    - ผลลัพธ์ถูกเก็บไว้ให้ get_or_create_user() ของข้อความเหล่านั้นหยิบใช้ โดยไม่ต้องเขียน DB ซ้ำ
+    - คืนจำนวนผู้ใช้ (ไม่ซ้ำ) ที่อัปเดต
+    """
+    counts: Dict[int, int] = {}
+    latest: Dict[int, Dict[str, Any]] = {}
+    for u in users or []:
+        try:
+            uid = int(u["id"])
+        except Exception:
+            continue
+        counts[uid] = counts.get(uid, 0) + 1
+        latest[uid] = u
+    if not latest:
+        return 0
+
+    now_iso = datetime.datetime.now().isoformat()
+    rows = []
+    for uid, u in latest.items():
+        st, role, _ = _user_defaults(uid)
+        rows.append((uid, u.get("first_name", "") or "", u.get("last_name", "") or "",
+                     u.get("username", "") or "", now_iso, now_iso, st, role))
+    ids = list(latest)
+    marks = ",".join("?" * len(ids))
+    pc = _get_profile_cache()
+    epoch = pc.epoch() if pc is not None else -1
+    try:
+        with _get_db_connection() as conn:
+            existing = {r[0] for r in conn.execute(f"SELECT user_id FROM users WHERE user_id IN ({marks})", ids)}
+            _executemany_retry(conn, _UPSERT_USER_SQL, rows)
+            conn.commit()
+            profiles = {int(r["user_id"]): dict(r) for r in
+                        conn.execute(f"SELECT * FROM users WHERE user_id IN ({marks})", ids)}
+    except sqlite3.Error as e:
+        print(f"[Memory] DB error in touch_users: {e}")
+        return 0
+
+    expires = time.monotonic() + _PRIMED_TTL_SEC
+    with _PRIMED_LOCK:
+        for uid, prof in profiles.items():
+            report = "returning_user" if uid in existing else _user_defaults(uid)[2]
+            _PRIMED_USERS[uid] = [counts[uid], {"status": report, "profile": prof}, expires]
+    for uid, prof in profiles.items():
+        _remember_profile(uid, prof, epoch)
+    return len(profiles)
+
 def get_or_create_user(user_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """
     ดึงโปรไฟล์; ถ้าไม่มีจะสร้างใหม่
     - ผู้ใช้ใหม่ default: status='pending', role='employee'
     - ถ้าอยู่ใน SUPER_ADMIN_IDS: default status='approved', role='super_admin' (และ report เป็น returning_user)
     - ใช้ UPSERT ป้องกัน race
+    - อยู่ใน cache โปรไฟล์และชื่อ/username ไม่เปลี่ยน → คืนจาก cache ไม่แตะ DB
+      (last_seen จึงละเอียดระดับ MEMORY_PROFILE_TTL_SEC)
     """
     try:
         user_id    = int(user_data["id"])
@@ -447,32 +1066,28 @@ def get_or_create_user(user_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         username   = user_data.get("username", "") or ""
         now_iso    = datetime.datetime.now().isoformat()
 
-        if is_super_admin(user_id):
-            default_status = "approved"
-            default_role   = "super_admin"
-            status_report  = "returning_user"
-        else:
-            default_status = "pending"
-            default_role   = "employee"
-            status_report  = "new_user_pending"
+        primed = _take_primed_user(user_id)
+        if primed is not None:
+            return primed
+
+        cached, epoch = _cached_profile(user_id)
+        if cached is not None and (
+            (cached.get("first_name") or "", cached.get("last_name") or "", cached.get("username") or "")
+            == (first_name, last_name, username)
+        ):
+            return {"status": "returning_user", "profile": cached}
+
+        default_status, default_role, status_report = _user_defaults(user_id)
 
         with _get_db_connection() as conn:
-            _execute_retry(conn,
-                """
-                INSERT INTO users (user_id, first_name, last_name, username, first_seen, last_seen, status, role)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ON CONFLICT(user_id) DO UPDATE SET
-                    first_name=excluded.first_name,
-                    last_name =excluded.last_name,
-                    username  =excluded.username,
-                    last_seen =excluded.last_seen
-                """,
+            _execute_retry(conn, _UPSERT_USER_SQL,
                 (user_id, first_name, last_name, username, now_iso, now_iso, default_status, default_role),
             )
             conn.commit()
 
             row = conn.execute("SELECT * FROM users WHERE user_id = ?", (user_id,)).fetchone()
             profile = dict(row) if row else None
+        _remember_profile(user_id, profile, epoch)
 
         if profile and profile.get("first_seen") != now_iso:
             status_report = "returning_user"
@@ -487,12 +1102,21 @@ def get_or_create_user(user_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         return None
 
 def get_user_by_id(user_id: int) -> Optional[Dict[str, Any]]:
+    try:
+        uid = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    cached, epoch = _cached_profile(uid)
+    if cached is not None:
+        return cached
     try:
         with _get_db_connection() as conn:
-            row = conn.execute("SELECT * FROM users WHERE user_id = ?", (user_id,)).fetchone()
-            return dict(row) if row else None
+            row = conn.execute("SELECT * FROM users WHERE user_id = ?", (uid,)).fetchone()
+            profile = dict(row) if row else None
     except sqlite3.Error:
         return None
+    _remember_profile(uid, profile, epoch)
+    return profile
 
 def get_all_users() -> List[Dict[str, Any]]:
     try:
@@ -507,6 +1131,7 @@ def get_all_users() -> List[Dict[str, Any]]:
         return []
 
 def update_user_status(user_id: int, status: str) -> bool:
+    _drop_primed_user(user_id)
     status = (status or "").strip().lower()
     if status not in _ALLOWED_STATUS:
         print(f"[Memory] Reject invalid status '{status}' for user {user_id}")
@@ -514,16 +1139,21 @@ def update_user_status(user_id: int, status: str) -> bool:
     try:
         with _get_db_connection() as conn:
             res = _execute_retry(conn, "UPDATE users SET status = ? WHERE user_id = ?", (status, user_id))
+            ok = (res.rowcount if res else 0) > 0
+            gen = _bump_profile_gen(conn) if ok else None
             conn.commit()
-            return (res.rowcount if res else 0) > 0
     except sqlite3.Error:
         return False
+    if ok:
+        _profile_written(user_id, {"status": status}, gen)
+    return ok
 
 # alias เดิม
 def set_user_status(user_id: int, status: str) -> bool:
     return update_user_status(user_id, status)
 
 def update_user_role(user_id: int, role: str) -> bool:
+    _drop_primed_user(user_id)
     role = (role or "").strip().lower()
     if role not in _ALLOWED_ROLES:
         print(f"[Memory] Reject invalid role '{role}' for user {user_id}")
@@ -531,81 +1161,155 @@ def update_user_role(user_id: int, role: str) -> bool:
     try:
         with _get_db_connection() as conn:
             res = _execute_retry(conn, "UPDATE users SET role = ? WHERE user_id = ?", (role, user_id))
+            ok = (res.rowcount if res else 0) > 0
+            gen = _bump_profile_gen(conn) if ok else None
             conn.commit()
-            return (res.rowcount if res else 0) > 0
     except sqlite3.Error:
         return False
+    if ok:
+        _profile_written(user_id, {"role": role}, gen)
+    return ok
 
 def update_user_location(user_id: int, lat: float, lon: float) -> bool:
+    _drop_primed_user(user_id)
     try:
         with _get_db_connection() as conn:
             _execute_retry(conn, "UPDATE users SET latitude = ?, longitude = ? WHERE user_id = ?", (lat, lon, user_id))
+            gen = _bump_profile_gen(conn)
             conn.commit()
-            return True
     except sqlite3.Error:
         return False
+    _profile_written(user_id, {"latitude": lat, "longitude": lon}, gen)
+    return True
 
 def delete_user(user_id: int) -> bool:
     """
     ลบผู้ใช้ (และข้อมูลลูกทั้งหมดด้วยเพราะ ON DELETE CASCADE)
     """
+    _drop_primed_user(user_id)
+    _flush_user(user_id)      # ไม่ให้ข้อความค้างถูกเขียนทีหลังแล้วชน FK
     try:
         with _get_db_connection() as conn:
             res = _execute_retry(conn, "DELETE FROM users WHERE user_id = ?", (user_id,))
+            gen = _bump_profile_gen(conn)
             conn.commit()
-            return (res.rowcount if res else 0) > 0
     except sqlite3.Error as e:
         print(f"[Memory] Failed to delete user {user_id}: {e}")
         return False
+    _profile_written(user_id, None, gen)
+    return (res.rowcount if res else 0) > 0
 
 # --------------------- Chat History & Context ---------------------
 
 def append_message(user_id: int, role: str, content: str) -> None:
     """
     บันทึกข้อความ โดย normalize role และ cap ความยาว content
+    - เปิด write-behind: เข้าคิว group commit (เขียนจริงภายใน MEMORY_WB_FLUSH_MS) แล้วคืนทันที
     """
+    row = (int(user_id), _norm_role(role), _norm_text(content), _ts_now())
+    wb = _get_write_behind()
+    if wb is not None:
+        wb.add(row)
+        return
     try:
         with _get_db_connection() as conn:
-            ts = _ts_now()
-            _execute_retry(
-                conn,
-                "INSERT INTO messages (user_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
-                (user_id, _norm_role(role), _norm_text(content), ts),
-            )
+            _execute_retry(conn, "INSERT INTO messages (user_id, role, content, timestamp) VALUES (?, ?, ?, ?)", row)
             conn.commit()
     except sqlite3.Error as e:
         print(f"[Memory] DB error appending message: {e}")
 
-def get_recent_context(user_id: int, max_items: int = CTX_MAX_ITEMS, max_chars: int = CTX_MAX_CHARS) -> List[Dict[str, str]]:
+def get_recent_context(user_id: int, max_items: int = CTX_MAX_ITEMS, max_chars: int = CTX_MAX_CHARS) -> List[Dict[str, Any]]:
     """
-    คืนค่า messages ล่าสุด (role/content) สำหรับ LLM
-    - จำกัดจำนวนชิ้น และจำนวนตัวอักษรรวม
+    คืนค่า messages ล่าสุด (role/content/message_id) สำหรับ LLM
+    - จำกัดจำนวนชิ้น และจำนวนตัวอักษรรวม (max_chars <= 0 = ไม่จำกัด เช่น เมื่อจัดตามงบ token ภายหลัง)
+    - message_id ใช้เป็น key ของ cache จำนวน token ต่อแถว (utils.token_budget)
+    - รวมข้อความที่ยังค้างใน write-behind (ใหม่กว่าทุกแถวใน DB; message_id=None) → เห็นสิ่งที่เพิ่งเขียนเสมอ
     """
     try:
-        with _get_db_connection() as conn:
-            rows = conn.execute(
-                "SELECT role, content FROM messages WHERE user_id = ? ORDER BY timestamp DESC LIMIT ?",
-                (user_id, max_items),
-            ).fetchall()
-            out: List[Dict[str, str]] = []
-            total = 0
-            for r in rows:
-                content = r["content"] or ""
-                if total + len(content) > max_chars and out:
-                    break
-                out.append({"role": r["role"], "content": content})
-                total += len(content)
-            out.reverse()
-            return out
+        rows, pending = _read_with_pending(user_id, lambda conn: conn.execute(
+            "SELECT role, content, message_id FROM messages WHERE user_id = ? ORDER BY timestamp DESC, message_id DESC LIMIT ?",
+            (user_id, max_items),
+        ).fetchall())
     except sqlite3.Error:
         return []
+    return _shape_context(rows, pending, max_items, max_chars)
+
+def _shape_context(rows: List[Any], pending: List[_MsgRow], max_items: int, max_chars: int) -> List[Dict[str, Any]]:
+    """rows จาก DB (ใหม่→เก่า) + แถวค้าง (เก่า→ใหม่) → บริบทเก่า→ใหม่ ตามเพดานจำนวน/ตัวอักษร"""
+    newest = [{"role": r[1], "content": r[2], "message_id": None} for r in reversed(pending)]
+    newest += [{"role": r["role"], "content": r["content"] or "", "message_id": r["message_id"]} for r in rows]
+    out: List[Dict[str, Any]] = []
+    total = 0
+    for m in newest[:max_items]:
+        if max_chars > 0 and total + len(m["content"]) > max_chars and out:
+            break
+        out.append(m)
+        total += len(m["content"])
+    out.reverse()
+    return out
+
+# --------------------- Turn API (หนึ่งเทิร์นแชต) ---------------------
+
+# SQL คงที่ → ใช้ prepared statement จาก cache ของ connection (SQLITE_STATEMENT_CACHE) ทุกเทิร์น
+# (SQLite อยู่ในโปรเซส: รวมเป็น UNION คิวรีเดียวช้ากว่า 3 statement บน connection/snapshot เดียวกัน)
+_TURN_INSERT_SQL  = "INSERT INTO messages (user_id, role, content, timestamp) VALUES (?, ?, ?, ?)"
+_TURN_CONTEXT_SQL = "SELECT role, content, message_id FROM messages WHERE user_id = ? ORDER BY timestamp DESC, message_id DESC LIMIT ?"
+_TURN_SUMMARY_SQL = "SELECT summary FROM users WHERE user_id = ?"
+_TURN_COUNT_SQL   = "SELECT COUNT(*) FROM (SELECT 1 FROM messages WHERE user_id = ? LIMIT ?)"   # นับแค่ถึงเพดาน
+
+def _turn_reads(conn: sqlite3.Connection, uid: int, max_items: int) -> Tuple[List[Any], str, int]:
+    rows = conn.execute(_TURN_CONTEXT_SQL, (uid, max_items)).fetchall()
+    srow = conn.execute(_TURN_SUMMARY_SQL, (uid,)).fetchone()
+    count = conn.execute(_TURN_COUNT_SQL, (uid, MAX_HISTORY_ITEMS + 1)).fetchone()[0]
+    return rows, (srow["summary"] if srow else "") or "", int(count)
+
+def begin_turn(user_id: int, user_text: str, max_items: int = CTX_MAX_ITEMS, max_chars: int = CTX_MAX_CHARS) -> Dict[str, Any]:
+    """
+    เริ่มเทิร์นแชต: บันทึกข้อความผู้ใช้ + อ่านบริบท + สรุป + จำนวนข้อความ บน connection/snapshot เดียว
+    (แทน append_message → get_recent_context → get_summary → count_messages ที่ต่างคนต่างเปิด/ล็อก)
+    - write-behind เปิด: ข้อความเข้าคิว group commit แล้วอ่านครั้งเดียวภายใต้ lock เดียว (รวมแถวที่ค้าง)
+    - write-behind ปิด: INSERT + อ่านในทรานแซกชันเดียว commit ครั้งเดียว
+    คืน {"user_id", "context" (เก่า→ใหม่ รวมข้อความนี้), "summary", "message_count"}
+    - message_count นับสูงสุด MAX_HISTORY_ITEMS+1 (พอสำหรับตัดสินว่าต้องสรุปไหม; ต้นทุนคงที่ไม่โตตามประวัติ)
+    """
+    uid = int(user_id)
+    row = (uid, "user", _norm_text(user_text), _ts_now())
+    rows: List[Any] = []
+    summary, count = "", 0
+    pending: List[_MsgRow] = []
+    wb = _get_write_behind()
+    try:
+        if wb is not None:
+            wb.add(row)
+            (rows, summary, count), pending = _read_with_pending(uid, lambda conn: _turn_reads(conn, uid, max_items))
+        else:
+            with _get_db_connection() as conn:
+                _execute_retry(conn, _TURN_INSERT_SQL, row)
+                rows, summary, count = _turn_reads(conn, uid, max_items)
+    except sqlite3.Error as e:
+        print(f"[Memory] DB error in begin_turn: {e}")
+    return {
+        "user_id": uid,
+        "context": _shape_context(rows, pending, max_items, max_chars),
+        "summary": summary,
+        "message_count": count + len(pending),
+    }
+
+def commit_turn_reply(turn: Dict[str, Any], reply: str) -> bool:
+    """
+    ปิดเทิร์น: บันทึกคำตอบของบอท (ผ่าน write-behind ถ้าเปิด)
+    คืน True ถ้าประวัติเกิน MAX_HISTORY_ITEMS แล้ว (ควรส่งเข้า summarizer) — คิดจาก message_count ของ begin_turn
+    """
+    append_message(turn["user_id"], "assistant", reply)
+    return int(turn.get("message_count") or 0) + 1 > MAX_HISTORY_ITEMS
 
 def get_user_chat_history(user_id: int, limit: int = 10) -> List[Dict[str, Any]]:
+    _flush_user(user_id)
     try:
         with _get_db_connection() as conn:
             history: List[Dict[str, Any]] = []
             for row in conn.execute(
-                "SELECT role, content, timestamp FROM messages WHERE user_id = ? ORDER BY timestamp DESC LIMIT ?",
+                "SELECT role, content, timestamp FROM messages WHERE user_id = ? ORDER BY timestamp DESC, message_id DESC LIMIT ?",
                 (user_id, limit),
             ).fetchall():
                 d = dict(row)
@@ -618,9 +1322,10 @@ def get_user_chat_history(user_id: int, limit: int = 10) -> List[Dict[str, Any]]
 
 def count_messages(user_id: int) -> int:
     try:
-        with _get_db_connection() as conn:
-            row = conn.execute("SELECT COUNT(*) AS c FROM messages WHERE user_id = ?", (user_id,)).fetchone()
-            return int(row["c"]) if row else 0
+        row, pending = _read_with_pending(user_id, lambda conn: conn.execute(
+            "SELECT COUNT(*) AS c FROM messages WHERE user_id = ?", (user_id,)
+        ).fetchone())
+        return (int(row["c"]) if row else 0) + len(pending)
     except sqlite3.Error:
         return 0
 
@@ -654,63 +1359,130 @@ def get_summary(user_id: int) -> str:
         return ""
 
 def set_summary(user_id: int, summary: str) -> None:
+    summary = _norm_text(summary, 20000)
     try:
         with _get_db_connection() as conn:
-            _execute_retry(conn, "UPDATE users SET summary = ? WHERE user_id = ?", (_norm_text(summary, 20000), user_id))
+            _execute_retry(conn, "UPDATE users SET summary = ? WHERE user_id = ?", (summary, user_id))
             conn.commit()
     except sqlite3.Error:
-        pass
+        return
+    _profile_written(user_id, {"summary": summary})
 
-def prune_and_maybe_summarize(user_id: int, summarize_func: Callable[[str], str]) -> None:
+def count_messages_many(user_ids: List[int]) -> Dict[int, int]:
+    """จำนวนข้อความของหลายผู้ใช้ในคิวรีเดียว (ใช้กับ summarizer ที่รวบหลายคนต่อรอบ; รวมข้อความที่ยังค้าง)"""
+    ids = list(dict.fromkeys(int(u) for u in user_ids))
+    if not ids:
+        return {}
+    _flush_many(ids)
+    try:
+        with _get_db_connection() as conn:
+            rows = conn.execute(
+                f"SELECT user_id, COUNT(*) AS c FROM messages WHERE user_id IN ({','.join('?' for _ in ids)}) GROUP BY user_id",
+                tuple(ids),
+            ).fetchall()
+            out = {u: 0 for u in ids}
+            out.update({int(r["user_id"]): int(r["c"]) for r in rows})
+            return out
+    except sqlite3.Error:
+        return {}
+
+def collect_for_summary(user_id: int, msg_count: Optional[int] = None) -> Optional[Dict[str, Any]]:
     """
-    - ถ้าจำนวนข้อความเกิน MAX_HISTORY_ITEMS → รวบรวมส่วนต้น (เก่า) เพื่อสรุป
-    - แนบสรุปเดิม + ข้อความใหม่ แล้วเรียก summarize_func
-    - ลบข้อความเก่าที่ถูกสรุปออก เหลือท้ายไว้ KEEP_TAIL_AFTER_SUM
-    - จำกัดขนาดอินพุตที่ส่งให้ summarize_func ด้วย SUMMARIZE_MAX_CHARS
+    ขั้นอ่าน (ไม่แก้ DB): ถ้าจำนวนข้อความเกิน MAX_HISTORY_ITEMS → เตรียม prompt ของส่วนต้น (เก่า) ที่จะสรุป
+    คืน {"user_id", "prompt", "prev", "ids"} หรือ None ถ้ายังไม่ถึงเกณฑ์
+    - ids = เฉพาะข้อความที่อยู่ใน prompt จริง (จำกัดด้วย SUMMARIZE_MAX_CHARS; ส่วนเกินรอสรุปรอบถัดไป)
+    - ส่วนท้าย KEEP_TAIL_AFTER_SUM ข้อความไม่ถูกแตะ
     """
+    _flush_user(user_id)      # ต้องการ message_id จริง + จำนวนตาม DB
     try:
         with _get_db_connection() as conn:
-            msg_count = conn.execute("SELECT COUNT(*) FROM messages WHERE user_id = ?", (user_id,)).fetchone()[0]
+            if msg_count is None:
+                msg_count = conn.execute("SELECT COUNT(*) FROM messages WHERE user_id = ?", (user_id,)).fetchone()[0]
             if msg_count <= MAX_HISTORY_ITEMS:
-                return
+                return None
 
             limit = msg_count - KEEP_TAIL_AFTER_SUM
             part = conn.execute(
-                "SELECT role, content, message_id FROM messages WHERE user_id = ? ORDER BY timestamp ASC LIMIT ?",
+                "SELECT role, content, message_id FROM messages WHERE user_id = ? ORDER BY timestamp ASC, message_id ASC LIMIT ?",
                 (user_id, limit),
             ).fetchall()
             if not part:
-                return
-
-            text_parts: List[str] = []
-            total = 0
-            for m in part:
-                seg = f"[{m['role']}] {m['content']}"
-                if total + len(seg) > SUMMARIZE_MAX_CHARS and text_parts:
-                    break
-                text_parts.append(seg)
-                total += len(seg)
-            text = "\n".join(text_parts)
-
-            prev = get_summary(user_id)
-            header = f"[สรุปเดิม] {prev}\n" if prev else ""
-            prompt = f"{header}[เนื้อหาใหม่ที่จะสรุปต่อ]\n{text}"
+                return None
+            res = conn.execute("SELECT summary FROM users WHERE user_id = ?", (user_id,)).fetchone()
+            prev = (res["summary"] if res else "") or ""
+    except sqlite3.Error:
+        return None
 
+    text_parts: List[str] = []
+    ids: List[int] = []
+    total = 0
+    for m in part:
+        seg = f"[{m['role']}] {m['content']}"
+        if total + len(seg) > SUMMARIZE_MAX_CHARS and text_parts:
+            break
+        text_parts.append(seg)
+        ids.append(m["message_id"])
+        total += len(seg)
+
+    header = f"[สรุปเดิม] {prev}\n" if prev else ""
+    prompt = f"{header}[เนื้อหาใหม่ที่จะสรุปต่อ]\n" + "\n".join(text_parts)
+    return {"user_id": user_id, "prompt": prompt, "prev": prev, "ids": ids}
+
+def apply_summary(user_id: int, new_summary: str, ids: List[int], prev: str = "") -> int:
+    """
+    ขั้นเขียน: บันทึกสรุปใหม่ + ลบข้อความที่ถูกสรุปแล้ว ในทรานแซกชันเดียว (คืนจำนวนที่ลบ, -1 = ไม่ได้ทำ)
+    - ถ้าสรุปใน DB เปลี่ยนไปจาก prev ระหว่างรอ LLM (อีก worker สรุปไปแล้ว) → ไม่ทำอะไร กันลบซ้ำ/ทับสรุป
+    """
+    if not new_summary:
+        return -1
+    new_summary = _norm_text(new_summary, 20000)
+    try:
+        with _get_db_connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
             try:
-                new_sum = summarize_func(prompt) or prev
+                cur = _execute_retry(
+                    conn,
+                    "UPDATE users SET summary = ? WHERE user_id = ? AND COALESCE(summary, '') = ?",
+                    (new_summary, user_id, prev or ""),
+                )
+                if not cur or cur.rowcount == 0:
+                    conn.rollback()
+                    return -1
+                deleted = 0
+                CHUNK = 500
+                for i in range(0, len(ids), CHUNK):
+                    sub = ids[i : i + CHUNK]
+                    res = _execute_retry(
+                        conn,
+                        f"DELETE FROM messages WHERE user_id = ? AND message_id IN ({','.join('?' for _ in sub)})",
+                        (user_id, *sub),
+                    )
+                    deleted += res.rowcount if res else 0
+                conn.commit()
             except Exception:
-                new_sum = prev
-
-            set_summary(user_id, new_sum)
+                conn.rollback()
+                raise
+    except sqlite3.Error as e:
+        print(f"[Memory] DB error applying summary: {e}")
+        return -1
+    _profile_written(user_id, {"summary": new_summary})   # เฉพาะโปรเซสนี้ (สรุปอ่านจาก DB ผ่าน get_summary/begin_turn)
+    return deleted
 
-            ids = [m["message_id"] for m in part]
-            CHUNK = 500
-            for i in range(0, len(ids), CHUNK):
-                sub = ids[i : i + CHUNK]
-                _execute_retry(conn, f"DELETE FROM messages WHERE message_id IN ({','.join('?' for _ in sub)})", tuple(sub))
-            conn.commit()
-    except sqlite3.Error:
-        pass
+def prune_and_maybe_summarize(user_id: int, summarize_func: Callable[[str], str]) -> None:
+    """
+    แบบ synchronous (เดิม): collect_for_summary → summarize_func → apply_summary
+    - ไม่ถือ connection ระหว่างรอ LLM; บันทึกสรุป + ลบข้อความเก่าในทรานแซกชันเดียว
+    - เส้นทางตอบแชตใช้ utils.summarizer (คิวเบื้องหลัง) แทน
+    """
+    job = collect_for_summary(user_id)
+    if job is None:
+        return
+    try:
+        new_sum = summarize_func(job["prompt"])
+    except Exception:
+        new_sum = ""
+    if new_sum and not new_sum.startswith("❌"):
+        apply_summary(user_id, new_sum, job["ids"], job["prev"])
 
 # --------------------- Reviews ---------------------
 
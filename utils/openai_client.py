@@ -11,6 +11,8 @@ OpenAI client (SDK v1.x) — เสถียร, ไม่ทวนคำถา
 - Vision: วิเคราะห์ภาพจาก URL/dataURL (พร้อม helper แปลง bytes → dataURL)
 - Image generation: คืนไฟล์ PNG พร้อม path
 - จัดการข้อผิดพลาดเป็นมิตร (ไทย) + timeout/retry ผ่าน SDK
+- ทุกคำขอผ่าน rate limiter ของ (openai, model) ร่วมกับ orchestrator (providers/rate_limit.py)
+  เกินโควตา → สลับโมเดลสำรอง (ถ้ามี) หรือคืนข้อความ rate limit แทนการบล็อก
 
 ENV ที่รองรับ:
   OPENAI_API_KEY          (จำเป็น)
@@ -55,6 +57,8 @@ try:
 except Exception as _e:  # pragma: no cover
     raise RuntimeError("ไม่พบแพ็กเกจ openai (v1.x). โปรดติดตั้งด้วย: pip install openai>=1.0.0") from _e
 
+from providers.rate_limit import BudgetExceeded, acquire, estimate_request_tokens, note_rate_limited, usage_tokens
+
 # ---- System / Templates (no-echo) ----
 try:
     from utils.prompt_templates import SYSTEM_NO_ECHO
@@ -101,6 +105,8 @@ client = OpenAI(**_client_kwargs)
 # ================
 def _err_to_text(e: Exception) -> str:
     # ไล่ชนิด error ที่พบบ่อยใน SDK v1.x
+    if isinstance(e, BudgetExceeded):
+        return "❌ ตอนนี้มีการใช้งานหนาแน่น (rate limit) กรุณาลองใหม่ครับ"
     if isinstance(e, APITimeoutError):
         return "❌ หมดเวลาเชื่อมต่อบริการ AI (timeout) กรุณาลองใหม่ครับ"
     if isinstance(e, RateLimitError):
@@ -164,6 +170,18 @@ def _coerce_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         out.append({"role": role, "content": content if isinstance(content, (str, list, dict)) else str(content)})
     return out
 
+def _create(model: str, messages: List[Dict[str, Any]], max_tokens: Optional[int] = None, **kw: Any) -> Any:
+    """chat.completions.create ผ่าน rate limiter (จองตามค่าประมาณ แล้ว settle ด้วย usage จริง)"""
+    est = estimate_request_tokens(model, messages, max_tokens or 1024)
+    with acquire("openai", model, est) as permit:
+        try:
+            resp = client.chat.completions.create(model=model, messages=messages, max_tokens=max_tokens, **kw)
+        except Exception as e:
+            note_rate_limited("openai", model, e)
+            raise
+        permit.settle(usage_tokens(resp))
+        return resp
+
 # ==========================
 # Core Chat Completions
 # ==========================
@@ -181,7 +199,7 @@ def chat_completion(
         if no_echo:
             _messages = ensure_no_echo_system(_messages)
 
-        resp = client.chat.completions.create(
+        resp = _create(
             model=(model or DEFAULT_MODEL),
             messages=_messages,
             temperature=temperature,
@@ -218,7 +236,7 @@ def chat_completion_smart(
         if no_echo:
             _messages = ensure_no_echo_system(_messages)
 
-        resp = client.chat.completions.create(
+        resp = _create(
             model=model,
             messages=_messages,
             temperature=temperature,
@@ -232,7 +250,7 @@ def chat_completion_smart(
             _messages = _coerce_messages(messages)
             if no_echo:
                 _messages = ensure_no_echo_system(_messages)
-            resp = client.chat.completions.create(
+            resp = _create(
                 model=backup,
                 messages=_messages,
                 temperature=temperature,
@@ -270,7 +288,7 @@ def chat_with_tools_smart(
         if no_echo:
             _messages = ensure_no_echo_system(_messages)
 
-        return client.chat.completions.create(
+        return _create(
             model=model,
             messages=_messages,
             tools=tools,
@@ -283,7 +301,7 @@ def chat_with_tools_smart(
         _messages = _coerce_messages(messages)
         if no_echo:
             _messages = ensure_no_echo_system(_messages)
-        return client.chat.completions.create(
+        return _create(
             model=backup,
             messages=_messages,
             tools=tools,
@@ -347,7 +365,7 @@ def vision_analyze(
         content.append({"type": "image_url", "image_url": {"url": u}})
     messages = [{"role": "user", "content": content}]
     try:
-        resp = client.chat.completions.create(
+        resp = _create(
             model=_model,
             messages=messages,
             temperature=temperature,
@@ -416,16 +434,21 @@ def stream_chat(
         _messages = ensure_no_echo_system(_messages)
     _model = model or DEFAULT_MODEL
     try:
-        stream = client.chat.completions.create(
-            model=_model,
-            messages=_messages,
-            temperature=temperature,
-            stream=True,
-        )
-        for chunk in stream:
-            delta = getattr(chunk.choices[0].delta, "content", None)
-            if delta:
-                yield delta
+        with acquire("openai", _model, estimate_request_tokens(_model, _messages, 1024)):
+            try:
+                stream = client.chat.completions.create(
+                    model=_model,
+                    messages=_messages,
+                    temperature=temperature,
+                    stream=True,
+                )
+            except Exception as e:
+                note_rate_limited("openai", _model, e)
+                raise
+            for chunk in stream:
+                delta = getattr(chunk.choices[0].delta, "content", None)
+                if delta:
+                    yield delta
     except Exception as e:
         yield _err_to_text(e)
 
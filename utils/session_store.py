@@ -0,0 +1,177 @@
+# utils/session_store.py
+# -*- coding: utf-8 -*-
+"""
+SessionStore — ที่เก็บ object ต่อผู้ใช้ในหน่วยความจำ (เช่น Gemini ChatSession ของ function_calling)
+- LRU แบบ O(1): OrderedDict (get/put = move_to_end, ไล่ออก = popitem(last=False))
+- idle TTL: ไม่ได้ใช้นานเกิน idle_ttl_sec → ทิ้ง (เช็กตอน get + กวาดจากหัวคิวตอน put; หัวคิว = เก่าสุดเสมอ)
+- จำกัดขนาดต่อ session: note_turn() สะสม bytes/turns โดยประมาณ เกิน max_turns/max_session_bytes
+  → ทิ้งทันที ให้ผู้เรียกสร้างใหม่จากสรุป + ข้อความท้าย ๆ ในครั้งถัดไป
+- จำกัดรวม: จำนวน session (max_sessions) + bytes รวม (max_total_bytes)
+- thread-safe (lock เดียว, ไม่มี I/O ภายใน lock) สำหรับ gunicorn gthread
+- pop(key, default) เหมือน dict → โค้ดเดิมที่ทำ CHAT_SESSIONS.pop(uid, None) ใช้ต่อได้
+- stats(): จำนวน/bytes/hit/miss + จำนวนที่ถูกไล่ออกแยกตามเหตุผล (lru/ttl/bytes/too_long/cleared)
+"""
+
+from __future__ import annotations
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Optional
+import time
+
+
+class _Entry:
+    __slots__ = ("value", "last_used", "bytes", "turns")
+
+    def __init__(self, value: Any, nbytes: int, now: float):
+        self.value = value
+        self.last_used = now
+        self.bytes = max(0, int(nbytes))
+        self.turns = 0
+
+
+def text_bytes(*parts: Optional[str]) -> int:
+    """ขนาดข้อความแบบ UTF-8 (ไทย ~3 bytes/ตัวอักษร) — ใช้ประมาณขนาด history"""
+    return sum(len(p.encode("utf-8", "ignore")) for p in parts if p)
+
+
+class SessionStore:
+    def __init__(
+        self,
+        *,
+        max_sessions: int = 200,
+        idle_ttl_sec: float = 1800.0,
+        max_turns: int = 40,
+        max_session_bytes: int = 64 * 1024,
+        max_total_bytes: int = 32 * 1024 * 1024,
+    ):
+        self._max_sessions = max(1, int(max_sessions))
+        self._ttl = float(idle_ttl_sec) if idle_ttl_sec and idle_ttl_sec > 0 else 0.0
+        self._max_turns = max(0, int(max_turns))                 # 0 = ไม่จำกัด
+        self._max_session_bytes = max(0, int(max_session_bytes))
+        self._max_total_bytes = max(0, int(max_total_bytes))
+        self._data: "OrderedDict[Any, _Entry]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evicted: Dict[str, int] = {"lru": 0, "ttl": 0, "bytes": 0, "too_long": 0, "cleared": 0}
+
+    # ---------- internal (เรียกภายใต้ lock) ----------
+    def _drop(self, key: Any, reason: str) -> Optional[_Entry]:
+        e = self._data.pop(key, None)
+        if e is not None:
+            self._total_bytes -= e.bytes
+            self._evicted[reason] += 1
+        return e
+
+    def _expired(self, e: _Entry, now: float) -> bool:
+        return bool(self._ttl) and now - e.last_used > self._ttl
+
+    def _too_long(self, e: _Entry) -> bool:
+        return bool(
+            (self._max_turns and e.turns >= self._max_turns)
+            or (self._max_session_bytes and e.bytes > self._max_session_bytes)
+        )
+
+    def _sweep(self, now: float, keep: Any) -> None:
+        while self._data:
+            key, e = next(iter(self._data.items()))
+            if key == keep or not self._expired(e, now):
+                break
+            self._drop(key, "ttl")
+        while len(self._data) > self._max_sessions:
+            key = next(iter(self._data))
+            if key == keep:
+                break
+            self._drop(key, "lru")
+        while self._max_total_bytes and self._total_bytes > self._max_total_bytes and len(self._data) > 1:
+            key = next(iter(self._data))
+            if key == keep:
+                break
+            self._drop(key, "bytes")
+
+    # ---------- public ----------
+    def get(self, key: Any, default: Any = None) -> Any:
+        now = time.time()
+        with self._lock:
+            e = self._data.get(key)
+            if e is not None and self._expired(e, now):
+                self._drop(key, "ttl")
+                e = None
+            if e is None:
+                self._misses += 1
+                return default
+            e.last_used = now
+            self._data.move_to_end(key)
+            self._hits += 1
+            return e.value
+
+    def put(self, key: Any, value: Any, nbytes: int = 0) -> None:
+        """เพิ่ม/แทนที่ (nbytes = ขนาด history เริ่มต้นโดยประมาณ) แล้วไล่ TTL/LRU/bytes ตามเพดาน"""
+        now = time.time()
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._total_bytes -= old.bytes
+            e = _Entry(value, nbytes, now)
+            self._data[key] = e
+            self._total_bytes += e.bytes
+            self._sweep(now, keep=key)
+
+    def note_turn(self, key: Any, nbytes: int, value: Any = None) -> bool:
+        """
+        บันทึกว่า session คุยไปอีก 1 เทิร์น (nbytes = ข้อความที่เพิ่มเข้า history)
+        - เกินเพดานต่อ session → ทิ้งเลย (คืน False) ให้ครั้งหน้าสร้างใหม่จากสรุป + ท้ายบทสนทนา
+        - value: ถ้าให้มา จะนับเฉพาะเมื่อ entry ยังเป็น object เดิม (กันนับใส่ session ที่เพิ่งถูกสร้างใหม่)
+        """
+        with self._lock:
+            e = self._data.get(key)
+            if e is None or (value is not None and e.value is not value):
+                return False
+            add = max(0, int(nbytes))
+            e.bytes += add
+            e.turns += 1
+            self._total_bytes += add
+            if self._too_long(e):
+                self._drop(key, "too_long")
+                return False
+            if self._max_total_bytes and self._total_bytes > self._max_total_bytes:
+                self._sweep(time.time(), keep=key)
+            return True
+
+    def pop(self, key: Any, default: Any = None) -> Any:
+        with self._lock:
+            e = self._drop(key, "cleared")
+        return e.value if e is not None else default
+
+    def clear(self) -> None:
+        with self._lock:
+            self._evicted["cleared"] += len(self._data)
+            self._data.clear()
+            self._total_bytes = 0
+
+    def __contains__(self, key: Any) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._data),
+                "bytes": self._total_bytes,
+                "max_sessions": self._max_sessions,
+                "max_total_bytes": self._max_total_bytes,
+                "max_session_bytes": self._max_session_bytes,
+                "max_turns": self._max_turns,
+                "idle_ttl_sec": self._ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evicted": dict(self._evicted),
+            }
+
+
+__all__ = ["SessionStore", "text_bytes"]
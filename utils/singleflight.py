@@ -0,0 +1,106 @@
+# utils/singleflight.py
+# -*- coding: utf-8 -*-
+"""
+Singleflight — รวมคำขอที่เหมือนกันซึ่งมาพร้อมกันให้เรียก upstream ครั้งเดียว
+- Group.do(key, fn, timeout): คนแรกของ key (leader) รัน fn บนเธรดตัวเอง
+  คนที่มาระหว่างนั้น (follower) รอผลเดียวกัน → ได้ผลเดียวกัน / exception เดียวกัน
+- follower รอเกิน timeout → FlightTimeout (ผู้เรียกตัดสินใจเองว่าจะเรียกเองหรือยอมแพ้)
+- leader ไม่มี timeout (เวลาจริงถูกคุมด้วย timeout ของ provider อยู่แล้ว)
+- key หลุดจากตารางทันทีที่ leader จบ → คำขอถัดไปเริ่ม flight ใหม่ (ควรเก็บผลลง cache ก่อน fn คืนค่า)
+- get_group(name) ต่อหน้าที่ (เช่น "orchestrate", "summarize"); group_stats() สำหรับ /diag
+"""
+
+from __future__ import annotations
+from threading import Event, Lock
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class FlightTimeout(TimeoutError):
+    def __init__(self, group: str, timeout: Optional[float]):
+        super().__init__(f"singleflight {group}: waited {timeout}s for leader")
+        self.group = group
+        self.timeout = timeout
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error", "dups")
+
+    def __init__(self):
+        self.done = Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.dups = 0
+
+
+class Group:
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = Lock()
+        self._flights: Dict[Any, _Flight] = {}
+        self._stats: Dict[str, int] = {"leaders": 0, "coalesced": 0, "timeouts": 0, "errors": 0}
+
+    def do(self, key: Any, fn: Callable[[], Any], timeout: Optional[float] = None) -> Tuple[Any, int, bool]:
+        """
+        คืน (ผลลัพธ์, จำนวน follower ที่ใช้ผลนี้ร่วม, shared)
+        - shared=False: เราเป็น leader (เรียก fn เอง)
+        - shared=True : ได้ผลจาก leader; leader ล้ม → raise exception เดียวกัน
+        """
+        with self._lock:
+            f = self._flights.get(key)
+            if f is None:
+                f = self._flights[key] = _Flight()
+                self._stats["leaders"] += 1
+                leader = True
+            else:
+                f.dups += 1
+                self._stats["coalesced"] += 1
+                leader = False
+
+        if not leader:
+            if not f.done.wait(timeout):
+                with self._lock:
+                    self._stats["timeouts"] += 1
+                raise FlightTimeout(self.name, timeout)
+            if f.error is not None:
+                raise f.error
+            return f.result, f.dups, True
+
+        try:
+            f.result = fn()
+        except BaseException as e:
+            f.error = e
+            with self._lock:
+                self._stats["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            f.done.set()
+        return f.result, f.dups, False          # dups นับครบแล้ว (หลุดจากตารางก่อนอ่าน)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            out["in_flight"] = len(self._flights)
+        return out
+
+
+_GROUPS: Dict[str, Group] = {}
+_GROUPS_LOCK = Lock()
+
+
+def get_group(name: str) -> Group:
+    g = _GROUPS.get(name)
+    if g is None:
+        with _GROUPS_LOCK:
+            g = _GROUPS.setdefault(name, Group(name))
+    return g
+
+
+def group_stats() -> Dict[str, Any]:
+    with _GROUPS_LOCK:
+        groups = list(_GROUPS.values())
+    return {g.name: g.stats() for g in groups}
+
+
+__all__ = ["FlightTimeout", "Group", "get_group", "group_stats"]
@@ -0,0 +1,196 @@
+# utils/stream_reply.py
+# -*- coding: utf-8 -*-
+"""
+Streaming reply ไปยัง Telegram ด้วย placeholder + editMessageText แบบคุมจังหวะ
+- start(): ส่ง placeholder ("…") ทันที → ผู้ใช้เห็นว่าบอทรับเรื่องแล้ว
+- feed(delta): สะสมข้อความ แล้ว edit ตามจังหวะที่ Telegram ยอมรับ
+  * แชตส่วนตัว ~1 edit/วินาที (STREAM_EDIT_INTERVAL_MS), กลุ่มช้ากว่า (STREAM_GROUP_EDIT_INTERVAL_MS)
+  * edit แรกทำทันทีที่มีข้อความ (ตัวชี้วัดหลัก = time-to-first-visible-token)
+  * ไม่ edit ถ้าข้อความเพิ่มน้อยกว่า STREAM_MIN_DELTA_CHARS หรือไม่เปลี่ยน (กัน 400 "message is not modified")
+- เกิน 4096 ตัวอักษร: ปิดข้อความปัจจุบันที่จุดตัดบรรทัด/ช่องว่าง แล้วส่งข้อความใหม่ต่อ (rollover)
+- finish(final_text): edit รอบสุดท้ายด้วยข้อความที่ post-process แล้ว (แบ่งชิ้นแบบเดียวกับ send_message)
+  ข้อความที่เกินมา (ผลสุดท้ายสั้นลง) จะถูกลบ
+- reset(): เริ่มสตรีมใหม่ในข้อความเดิม (ใช้เมื่อ engine แรกล้มกลางทางแล้วสลับไป fallback)
+- ถ้าส่ง placeholder ไม่สำเร็จ → finish() ใช้ send_message ปกติ (ไม่ทำให้คำตอบหาย)
+- stats(): ttfv_ms (จากสร้าง object ถึง edit แรกที่มีเนื้อหา), placeholder_ms, edits, messages
+"""
+
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, Optional
+import time
+
+from utils.telegram_api import (
+    TELEGRAM_MESSAGE_LIMIT,
+    _split_for_telegram,
+    delete_message,
+    edit_message_text,
+    send_message,
+)
+
+PLACEHOLDER = "…"
+
+
+def _log(tag: str, **kw: Any) -> None:
+    extra = f" | {kw}" if kw else ""
+    print(f"[stream_reply] {tag}{extra}", flush=True)
+
+
+def _message_id(res: Any) -> Optional[int]:
+    if isinstance(res, dict) and res.get("ok"):
+        return (res.get("result") or {}).get("message_id")
+    return None
+
+
+def _cut_point(text: str, limit: int) -> int:
+    """ตำแหน่งตัด ≤ limit: ขึ้นบรรทัดใหม่ > ช่องว่าง > ตัดตรง ๆ (ไม่ตัดถ้าจุดตัดอยู่ต้นข้อความเกินไป)"""
+    for sep in ("\n", " "):
+        i = text.rfind(sep, 0, limit)
+        if i >= limit // 2:
+            return i + 1
+    return limit
+
+
+class StreamingReply:
+    def __init__(
+        self,
+        chat_id: int | str,
+        *,
+        interval_ms: Optional[int] = None,
+        min_delta_chars: Optional[int] = None,
+        limit: int = TELEGRAM_MESSAGE_LIMIT,
+        send: Callable[..., Any] = send_message,
+        edit: Callable[..., Any] = edit_message_text,
+        delete: Callable[..., Any] = delete_message,
+    ):
+        from config import STREAM_EDIT_INTERVAL_MS, STREAM_GROUP_EDIT_INTERVAL_MS, STREAM_MIN_DELTA_CHARS
+        if interval_ms is None:
+            group = str(chat_id).startswith("-")
+            interval_ms = STREAM_GROUP_EDIT_INTERVAL_MS if group else STREAM_EDIT_INTERVAL_MS
+        self.chat_id = chat_id
+        self._interval = max(0, int(interval_ms)) / 1000.0
+        self._min_delta = STREAM_MIN_DELTA_CHARS if min_delta_chars is None else max(0, int(min_delta_chars))
+        self._limit = int(limit)
+        self._send, self._edit, self._delete = send, edit, delete
+
+        self._created = time.monotonic()
+        self._buf: List[str] = []
+        self._text = ""                 # ข้อความสะสมทั้งหมด
+        self._msgs: List[int] = []      # message_id ตามลำดับ
+        self._sent: List[str] = []      # ข้อความล่าสุดที่แสดงอยู่ในแต่ละ message
+        self._seg_start = 0             # offset ใน _text ของข้อความปัจจุบัน (ตัวสุดท้าย)
+        self._last_edit = 0.0
+        self._failed = False
+        self.ttfv_ms: Optional[int] = None
+        self.placeholder_ms: Optional[int] = None
+        self.edits = 0
+
+    # ---------- lifecycle ----------
+    def start(self) -> bool:
+        mid = _message_id(self._send(self.chat_id, PLACEHOLDER))
+        if mid is None:
+            self._failed = True
+            _log("PLACEHOLDER_FAILED", chat_id=self.chat_id)
+            return False
+        self.placeholder_ms = int((time.monotonic() - self._created) * 1000)
+        self._msgs.append(mid)
+        self._sent.append(PLACEHOLDER)
+        return True
+
+    @property
+    def active(self) -> bool:
+        return bool(self._msgs) and not self._failed
+
+    def feed(self, delta: str) -> None:
+        if not delta:
+            return
+        self._buf.append(delta)
+        if not self.active:
+            return
+        now = time.monotonic()
+        first = self.ttfv_ms is None
+        if not first and now - self._last_edit < self._interval:
+            return
+        pending = sum(len(b) for b in self._buf)
+        if not first and pending < self._min_delta:
+            return
+        if first and not "".join(self._buf).strip():
+            return
+        self._flush(now)
+
+    def _flush(self, now: float) -> None:
+        self._text += "".join(self._buf)
+        self._buf.clear()
+        seg = self._text[self._seg_start:]
+        while len(seg) > self._limit:               # rollover: ปิดข้อความนี้แล้วเปิดข้อความใหม่
+            cut = _cut_point(seg, self._limit)
+            self._show(len(self._msgs) - 1, seg[:cut])
+            mid = _message_id(self._send(self.chat_id, seg[cut:cut + self._limit] or PLACEHOLDER))
+            if mid is None:
+                self._failed = True
+                _log("ROLLOVER_FAILED", chat_id=self.chat_id, messages=len(self._msgs))
+                return
+            self._msgs.append(mid)
+            self._sent.append(seg[cut:cut + self._limit] or PLACEHOLDER)
+            self._seg_start += cut
+            seg = self._text[self._seg_start:]
+        if seg.strip():
+            self._show(len(self._msgs) - 1, seg)
+        self._last_edit = now
+
+    def _show(self, idx: int, text: str) -> bool:
+        if not text.strip() or self._sent[idx] == text:
+            return True
+        res = self._edit(self.chat_id, self._msgs[idx], text)
+        if not (isinstance(res, dict) and res.get("ok")):
+            return False
+        self._sent[idx] = text
+        self.edits += 1
+        if self.ttfv_ms is None:
+            self.ttfv_ms = int((time.monotonic() - self._created) * 1000)
+        return True
+
+    def reset(self) -> None:
+        """ทิ้งข้อความที่สตรีมไปแล้ว (เช่น primary ล้มกลางทาง → fallback เริ่มใหม่) เหลือ message แรกไว้เขียนทับ"""
+        self._buf.clear()
+        self._text = ""
+        self._seg_start = 0
+        for mid in self._msgs[1:]:
+            try:
+                self._delete(self.chat_id, mid)
+            except Exception as e:
+                _log("DELETE_ERROR", err=str(e))
+        del self._msgs[1:]
+        del self._sent[1:]
+
+    def finish(self, final_text: str) -> None:
+        """edit สุดท้ายด้วยข้อความที่ post-process แล้ว (หรือส่งปกติถ้าสตรีมใช้ไม่ได้)"""
+        if not self._msgs:
+            self._send(self.chat_id, final_text)
+            return
+        chunks = _split_for_telegram(final_text or "", self._limit)
+        for i, chunk in enumerate(chunks):
+            if i < len(self._msgs):
+                if not self._show(i, chunk) and i == 0:
+                    # edit ไม่ได้ (เช่น ข้อความถูกลบ) → ส่งใหม่ทั้งหมด
+                    self._send(self.chat_id, final_text)
+                    return
+            else:
+                self._send(self.chat_id, chunk)
+                if self.ttfv_ms is None:
+                    self.ttfv_ms = int((time.monotonic() - self._created) * 1000)
+        for mid in self._msgs[len(chunks):]:
+            try:
+                self._delete(self.chat_id, mid)
+            except Exception as e:
+                _log("DELETE_ERROR", err=str(e))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ttfv_ms": self.ttfv_ms,
+            "placeholder_ms": self.placeholder_ms,
+            "edits": self.edits,
+            "messages": len(self._msgs),
+        }
+
+
+__all__ = ["StreamingReply", "PLACEHOLDER"]
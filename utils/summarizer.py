@@ -0,0 +1,257 @@
+# utils/summarizer.py
+# -*- coding: utf-8 -*-
+"""
+Background summarizer — ย้ายการสรุป/ตัดประวัติแชตออกจากเส้นทางตอบข้อความ
+- schedule(user_id): ใส่คิวแบบไม่ซ้ำ (O(1), ไม่แตะ DB/LLM บนเธรดคำขอ)
+  * ผู้ใช้ที่อยู่ในคิว/กำลังสรุปอยู่แล้ว → ไม่เพิ่มซ้ำ (กำลังสรุป = ทำเครื่องหมายให้เช็กใหม่หลังจบ)
+- scheduler thread: ทุก SUMMARY_TICK_MS (หรือทันทีที่มีงานเข้า) หยิบผู้ใช้ไม่เกิน SUMMARY_BATCH คน
+  → นับข้อความทั้งชุดด้วยคิวรีเดียว (memory_store.count_messages_many)
+  → เฉพาะคนที่เกิน MAX_HISTORY_ITEMS ส่งเข้า pool ขนาด SUMMARY_CONCURRENCY
+  (งานในมือรวมไม่เกิน SUMMARY_BATCH → คิวที่ค้างยาวไม่ถูกเทเข้า pool ทีเดียว)
+- งานสรุปมีงบ provider ของตัวเอง (RateLimiter แยก SUMMARY_RPM) → งานเบื้องหลังไม่แย่งโควตาแชตจนหมด
+  งบไม่พอภายใน SUMMARY_BUDGET_WAIT_MS → เลื่อนไปรอบหน้า (ใส่คิวใหม่)
+- ต่อผู้ใช้: collect_for_summary (อ่าน) → summarize_func (ไม่ถือ connection) → apply_summary
+  (บันทึกสรุป + ลบข้อความที่สรุปแล้วในทรานแซกชันเดียว; สรุปล้ม/ได้ข้อความ error → ไม่ลบอะไร)
+- stop(timeout): drain hook (utils.lifecycle ลำดับ 25) — งานที่ยังไม่เริ่มถูกทิ้ง
+  (ข้อความยังอยู่ครบ ข้อความถัดไปของผู้ใช้จะ schedule ใหม่เอง)
+- stats() สำหรับ /diag
+"""
+
+from __future__ import annotations
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+import threading
+import time
+
+
+def _log(tag: str, **kw: Any) -> None:
+    extra = f" | {kw}" if kw else ""
+    print(f"[summarizer] {tag}{extra}", flush=True)
+
+
+class Summarizer:
+    def __init__(
+        self,
+        summarize_func: Callable[[str], str],
+        *,
+        concurrency: int = 2,
+        batch: int = 8,
+        tick_ms: int = 2000,
+        rpm: int = 20,
+        budget_wait_ms: int = 30000,
+        max_pending: int = 10000,
+    ):
+        from providers.rate_limit import RateLimiter
+        self._func = summarize_func
+        self._concurrency = max(1, int(concurrency))
+        self._batch = max(self._concurrency, int(batch))
+        self._tick = max(50, int(tick_ms)) / 1000.0
+        self._budget_wait_ms = max(0, int(budget_wait_ms))
+        self._max_pending = max(1, int(max_pending))
+        self._budget = RateLimiter(
+            "summarizer", "background", rpm=max(1, int(rpm)), max_concurrency=self._concurrency,
+            max_waiters=self._concurrency, burst_sec=60.0,
+        )
+        self._pending: "OrderedDict[int, float]" = OrderedDict()   # user_id → เวลาที่เข้าคิว
+        self._running: Dict[int, bool] = {}                          # user_id → ต้องเช็กใหม่หลังจบ
+        self._cond = threading.Condition()
+        self._stop = False
+        self._pool = ThreadPoolExecutor(max_workers=self._concurrency, thread_name_prefix="summarizer")
+        self._thread = threading.Thread(target=self._loop, name="summarizer-scheduler", daemon=True)
+        self._stats: Dict[str, int] = {
+            "scheduled": 0, "deduped": 0, "dropped": 0, "ticks": 0, "checked": 0,
+            "summarized": 0, "deleted": 0, "skipped": 0, "failed": 0, "deferred": 0,
+        }
+        self._active = 0                                             # งานที่เริ่มรันจริง (ไม่นับที่รอใน pool)
+        self._last_ms: Optional[float] = None
+        self._thread.start()
+
+    # ---------- producer ----------
+    def schedule(self, user_id: int) -> bool:
+        """ใส่ผู้ใช้เข้าคิว (ซ้ำ → ไม่เพิ่ม); คืน True ถ้าเพิ่มใหม่"""
+        uid = int(user_id)
+        with self._cond:
+            if self._stop:
+                return False
+            if uid in self._running:
+                self._running[uid] = True
+                self._stats["deduped"] += 1
+                return False
+            if uid in self._pending:
+                self._stats["deduped"] += 1
+                return False
+            if len(self._pending) >= self._max_pending:
+                self._stats["dropped"] += 1
+                return False
+            self._pending[uid] = time.time()
+            self._stats["scheduled"] += 1
+            self._cond.notify()
+            return True
+
+    # ---------- scheduler ----------
+    def _take_batch(self) -> List[int]:
+        """เรียกภายใต้ lock: หยิบผู้ใช้ให้ในมือ (รอ/กำลังสรุป) รวมไม่เกิน batch"""
+        room = self._batch - len(self._running)
+        out: List[int] = []
+        while self._pending and len(out) < room:
+            uid, _ = self._pending.popitem(last=False)
+            self._running[uid] = False
+            out.append(uid)
+        return out
+
+    def _loop(self) -> None:
+        from utils.memory_store import MAX_HISTORY_ITEMS, count_messages_many
+        while True:
+            with self._cond:
+                if not self._stop and (not self._pending or len(self._running) >= self._batch):
+                    self._cond.wait(self._tick)
+                if self._stop:
+                    return
+                batch = self._take_batch()
+                self._stats["ticks"] += 1
+            if not batch:
+                continue
+            counts = count_messages_many(batch)
+            with self._cond:
+                self._stats["checked"] += len(batch)
+            for uid in batch:
+                n = counts.get(uid, 0)
+                if n <= MAX_HISTORY_ITEMS:
+                    self._finish(uid)
+                    continue
+                try:
+                    self._pool.submit(self._job, uid, n)
+                except RuntimeError:        # pool ปิดแล้ว (กำลัง drain)
+                    self._finish(uid)
+
+    def _finish(self, uid: int, requeue: bool = False) -> None:
+        with self._cond:
+            again = self._running.pop(uid, False)
+            if (again or requeue) and not self._stop and uid not in self._pending:
+                self._pending[uid] = time.time()
+            self._cond.notify_all()
+
+    # ---------- worker ----------
+    def _job(self, uid: int, count: int) -> None:
+        from providers.rate_limit import BudgetExceeded
+        from utils.memory_store import apply_summary, collect_for_summary
+        requeue = False
+        with self._cond:
+            self._active += 1
+        try:
+            job = collect_for_summary(uid, count)
+            if job is None:
+                self._bump("skipped")
+                return
+            try:
+                permit = self._budget.acquire(0, self._budget_wait_ms)
+            except BudgetExceeded:
+                self._bump("deferred")
+                requeue = True
+                return
+            t0 = time.time()
+            with permit:
+                try:
+                    new_sum = (self._func(job["prompt"]) or "").strip()
+                except Exception as e:
+                    _log("SUMMARIZE_ERROR", user_id=uid, err=str(e))
+                    new_sum = ""
+            self._last_ms = (time.time() - t0) * 1000
+            if not new_sum or new_sum.startswith("❌"):
+                self._bump("failed")
+                return
+            deleted = apply_summary(uid, new_sum, job["ids"], job["prev"])
+            if deleted < 0:
+                self._bump("skipped")
+                return
+            self._bump("summarized")
+            self._bump("deleted", deleted)
+        except Exception as e:
+            self._bump("failed")
+            _log("JOB_ERROR", user_id=uid, err=str(e))
+        finally:
+            with self._cond:
+                self._active -= 1
+            self._finish(uid, requeue=requeue)
+
+    def _bump(self, key: str, n: int = 1) -> None:
+        with self._cond:
+            self._stats[key] += n
+
+    # ---------- lifecycle ----------
+    def stop(self, timeout: float = 10.0) -> bool:
+        """หยุดรับงาน + ทิ้งคิวที่ยังไม่เริ่ม + รองานที่กำลังสรุปไม่เกิน timeout; True = ไม่มีงานค้าง"""
+        deadline = time.time() + max(0.0, timeout)
+        with self._cond:
+            self._stop = True
+            dropped = len(self._pending)
+            self._pending.clear()
+            self._cond.notify_all()
+        self._pool.shutdown(wait=False, cancel_futures=True)   # งานที่ยังไม่เริ่มถูกยกเลิก (ไม่เรียก _finish)
+        with self._cond:
+            while self._active and time.time() < deadline:
+                self._cond.wait(max(0.01, deadline - time.time()))
+            left = self._active
+        _log("STOPPED", dropped_pending=dropped, left_running=left)
+        return left == 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            out: Dict[str, Any] = dict(self._stats)
+            out.update(
+                pending=len(self._pending),
+                in_hand=len(self._running),
+                running=self._active,
+                concurrency=self._concurrency,
+                batch=self._batch,
+                last_summary_ms=round(self._last_ms, 1) if self._last_ms is not None else None,
+                budget=self._budget.snapshot(),
+            )
+        return out
+
+
+# ---------- default instance ----------
+_DEFAULT: Optional[Summarizer] = None
+_DEFAULT_LOCK = threading.Lock()
+
+
+def get_summarizer(summarize_func: Optional[Callable[[str], str]] = None) -> Optional[Summarizer]:
+    """summarizer หลัก (None ถ้าปิด SUMMARY_BACKGROUND หรือยังไม่เคยสร้างและไม่ได้ให้ summarize_func)"""
+    global _DEFAULT
+    from config import (
+        SUMMARY_BACKGROUND,
+        SUMMARY_CONCURRENCY,
+        SUMMARY_BATCH,
+        SUMMARY_TICK_MS,
+        SUMMARY_RPM,
+        SUMMARY_BUDGET_WAIT_MS,
+    )
+    if not SUMMARY_BACKGROUND:
+        return None
+    if _DEFAULT is not None or summarize_func is None:
+        return _DEFAULT
+    with _DEFAULT_LOCK:
+        if _DEFAULT is None:
+            _DEFAULT = Summarizer(
+                summarize_func,
+                concurrency=SUMMARY_CONCURRENCY,
+                batch=SUMMARY_BATCH,
+                tick_ms=SUMMARY_TICK_MS,
+                rpm=SUMMARY_RPM,
+                budget_wait_ms=SUMMARY_BUDGET_WAIT_MS,
+            )
+    return _DEFAULT
+
+
+def schedule_summary(user_id: int, summarize_func: Callable[[str], str]) -> None:
+    """ใช้หลังตอบแชต: ส่งเข้าคิวเบื้องหลัง (ปิด SUMMARY_BACKGROUND → ทำแบบเดิมบนเธรดนี้)"""
+    s = get_summarizer(summarize_func)
+    if s is not None:
+        s.schedule(user_id)
+        return
+    from utils.memory_store import prune_and_maybe_summarize
+    prune_and_maybe_summarize(user_id, summarize_func=summarize_func)
+
+
+__all__ = ["Summarizer", "get_summarizer", "schedule_summary"]
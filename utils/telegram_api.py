@@ -69,7 +69,7 @@ def _retry_sleep(attempt: int, retry_after: Optional[float] = None):
     delay = BACKOFF_BASE * (2 ** max(0, attempt - 1)) + 0.05 * attempt
     time.sleep(min(delay, 2.5))
 
-def _request(method: str, path: str, *, json_payload: Optional[Dict[str, Any]] = None, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any] | None:
+def _request(method: str, path: str, *, json_payload: Optional[Dict[str, Any]] = None, params: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None) -> Dict[str, Any] | None:
     if not BOT_TOKEN or not API:
         print("[telegram_api] Missing TELEGRAM_BOT_TOKEN/TELEGRAM_TOKEN")
         return None
@@ -80,9 +80,9 @@ def _request(method: str, path: str, *, json_payload: Optional[Dict[str, Any]] =
     for attempt in range(1, RETRIES + 2):
         try:
             if method == "POST":
-                r = requests.post(url, json=json_payload or {}, timeout=TIMEOUT)
+                r = requests.post(url, json=json_payload or {}, timeout=timeout or TIMEOUT)
             else:
-                r = requests.get(url, params=params or {}, timeout=TIMEOUT)
+                r = requests.get(url, params=params or {}, timeout=timeout or TIMEOUT)
 
             # 429 handling
             if r.status_code == 429:
@@ -311,6 +311,9 @@ def edit_message_text(
     if reply_markup: payload["reply_markup"] = reply_markup
     return _api_post("editMessageText", payload)
 
+def delete_message(chat_id: int | str, message_id: int):
+    return _api_post("deleteMessage", {"chat_id": chat_id, "message_id": message_id})
+
 def answer_callback_query(callback_query_id: str, text: str | None = None, show_alert: bool = False):
     payload = {"callback_query_id": callback_query_id, "show_alert": show_alert}
     if text: payload["text"] = text
@@ -334,6 +337,19 @@ def get_webhook_info():
 def get_me():
     return _api_get("getMe")
 
+def get_updates(offset: Optional[int] = None, limit: int = 100, timeout: int = 25,
+                allowed_updates: Optional[List[str]] = None) -> Dict[str, Any] | None:
+    """
+    long-poll getUpdates (ใช้เมื่อไม่มี webhook)
+    - HTTP timeout = timeout ของ long-poll + 10 วินาที กันตัดก่อน Telegram ตอบ
+    """
+    payload: Dict[str, Any] = {"limit": max(1, min(100, int(limit))), "timeout": max(0, int(timeout))}
+    if offset is not None:
+        payload["offset"] = int(offset)
+    if allowed_updates is not None:
+        payload["allowed_updates"] = allowed_updates
+    return _request("POST", "getUpdates", json_payload=payload, timeout=float(timeout) + 10.0)
+
 def inline_rating_keyboard():
     rows = [[{"text": str(i), "callback_data": f"review:{i}"} for i in range(1, 6)]]
     return {"inline_keyboard": rows}
@@ -0,0 +1,257 @@
+# utils/token_budget.py
+# -*- coding: utf-8 -*-
+"""
+นับ token ต่อโมเดล + จัดบริบทให้พอดีงบ token (แทนการตัดด้วยจำนวนตัวอักษร)
+- ภาษาไทยกิน token ต่างจากจำนวนตัวอักษรมาก → ตัดตามตัวอักษรทั้งล้นและใช้บริบทไม่เต็ม
+- TokenCounter ต่อโมเดล:
+  * โมเดล OpenAI + มี tiktoken → นับจริงด้วย encoding ของโมเดลนั้น (ไม่รู้จักโมเดล → o200k_base)
+  * อื่น ๆ (Gemini / ไม่มี tiktoken) → ค่าประมาณแบบเผื่อ (นับเกินดีกว่าล้น):
+    ไทย ~1.5 ตัวอักษร/token (Gemini ~2.5), คำละติน/ตัวเลข ~4 ตัวอักษร/token, สัญลักษณ์อื่น 1 token
+  * +MESSAGE_OVERHEAD ต่อข้อความ (role/ตัวคั่นของ chat format)
+- cache จำนวน token ต่อแถวข้อความ: key = (ชนิด counter, message_id) ถ้ามี ไม่งั้น (ชนิด counter, เนื้อหา)
+  → บริบทเดิมที่ถูกดึงซ้ำทุกเทิร์นไม่ต้องนับใหม่
+- pack_messages(): system prompt + สรุปบทสนทนา (ไม่เกิน summary_share ของงบ) + ข้อความล่าสุดย้อนหลัง
+  ให้มากที่สุดที่ไม่เกินงบ + ข้อความปัจจุบัน (system/ข้อความปัจจุบันไม่ถูกตัดทิ้ง)
+- context_budget(model): min(CONTEXT_TOKEN_BUDGET, context window ของโมเดล - CONTEXT_REPLY_RESERVE)
+"""
+
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Tuple
+from collections import OrderedDict
+import math
+import re
+import threading
+
+try:
+    import tiktoken  # type: ignore
+except Exception:  # ออปชัน: ไม่มีก็ใช้ค่าประมาณ
+    tiktoken = None  # type: ignore
+
+MESSAGE_OVERHEAD = 4
+REPLY_PRIMING = 3           # token ที่ใส่ต้นคำตอบ assistant
+_SUMMARY_PREFIX = "สรุปบทสนทนาก่อนหน้า: "
+
+_THAI = re.compile("[\u0e00-\u0e7f]")
+_WORD = re.compile(r"[A-Za-z0-9]+")
+_SPACE = re.compile(r"\s")
+
+# context window (token) ตาม prefix ชื่อโมเดล — ตัวที่ยาวกว่าเช็กก่อน
+_MODEL_WINDOWS = {
+    "gpt-3.5": 16_385,
+    "gpt-4": 8_192,
+    "gpt-4-turbo": 128_000,
+    "gpt-4o": 128_000,
+    "gpt-4.1": 1_000_000,
+    "gpt-5": 400_000,
+    "o1": 200_000,
+    "o3": 200_000,
+    "o4": 200_000,
+    "gemini": 1_000_000,
+}
+_DEFAULT_WINDOW = 32_000
+
+
+def model_window(model: str) -> int:
+    m = (model or "").lower()
+    for prefix in sorted(_MODEL_WINDOWS, key=len, reverse=True):
+        if m.startswith(prefix):
+            return _MODEL_WINDOWS[prefix]
+    return _DEFAULT_WINDOW
+
+
+def estimate_tokens(text: str, thai_chars_per_token: float = 1.5) -> int:
+    """ค่าประมาณแบบเผื่อ (ไม่ใช้ไลบรารี)"""
+    if not text:
+        return 0
+    thai = len(_THAI.findall(text))
+    words = _WORD.findall(text)
+    word_chars = sum(len(w) for w in words)
+    spaces = len(_SPACE.findall(text))
+    other = max(0, len(text) - thai - word_chars - spaces)
+    return math.ceil(thai / thai_chars_per_token) + sum(math.ceil(len(w) / 4) for w in words) + other
+
+
+class _LRU:
+    def __init__(self, size: int):
+        self._size = max(0, int(size))
+        self._d: "OrderedDict[Any, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Any) -> Optional[int]:
+        with self._lock:
+            v = self._d.get(key)
+            if v is None:
+                self.misses += 1
+                return None
+            self._d.move_to_end(key)
+            self.hits += 1
+            return v
+
+    def put(self, key: Any, value: int) -> None:
+        if not self._size:
+            return
+        with self._lock:
+            self._d[key] = value
+            self._d.move_to_end(key)
+            while len(self._d) > self._size:
+                self._d.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._d)
+
+
+_CACHE: Optional[_LRU] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def _cache() -> _LRU:
+    global _CACHE
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                from config import TOKEN_COUNT_CACHE_SIZE
+                _CACHE = _LRU(TOKEN_COUNT_CACHE_SIZE)
+    return _CACHE
+
+
+class TokenCounter:
+    def __init__(self, model: str):
+        self.model = model or ""
+        self._enc = None
+        gemini = "gemini" in self.model.lower()
+        self._thai_ratio = 2.5 if gemini else 1.5
+        if tiktoken is not None and not gemini:
+            try:
+                self._enc = tiktoken.encoding_for_model(self.model)
+            except Exception:
+                try:
+                    self._enc = tiktoken.get_encoding("o200k_base")
+                except Exception:
+                    self._enc = None
+        self.kind = f"tiktoken:{self._enc.name}" if self._enc is not None else ("heuristic:gemini" if gemini else "heuristic")
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._enc is not None:
+            return len(self._enc.encode(text, disallowed_special=()))
+        return estimate_tokens(text, self._thai_ratio)
+
+    def count_message(self, msg: Dict[str, Any]) -> int:
+        content = msg.get("content") or ""
+        mid = msg.get("message_id")
+        key = (self.kind, "id", mid) if mid is not None else (self.kind, "text", content)
+        cache = _cache()
+        n = cache.get(key)
+        if n is None:
+            n = self.count(content)
+            cache.put(key, n)
+        return n + MESSAGE_OVERHEAD
+
+
+_COUNTERS: Dict[str, TokenCounter] = {}
+
+
+def get_counter(model: str) -> TokenCounter:
+    c = _COUNTERS.get(model)
+    if c is None:
+        c = _COUNTERS[model] = TokenCounter(model)
+    return c
+
+
+def context_budget(model: str) -> int:
+    from config import CONTEXT_TOKEN_BUDGET, CONTEXT_REPLY_RESERVE
+    return max(256, min(int(CONTEXT_TOKEN_BUDGET), model_window(model) - int(CONTEXT_REPLY_RESERVE)))
+
+
+def _truncate_to(counter: TokenCounter, text: str, max_tokens: int) -> str:
+    """ตัดข้อความ (เก็บส่วนต้น) ให้ไม่เกิน max_tokens — ประมาณสัดส่วนแล้วไล่ลดจนพอดี"""
+    n = counter.count(text)
+    while n > max_tokens and text:
+        text = text[: max(0, int(len(text) * max_tokens / n) - 1)]
+        n = counter.count(text)
+    return text
+
+
+def pack_messages(
+    system_prompt: str,
+    history: List[Dict[str, Any]],
+    current: str,
+    *,
+    model: str,
+    budget: Optional[int] = None,
+    summary: str = "",
+    summary_share: float = 0.25,
+) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+    """
+    คืน (messages สำหรับ provider, info)
+    history: [{"role", "content", "message_id"?}] เรียงเก่า→ใหม่ (ถ้าข้อความล่าสุดคือ current ซ้ำ จะไม่ใส่ซ้ำ)
+    info: budget, tokens, turns, dropped, summary_tokens, counter, over_budget
+    """
+    counter = get_counter(model)
+    budget = int(budget if budget is not None else context_budget(model))
+    sys_msg = {"role": "system", "content": system_prompt}
+    cur_msg = {"role": "user", "content": current}
+    used = counter.count_message(sys_msg) + counter.count_message(cur_msg) + REPLY_PRIMING
+
+    if history and history[-1].get("role") == "user" and (history[-1].get("content") or "").strip() == (current or "").strip():
+        history = history[:-1]
+
+    summary_msg: Optional[Dict[str, str]] = None
+    summary_tokens = 0
+    if summary:
+        cap = min(int(budget * summary_share), budget - used - MESSAGE_OVERHEAD) - counter.count(_SUMMARY_PREFIX)
+        if cap > 16:
+            text = _truncate_to(counter, summary, cap)
+            if text:
+                summary_msg = {"role": "system", "content": _SUMMARY_PREFIX + text}
+                summary_tokens = counter.count(summary_msg["content"]) + MESSAGE_OVERHEAD
+                used += summary_tokens
+
+    kept: List[Dict[str, str]] = []
+    for m in reversed(history):
+        t = counter.count_message(m)
+        if used + t > budget:
+            break
+        kept.append({"role": m["role"], "content": m["content"]})
+        used += t
+    kept.reverse()
+
+    out: List[Dict[str, str]] = [sys_msg]
+    if summary_msg is not None:
+        out.append(summary_msg)
+    out.extend(kept)
+    out.append(cur_msg)
+    return out, {
+        "budget": budget,
+        "tokens": used,
+        "turns": len(kept),
+        "dropped": len(history) - len(kept),
+        "summary_tokens": summary_tokens,
+        "counter": counter.kind,
+        "over_budget": used > budget,
+    }
+
+
+def cache_stats() -> Dict[str, Any]:
+    c = _cache()
+    total = c.hits + c.misses
+    return {
+        "entries": len(c),
+        "hit_rate": round(c.hits / total, 4) if total else 0.0,
+        "tiktoken": tiktoken is not None,
+    }
+
+
+__all__ = [
+    "TokenCounter",
+    "get_counter",
+    "estimate_tokens",
+    "model_window",
+    "context_budget",
+    "pack_messages",
+    "cache_stats",
+    "MESSAGE_OVERHEAD",
+]
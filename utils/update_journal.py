@@ -0,0 +1,447 @@
+# utils/update_journal.py
+# -*- coding: utf-8 -*-
+"""
+Durable inbound update journal (SQLite, group commit)
+- webhook เขียน update ลง journal ก่อนตอบ Telegram "ok" → ถ้าโปรเซสตายกลางคัน (redeploy/OOM) ยังไม่หาย
+- worker mark_done() เมื่อ handler จบ (สำเร็จหรือ error ที่จัดการแล้ว ก็ถือว่าจบ)
+- ตอนสตาร์ต (และเป็นระยะ) จะ "claim" รายการที่ค้างของโปรเซสที่ตายไปแล้วมา replay
+  (ดูจาก heartbeat ของเจ้าของ: เกิน JOURNAL_STALE_SEC ถือว่าตาย) — ปลอดภัยกับหลาย gunicorn worker
+- Group commit: มี writer thread เดียวรวบทุกคำขอที่ค้างอยู่ ณ ขณะนั้นเป็นทรานแซกชันเดียว
+  (ขณะ commit ชุดก่อน ชุดถัดไปสะสมรอ) → webhook รอแค่ commit ของชุดตัวเอง (WAL + synchronous=NORMAL)
+- กัน replay วนไม่จบ: เกิน JOURNAL_MAX_ATTEMPTS จะปิดรายการทิ้งพร้อม log
+- ลบรายการที่เสร็จแล้วเก่ากว่า JOURNAL_RETENTION_SEC อัตโนมัติ
+"""
+
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+
+
+def _log(tag: str, **kw: Any) -> None:
+    extra = f" | {kw}" if kw else ""
+    print(f"[journal] {tag}{extra}", flush=True)
+
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS journal (
+        jkey        TEXT PRIMARY KEY,
+        update_id   INTEGER,
+        payload     TEXT NOT NULL,
+        owner       TEXT NOT NULL,
+        attempts    INTEGER NOT NULL DEFAULT 0,
+        received_at REAL NOT NULL,
+        done_at     REAL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_journal_open ON journal (done_at, owner)",
+    """
+    CREATE TABLE IF NOT EXISTS journal_owners (
+        owner     TEXT PRIMARY KEY,
+        heartbeat REAL NOT NULL
+    )
+    """,
+]
+
+
+class _Pending:
+    __slots__ = ("key", "update_id", "payload", "received_at", "event", "ok")
+
+    def __init__(self, key: str, update_id: Any, payload: str):
+        self.key = key
+        self.update_id = update_id if isinstance(update_id, int) else None
+        self.payload = payload
+        self.received_at = time.time()
+        self.event = threading.Event()
+        self.ok = False
+
+
+class UpdateJournal:
+    """
+    - append(update) -> key | None : บันทึกและรอ commit (group commit); None = เขียนไม่สำเร็จ
+    - append_many(updates)         : แบบ batch รอ commit ครั้งเดียว
+    - mark_done(keys)              : ปิดรายการ (ไม่รอ; รวบไปกับ commit ถัดไป)
+    - claim_orphans(limit)         : ยึดรายการค้างของเจ้าของที่ตายแล้ว → [(key, update)]
+    - flush(timeout) / stats()
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        commit_timeout_sec: float = 2.0,
+        max_batch: int = 500,
+        stale_sec: float = 20.0,
+        heartbeat_sec: float = 5.0,
+        retention_sec: float = 86400.0,
+        max_attempts: int = 3,
+        synchronous: str = "NORMAL",
+    ):
+        self._path = path
+        self._commit_timeout = max(0.05, float(commit_timeout_sec))
+        self._max_batch = max(1, int(max_batch))
+        self._stale_sec = max(2.0, float(stale_sec))
+        self._heartbeat_sec = max(0.5, float(heartbeat_sec))
+        self._retention_sec = max(60.0, float(retention_sec))
+        self._max_attempts = max(1, int(max_attempts))
+        self._sync = synchronous if synchronous in ("OFF", "NORMAL", "FULL") else "NORMAL"
+
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._appends: List[_Pending] = []
+        self._dones: List[str] = []
+        self._pid: Optional[int] = None
+        self._owner = ""
+        self._seq = 0
+        self._replay_fn: Optional[Callable[[str, Dict[str, Any]], bool]] = None
+        self._last_sweep = 0.0
+        self._last_prune = 0.0
+        self._closing = False
+
+        # counters
+        self._appended = 0
+        self._done = 0
+        self._failed = 0
+        self._batches = 0
+        self._replayed = 0
+        self._given_up = 0
+        self._commit_ms_max = 0.0
+        self._commit_ms_sum = 0.0
+
+    # ---------- connection / thread ----------
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self._path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self._path, timeout=10, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL;")
+        conn.execute(f"PRAGMA synchronous={self._sync};")
+        conn.execute("PRAGMA busy_timeout=5000;")
+        for sql in _SCHEMA:
+            conn.execute(sql)
+        conn.commit()
+        return conn
+
+    def _ensure_started(self) -> None:
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            self._owner = f"{socket.gethostname()}:{pid}:{int(time.time() * 1000)}"
+            self._seq = 0
+            self._appends, self._dones = [], []
+            self._pid = pid
+            threading.Thread(target=self._writer, name="journal-writer", daemon=True).start()
+
+    def set_replay(self, fn: Callable[[str, Dict[str, Any]], bool]) -> None:
+        """fn(key, update) -> bool (True = รับไป replay แล้ว) ใช้ตอน sweep เป็นระยะ"""
+        self._replay_fn = fn
+
+    # ---------- public API ----------
+    def append(self, update: Dict[str, Any]) -> Optional[str]:
+        return self.append_many([update])[0]
+
+    def append_many(self, updates: List[Dict[str, Any]]) -> List[Optional[str]]:
+        """บันทึกหลาย update แล้วรอ commit ครั้งเดียว (batch จาก getUpdates) → key ตามลำดับ (None = ไม่สำเร็จ)"""
+        self._ensure_started()
+        items: List[Optional[_Pending]] = []
+        with self._cond:
+            if self._closing:
+                return [None] * len(updates)
+            for upd in updates:
+                try:
+                    payload = json.dumps(upd, ensure_ascii=False, separators=(",", ":"))
+                except Exception:
+                    items.append(None)
+                    continue
+                self._seq += 1
+                it = _Pending(f"{self._owner}#{self._seq}", upd.get("update_id"), payload)
+                self._appends.append(it)
+                items.append(it)
+            self._cond.notify_all()
+        deadline = time.monotonic() + self._commit_timeout
+        out: List[Optional[str]] = []
+        failed = 0
+        for it in items:
+            if it is not None:
+                it.event.wait(max(0.0, deadline - time.monotonic()))
+            if it is None or not it.ok:
+                failed += 1
+                out.append(None)
+            else:
+                out.append(it.key)
+        if failed:
+            with self._lock:
+                self._failed += failed
+        return out
+
+    def mark_done(self, keys: List[str]) -> None:
+        keys = [k for k in (keys or []) if k]
+        if not keys:
+            return
+        with self._cond:
+            self._dones.extend(keys)
+            self._cond.notify_all()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """รอให้ของที่ค้างใน buffer ถูก commit (ใช้ตอนปิดโปรเซส)"""
+        deadline = time.monotonic() + max(0.0, timeout)
+        with self._cond:
+            self._cond.notify_all()
+            while (self._appends or self._dones) and time.monotonic() < deadline:
+                self._cond.wait(0.05)
+            return not (self._appends or self._dones)
+
+    def close(self, timeout: float = 5.0) -> bool:
+        ok = self.flush(timeout)
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        return ok
+
+    # ---------- writer loop ----------
+    def _writer(self) -> None:
+        conn: Optional[sqlite3.Connection] = None
+        my_pid = os.getpid()
+        last_hb = 0.0
+        while self._pid == my_pid:
+            with self._cond:
+                while not (self._appends or self._dones or self._closing):
+                    if not self._cond.wait(self._heartbeat_sec):
+                        break
+                appends = self._appends[: self._max_batch]
+                del self._appends[: len(appends)]
+                dones, self._dones = self._dones, []
+                closing = self._closing
+            try:
+                if conn is None:
+                    conn = self._connect()
+                now = time.time()
+                if appends or dones or now - last_hb >= self._heartbeat_sec:
+                    t0 = time.perf_counter()
+                    self._write_batch(conn, appends, dones, now)
+                    if appends or dones:
+                        ms = (time.perf_counter() - t0) * 1000.0
+                        with self._lock:
+                            self._batches += 1
+                            self._commit_ms_sum += ms
+                            self._commit_ms_max = max(self._commit_ms_max, ms)
+                    last_hb = now
+                for it in appends:
+                    it.ok = True
+                    it.event.set()
+                with self._cond:
+                    self._appended += len(appends)
+                    self._done += len(dones)
+                    self._cond.notify_all()
+                self._maybe_sweep(conn, now)
+                self._maybe_prune(conn, now)
+            except Exception as e:
+                _log("WRITE_ERROR", err=str(e), tb=traceback.format_exc())
+                for it in appends:
+                    it.event.set()          # ok=False → webhook ตัดสินใจเอง
+                with self._cond:
+                    self._dones[:0] = dones  # ลองใหม่รอบหน้า
+                try:
+                    if conn is not None:
+                        conn.close()
+                except Exception:
+                    pass
+                conn = None
+                time.sleep(0.2)
+            if closing:
+                break
+        try:
+            if conn is not None:
+                conn.close()
+        except Exception:
+            pass
+
+    def _write_batch(self, conn: sqlite3.Connection, appends: List[_Pending], dones: List[str], now: float) -> None:
+        with conn:
+            if appends:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO journal (jkey, update_id, payload, owner, attempts, received_at) "
+                    "VALUES (?, ?, ?, ?, 0, ?)",
+                    [(it.key, it.update_id, it.payload, self._owner, it.received_at) for it in appends],
+                )
+            if dones:
+                conn.executemany(
+                    "UPDATE journal SET done_at = ? WHERE jkey = ? AND done_at IS NULL",
+                    [(now, k) for k in dones],
+                )
+            conn.execute(
+                "INSERT INTO journal_owners (owner, heartbeat) VALUES (?, ?) "
+                "ON CONFLICT(owner) DO UPDATE SET heartbeat = excluded.heartbeat",
+                (self._owner, now),
+            )
+
+    # ---------- orphan replay ----------
+    def claim_orphans(self, limit: int = 100, conn: Optional[sqlite3.Connection] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        ยึดรายการที่ยังไม่ done ของเจ้าของที่ heartbeat เก่ากว่า stale_sec (หรือไม่มี heartbeat)
+        ทำใน BEGIN IMMEDIATE เดียว → หลาย worker แย่งกัน claim ได้อย่างปลอดภัย
+        """
+        self._ensure_started()
+        own = conn is None
+        conn = conn or self._connect()
+        out: List[Tuple[str, Dict[str, Any]]] = []
+        try:
+            cutoff = time.time() - self._stale_sec
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                """
+                SELECT j.jkey, j.payload, j.attempts FROM journal j
+                LEFT JOIN journal_owners o ON o.owner = j.owner
+                WHERE j.done_at IS NULL AND j.owner != ?
+                  AND (o.heartbeat IS NULL OR o.heartbeat < ?)
+                ORDER BY j.received_at ASC
+                LIMIT ?
+                """,
+                (self._owner, cutoff, max(1, int(limit))),
+            ).fetchall()
+            now = time.time()
+            for jkey, payload, attempts in rows:
+                if attempts + 1 > self._max_attempts:
+                    conn.execute("UPDATE journal SET done_at = ? WHERE jkey = ?", (now, jkey))
+                    self._given_up += 1
+                    _log("GIVE_UP", key=jkey, attempts=attempts)
+                    continue
+                conn.execute(
+                    "UPDATE journal SET owner = ?, attempts = attempts + 1 WHERE jkey = ?",
+                    (self._owner, jkey),
+                )
+                try:
+                    out.append((jkey, json.loads(payload)))
+                except Exception:
+                    conn.execute("UPDATE journal SET done_at = ? WHERE jkey = ?", (now, jkey))
+            conn.execute("DELETE FROM journal_owners WHERE heartbeat < ? AND owner != ?", (cutoff, self._owner))
+            conn.commit()
+        except Exception as e:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            _log("CLAIM_ERROR", err=str(e))
+            out = []
+        finally:
+            if own:
+                conn.close()
+        return out
+
+    def release(self, keys: List[str], conn: Optional[sqlite3.Connection] = None) -> None:
+        """
+        คืนรายการที่ claim แล้วแต่ส่งไม่สำเร็จให้เป็นของ "ไม่มีเจ้าของ" (owner = '')
+        → sweep รอบหน้า (ของ worker ไหนก็ได้ รวมถึงตัวเอง) claim ใหม่ได้; attempts ที่เพิ่มไปแล้วยังนับ
+        """
+        if not keys:
+            return
+        own = conn is None
+        conn = conn or self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    "UPDATE journal SET owner = '' WHERE jkey = ? AND owner = ? AND done_at IS NULL",
+                    [(k, self._owner) for k in keys],
+                )
+        except Exception as e:
+            _log("RELEASE_ERROR", count=len(keys), err=str(e))
+        finally:
+            if own:
+                conn.close()
+
+    def replay(self, limit: int = 100, conn: Optional[sqlite3.Connection] = None) -> int:
+        """claim แล้วส่งเข้า replay_fn; รายการที่ส่งไม่สำเร็จจะถูก release ให้ sweep รอบหน้า claim ใหม่"""
+        fn = self._replay_fn
+        if fn is None:
+            return 0
+        claimed = self.claim_orphans(limit, conn=conn)
+        n = 0
+        failed: List[str] = []
+        for key, update in claimed:
+            try:
+                if fn(key, update):
+                    n += 1
+                    continue
+            except Exception as e:
+                _log("REPLAY_ERROR", key=key, err=str(e))
+            failed.append(key)
+        self.release(failed, conn=conn)
+        if claimed:
+            with self._lock:
+                self._replayed += n
+            _log("REPLAYED", claimed=len(claimed), accepted=n, released=len(failed))
+        return n
+
+    def _maybe_sweep(self, conn: sqlite3.Connection, now: float) -> None:
+        if self._replay_fn is None or now - self._last_sweep < self._stale_sec / 2:
+            return
+        self._last_sweep = now
+        self.replay(conn=conn)
+
+    def _maybe_prune(self, conn: sqlite3.Connection, now: float) -> None:
+        if now - self._last_prune < 600:
+            return
+        self._last_prune = now
+        with conn:
+            conn.execute("DELETE FROM journal WHERE done_at IS NOT NULL AND done_at < ?", (now - self._retention_sec,))
+
+    # ---------- stats ----------
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "path": self._path,
+                "owner": self._owner,
+                "appended": self._appended,
+                "done": self._done,
+                "failed": self._failed,
+                "replayed": self._replayed,
+                "given_up": self._given_up,
+                "buffered": len(self._appends) + len(self._dones),
+                "batches": self._batches,
+                "commit_ms": {
+                    "avg": round(self._commit_ms_sum / self._batches, 3) if self._batches else 0.0,
+                    "max": round(self._commit_ms_max, 3),
+                },
+            }
+
+
+# ---------- default instance ----------
+_DEFAULT: Optional[UpdateJournal] = None
+_DEFAULT_LOCK = threading.Lock()
+
+
+def get_journal() -> Optional[UpdateJournal]:
+    """คืน journal หลัก (None ถ้าปิดด้วย JOURNAL_ENABLED=0)"""
+    global _DEFAULT
+    from config import (
+        JOURNAL_ENABLED,
+        JOURNAL_DB_FILE,
+        JOURNAL_STALE_SEC,
+        JOURNAL_RETENTION_SEC,
+        JOURNAL_MAX_ATTEMPTS,
+        JOURNAL_SYNCHRONOUS,
+    )
+    if not JOURNAL_ENABLED:
+        return None
+    if _DEFAULT is not None:
+        return _DEFAULT
+    with _DEFAULT_LOCK:
+        if _DEFAULT is None:
+            _DEFAULT = UpdateJournal(
+                JOURNAL_DB_FILE,
+                stale_sec=JOURNAL_STALE_SEC,
+                retention_sec=JOURNAL_RETENTION_SEC,
+                max_attempts=JOURNAL_MAX_ATTEMPTS,
+                synchronous=JOURNAL_SYNCHRONOUS,
+            )
+    return _DEFAULT
+
+
+__all__ = ["UpdateJournal", "get_journal"]